@@ -229,3 +229,59 @@ with DAG(
             f"--target-year {{{{ dag_run.conf.get('kpi_forecast_target_year', '') }}}}"
         ),
     )
+
+
+# KPI PIPELINE: chạy tất cả stage trong 1 process (dùng chung client + kết quả in-memory giữa các stage)
+# Or pass via conf when triggering: {"kpi_pipeline_target_month": "2", "kpi_pipeline_stages": "kpi_day,kpi_channel"}
+with DAG(
+    dag_id="kpi_pipeline_manual",
+    start_date=datetime(2026, 1, 1),
+    schedule=None,
+    default_args=default_args,
+    catchup=False,
+    tags=["cdp-kpi-models", "manual", "kpi_pipeline"],
+) as dag:
+    kpi_pipeline_manual_task = BashOperator(
+        task_id="kpi_pipeline_manual_task",
+        bash_command=(
+            f"{PYTHON_CMD} -m src.pipeline "
+            f"{{% if dag_run.conf.get('kpi_pipeline_target_month') %}}--target-month {{{{ dag_run.conf.get('kpi_pipeline_target_month') }}}} {{% endif %}}"
+            f"{{% if dag_run.conf.get('kpi_pipeline_stages') %}}--stages {{{{ dag_run.conf.get('kpi_pipeline_stages') }}}} {{% endif %}}"
+            f"--report /tmp/kpi_pipeline_report.json"
+        ),
+    )
+
+# Refresh profile % revenue theo giờ (intraday) trước các job chạy trong ngày
+with DAG(
+    dag_id="kpi_intraday_profile",
+    start_date=datetime(2026, 1, 1),
+    schedule="15 0 * * *",
+    default_args=default_args,
+    catchup=False,
+    tags=["cdp-kpi-models", "daily", "kpi_intraday_profile"],
+) as dag:
+    kpi_intraday_profile_task = BashOperator(
+        task_id="kpi_intraday_profile_task",
+        bash_command=f"{PYTHON_CMD} -m src.utils.intraday_profile --dimensions all,channel",
+    )
+
+# Backfill nhiều tháng song song, vd conf: {"kpi_backfill_months": "1-12", "kpi_backfill_max_workers": "4"}
+with DAG(
+    dag_id="kpi_pipeline_backfill",
+    start_date=datetime(2026, 1, 1),
+    schedule=None,
+    default_args=default_args,
+    catchup=False,
+    tags=["cdp-kpi-models", "manual", "kpi_pipeline"],
+) as dag:
+    kpi_pipeline_backfill_task = BashOperator(
+        task_id="kpi_pipeline_backfill_task",
+        bash_command=(
+            f"{PYTHON_CMD} -m src.pipeline "
+            f"--months {{{{ dag_run.conf.get('kpi_backfill_months', '1-12') }}}} "
+            f"--max-workers {{{{ dag_run.conf.get('kpi_backfill_max_workers', '4') }}}} "
+            f"{{% if dag_run.conf.get('kpi_pipeline_stages') %}}--stages {{{{ dag_run.conf.get('kpi_pipeline_stages') }}}} {{% endif %}}"
+            f"--continue-on-error "
+            f"--report /tmp/kpi_backfill_report.json"
+        ),
+    )
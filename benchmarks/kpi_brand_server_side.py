@@ -0,0 +1,175 @@
+"""
+So sánh kpi_brand server-side (get_kpi_brand_server_side_query, chạy trong ClickHouse) với bản Python
+(calculate_kpi_brand) trên 1 tháng giả lập cố định (benchmarks.synthetic, seed cố định) load vào ClickHouse
+LOCAL. Chỉ đọc kpi_brand, không insert.
+
+    docker compose -f infrastructure/docker/docker-compose.yml --profile benchmark up -d clickhouse
+    python -m benchmarks.kpi_brand_server_side [--seed 42] [--brands 20] [--skus-per-brand 20]
+        [--orders-per-day 300] [--no-snapshot] [--allow-remote]
+
+Kết nối như benchmarks.pipeline_stages (BENCHMARK_CLICKHOUSE_*, KHÔNG đọc CLICKHOUSE_* trong .env); bảng
+hskcdp.* trên server benchmark bị DROP + load lại (load_parity_month). Tháng target = tháng hiện tại, dữ liệu
+tới đầu giờ hiện tại: cùng seed + cùng giờ chạy cho cùng dữ liệu. Edge case:
+    - brand mới (không có trong kpi_brand_metadata): Python ở cả 2 mode, không nằm trong phần so sánh
+    - channel PARITY_NULL_ADJUSTMENT_CHANNEL không có kpi_channel_adjustment -> kpi_brand_adjustment NULL
+    - ngày quá khứ / hôm nay / tương lai
+(kpi_brand không dùng profile intraday; case channel thiếu profile nằm ở benchmarks.kpi_sku_server_side.)
+So theo key (calendar_date, channel, brand_name). Bản Python dùng Decimal, server-side dùng Float64 nên so với
+tolerance của kpi_sku (KPI_SKU_VECTORIZED_REL_TOL / KPI_SKU_VECTORIZED_ABS_TOL); NULL phải khớp NULL.
+"""
+import sys
+import math
+import time
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+from src.utils.query_helper import RevenueQueryHelper
+from src.utils.transaction_snapshot import TransactionSnapshotCache
+from src.etl.kpi_brand import KPIBrandCalculator, KPI_BRAND_INSERT_COLUMNS
+from src.etl.kpi_sku import KPI_SKU_VECTORIZED_REL_TOL, KPI_SKU_VECTORIZED_ABS_TOL
+from benchmarks.pipeline_stages import create_benchmark_client
+from benchmarks.synthetic import (
+    SyntheticDataset, SYNTHETIC_DATABASE, PARITY_SEED, PARITY_BRANDS, PARITY_SKUS_PER_BRAND,
+    PARITY_ORDERS_PER_DAY, PARITY_NULL_ADJUSTMENT_CHANNEL, load_parity_month
+)
+
+KEY_COLUMNS = ['calendar_date', 'channel', 'brand_name']
+COMPARED_FIELDS = ['pct_of_rev_by_brand', 'kpi_brand_initial', 'actual', 'gap', 'kpi_brand_adjustment', 'forecast']
+
+
+def get_key(row: Dict) -> Tuple:
+    return tuple(str(row[name]) for name in KEY_COLUMNS)
+
+
+def values_match(expected, actual) -> bool:
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    return math.isclose(
+        float(actual),
+        float(expected),
+        rel_tol=KPI_SKU_VECTORIZED_REL_TOL,
+        abs_tol=KPI_SKU_VECTORIZED_ABS_TOL
+    )
+
+
+def compare_rows(expected_rows: List[Dict], actual_rows: List[Dict]) -> Dict[str, Dict]:
+    report = {}
+    for field in COMPARED_FIELDS:
+        mismatches = 0
+        max_abs_diff = 0.0
+        for expected, actual in zip(expected_rows, actual_rows):
+            if not values_match(expected[field], actual[field]):
+                mismatches += 1
+            if expected[field] is not None and actual[field] is not None:
+                max_abs_diff = max(max_abs_diff, abs(float(actual[field]) - float(expected[field])))
+        report[field] = {'max_abs_diff': max_abs_diff, 'mismatches': mismatches}
+    return report
+
+
+def get_edge_case_counts(python_rows: List[Dict], server_brands: set, today: date) -> Dict[str, int]:
+    return {
+        'past rows': sum(1 for row in python_rows if row['calendar_date'] < today),
+        'today rows': sum(1 for row in python_rows if row['calendar_date'] == today),
+        'future rows': sum(1 for row in python_rows if row['calendar_date'] > today),
+        'NULL kpi_brand_adjustment': sum(
+            1 for row in python_rows
+            if row['brand_name'] in server_brands
+            and row['channel'] == PARITY_NULL_ADJUSTMENT_CHANNEL
+            and row['kpi_brand_adjustment'] is None
+        ),
+        'new brand rows (python only)': sum(1 for row in python_rows if row['brand_name'] not in server_brands),
+    }
+
+
+if __name__ == "__main__":
+    n_brands = PARITY_BRANDS
+    skus_per_brand = PARITY_SKUS_PER_BRAND
+    orders_per_day = PARITY_ORDERS_PER_DAY
+    seed = PARITY_SEED
+    use_snapshot = True
+    allow_remote = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--seed" and i + 1 < len(sys.argv):
+            seed = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--brands" and i + 1 < len(sys.argv):
+            n_brands = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--skus-per-brand" and i + 1 < len(sys.argv):
+            skus_per_brand = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--orders-per-day" and i + 1 < len(sys.argv):
+            orders_per_day = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--no-snapshot":
+            use_snapshot = False
+            i += 1
+        elif sys.argv[i] == "--allow-remote":
+            allow_remote = True
+            i += 1
+        else:
+            i += 1
+
+    dataset = SyntheticDataset(
+        n_brands=n_brands,
+        skus_per_brand=skus_per_brand,
+        orders_per_day=orders_per_day,
+        now=datetime.now().replace(minute=0, second=0),
+        seed=seed
+    )
+    dataset.generate()
+    target_year, target_month = dataset.target_year, dataset.target_month
+    print(f"Synthetic month {target_month}/{target_year} (seed {seed}, now {dataset.now})")
+
+    create_benchmark_client(database='default', allow_remote=allow_remote).command(
+        f"CREATE DATABASE IF NOT EXISTS {SYNTHETIC_DATABASE}"
+    )
+    client = create_benchmark_client(allow_remote=allow_remote)
+    load_parity_month(client, dataset)
+
+    revenue_helper = RevenueQueryHelper(
+        client=client,
+        snapshot_cache=TransactionSnapshotCache(client) if use_snapshot else None
+    )
+    calculator = KPIBrandCalculator(dataset.constants, client=client, revenue_helper=revenue_helper)
+    today = date.today()
+
+    started = time.perf_counter()
+    python_rows = calculator.calculate_kpi_brand(target_year, target_month)
+    python_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    query = calculator.get_kpi_brand_server_side_query(target_year, target_month, today, datetime.now())
+    server_rows = [dict(zip(KPI_BRAND_INSERT_COLUMNS, row)) for row in client.query(query).result_rows]
+    server_seconds = time.perf_counter() - started
+    print(f"kpi_brand {target_month}/{target_year}: python {len(python_rows)} rows in {python_seconds:.2f}s, "
+          f"server-side {len(server_rows)} rows in {server_seconds:.2f}s")
+
+    # Bản Python có thêm dòng của brand mới / brand không có metadata
+    server_brands = {row['brand_name'] for row in server_rows}
+    for name, count in get_edge_case_counts(python_rows, server_brands, today).items():
+        print(f"  {name:<28} {count:>8}")
+        if count == 0:
+            # vd hôm nay là ngày đầu / cuối tháng thì không có ngày quá khứ / tương lai
+            print(f"  WARNING: edge case '{name}' is not covered by this month")
+
+    python_by_key = {get_key(row): row for row in python_rows if row['brand_name'] in server_brands}
+    server_by_key = {get_key(row): row for row in server_rows}
+    missing = python_by_key.keys() - server_by_key.keys()
+    extra = server_by_key.keys() - python_by_key.keys()
+    if missing or extra:
+        print(f"FAILED: {len(missing)} keys only in python, {len(extra)} keys only in server-side")
+        sys.exit(1)
+
+    keys = sorted(python_by_key.keys())
+    report = compare_rows([python_by_key[key] for key in keys], [server_by_key[key] for key in keys])
+
+    failed = False
+    for field, stats in report.items():
+        status = "OK" if stats['mismatches'] == 0 else f"FAILED ({stats['mismatches']} values)"
+        failed = failed or stats['mismatches'] > 0
+        print(f"  {field:<22} {status}, max abs diff {stats['max_abs_diff']:.3e}")
+
+    if failed:
+        sys.exit(1)
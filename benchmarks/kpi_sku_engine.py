@@ -0,0 +1,259 @@
+"""
+Benchmark engine kpi_sku: calculate_kpi_sku_rows (từng dòng) vs calculate_kpi_sku_rows_vectorized (numpy)
+trên dữ liệu giả lập, không cần ClickHouse.
+
+    python -m benchmarks.kpi_sku_engine [--sizes 10000,100000,1000000] [--skip-loop-above N] [--seed 42]
+
+Kết quả vectorized được so với engine từng dòng theo KPI_SKU_VECTORIZED_REL_TOL / KPI_SKU_VECTORIZED_ABS_TOL.
+"""
+import sys
+import math
+import time
+import numpy as np
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from src.utils.constants import Constants
+from src.utils.columnar import ColumnarResult, DATE_DTYPE
+from src.utils.intraday_profile import IntradayProfile
+from src.etl.kpi_sku import (
+    KPISKUCalculator,
+    KPI_SKU_BASE_COLUMNS,
+    KPI_SKU_BASE_DTYPES,
+    KPI_SKU_VECTORIZED_REL_TOL,
+    KPI_SKU_VECTORIZED_ABS_TOL
+)
+
+COMPARED_FIELDS = ['kpi_sku_initial', 'actual', 'gap', 'kpi_sku_adjustment', 'forecast']
+CHANNELS = ['ONLINE_HASAKI', 'OFFLINE_HASAKI', 'ECOM']
+CLASSIFICATIONS = np.array(['Hero', 'Core', 'Tail'], dtype=object)
+
+
+class OfflineClient:
+    """Client giả: benchmark không được query ClickHouse"""
+
+    def __getattr__(self, name):
+        raise RuntimeError(f"benchmark does not use ClickHouse (called client.{name})")
+
+
+def generate_inputs(n_rows: int, seed: int = 42) -> Dict:
+    """
+    Sinh dữ liệu giả lập cho 1 tháng 31 ngày: date × channel × sku (mỗi brand ~20 sku),
+    today = ngày 15 để có đủ ngày quá khứ / hôm nay / tương lai.
+    """
+    rng = np.random.default_rng(seed)
+    month_start = date(2026, 1, 1)
+    days = [month_start + timedelta(days=i) for i in range(31)]
+    today = days[14]
+
+    n_skus = max(1, math.ceil(n_rows / (len(days) * len(CHANNELS))))
+    n_brands = max(1, n_skus // 20)
+    sku_names = np.array([f"{100000 + i}" for i in range(n_skus)], dtype=object)
+    sku_brand_index = np.arange(n_skus) % n_brands
+    brand_names = np.array([f"BRAND_{i}" for i in range(n_brands)], dtype=object)
+    sku_classes = CLASSIFICATIONS[rng.choice(3, size=n_skus, p=[0.2, 0.5, 0.3])]
+
+    hero_counts = np.bincount(sku_brand_index, weights=(sku_classes == 'Hero'), minlength=n_brands).astype(np.int64)
+    core_counts = np.bincount(sku_brand_index, weights=(sku_classes == 'Core'), minlength=n_brands).astype(np.int64)
+
+    # date × channel × sku, cắt còn n_rows
+    date_index = np.repeat(np.arange(len(days)), len(CHANNELS) * n_skus)[:n_rows]
+    channel_index = np.tile(np.repeat(np.arange(len(CHANNELS)), n_skus), len(days))[:n_rows]
+    sku_index = np.tile(np.arange(n_skus), len(days) * len(CHANNELS))[:n_rows]
+    brand_index = sku_brand_index[sku_index]
+
+    calendar_dates = np.array(days, dtype=DATE_DTYPE)[date_index]
+    channels = np.array(CHANNELS, dtype=object)[channel_index]
+    kpi_brand_adjustment = rng.uniform(0, 5e7, size=n_rows)
+    kpi_brand_adjustment[rng.random(n_rows) < 0.05] = np.nan
+    columns = {
+        'calendar_date': calendar_dates,
+        'date_label': np.full(n_rows, 'Normal day', dtype=object),
+        'channel': channels,
+        'brand_name': brand_names[brand_index],
+        'kpi_brand_initial': rng.uniform(0, 5e7, size=n_rows),
+        'kpi_brand_adjustment': kpi_brand_adjustment,
+        'sku': sku_names[sku_index],
+        'sku_classification': sku_classes[sku_index],
+        'revenue_share_in_class': rng.uniform(0, 100, size=n_rows),
+        'hero_count': hero_counts[brand_index],
+        'core_count': core_counts[brand_index],
+        'kpi_brand': rng.uniform(0, 1e8, size=n_rows),
+        'revenue_by_group_sku': rng.uniform(0, 5e7, size=n_rows),
+        'kpi_sku_initial': rng.uniform(0, 1e6, size=n_rows),
+        'category_name': np.where(rng.random(n_rows) < 0.1, None, 'Skincare').astype(object),
+    }
+    base_columns = ColumnarResult(KPI_SKU_BASE_COLUMNS, columns)
+
+    # Actual: ~70% dòng quá khứ / hôm nay có doanh thu
+    has_actual = (calendar_dates <= np.datetime64(today, 'D')) & (rng.random(n_rows) < 0.7)
+    actual_columns = ColumnarResult(
+        ['calendar_date', 'channel', 'brand_name', 'sku', 'actual_amount'],
+        {
+            'calendar_date': calendar_dates[has_actual],
+            'channel': channels[has_actual],
+            'brand_name': columns['brand_name'][has_actual],
+            'sku': columns['sku'][has_actual],
+            'actual_amount': rng.uniform(0, 1e6, size=int(has_actual.sum())),
+        }
+    )
+
+    # Actual tới giờ cutoff của hôm nay: {channel: {sku: actual}}
+    actual_by_sku_today = {channel: {} for channel in CHANNELS}
+    today_rows = np.nonzero(calendar_dates == np.datetime64(today, 'D'))[0]
+    for i in today_rows[rng.random(len(today_rows)) < 0.5]:
+        actual_by_sku_today[channels[i]][sku_names[sku_index[i]]] = float(rng.uniform(0, 5e5))
+
+    intraday_profile = IntradayProfile('channel', {
+        channel: {h: float(w) for h, w in enumerate(rng.dirichlet(np.ones(24)))}
+        for channel in CHANNELS
+    })
+
+    forecast_top_down_sku = {}
+    for day in days[15:]:
+        forecast_top_down_sku[day] = {
+            channel: {
+                brand_name: Decimal(str(round(float(rng.uniform(0, 1e8)), 2)))
+                for brand_name in brand_names
+            }
+            for channel in CHANNELS
+        }
+
+    return {
+        'today': today,
+        'cutoff_hour': 13,
+        'base_columns': base_columns,
+        'actual_columns': actual_columns,
+        'actual_by_sku_today': actual_by_sku_today,
+        'intraday_profile': intraday_profile,
+        'forecast_top_down_sku': forecast_top_down_sku,
+    }
+
+
+def to_result_rows(base_columns: ColumnarResult) -> List[Tuple]:
+    # Giống result_rows của client.query: tuple theo KPI_SKU_BASE_COLUMNS, NaN -> None
+    python_columns = []
+    for name in KPI_SKU_BASE_COLUMNS:
+        values = base_columns.python_column(name)
+        if KPI_SKU_BASE_DTYPES.get(name) == 'f8':
+            values = [None if isinstance(v, float) and math.isnan(v) else v for v in values]
+        python_columns.append(values)
+    return list(zip(*python_columns))
+
+
+def run_engine(calculator: KPISKUCalculator, inputs: Dict, engine: str) -> Tuple[object, float]:
+    """
+    engine: 'loop' (calculate_kpi_sku_rows), 'vectorized' (calculate_kpi_sku_rows_vectorized, ra list dict)
+    hoặc 'columns' (calculate_kpi_sku_columns_vectorized, chỉ tính cột)
+    """
+    today = inputs['today']
+    actual_by_sku_cache = {today: inputs['actual_by_sku_today']}
+    started = time.perf_counter()
+    if engine == 'columns':
+        results = calculator.calculate_kpi_sku_columns_vectorized(
+            base_columns=inputs['base_columns'],
+            actual_columns=inputs['actual_columns'],
+            today=today,
+            cutoff_hour=inputs['cutoff_hour'],
+            intraday_profile=inputs['intraday_profile'],
+            forecast_top_down_sku=inputs['forecast_top_down_sku'],
+            until_hour=inputs['cutoff_hour'] + 1,
+            actual_by_sku_cache=actual_by_sku_cache
+        )
+    elif engine == 'vectorized':
+        results = calculator.calculate_kpi_sku_rows_vectorized(
+            base_columns=inputs['base_columns'],
+            actual_columns=inputs['actual_columns'],
+            today=today,
+            cutoff_hour=inputs['cutoff_hour'],
+            intraday_profile=inputs['intraday_profile'],
+            forecast_top_down_sku=inputs['forecast_top_down_sku'],
+            until_hour=inputs['cutoff_hour'] + 1,
+            actual_by_sku_cache=actual_by_sku_cache
+        )
+    else:
+        rows = inputs['result_rows']
+        actual_lookup = inputs['actual_columns'].to_lookup(
+            ['calendar_date', 'channel', 'brand_name', 'sku'], 'actual_amount'
+        )
+        results = calculator.calculate_kpi_sku_rows(
+            rows=rows,
+            actual_lookup=actual_lookup,
+            today=today,
+            cutoff_hour=inputs['cutoff_hour'],
+            intraday_profile=inputs['intraday_profile'],
+            forecast_top_down_sku=inputs['forecast_top_down_sku'],
+            until_hour=inputs['cutoff_hour'] + 1,
+            actual_by_sku_cache=actual_by_sku_cache
+        )
+    return results, time.perf_counter() - started
+
+
+def compare_results(loop_results: List[Dict], vectorized_results: List[Dict]) -> Dict[str, Dict]:
+    if len(loop_results) != len(vectorized_results):
+        raise AssertionError(f"row count differs: {len(loop_results)} vs {len(vectorized_results)}")
+
+    report = {}
+    for field in COMPARED_FIELDS:
+        expected = np.array([float(row[field] or 0) for row in loop_results], dtype=np.float64)
+        actual = np.array([float(row[field] or 0) for row in vectorized_results], dtype=np.float64)
+        close = np.isclose(actual, expected, rtol=KPI_SKU_VECTORIZED_REL_TOL, atol=KPI_SKU_VECTORIZED_ABS_TOL)
+        report[field] = {
+            'max_abs_diff': float(np.max(np.abs(actual - expected))) if len(actual) else 0.0,
+            'mismatches': int((~close).sum())
+        }
+    return report
+
+
+if __name__ == "__main__":
+    sizes = [10_000, 100_000, 1_000_000]
+    skip_loop_above = None
+    seed = 42
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--sizes" and i + 1 < len(sys.argv):
+            sizes = [int(size) for size in sys.argv[i + 1].split(",") if size.strip()]
+            i += 2
+        elif sys.argv[i] == "--skip-loop-above" and i + 1 < len(sys.argv):
+            skip_loop_above = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--seed" and i + 1 < len(sys.argv):
+            seed = int(sys.argv[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    offline_client = OfflineClient()
+    calculator = KPISKUCalculator(Constants(), client=offline_client)
+
+    print(f"Tolerance: rel={KPI_SKU_VECTORIZED_REL_TOL}, abs={KPI_SKU_VECTORIZED_ABS_TOL}")
+    # columns (s): chỉ phần tính toán numpy; vector (s): gồm cả tạo list dict cho save_kpi_sku
+    print(f"{'rows':>10} {'loop (s)':>10} {'columns (s)':>12} {'vector (s)':>11} {'speedup':>8}  parity")
+    failed = False
+    for size in sizes:
+        inputs = generate_inputs(size, seed=seed)
+        _, columns_seconds = run_engine(calculator, inputs, engine='columns')
+        vectorized_results, vectorized_seconds = run_engine(calculator, inputs, engine='vectorized')
+
+        if skip_loop_above is not None and size > skip_loop_above:
+            print(
+                f"{size:>10} {'-':>10} {columns_seconds:>12.3f} {vectorized_seconds:>11.3f} "
+                f"{'-':>8}  (loop skipped)"
+            )
+            continue
+
+        inputs['result_rows'] = to_result_rows(inputs['base_columns'])
+        loop_results, loop_seconds = run_engine(calculator, inputs, engine='loop')
+        report = compare_results(loop_results, vectorized_results)
+        mismatches = sum(field['mismatches'] for field in report.values())
+        max_diff = max(field['max_abs_diff'] for field in report.values())
+        parity = "OK" if mismatches == 0 else f"FAILED ({mismatches} values)"
+        failed = failed or mismatches > 0
+        print(
+            f"{size:>10} {loop_seconds:>10.3f} {columns_seconds:>12.3f} {vectorized_seconds:>11.3f} "
+            f"{loop_seconds / vectorized_seconds:>7.1f}x  {parity}, max abs diff {max_diff:.3e}"
+        )
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,113 @@
+"""
+So sánh kpi_sku_metadata tính từ history_cache (classify_skus, Python) với query CTE gốc (chạy trong ClickHouse)
+trên cùng 3 tháng gần nhất. Chỉ đọc, không insert vào hskcdp.kpi_sku_metadata.
+
+    python -m benchmarks.kpi_sku_metadata_history_cache [--target-month M] [--target-year Y] [--cache-dir DIR]
+
+--cache-dir mặc định KPI_HISTORY_CACHE_DIR, không có thì dùng thư mục tạm (cache được điền lần đầu).
+So theo key (brand_name, sku), khớp tuyệt đối (Decimal): revenue / tổng cộng bằng int64 đúng scale của
+total_amount, các tỷ lệ cắt về scale đó giống phép chia Decimal của ClickHouse (clickhouse_decimal_divide).
+Chạy ngoài thời điểm có transaction mới để 2 lần đọc thấy cùng dữ liệu.
+"""
+import os
+import sys
+import time
+import tempfile
+from datetime import date
+from typing import Dict, List, Tuple
+from src.utils.constants import Constants
+from src.utils.clickhouse_client import get_client
+from src.utils.query_helper import RevenueQueryHelper
+from src.utils.history_cache import HistoryCache
+from src.etl.kpi_sku_metadata import KPISKUMetadataCalculator
+
+COMPARED_FIELDS = [
+    'revenue', 'total_revenue_by_brand', 'revenue_distribution_by_sku', 'cum_rev_share',
+    'sku_classification', 'class_revenue', 'revenue_share_in_class'
+]
+
+
+def get_key(row: Dict) -> Tuple:
+    return (row['brand_name'], row['sku'])
+
+
+def compare_rows(expected_rows: List[Dict], actual_rows: List[Dict]) -> Dict[str, Dict]:
+    report = {}
+    for field in COMPARED_FIELDS:
+        mismatches = [
+            (get_key(expected), expected[field], actual[field])
+            for expected, actual in zip(expected_rows, actual_rows)
+            if expected[field] != actual[field]
+        ]
+        report[field] = {'mismatches': len(mismatches), 'examples': mismatches[:3]}
+    return report
+
+
+if __name__ == "__main__":
+    constants = Constants()
+    target_year = constants.KPI_YEAR_2026
+    target_month = None
+    cache_dir = os.getenv("KPI_HISTORY_CACHE_DIR", "")
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--target-month" and i + 1 < len(sys.argv):
+            target_month = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--target-year" and i + 1 < len(sys.argv):
+            target_year = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--cache-dir" and i + 1 < len(sys.argv):
+            cache_dir = sys.argv[i + 1]
+            i += 2
+        else:
+            i += 1
+
+    if target_month is None:
+        today = date.today()
+        target_month = today.month if today.year == target_year else 1
+    if not cache_dir:
+        cache_dir = tempfile.mkdtemp(prefix="kpi_history_cache_")
+
+    client = get_client()
+    sql_helper = RevenueQueryHelper(client=client)
+    # Tắt cache cho đường SQL kể cả khi có KPI_HISTORY_CACHE_DIR
+    sql_helper.history_cache = None
+    cache_helper = RevenueQueryHelper(client=client, history_cache=HistoryCache(client, cache_dir))
+
+    started = time.perf_counter()
+    sql_rows = KPISKUMetadataCalculator(constants, client=client, revenue_helper=sql_helper).calculate_kpi_sku_metadata(
+        target_year, target_month
+    )
+    sql_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cache_rows = KPISKUMetadataCalculator(constants, client=client, revenue_helper=cache_helper).calculate_kpi_sku_metadata(
+        target_year, target_month
+    )
+    cache_seconds = time.perf_counter() - started
+    print(f"kpi_sku_metadata {target_month}/{target_year}: sql {len(sql_rows)} rows in {sql_seconds:.2f}s, "
+          f"history cache {len(cache_rows)} rows in {cache_seconds:.2f}s "
+          f"(decimal scale {cache_helper.history_cache.get_decimal_scale()}, cache {cache_dir})")
+
+    sql_by_key = {get_key(row): row for row in sql_rows}
+    cache_by_key = {get_key(row): row for row in cache_rows}
+    missing = sql_by_key.keys() - cache_by_key.keys()
+    extra = cache_by_key.keys() - sql_by_key.keys()
+    if missing or extra:
+        print(f"FAILED: {len(missing)} keys only in sql, {len(extra)} keys only in history cache")
+        sys.exit(1)
+
+    keys = sorted(sql_by_key.keys())
+    report = compare_rows([sql_by_key[key] for key in keys], [cache_by_key[key] for key in keys])
+
+    failed = False
+    for field, stats in report.items():
+        status = "OK" if stats['mismatches'] == 0 else f"FAILED ({stats['mismatches']} values)"
+        failed = failed or stats['mismatches'] > 0
+        print(f"  {field:<28} {status}")
+        for key, expected, actual in stats['examples']:
+            print(f"      {key}: sql {expected}, history cache {actual}")
+
+    if failed:
+        sys.exit(1)
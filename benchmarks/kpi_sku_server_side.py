@@ -0,0 +1,205 @@
+"""
+Parity check kpi_sku server-side (get_kpi_sku_server_side_query, chạy trong ClickHouse) với engine Python
+(calculate_kpi_sku_rows_vectorized) trên 1 tháng giả lập cố định (benchmarks.synthetic, seed cố định)
+load vào ClickHouse LOCAL. Chỉ đọc kpi_sku, không insert.
+
+    docker compose -f infrastructure/docker/docker-compose.yml --profile benchmark up -d clickhouse
+    python -m benchmarks.kpi_sku_server_side [--seed 42] [--brands 20] [--skus-per-brand 20]
+        [--orders-per-day 300] [--no-snapshot] [--allow-remote]
+
+Kết nối như benchmarks.pipeline_stages (BENCHMARK_CLICKHOUSE_*, KHÔNG đọc CLICKHOUSE_* trong .env); bảng
+hskcdp.* trên server benchmark bị DROP + load lại (load_parity_month). Tháng target = tháng hiện tại, dữ liệu
+tới đầu giờ hiện tại: cùng seed + cùng giờ chạy cho cùng dữ liệu. Edge case:
+    - sku mới / brand mới (không có trong kpi_sku_metadata): Python ở cả 2 mode, không nằm trong phần so sánh
+    - channel PARITY_NULL_ADJUSTMENT_CHANNEL không có kpi_channel_adjustment -> kpi_brand_adjustment NULL
+      (kpi_sku_adjustment = 0)
+    - channel PROFILE_MISSING_CHANNEL bị bỏ khỏi profile intraday: sku của channel đó không có share_completed
+    - ngày quá khứ / hôm nay / tương lai
+So sánh theo key (calendar_date, channel, brand_name, sku) với tolerance của benchmark kpi_sku_engine.
+"""
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+import numpy as np
+from src.utils.query_helper import RevenueQueryHelper
+from src.utils.transaction_snapshot import TransactionSnapshotCache
+from src.utils.intraday_profile import IntradayProfile
+from src.etl.kpi_sku import KPISKUCalculator, KPI_SKU_INSERT_COLUMNS
+from benchmarks.kpi_sku_engine import compare_results
+from benchmarks.pipeline_stages import create_benchmark_client
+from benchmarks.synthetic import (
+    SyntheticDataset, SYNTHETIC_DATABASE, PARITY_SEED, PARITY_BRANDS, PARITY_SKUS_PER_BRAND,
+    PARITY_ORDERS_PER_DAY, load_parity_month
+)
+
+KEY_COLUMNS = ['calendar_date', 'channel', 'brand_name', 'sku']
+TEXT_COLUMNS = ['date_label', 'sku_classification', 'category_name']
+PROFILE_MISSING_CHANNEL = 'OFFLINE_HASAKI'
+
+
+def get_key(row: Dict) -> Tuple:
+    return tuple(str(row[name]) for name in KEY_COLUMNS)
+
+
+def drop_profile_key(profile: IntradayProfile, key: str) -> IntradayProfile:
+    # Profile giống hệt nhưng không có key (share_completed -> 0 ở cả 2 mode)
+    return IntradayProfile(
+        profile.dimension,
+        {
+            profile_key: dict(enumerate(hourly))
+            for profile_key, hourly in profile.hourly_pct.items()
+            if profile_key != key
+        },
+        days_back=profile.days_back,
+        profile_date=profile.profile_date
+    )
+
+
+def run_python(calculator: KPISKUCalculator, target_year: int, target_month: int) -> Tuple[List[Dict], Dict, float]:
+    started = time.perf_counter()
+    inputs = calculator.get_kpi_sku_inputs(target_year, target_month, base_mode='columns')
+    inputs['intraday_profile'] = drop_profile_key(inputs['intraday_profile'], PROFILE_MISSING_CHANNEL)
+    results = calculator.calculate_kpi_sku_rows_vectorized(
+        base_columns=inputs['base'],
+        actual_columns=inputs['actual_columns'],
+        today=inputs['today'],
+        cutoff_hour=inputs['cutoff_hour'],
+        intraday_profile=inputs['intraday_profile'],
+        forecast_top_down_sku=inputs['forecast_top_down_sku'],
+        until_hour=inputs['until_hour'],
+        actual_by_sku_cache=inputs['actual_by_sku_cache']
+    )
+    return results, inputs, time.perf_counter() - started
+
+
+def run_server_side(
+    calculator: KPISKUCalculator,
+    target_year: int,
+    target_month: int,
+    inputs: Dict
+) -> Tuple[List[Dict], float]:
+    # Dùng cùng today / cutoff_hour / profile với bản Python
+    started = time.perf_counter()
+    query = calculator.get_kpi_sku_server_side_query(
+        target_year,
+        target_month,
+        today=inputs['today'],
+        cutoff_hour=inputs['cutoff_hour'],
+        intraday_profile=inputs['intraday_profile'],
+        now=datetime.now()
+    )
+    result = calculator.client.query(query)
+    rows = [dict(zip(KPI_SKU_INSERT_COLUMNS, row)) for row in result.result_rows]
+    return rows, time.perf_counter() - started
+
+
+def get_edge_case_counts(rows: List[Dict], inputs: Dict) -> Dict[str, int]:
+    today = inputs['today']
+    return {
+        'past rows': sum(1 for row in rows if row['calendar_date'] < today),
+        'today rows': sum(1 for row in rows if row['calendar_date'] == today),
+        'future rows': sum(1 for row in rows if row['calendar_date'] > today),
+        'today rows without profile': sum(
+            1 for row in rows if row['calendar_date'] == today and row['channel'] == PROFILE_MISSING_CHANNEL
+        ),
+        # kpi_brand_adjustment NULL (channel không có kpi_channel_adjustment) -> kpi_sku_adjustment = 0
+        'NULL kpi_brand_adjustment': int(np.isnan(inputs['base']['kpi_brand_adjustment']).sum()),
+        'new skus (python only)': len(inputs['new_skus']),
+    }
+
+
+if __name__ == "__main__":
+    n_brands = PARITY_BRANDS
+    skus_per_brand = PARITY_SKUS_PER_BRAND
+    orders_per_day = PARITY_ORDERS_PER_DAY
+    seed = PARITY_SEED
+    use_snapshot = True
+    allow_remote = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--seed" and i + 1 < len(sys.argv):
+            seed = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--brands" and i + 1 < len(sys.argv):
+            n_brands = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--skus-per-brand" and i + 1 < len(sys.argv):
+            skus_per_brand = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--orders-per-day" and i + 1 < len(sys.argv):
+            orders_per_day = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--no-snapshot":
+            use_snapshot = False
+            i += 1
+        elif sys.argv[i] == "--allow-remote":
+            allow_remote = True
+            i += 1
+        else:
+            i += 1
+
+    dataset = SyntheticDataset(
+        n_brands=n_brands,
+        skus_per_brand=skus_per_brand,
+        orders_per_day=orders_per_day,
+        now=datetime.now().replace(minute=0, second=0),
+        seed=seed
+    )
+    dataset.generate()
+    target_year, target_month = dataset.target_year, dataset.target_month
+    print(f"Synthetic month {target_month}/{target_year} (seed {seed}, now {dataset.now})")
+
+    create_benchmark_client(database='default', allow_remote=allow_remote).command(
+        f"CREATE DATABASE IF NOT EXISTS {SYNTHETIC_DATABASE}"
+    )
+    client = create_benchmark_client(allow_remote=allow_remote)
+    load_parity_month(client, dataset)
+
+    revenue_helper = RevenueQueryHelper(
+        client=client,
+        snapshot_cache=TransactionSnapshotCache(client) if use_snapshot else None
+    )
+    calculator = KPISKUCalculator(dataset.constants, client=client, revenue_helper=revenue_helper)
+
+    python_rows, inputs, python_seconds = run_python(calculator, target_year, target_month)
+    server_rows, server_seconds = run_server_side(calculator, target_year, target_month, inputs)
+    print(f"kpi_sku {target_month}/{target_year}: python {len(python_rows)} rows in {python_seconds:.2f}s, "
+          f"server-side {len(server_rows)} rows in {server_seconds:.2f}s")
+
+    for name, count in get_edge_case_counts(python_rows, inputs).items():
+        print(f"  {name:<28} {count:>8}")
+        if count == 0:
+            # vd hôm nay là ngày đầu / cuối tháng thì không có ngày quá khứ / tương lai
+            print(f"  WARNING: edge case '{name}' is not covered by this month")
+
+    python_by_key = {get_key(row): row for row in python_rows}
+    server_by_key = {get_key(row): row for row in server_rows}
+    missing = python_by_key.keys() - server_by_key.keys()
+    extra = server_by_key.keys() - python_by_key.keys()
+    if missing or extra:
+        print(f"FAILED: {len(missing)} keys only in python, {len(extra)} keys only in server-side")
+        sys.exit(1)
+
+    keys = sorted(python_by_key.keys())
+    expected = [python_by_key[key] for key in keys]
+    actual = [server_by_key[key] for key in keys]
+    report = compare_results(expected, actual)
+    report['text'] = {
+        'max_abs_diff': 0.0,
+        'mismatches': sum(
+            1 for left, right in zip(expected, actual)
+            for name in TEXT_COLUMNS
+            if str(left[name]) != str(right[name])
+        )
+    }
+
+    failed = False
+    for field, stats in report.items():
+        status = "OK" if stats['mismatches'] == 0 else f"FAILED ({stats['mismatches']} values)"
+        failed = failed or stats['mismatches'] > 0
+        print(f"  {field:<20} {status}, max abs diff {stats['max_abs_diff']:.3e}")
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,326 @@
+"""
+Benchmark numeric policy (decimal / float / fixed, src/utils/numeric_policy.py) trên dữ liệu giả lập,
+không cần ClickHouse:
+    - convert: safe_decimal / safe_float / policy.amount trên N giá trị
+    - stage: vòng lặp calculate_kpi_day_channel và calculate_kpi_brand (input in-memory như trong pipeline)
+    - parity: output float / fixed so với decimal (max abs diff, max rel diff, số giá trị lệch >= 1 VND)
+
+    python -m benchmarks.numeric_policy [--sizes 10000,100000] [--seed 42] [--repeat 3]
+
+Thời gian stage lấy min của --repeat lần chạy. Fail nếu float lệch > FLOAT_MAX_ABS_DIFF,
+fixed lệch >= FIXED_MAX_ABS_DIFF (có giá trị lệch >= 1 VND) so với decimal.
+"""
+import gc
+import sys
+import math
+import time
+import calendar
+import numpy as np
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from src.utils.constants import Constants
+from src.utils.columnar import ColumnarResult, DATE_DTYPE
+from src.utils.numeric_helper import safe_decimal, safe_float
+from src.utils.numeric_policy import NUMERIC_POLICIES, NUMERIC_DECIMAL, NUMERIC_FLOAT, get_numeric_policy
+from src.etl.kpi_channel import KPIDayChannelCalculator
+from src.etl.kpi_brand import KPIBrandCalculator
+from benchmarks.kpi_sku_engine import OfflineClient
+
+CHANNELS = ['ONLINE_HASAKI', 'OFFLINE_HASAKI', 'ECOM']
+CHANNEL_FIELDS = ['kpi_channel_initial', 'actual', 'gap', 'kpi_channel_adjustment', 'forecast']
+BRAND_FIELDS = ['pct_of_rev_by_brand', 'kpi_brand_initial', 'actual', 'gap', 'kpi_brand_adjustment', 'forecast']
+# Lệch tối đa cho phép so với decimal (VND): float chỉ sai số làm tròn nhị phân; fixed làm tròn 1 lần
+# ở output (<= 0.5 + sai số float64), không được có giá trị nào lệch >= 1 VND
+FLOAT_MAX_ABS_DIFF = 0.01
+FIXED_MAX_ABS_DIFF = 1.0
+
+
+def to_decimal(value: float) -> Decimal:
+    # Giống giá trị đọc từ cột Decimal của ClickHouse
+    return Decimal(str(round(float(value), 2)))
+
+
+class SyntheticRevenueHelper:
+    """
+    Thay RevenueQueryHelper cho calculate_kpi_day_channel / calculate_kpi_brand, trả dữ liệu sinh sẵn.
+    Tháng giả lập = tháng hiện tại (các calculator dùng date.today() để tách quá khứ / hôm nay / tương lai).
+    """
+
+    def __init__(self, n_rows: int, seed: int = 42):
+        rng = np.random.default_rng(seed)
+        today = date.today()
+        self.target_year = today.year
+        self.target_month = today.month
+        n_days = calendar.monthrange(today.year, today.month)[1]
+        self.days = [date(today.year, today.month, d) for d in range(1, n_days + 1)]
+
+        # kpi_channel: ngày × channel; thêm channel giả để đủ n_rows
+        n_channels = max(len(CHANNELS), math.ceil(n_rows / n_days))
+        self.channels = CHANNELS + [f"CHANNEL_{i}" for i in range(n_channels - len(CHANNELS))]
+        self.kpi_day_data = [
+            {
+                'calendar_date': day,
+                'kpi_day_adjustment': None if rng.random() < 0.05 else to_decimal(rng.uniform(1e8, 5e9)),
+                'eod': to_decimal(rng.uniform(1e8, 5e9)),
+            }
+            for day in self.days
+        ]
+        rev_pct = {channel: to_decimal(rng.uniform(0, 1)) for channel in self.channels}
+        self.kpi_day_with_channel_metadata = [
+            {
+                'calendar_date': day,
+                'year': day.year,
+                'month': day.month,
+                'day': day.day,
+                'date_label': 'Normal day',
+                'channel': channel,
+                'rev_pct_adjustment': rev_pct[channel],
+                'kpi_day_initial': to_decimal(rng.uniform(1e8, 5e9)),
+            }
+            for day in self.days
+            for channel in self.channels
+        ]
+        self.actual_by_channel_and_date = {
+            day: {channel: to_decimal(rng.uniform(0, 1e9)) for channel in self.channels}
+            for day in self.days if day <= today
+        }
+        # Cùng dữ liệu dạng cột (float64) như query_columns trả về cho policy float / fixed
+        self.kpi_day_with_channel_metadata_columns = ColumnarResult(
+            list(self.kpi_day_with_channel_metadata[0].keys()),
+            {
+                name: np.array(
+                    [row[name] for row in self.kpi_day_with_channel_metadata],
+                    dtype=DATE_DTYPE if name == 'calendar_date' else (
+                        object if name in ('date_label', 'channel') else (
+                            np.int64 if name in ('year', 'month', 'day') else np.float64))
+                )
+                for name in self.kpi_day_with_channel_metadata[0]
+            }
+        )
+        actual_channel_keys = [
+            (day, channel) for day, by_channel in self.actual_by_channel_and_date.items() for channel in by_channel
+        ]
+        self.actual_by_channel_columns = ColumnarResult(
+            ['calendar_date', 'channel', 'actual_amount'],
+            {
+                'calendar_date': np.array([key[0] for key in actual_channel_keys], dtype=DATE_DTYPE),
+                'channel': np.array([key[1] for key in actual_channel_keys], dtype=object),
+                'actual_amount': np.array(
+                    [self.actual_by_channel_and_date[day][channel] for day, channel in actual_channel_keys],
+                    dtype=np.float64
+                ),
+            }
+        )
+        self.forecast_by_channel_for_today = {channel: to_decimal(rng.uniform(0, 1e9)) for channel in self.channels}
+
+        # kpi_brand: ngày × 3 channel × brand; ~2% brand mới, ~2% brand có actual nhưng không có metadata
+        n_brands = max(1, math.ceil(n_rows / (n_days * len(CHANNELS))))
+        brand_names = [f"BRAND_{i}" for i in range(n_brands)]
+        self.kpi_brand_metadata = [
+            {'brand_name': brand_name, 'per_of_rev_by_brand_adj': to_decimal(rng.uniform(0, 0.05))}
+            for brand_name in brand_names
+        ]
+        extra_brands = [f"EXTRA_BRAND_{i}" for i in range(max(1, n_brands // 50))]
+        self.new_brand_this_month = {f"NEW_BRAND_{i}" for i in range(max(1, n_brands // 50))}
+
+        actual_keys = [
+            (day, channel, brand_name)
+            for day in self.days if day <= today
+            for channel in CHANNELS
+            for brand_name in brand_names + extra_brands + sorted(self.new_brand_this_month)
+        ]
+        actual_keys = [key for key in actual_keys if rng.random() < 0.7]
+        self.actual_by_brand_columns = ColumnarResult(
+            ['calendar_date', 'channel', 'brand_name', 'actual_amount'],
+            {
+                'calendar_date': np.array([key[0] for key in actual_keys], dtype=DATE_DTYPE),
+                'channel': np.array([key[1] for key in actual_keys], dtype=object),
+                'brand_name': np.array([key[2] for key in actual_keys], dtype=object),
+                'actual_amount': rng.uniform(0, 1e8, size=len(actual_keys)),
+            }
+        )
+        self.forecast_by_brand_for_today = {
+            channel: {brand_name: to_decimal(rng.uniform(0, 1e8)) for brand_name in brand_names}
+            for channel in CHANNELS
+        }
+
+    def gather(self, calls: Dict) -> Dict:
+        return {name: call() for name, call in calls.items()}
+
+    def get_kpi_day_with_channel_metadata(self, target_year: int, target_month: int) -> List[Dict]:
+        return self.kpi_day_with_channel_metadata
+
+    def get_actual_by_channel_and_date(self, target_year: int, target_month: int) -> Dict:
+        return self.actual_by_channel_and_date
+
+    def get_kpi_day_with_channel_metadata_columns(self, target_year: int, target_month: int) -> ColumnarResult:
+        return self.kpi_day_with_channel_metadata_columns
+
+    def get_actual_by_channel_and_date_columns(self, target_year: int, target_month: int) -> ColumnarResult:
+        return self.actual_by_channel_columns
+
+    def get_forecast_by_channel_for_today(self) -> Dict:
+        return self.forecast_by_channel_for_today
+
+    def get_actual_by_brand_channel_and_date_columns(self, target_year: int, target_month: int) -> ColumnarResult:
+        return self.actual_by_brand_columns
+
+    def get_forecast_by_brand_for_today(self) -> Dict:
+        return self.forecast_by_brand_for_today
+
+    def get_new_brand_this_month(self) -> set:
+        return self.new_brand_this_month
+
+
+def get_brand_channel_data(kpi_channel_data: List[Dict]) -> List[Dict]:
+    # Input kpi_brand: chỉ 3 channel thật (channel giả chỉ để tăng số dòng kpi_channel)
+    return [row for row in kpi_channel_data if row['channel'] in CHANNELS]
+
+
+def run_stages(helper: SyntheticRevenueHelper, policy_name: str) -> Tuple[List[Dict], float, List[Dict], float]:
+    constants = Constants()
+    numeric = get_numeric_policy(name=policy_name)
+    client = OfflineClient()
+    # Output của policy trước vẫn giữ để so parity: freeze để GC không quét lại trong lần đo này
+    gc.collect()
+    gc.freeze()
+
+    channel_calculator = KPIDayChannelCalculator(constants, client=client, revenue_helper=helper, numeric=numeric)
+    started = time.perf_counter()
+    kpi_channel_data = channel_calculator.calculate_kpi_day_channel(
+        helper.target_year,
+        helper.target_month,
+        kpi_day_data=helper.kpi_day_data
+    )
+    channel_seconds = time.perf_counter() - started
+
+    brand_calculator = KPIBrandCalculator(constants, client=client, revenue_helper=helper, numeric=numeric)
+    brand_input = get_brand_channel_data(kpi_channel_data)
+    started = time.perf_counter()
+    kpi_brand_data = brand_calculator.calculate_kpi_brand(
+        helper.target_year,
+        helper.target_month,
+        kpi_channel_data=brand_input,
+        kpi_brand_metadata=helper.kpi_brand_metadata
+    )
+    brand_seconds = time.perf_counter() - started
+    return kpi_channel_data, channel_seconds, kpi_brand_data, brand_seconds
+
+
+def compare_to_decimal(
+    expected_rows: List[Dict],
+    actual_rows: List[Dict],
+    key_fields: List[str],
+    fields: List[str]
+) -> Dict:
+    """
+    So theo key; None phải khớp None. Trả về max abs diff, max rel diff, số giá trị lệch >= 1 VND
+    """
+    actual_by_key = {tuple(row[name] for name in key_fields): row for row in actual_rows}
+    report = {'max_abs_diff': 0.0, 'max_rel_diff': 0.0, 'over_1_vnd': 0, 'null_mismatches': 0, 'missing': 0}
+    for expected in expected_rows:
+        actual = actual_by_key.get(tuple(expected[name] for name in key_fields))
+        if actual is None:
+            report['missing'] += 1
+            continue
+        for field in fields:
+            if expected[field] is None or actual[field] is None:
+                if expected[field] is not actual[field]:
+                    report['null_mismatches'] += 1
+                continue
+            diff = abs(float(actual[field]) - float(expected[field]))
+            report['max_abs_diff'] = max(report['max_abs_diff'], diff)
+            if expected[field] != 0:
+                report['max_rel_diff'] = max(report['max_rel_diff'], diff / abs(float(expected[field])))
+            if diff >= 1:
+                report['over_1_vnd'] += 1
+    return report
+
+
+def time_convert(values: List, convert) -> float:
+    started = time.perf_counter()
+    for value in values:
+        convert(value)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    sizes = [10_000, 100_000]
+    seed = 42
+    repeat = 3
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--sizes" and i + 1 < len(sys.argv):
+            sizes = [int(size) for size in sys.argv[i + 1].split(",") if size.strip()]
+            i += 2
+        elif sys.argv[i] == "--seed" and i + 1 < len(sys.argv):
+            seed = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--repeat" and i + 1 < len(sys.argv):
+            repeat = max(1, int(sys.argv[i + 1]))
+            i += 2
+        else:
+            i += 1
+
+    failed = False
+    for size in sizes:
+        rng = np.random.default_rng(seed)
+        raw_values = [to_decimal(v) for v in rng.uniform(0, 1e9, size=size)] + rng.uniform(0, 1e9, size=size).tolist()
+        print(f"\nconvert {len(raw_values)} values (Decimal + float):")
+        print(f"  {'safe_decimal':<22} {time_convert(raw_values, safe_decimal):>8.3f}s")
+        print(f"  {'safe_float':<22} {time_convert(raw_values, safe_float):>8.3f}s")
+        for policy_name in NUMERIC_POLICIES:
+            policy = get_numeric_policy(name=policy_name)
+            print(f"  {policy_name + '.amount':<22} {time_convert(raw_values, policy.amount):>8.3f}s")
+
+        helper = SyntheticRevenueHelper(size, seed=seed)
+        outputs = {}
+        print(f"\nstages ~{size} rows:")
+        print(f"  {'policy':<8} {'kpi_channel (s)':>16} {'rows':>8} {'kpi_brand (s)':>14} {'rows':>8}")
+        for policy_name in NUMERIC_POLICIES:
+            channel_times, brand_times = [], []
+            for _ in range(repeat):
+                kpi_channel_data, channel_seconds, kpi_brand_data, brand_seconds = run_stages(helper, policy_name)
+                channel_times.append(channel_seconds)
+                brand_times.append(brand_seconds)
+            channel_seconds, brand_seconds = min(channel_times), min(brand_times)
+            outputs[policy_name] = (kpi_channel_data, kpi_brand_data)
+            print(
+                f"  {policy_name:<8} {channel_seconds:>16.3f} {len(kpi_channel_data):>8} "
+                f"{brand_seconds:>14.3f} {len(kpi_brand_data):>8}"
+            )
+
+        print("\nparity vs decimal:")
+        expected_channel, expected_brand = outputs[NUMERIC_DECIMAL]
+        for policy_name in NUMERIC_POLICIES:
+            if policy_name == NUMERIC_DECIMAL:
+                continue
+            max_allowed = FLOAT_MAX_ABS_DIFF if policy_name == NUMERIC_FLOAT else FIXED_MAX_ABS_DIFF
+            kpi_channel_data, kpi_brand_data = outputs[policy_name]
+            reports = {
+                'kpi_channel': compare_to_decimal(
+                    expected_channel, kpi_channel_data, ['calendar_date', 'channel'], CHANNEL_FIELDS
+                ),
+                'kpi_brand': compare_to_decimal(
+                    expected_brand, kpi_brand_data, ['calendar_date', 'channel', 'brand_name'], BRAND_FIELDS
+                ),
+            }
+            for stage_name, report in reports.items():
+                ok = (
+                    report['max_abs_diff'] <= max_allowed
+                    and (policy_name == NUMERIC_FLOAT or report['over_1_vnd'] == 0)
+                    and report['null_mismatches'] == 0
+                    and report['missing'] == 0
+                )
+                failed = failed or not ok
+                print(
+                    f"  {policy_name:<6} {stage_name:<12} {'OK' if ok else 'FAILED'}, "
+                    f"max abs diff {report['max_abs_diff']:.3e}, max rel diff {report['max_rel_diff']:.3e}, "
+                    f">= 1 VND: {report['over_1_vnd']}, null mismatches: {report['null_mismatches']}, "
+                    f"missing: {report['missing']}"
+                )
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,241 @@
+"""
+Benchmark từng stage của pipeline trên dữ liệu giả lập (benchmarks.synthetic) load vào ClickHouse LOCAL,
+report thời gian, số query / command / insert, top call-site (InstrumentedClient) và peak memory
+(tracemalloc) theo stage.
+
+    docker compose -f infrastructure/docker/docker-compose.yml --profile benchmark up -d clickhouse
+    python -m benchmarks.pipeline_stages [--brands 50] [--skus-per-brand 40] [--orders-per-day 2000]
+        [--stages kpi_day,kpi_channel] [--report benchmark_report.json] [--skip-load] [--dry-run]
+        [--no-tracemalloc] [--continue-on-error] [--seed 42] [--query-log queries.jsonl]
+
+Các calculator query thẳng SQL ClickHouse nên stand-in là 1 ClickHouse local (không có client in-memory).
+Kết nối qua BENCHMARK_CLICKHOUSE_HOST / PORT / USER / PASSWORD (mặc định localhost:18123, benchmark / benchmark),
+KHÔNG đọc CLICKHOUSE_* trong .env; host khác localhost phải thêm --allow-remote. Bảng hskcdp.* trên
+server benchmark bị DROP + tạo lại trước khi load (trừ --skip-load).
+--dry-run: chỉ sinh dữ liệu và in số dòng, không kết nối ClickHouse.
+"""
+import os
+import sys
+import json
+import resource
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+from clickhouse_connect import get_client as ch_get_client
+from src.utils.constants import Constants
+from src.utils.clickhouse_client import set_client
+from src.utils.query_instrumentation import (
+    InstrumentedClient, get_stage_query_report, write_query_report, TOP_CALL_SITES
+)
+from src.pipeline import PipelineRunner
+from benchmarks.synthetic import SyntheticDataset, SYNTHETIC_DATABASE, create_tables, load_dataset
+
+LOCAL_HOSTS = ['localhost', '127.0.0.1', '::1', 'clickhouse']
+
+
+def create_benchmark_client(database: str = SYNTHETIC_DATABASE, allow_remote: bool = False):
+    host = os.getenv("BENCHMARK_CLICKHOUSE_HOST", "localhost")
+    if host not in LOCAL_HOSTS and not allow_remote:
+        raise ValueError(
+            f"BENCHMARK_CLICKHOUSE_HOST={host} is not local; the benchmark drops and reloads {database}.* tables. "
+            f"Use --allow-remote to run against it anyway"
+        )
+    return ch_get_client(
+        host=host,
+        port=int(os.getenv("BENCHMARK_CLICKHOUSE_PORT", "18123")),
+        username=os.getenv("BENCHMARK_CLICKHOUSE_USER", "benchmark"),
+        password=os.getenv("BENCHMARK_CLICKHOUSE_PASSWORD", "benchmark"),
+        database=database,
+        secure=False,
+        autogenerate_session_id=False
+    )
+
+
+def get_max_rss_mb() -> float:
+    # ru_maxrss: KB trên Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_stages(
+    runner: PipelineRunner,
+    client: InstrumentedClient,
+    stage_names: Optional[List[str]] = None,
+    use_tracemalloc: bool = True,
+    continue_on_error: bool = False,
+    query_log: Optional[str] = None
+) -> List[Dict]:
+    """
+    Chạy từng stage 1 lần runner.run([stage]) để đo riêng; kết quả in-memory vẫn chuyển cho stage sau
+    qua runner.results như pipeline thường. query_log: ghi thêm record từng query (JSON lines, 1 dòng / stage)
+    """
+    results = []
+    failed = set()
+    for stage in runner.resolve_stages(stage_names):
+        if any(dep in failed for dep in stage.depends_on):
+            failed.add(stage.name)
+            results.append({'stage': stage.name, 'status': 'skipped'})
+            continue
+
+        client.drain()
+        if use_tracemalloc:
+            tracemalloc.reset_peak()
+        timing = runner.run([stage.name])[-1]
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if use_tracemalloc else None
+        query_report = get_stage_query_report(stage.name, client.drain(), status=timing['status'])
+        if query_log:
+            write_query_report(query_log, query_report)
+        kinds = [record['kind'] for record in query_report['records']]
+
+        results.append({
+            'stage': stage.name,
+            'status': timing['status'],
+            'seconds': timing['seconds'],
+            'rows': timing['rows'],
+            'queries': kinds.count('query') + kinds.count('stream'),
+            'commands': kinds.count('command'),
+            'inserts': kinds.count('insert'),
+            'clickhouse_seconds': query_report['seconds'],
+            'top_call_sites': query_report['by_call_site'][:TOP_CALL_SITES],
+            'peak_mb': round(peak_mb, 1) if peak_mb is not None else None,
+            'max_rss_mb': round(get_max_rss_mb(), 1),
+            'error': timing['error'],
+        })
+        if timing['status'] != 'ok':
+            failed.add(stage.name)
+            if not continue_on_error:
+                break
+    return results
+
+
+def print_results(results: List[Dict]) -> None:
+    print("")
+    print(
+        f"{'stage':<22} {'status':<8} {'seconds':>9} {'rows':>9} {'queries':>8} {'commands':>9} "
+        f"{'inserts':>8} {'ch (s)':>8} {'peak MB':>9} {'rss MB':>9}"
+    )
+    for result in results:
+        if result['status'] == 'skipped':
+            print(f"{result['stage']:<22} {'skipped':<8}")
+            continue
+        peak = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else "-"
+        rows = result['rows'] if result['rows'] is not None else "-"
+        print(
+            f"{result['stage']:<22} {result['status']:<8} {result['seconds']:>9.2f} {rows:>9} "
+            f"{result['queries']:>8} {result['commands']:>9} {result['inserts']:>8} "
+            f"{result['clickhouse_seconds']:>8.2f} {peak:>9} {result['max_rss_mb']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    n_brands = 50
+    skus_per_brand = 40
+    orders_per_day = 2000
+    seed = 42
+    stage_names = None
+    report_path = "benchmark_report.json"
+    skip_load = False
+    dry_run = False
+    use_tracemalloc = True
+    continue_on_error = False
+    allow_remote = False
+    query_log = None
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--brands" and i + 1 < len(sys.argv):
+            n_brands = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--skus-per-brand" and i + 1 < len(sys.argv):
+            skus_per_brand = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--orders-per-day" and i + 1 < len(sys.argv):
+            orders_per_day = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--seed" and i + 1 < len(sys.argv):
+            seed = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--stages" and i + 1 < len(sys.argv):
+            stage_names = [name.strip() for name in sys.argv[i + 1].split(",") if name.strip()]
+            i += 2
+        elif sys.argv[i] == "--report" and i + 1 < len(sys.argv):
+            report_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--skip-load":
+            skip_load = True
+            i += 1
+        elif sys.argv[i] == "--dry-run":
+            dry_run = True
+            i += 1
+        elif sys.argv[i] == "--no-tracemalloc":
+            use_tracemalloc = False
+            i += 1
+        elif sys.argv[i] == "--continue-on-error":
+            continue_on_error = True
+            i += 1
+        elif sys.argv[i] == "--query-log" and i + 1 < len(sys.argv):
+            query_log = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--allow-remote":
+            allow_remote = True
+            i += 1
+        else:
+            i += 1
+
+    constants = Constants()
+    dataset = SyntheticDataset(
+        n_brands=n_brands,
+        skus_per_brand=skus_per_brand,
+        orders_per_day=orders_per_day,
+        seed=seed
+    )
+    dataset.generate()
+    summary = dataset.get_summary()
+    print(f"Generated synthetic data in {dataset.generate_seconds:.2f}s "
+          f"({summary['start_date']} -> {summary['now']}, target {summary['target_month']}/{summary['target_year']}):")
+    for table, rows in summary['rows'].items():
+        print(f"  {table:<32} {rows:>12,}")
+    if dry_run:
+        sys.exit(0)
+
+    # Tạo database trước khi mở client mặc định database hskcdp (query dùng cả tên bảng không có schema)
+    create_benchmark_client(database='default', allow_remote=allow_remote).command(
+        f"CREATE DATABASE IF NOT EXISTS {SYNTHETIC_DATABASE}"
+    )
+    client = InstrumentedClient(create_benchmark_client(allow_remote=allow_remote))
+    # Code gọi get_client() trực tiếp (vd latest_state, intraday_profile) cũng dùng client local
+    set_client(client)
+
+    load_stats = None
+    if not skip_load:
+        create_tables(client, drop=True)
+        load_stats = load_dataset(client, dataset)
+
+    if use_tracemalloc:
+        tracemalloc.start()
+    runner = PipelineRunner(
+        constants,
+        client=client,
+        target_year=dataset.target_year,
+        target_month=dataset.target_month,
+        # client đã được bọc InstrumentedClient ở trên, không bọc lại theo KPI_QUERY_LOG
+        query_log=''
+    )
+    results = run_stages(runner, client, stage_names, use_tracemalloc, continue_on_error, query_log)
+    if use_tracemalloc:
+        tracemalloc.stop()
+    print_results(results)
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'dataset': summary,
+        'load': load_stats,
+        'snapshot_loads': runner.snapshot_cache.load_count if runner.snapshot_cache is not None else None,
+        'total_seconds': round(sum(result.get('seconds', 0.0) for result in results), 3),
+        'stages': results,
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nReport written to {report_path}")
+
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
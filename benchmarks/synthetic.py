@@ -0,0 +1,672 @@
+"""
+Sinh dữ liệu giả lập cùng schema với các bảng nguồn của pipeline trong hskcdp:
+object_sql_transaction_details, dim_date, raw_ecom_products, metadata_annually, kpi_month (version "Thang 1")
+và kpi_day_metadata / kpi_channel_metadata / kpi_brand_metadata / kpi_sku_metadata của tháng target.
+Quy mô: số brand, số sku / brand, số order / ngày. Dữ liệu là numpy theo cột, load vào ClickHouse local
+bằng BulkInsertWriter (SYNTHETIC_DDL tạo cả các bảng output của pipeline).
+
+Schema được suy ra từ query / insert trong src (chỉ đủ cột pipeline dùng), không phải DDL production.
+"""
+import time
+import calendar
+import numpy as np
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from src.utils.constants import Constants
+from src.utils.bulk_writer import BulkInsertWriter
+
+SYNTHETIC_DATABASE = 'hskcdp'
+
+# Platform -> channel giống CASE trong query_helper (platform khác ONLINE / OFFLINE -> ECOM)
+PLATFORMS = ['ONLINE_HASAKI', 'OFFLINE_HASAKI', 'SHOPEE', 'LAZADA', 'TIKTOK']
+PLATFORM_SHARES = [0.45, 0.30, 0.12, 0.08, 0.05]
+CHANNEL_BY_PLATFORM = {'ONLINE_HASAKI': 'ONLINE_HASAKI', 'OFFLINE_HASAKI': 'OFFLINE_HASAKI'}
+CATEGORIES = ['Skincare', 'Makeup', 'Haircare', 'Bodycare', 'Fragrance', 'none', None]
+CANCELED_RATE = 0.05
+# Uplift doanh thu theo date_label (so với Normal day)
+LABEL_UPLIFT = {
+    'Normal day': 1.0,
+    'Double Day': 3.0,
+    'Double Day +1': 1.4,
+    'Double Day -1': 1.3,
+    'Middle of month': 1.8,
+    'Middle of month +1': 1.2,
+    'Middle of month -1': 1.2,
+    'Pay Day': 1.6,
+    'Pay Day +1': 1.2,
+    'Pay Day -1': 1.1,
+    'Tet Duong Lich': 1.5,
+}
+PAY_DAY = 25
+MIDDLE_OF_MONTH = 15
+
+# Tháng cố định cho parity check server-side (load_parity_month): seed + quy mô nhỏ
+PARITY_SEED = 42
+PARITY_BRANDS = 20
+PARITY_SKUS_PER_BRAND = 20
+PARITY_ORDERS_PER_DAY = 300
+PARITY_NULL_ADJUSTMENT_CHANNEL = 'ECOM'
+
+DECIMAL = 'Decimal(40, 15)'
+SYNTHETIC_DDL = {
+    'object_sql_transaction_details': f"""
+        order_id String,
+        sku String,
+        brand_name String,
+        platform LowCardinality(String),
+        status LowCardinality(String),
+        total_amount Decimal(18, 2),
+        created_at DateTime,
+        updated_at DateTime
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    PARTITION BY toYYYYMM(created_at)
+    ORDER BY (toDate(created_at), brand_name, sku, order_id)""",
+    'dim_date': """
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        day UInt8,
+        date_label String,
+        priority_label String,
+        event_type String
+    ) ENGINE = ReplacingMergeTree
+    ORDER BY calendar_date""",
+    'raw_ecom_products': """
+        sku String,
+        category_name Nullable(String),
+        updated_at DateTime
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY sku""",
+    'metadata_annually': f"""
+        year UInt16,
+        month UInt8,
+        priority_label String,
+        uplift {DECIMAL},
+        pct_offline {DECIMAL},
+        pct_online {DECIMAL},
+        pct_ecom {DECIMAL}
+    ) ENGINE = MergeTree
+    ORDER BY (year, month, priority_label)""",
+    'kpi_month': f"""
+        version String,
+        year UInt16,
+        month UInt8,
+        kpi_initial {DECIMAL},
+        actual Nullable({DECIMAL}),
+        gap Nullable({DECIMAL}),
+        eom Nullable({DECIMAL}),
+        kpi_adjustment Nullable({DECIMAL}),
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (version, year, month)""",
+    'kpi_day_metadata': f"""
+        year UInt16,
+        month UInt8,
+        date_label String,
+        avg_total {DECIMAL},
+        uplift {DECIMAL},
+        so_ngay UInt32,
+        weight {DECIMAL},
+        total_weight_month {DECIMAL},
+        historical_start_date Date,
+        historical_end_date Date,
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, date_label)""",
+    'kpi_channel_metadata': f"""
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        day UInt8,
+        date_label String,
+        channel String,
+        rev_pct {DECIMAL},
+        rev_pct_adjustment {DECIMAL},
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, calendar_date, channel)""",
+    'kpi_brand_metadata': f"""
+        year UInt16,
+        month UInt8,
+        brand_name String,
+        per_of_rev_by_brand {DECIMAL},
+        pic String,
+        per_of_rev_by_brand_adj {DECIMAL},
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, brand_name)""",
+    'kpi_sku_metadata': f"""
+        year UInt16,
+        month UInt8,
+        brand_name String,
+        sku String,
+        revenue {DECIMAL},
+        total_revenue_by_brand {DECIMAL},
+        revenue_distribution_by_sku {DECIMAL},
+        cum_rev_share {DECIMAL},
+        sku_classification String,
+        class_revenue {DECIMAL},
+        revenue_share_in_class {DECIMAL},
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, brand_name, sku)""",
+    # Bảng output của pipeline (chỉ tạo, không sinh dữ liệu)
+    'kpi_day': f"""
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        day UInt8,
+        date_label String,
+        kpi_month {DECIMAL},
+        uplift {DECIMAL},
+        weight {DECIMAL},
+        weighted_left {DECIMAL},
+        total_weight_month {DECIMAL},
+        kpi_day_initial {DECIMAL},
+        actual Nullable({DECIMAL}),
+        gap Nullable({DECIMAL}),
+        kpi_day_adjustment Nullable({DECIMAL}),
+        eod Nullable({DECIMAL}),
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, calendar_date)""",
+    'kpi_channel': f"""
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        day UInt8,
+        date_label String,
+        channel String,
+        rev_pct {DECIMAL},
+        kpi_channel_initial {DECIMAL},
+        actual Nullable({DECIMAL}),
+        gap Nullable({DECIMAL}),
+        kpi_channel_adjustment Nullable({DECIMAL}),
+        forecast Nullable({DECIMAL}),
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, calendar_date, channel)""",
+    'kpi_brand': f"""
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        day UInt8,
+        date_label String,
+        channel String,
+        brand_name String,
+        pct_of_rev_by_brand {DECIMAL},
+        kpi_brand_initial {DECIMAL},
+        actual Nullable({DECIMAL}),
+        gap Nullable({DECIMAL}),
+        kpi_brand_adjustment Nullable({DECIMAL}),
+        forecast Nullable({DECIMAL}),
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, calendar_date, channel, brand_name)""",
+    'kpi_sku': f"""
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        date_label String,
+        channel String,
+        brand_name String,
+        sku String,
+        sku_classification String,
+        category_name Nullable(String),
+        revenue_share_in_class {DECIMAL},
+        kpi_sku_initial {DECIMAL},
+        actual Nullable({DECIMAL}),
+        gap Nullable({DECIMAL}),
+        kpi_sku_adjustment Nullable({DECIMAL}),
+        forecast Nullable({DECIMAL}),
+        created_at DateTime DEFAULT now(),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (calendar_date, channel, brand_name, sku)""",
+    'kpi_forecast': f"""
+        calendar_date Date,
+        year UInt16,
+        month UInt8,
+        day UInt8,
+        channel String,
+        brand_name String,
+        sku String,
+        forecast Nullable({DECIMAL}),
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month, calendar_date, channel, brand_name, sku)""",
+    'kpi_intraday_profile': f"""
+        profile_date Date,
+        dimension String,
+        key String,
+        days_back UInt16,
+        hour UInt8,
+        hour_pct {DECIMAL},
+        cumulative_pct {DECIMAL},
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (profile_date, dimension, key, days_back, hour)""",
+    'kpi_incremental_watermark': """
+        year UInt16,
+        month UInt8,
+        watermark DateTime,
+        updated_at DateTime DEFAULT now()
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (year, month)""",
+}
+
+
+def get_date_label(day: date) -> str:
+    # Nhãn ngày đơn giản hoá của dim_date (không có Tết âm lịch / Quốc tế phụ nữ)
+    last_day = calendar.monthrange(day.year, day.month)[1]
+    if day.month == 1 and day.day == 1:
+        return 'Tet Duong Lich'
+    if day.day == day.month:
+        return 'Double Day'
+    if day.day == day.month + 1:
+        return 'Double Day +1'
+    if day.day == day.month - 1:
+        return 'Double Day -1'
+    for anchor, label in ((MIDDLE_OF_MONTH, 'Middle of month'), (min(PAY_DAY, last_day), 'Pay Day')):
+        if day.day == anchor:
+            return label
+        if day.day == anchor + 1:
+            return f"{label} +1"
+        if day.day == anchor - 1:
+            return f"{label} -1"
+    return 'Normal day'
+
+
+class SyntheticDataset:
+    """
+    Dữ liệu 1 lần chạy benchmark: transaction từ start_date tới now (mặc định từ đầu năm target_year,
+    ít nhất ~100 ngày để đủ 3 tháng historical + profile intraday 30 ngày), tháng target = tháng của now.
+    Mỗi sku thuộc 1 brand, độ phổ biến theo Zipf; ~3% sku và 1 brand mới bán từ đầu tháng target.
+    """
+
+    def __init__(
+        self,
+        n_brands: int = 50,
+        skus_per_brand: int = 40,
+        orders_per_day: int = 2000,
+        target_year: Optional[int] = None,
+        now: Optional[datetime] = None,
+        start_date: Optional[date] = None,
+        seed: int = 42
+    ):
+        self.constants = Constants()
+        self.n_brands = n_brands
+        self.skus_per_brand = skus_per_brand
+        self.orders_per_day = orders_per_day
+        self.now = (now or datetime.now()).replace(microsecond=0)
+        self.today = self.now.date()
+        self.target_year = target_year or self.constants.KPI_YEAR_2026
+        self.target_month = self.today.month if self.today.year == self.target_year else 1
+        if start_date is None:
+            start_date = min(date(self.target_year, 1, 1), self.today - timedelta(days=100))
+        self.start_date = start_date
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.tables: Dict[str, Dict[str, np.ndarray]] = {}
+
+        n_skus = n_brands * skus_per_brand
+        self.brand_names = np.array([f"BRAND_{i:04d}" for i in range(n_brands)], dtype=object)
+        self.sku_names = np.array([str(100000 + i) for i in range(n_skus)], dtype=object)
+        self.sku_brand_index = np.arange(n_skus) // skus_per_brand
+        # Zipf theo thứ hạng sku trong brand + trọng số brand
+        brand_weight = 1.0 / np.arange(1, n_brands + 1) ** 0.8
+        sku_rank = np.arange(n_skus) % skus_per_brand + 1
+        popularity = brand_weight[self.sku_brand_index] / sku_rank ** 1.1
+        self.sku_popularity = popularity / popularity.sum()
+        self.sku_price = np.round(self.rng.lognormal(mean=12.3, sigma=0.6, size=n_skus), -3)
+
+        # sku mới (bán từ đầu tháng target): 3% sku bất kỳ + toàn bộ sku của brand cuối
+        month_start = date(self.today.year, self.today.month, 1)
+        launch_offset = np.zeros(n_skus, dtype=np.int64)
+        new_sku = self.rng.random(n_skus) < 0.03
+        new_sku[self.sku_brand_index == n_brands - 1] = True
+        self.new_sku_mask = new_sku
+        launch_offset[new_sku] = (month_start - self.start_date).days
+        self.sku_launch_offset = launch_offset
+
+    def generate(self) -> Dict[str, Dict[str, np.ndarray]]:
+        started = time.perf_counter()
+        self.tables = {}
+        self.tables['dim_date'] = self.generate_dim_date()
+        self.tables['object_sql_transaction_details'] = self.generate_transactions()
+        self.tables['raw_ecom_products'] = self.generate_ecom_products()
+        self.tables['metadata_annually'] = self.generate_metadata_annually()
+        self.tables['kpi_month'] = self.generate_kpi_month()
+        self.tables['kpi_day_metadata'] = self.generate_kpi_day_metadata()
+        self.tables['kpi_channel_metadata'] = self.generate_kpi_channel_metadata()
+        self.tables['kpi_brand_metadata'] = self.generate_kpi_brand_metadata()
+        self.tables['kpi_sku_metadata'] = self.generate_kpi_sku_metadata()
+        self.generate_seconds = time.perf_counter() - started
+        return self.tables
+
+    def get_days(self, year: int, month: Optional[int] = None) -> List[date]:
+        months = [month] if month is not None else range(1, 13)
+        return [
+            date(year, m, d)
+            for m in months
+            for d in range(1, calendar.monthrange(year, m)[1] + 1)
+        ]
+
+    def generate_dim_date(self) -> Dict[str, np.ndarray]:
+        # Cả năm của start_date tới hết năm target
+        days = []
+        for year in range(self.start_date.year, max(self.target_year, self.today.year) + 1):
+            days.extend(self.get_days(year))
+        labels = [get_date_label(d) for d in days]
+        return {
+            'calendar_date': np.array(days, dtype=object),
+            'year': np.array([d.year for d in days], dtype=np.int64),
+            'month': np.array([d.month for d in days], dtype=np.int64),
+            'day': np.array([d.day for d in days], dtype=np.int64),
+            'date_label': np.array(labels, dtype=object),
+            'priority_label': np.array(labels, dtype=object),
+            'event_type': np.array(['Normal Day' if label == 'Normal day' else 'Event' for label in labels], dtype=object),
+        }
+
+    def generate_transactions(self) -> Dict[str, np.ndarray]:
+        """
+        Mỗi ngày ~orders_per_day order × uplift của date_label, 1-4 dòng / order, giờ theo profile 2 đỉnh
+        (trưa, tối); ngày hôm nay chỉ tới giờ hiện tại
+        """
+        rng = self.rng
+        n_days = (self.today - self.start_date).days + 1
+        day_dates = [self.start_date + timedelta(days=i) for i in range(n_days)]
+        uplift = np.array([LABEL_UPLIFT.get(get_date_label(d), 1.0) for d in day_dates])
+        orders = rng.poisson(self.orders_per_day * uplift)
+
+        hour_weight = np.exp(-0.5 * ((np.arange(24) - 12) / 2.5) ** 2) + 1.3 * np.exp(-0.5 * ((np.arange(24) - 21) / 2.0) ** 2) + 0.05
+        hour_weight /= hour_weight.sum()
+
+        order_day = np.repeat(np.arange(n_days), orders)
+        n_orders = len(order_day)
+        order_seconds = rng.choice(24, size=n_orders, p=hour_weight) * 3600 + rng.integers(0, 3600, size=n_orders)
+        order_platform = rng.choice(len(PLATFORMS), size=n_orders, p=PLATFORM_SHARES)
+        order_status = np.where(rng.random(n_orders) < CANCELED_RATE, 'Canceled', 'Completed').astype(object)
+
+        lines = rng.integers(1, 5, size=n_orders)
+        line_order = np.repeat(np.arange(n_orders), lines)
+        line_day = order_day[line_order]
+        line_sku = rng.choice(len(self.sku_names), size=len(line_order), p=self.sku_popularity)
+
+        # Bỏ dòng của sku chưa bán (sku mới trước ngày launch) và giờ tương lai của hôm nay
+        start = np.datetime64(self.start_date, 's')
+        created_at = start + (line_day * 86400 + order_seconds[line_order]).astype('timedelta64[s]')
+        keep = (line_day >= self.sku_launch_offset[line_sku]) & (created_at <= np.datetime64(self.now, 's'))
+        line_order, line_sku, created_at = line_order[keep], line_sku[keep], created_at[keep]
+
+        quantity = rng.integers(1, 4, size=len(line_order))
+        return {
+            'order_id': np.char.add('ORD', line_order.astype(str)).astype(object),
+            'sku': self.sku_names[line_sku],
+            'brand_name': self.brand_names[self.sku_brand_index[line_sku]],
+            'platform': np.array(PLATFORMS, dtype=object)[order_platform[line_order]],
+            'status': order_status[line_order],
+            'total_amount': self.sku_price[line_sku] * quantity,
+            'created_at': created_at.astype(object),
+            'updated_at': created_at.astype(object),
+        }
+
+    def generate_ecom_products(self) -> Dict[str, np.ndarray]:
+        categories = np.array(CATEGORIES, dtype=object)
+        return {
+            'sku': self.sku_names,
+            'category_name': categories[self.rng.integers(0, len(categories), size=len(self.sku_names))],
+            'updated_at': np.full(len(self.sku_names), self.now, dtype=object),
+        }
+
+    def generate_metadata_annually(self) -> Dict[str, np.ndarray]:
+        rows = [
+            (self.target_year, month, label, LABEL_UPLIFT[label])
+            for month in range(1, 13)
+            for label in LABEL_UPLIFT
+        ]
+        offline = self.rng.uniform(0.25, 0.35, size=len(rows))
+        ecom = self.rng.uniform(0.2, 0.3, size=len(rows))
+        return {
+            'year': np.array([row[0] for row in rows], dtype=np.int64),
+            'month': np.array([row[1] for row in rows], dtype=np.int64),
+            'priority_label': np.array([row[2] for row in rows], dtype=object),
+            'uplift': np.array([row[3] for row in rows]),
+            'pct_offline': offline,
+            'pct_online': 1.0 - offline - ecom,
+            'pct_ecom': ecom,
+        }
+
+    def get_expected_daily_revenue(self) -> float:
+        avg_lines = 2.5
+        avg_quantity = 2.0
+        return self.orders_per_day * avg_lines * avg_quantity * float(np.dot(self.sku_popularity, self.sku_price))
+
+    def generate_kpi_month(self) -> Dict[str, np.ndarray]:
+        # Version baseline "Thang 1" cho 12 tháng: doanh thu kỳ vọng × 1.1
+        daily = self.get_expected_daily_revenue()
+        months = np.arange(1, 13)
+        kpi_initial = np.array([
+            daily * calendar.monthrange(self.target_year, int(m))[1] * 1.1 for m in months
+        ])
+        n = len(months)
+        return {
+            'version': np.full(n, 'Thang 1', dtype=object),
+            'year': np.full(n, self.target_year, dtype=np.int64),
+            'month': months,
+            'kpi_initial': kpi_initial,
+            'actual': np.zeros(n),
+            'gap': np.zeros(n),
+            'eom': kpi_initial.copy(),
+            'kpi_adjustment': kpi_initial.copy(),
+            'created_at': np.full(n, self.now, dtype=object),
+            'updated_at': np.full(n, self.now, dtype=object),
+        }
+
+    def generate_kpi_day_metadata(self) -> Dict[str, np.ndarray]:
+        days = self.get_days(self.target_year, self.target_month)
+        labels = sorted({get_date_label(d) for d in days})
+        so_ngay = np.array([sum(1 for d in days if get_date_label(d) == label) for label in labels])
+        uplift = np.array([LABEL_UPLIFT[label] for label in labels])
+        weight = uplift * so_ngay
+        n = len(labels)
+        return {
+            'year': np.full(n, self.target_year, dtype=np.int64),
+            'month': np.full(n, self.target_month, dtype=np.int64),
+            'date_label': np.array(labels, dtype=object),
+            'avg_total': uplift * self.get_expected_daily_revenue(),
+            'uplift': uplift,
+            'so_ngay': so_ngay,
+            'weight': weight,
+            'total_weight_month': np.full(n, weight.sum()),
+            'historical_start_date': np.full(n, self.today - timedelta(days=90), dtype=object),
+            'historical_end_date': np.full(n, self.today, dtype=object),
+            'created_at': np.full(n, self.now, dtype=object),
+            'updated_at': np.full(n, self.now, dtype=object),
+        }
+
+    def generate_kpi_channel_metadata(self) -> Dict[str, np.ndarray]:
+        channel_share = {'ONLINE_HASAKI': 0.0, 'OFFLINE_HASAKI': 0.0, 'ECOM': 0.0}
+        for platform, share in zip(PLATFORMS, PLATFORM_SHARES):
+            channel_share[CHANNEL_BY_PLATFORM.get(platform, 'ECOM')] += share
+        rows = [
+            (d, channel, share)
+            for d in self.get_days(self.target_year, self.target_month)
+            for channel, share in channel_share.items()
+        ]
+        n = len(rows)
+        return {
+            'calendar_date': np.array([row[0] for row in rows], dtype=object),
+            'year': np.full(n, self.target_year, dtype=np.int64),
+            'month': np.full(n, self.target_month, dtype=np.int64),
+            'day': np.array([row[0].day for row in rows], dtype=np.int64),
+            'date_label': np.array([get_date_label(row[0]) for row in rows], dtype=object),
+            'channel': np.array([row[1] for row in rows], dtype=object),
+            'rev_pct': np.array([row[2] for row in rows]),
+            'rev_pct_adjustment': np.array([row[2] for row in rows]),
+            'created_at': np.full(n, self.now, dtype=object),
+            'updated_at': np.full(n, self.now, dtype=object),
+        }
+
+    def generate_kpi_brand_metadata(self) -> Dict[str, np.ndarray]:
+        # Brand đã bán trước tháng target, share theo độ phổ biến
+        old_sku = ~self.new_sku_mask
+        brand_share = np.bincount(
+            self.sku_brand_index[old_sku],
+            weights=self.sku_popularity[old_sku] * self.sku_price[old_sku],
+            minlength=self.n_brands
+        )
+        brand_index = np.nonzero(brand_share > 0)[0]
+        share = brand_share[brand_index] / brand_share[brand_index].sum()
+        n = len(brand_index)
+        return {
+            'year': np.full(n, self.target_year, dtype=np.int64),
+            'month': np.full(n, self.target_month, dtype=np.int64),
+            'brand_name': self.brand_names[brand_index],
+            'per_of_rev_by_brand': share,
+            'pic': np.full(n, '', dtype=object),
+            'per_of_rev_by_brand_adj': share,
+            'created_at': np.full(n, self.now, dtype=object),
+            'updated_at': np.full(n, self.now, dtype=object),
+        }
+
+    def generate_kpi_sku_metadata(self) -> Dict[str, np.ndarray]:
+        """
+        Hero / Core / Tail theo cum_rev_share trong brand (giống query của kpi_sku_metadata), chỉ sku cũ
+        """
+        columns = {name: [] for name in [
+            'brand_name', 'sku', 'revenue', 'total_revenue_by_brand', 'revenue_distribution_by_sku',
+            'cum_rev_share', 'sku_classification', 'class_revenue', 'revenue_share_in_class'
+        ]}
+        expected_revenue = self.sku_popularity * self.sku_price * self.get_expected_daily_revenue() * 90
+        for brand_index in range(self.n_brands):
+            skus = np.nonzero((self.sku_brand_index == brand_index) & ~self.new_sku_mask)[0]
+            if len(skus) == 0:
+                continue
+            skus = skus[np.argsort(-expected_revenue[skus], kind='stable')]
+            revenue = expected_revenue[skus]
+            total = revenue.sum()
+            distribution = revenue / total * 100
+            cum_share = np.cumsum(revenue) / total * 100
+            classification = np.where(
+                (cum_share <= 80) | (distribution >= 40), 'Hero',
+                np.where((cum_share <= 95) | (distribution >= 10), 'Core', 'Tail')
+            )
+            class_revenue = np.array([revenue[classification == c].sum() for c in classification])
+            columns['brand_name'].extend([self.brand_names[brand_index]] * len(skus))
+            columns['sku'].extend(self.sku_names[skus].tolist())
+            columns['revenue'].extend(revenue.tolist())
+            columns['total_revenue_by_brand'].extend([float(total)] * len(skus))
+            columns['revenue_distribution_by_sku'].extend(distribution.tolist())
+            columns['cum_rev_share'].extend(cum_share.tolist())
+            columns['sku_classification'].extend(classification.tolist())
+            columns['class_revenue'].extend(class_revenue.tolist())
+            columns['revenue_share_in_class'].extend((revenue / class_revenue * 100).tolist())
+
+        n = len(columns['sku'])
+        result = {
+            'year': np.full(n, self.target_year, dtype=np.int64),
+            'month': np.full(n, self.target_month, dtype=np.int64),
+        }
+        for name, values in columns.items():
+            result[name] = np.array(values, dtype=object if name in ('brand_name', 'sku', 'sku_classification') else None)
+        result['created_at'] = np.full(n, self.now, dtype=object)
+        result['updated_at'] = np.full(n, self.now, dtype=object)
+        return result
+
+    def get_row_counts(self) -> Dict[str, int]:
+        return {name: len(next(iter(columns.values()))) for name, columns in self.tables.items()}
+
+    def get_summary(self) -> Dict:
+        return {
+            'n_brands': self.n_brands,
+            'skus_per_brand': self.skus_per_brand,
+            'orders_per_day': self.orders_per_day,
+            'start_date': str(self.start_date),
+            'now': self.now.isoformat(),
+            'target_year': self.target_year,
+            'target_month': self.target_month,
+            'seed': self.seed,
+            'rows': self.get_row_counts(),
+        }
+
+
+def create_tables(client, tables: Optional[List[str]] = None, drop: bool = False) -> None:
+    client.command(f"CREATE DATABASE IF NOT EXISTS {SYNTHETIC_DATABASE}")
+    for name in tables or SYNTHETIC_DDL:
+        if drop:
+            client.command(f"DROP TABLE IF EXISTS {SYNTHETIC_DATABASE}.{name}")
+        client.command(f"CREATE TABLE IF NOT EXISTS {SYNTHETIC_DATABASE}.{name} ({SYNTHETIC_DDL[name]}")
+
+
+def load_dataset(client, dataset: SyntheticDataset) -> Dict[str, Dict]:
+    """
+    Insert các bảng đã generate (column-oriented, theo block của BulkInsertWriter), trả về stats theo bảng
+    """
+    stats = {}
+    for name, columns in dataset.tables.items():
+        with BulkInsertWriter(client, f"{SYNTHETIC_DATABASE}.{name}", list(columns.keys())) as writer:
+            writer.write_columns(columns)
+        stats[name] = writer.get_stats()
+    return stats
+
+
+def load_parity_month(
+    client,
+    dataset: SyntheticDataset,
+    null_adjustment_channel: str = PARITY_NULL_ADJUSTMENT_CHANNEL
+) -> Dict[str, List[Dict]]:
+    """
+    Fixture cho parity check server-side (benchmarks.kpi_sku_server_side / kpi_brand_server_side): load dataset
+    (seed cố định) vào ClickHouse local rồi chạy kpi_month -> kpi_day -> kpi_channel -> kpi_brand -> kpi_sku
+    -> kpi_forecast của tháng target để mọi bảng input của kpi_brand / kpi_sku có dữ liệu (kể cả kpi_forecast
+    của hôm nay). Edge case:
+        - brand cuối + ~3% sku chỉ bán từ đầu tháng (không có trong kpi_brand_metadata / kpi_sku_metadata)
+        - channel null_adjustment_channel không có kpi_channel_adjustment (NULL) từ hôm nay
+        - ngày quá khứ / hôm nay / tương lai theo dataset.now (tháng target = tháng hiện tại, vì các calculator
+          dùng date.today() / today() của server)
+    Returns: kết quả in-memory theo stage
+    """
+    from src.pipeline import PipelineRunner
+    from src.etl.kpi_channel import KPIDayChannelCalculator
+    from src.utils.clickhouse_client import set_client
+
+    # Code gọi get_client() trực tiếp (vd intraday_profile) cũng dùng client local
+    set_client(client)
+    create_tables(client, drop=True)
+    load_dataset(client, dataset)
+
+    runner = PipelineRunner(
+        dataset.constants,
+        client=client,
+        target_year=dataset.target_year,
+        target_month=dataset.target_month,
+        query_log=''
+    )
+    runner.run(['kpi_month', 'kpi_day'])
+
+    calculator = KPIDayChannelCalculator(dataset.constants, client=client, revenue_helper=runner.revenue_helper)
+    kpi_channel_data = calculator.calculate_kpi_day_channel(
+        dataset.target_year,
+        dataset.target_month,
+        kpi_day_data=runner.results.get('kpi_day')
+    )
+    for row in kpi_channel_data:
+        if row['channel'] == null_adjustment_channel and row['calendar_date'] >= dataset.today:
+            row['kpi_channel_adjustment'] = None
+    calculator.save_kpi_day_channel(kpi_channel_data)
+    runner.results['kpi_channel'] = kpi_channel_data
+
+    runner.run(['kpi_brand', 'kpi_sku', 'kpi_forecast'])
+    failed = [timing['stage'] for timing in runner.timings if timing['status'] != 'ok']
+    if failed:
+        raise RuntimeError(f"Parity fixture stages failed: {failed}")
+    return runner.results
@@ -2,6 +2,9 @@
 
 # Script để chạy toàn bộ KPI pipeline
 # Sử dụng: ./run_pipeline.sh hoặc bash run_pipeline.sh
+# Mỗi bước chạy 1 process riêng. Để chạy tất cả trong 1 process (dùng chung client,
+# truyền kết quả in-memory giữa các stage, ghi report thời gian từng stage):
+#   python -m src.pipeline [--target-month M] [--stages kpi_day,kpi_channel] [--report pipeline_report.json]
 
 echo "============================================================"
 echo "BAT DAU CHAY KPI PIPELINE"
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.utils.logger import get_logger
+
+# Số tháng chạy song song tối đa (mỗi tháng 1 process, 1 connection ClickHouse)
+BACKFILL_MAX_WORKERS = int(os.getenv("KPI_BACKFILL_MAX_WORKERS", "4"))
+
+logger = get_logger(__name__)
+
+
+def parse_months(value: str) -> List[int]:
+    """
+    "1-12" -> [1..12], "1,3,5-7" -> [1, 3, 5, 6, 7]
+    """
+    months = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            months.update(range(int(start), int(end) + 1))
+        else:
+            months.add(int(part))
+
+    invalid = [m for m in months if m < 1 or m > 12]
+    if invalid:
+        raise ValueError(f"Months must be between 1 and 12, received: {sorted(invalid)}")
+    return sorted(months)
+
+
+def run_month(
+    target_year: int,
+    target_month: int,
+    stage_names: Optional[List[str]] = None,
+    continue_on_error: bool = False,
+    use_snapshot: bool = True,
+    read_path: Optional[str] = None,
+    numeric_policies: Optional[Dict[str, str]] = None,
+    incremental: bool = False,
+    stream_sku: bool = False,
+    server_side_sku: bool = False,
+    server_side_brand: bool = False
+) -> Dict:
+    """
+    Chạy pipeline của 1 tháng trong process con: các stage vẫn theo thứ tự dependency,
+    client ClickHouse được tạo riêng trong process này
+    """
+    from src.pipeline import PipelineRunner
+    from src.utils.constants import Constants
+
+    started = time.perf_counter()
+    try:
+        runner = PipelineRunner(
+            Constants(),
+            target_year=target_year,
+            target_month=target_month,
+            use_snapshot=use_snapshot,
+            read_path=read_path,
+            incremental=incremental,
+            stream_sku=stream_sku,
+            server_side_sku=server_side_sku,
+            server_side_brand=server_side_brand,
+            numeric_policies=numeric_policies
+        )
+        timings = runner.run(stage_names=stage_names, continue_on_error=continue_on_error)
+        failed = [t['stage'] for t in timings if t['status'] != 'ok']
+        return {
+            'month': target_month,
+            'status': 'failed' if failed else 'ok',
+            'seconds': round(time.perf_counter() - started, 3),
+            'stages': timings,
+            'error': f"failed stages: {failed}" if failed else None
+        }
+    except Exception as e:
+        return {
+            'month': target_month,
+            'status': 'failed',
+            'seconds': round(time.perf_counter() - started, 3),
+            'stages': [],
+            'error': str(e)
+        }
+
+
+def run_backfill(
+    target_year: int,
+    months: List[int],
+    stage_names: Optional[List[str]] = None,
+    continue_on_error: bool = False,
+    use_snapshot: bool = True,
+    read_path: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    numeric_policies: Optional[Dict[str, str]] = None,
+    incremental: bool = False,
+    stream_sku: bool = False,
+    server_side_sku: bool = False,
+    server_side_brand: bool = False
+) -> Dict:
+    """
+    Chạy lại nhiều tháng song song (process pool, tối đa max_workers tháng cùng lúc).
+    Các tháng độc lập với nhau; trong 1 tháng các stage chạy tuần tự theo STAGES.
+    incremental / stream_sku / server_side_* truyền thẳng cho PipelineRunner của từng tháng
+    (watermark incremental lưu theo từng tháng).
+    Dùng context 'spawn' để process con không kế thừa connection HTTP của process cha.
+    """
+    if (server_side_sku or server_side_brand) and incremental:
+        raise ValueError("server-side kpi_sku / kpi_brand cannot be combined with incremental mode")
+
+    max_workers = max(1, min(max_workers or BACKFILL_MAX_WORKERS, len(months)))
+    started = time.perf_counter()
+    results = []
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = {
+            executor.submit(
+                run_month,
+                target_year,
+                month,
+                stage_names,
+                continue_on_error,
+                use_snapshot,
+                read_path,
+                numeric_policies,
+                incremental,
+                stream_sku,
+                server_side_sku,
+                server_side_brand
+            ): month
+            for month in months
+        }
+        for future in as_completed(futures):
+            month = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Process con chết (OOM, ...) thì không có kết quả trả về
+                result = {'month': month, 'status': 'failed', 'seconds': None, 'stages': [], 'error': str(e)}
+            seconds = f"{result['seconds']:.2f}s" if result['seconds'] is not None else "-"
+            logger.info(
+                "[%s] month %s/%s: %s%s",
+                result['status'].upper(), month, target_year, seconds, f" ({result['error']})" if result['error'] else ""
+            )
+            results.append(result)
+
+    results.sort(key=lambda r: r['month'])
+    return {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'target_year': target_year,
+        'months': months,
+        'max_workers': max_workers,
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'results': results
+    }
+
+
+def write_backfill_report(report: Dict, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
@@ -1,45 +1,186 @@
-from decimal import Decimal
+import numpy as np
+from functools import partial
 from datetime import datetime, date
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.bulk_writer import BulkInsertWriter
+from src.utils.columnar import ColumnarResult, join_values
+from src.utils.numeric_policy import get_numeric_policy
+
+# Cột insert vào hskcdp.kpi_brand
+KPI_BRAND_INSERT_COLUMNS = [
+    'calendar_date', 'year', 'month', 'day', 'date_label',
+    'channel', 'brand_name', 'pct_of_rev_by_brand', 
+    'kpi_brand_initial',
+    'actual', 'gap', 'kpi_brand_adjustment', 'forecast', 
+    'created_at', 'updated_at'
+]
 
 
 class KPIBrandCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None, writer=None, numeric=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        # Đích insert (cùng signature client.insert), vd IncrementalWriter; mặc định ghi thẳng client
+        self.writer = writer if writer is not None else self.client
+        # Kiểu số trong vòng lặp (decimal / float / fixed), xem src/utils/numeric_policy.py
+        self.numeric = numeric if numeric is not None else get_numeric_policy('kpi_brand')
+    
+    def get_kpi_channel_maps_from_results(
+        self,
+        kpi_channel_data: List[Dict]
+    ) -> Tuple[Dict[date, Dict[str, object]], Dict[date, Dict[str, object]], List[Dict]]:
+        """
+        Dựng lại từ kết quả stage kpi_channel (thay cho 3 query đọc lại kpi_channel FINAL):
+            - {calendar_date: {channel: kpi_channel_adjustment}}
+            - forecast top-down {calendar_date: {channel: forecast}} cho các ngày tương lai
+            - list combination (calendar_date, channel)
+        """
+        today = date.today()
+        num = self.numeric
+        kpi_day_channel_adjustment_by_date = {}
+        forecast_top_down_brand = {}
+        date_channel_combinations = []
+        for row in sorted(kpi_channel_data, key=lambda r: (r['calendar_date'], r['channel'])):
+            calendar_date = row['calendar_date']
+            channel = row['channel']
+            kpi_channel_adjustment = row['kpi_channel_adjustment']
+            
+            if calendar_date not in kpi_day_channel_adjustment_by_date:
+                kpi_day_channel_adjustment_by_date[calendar_date] = {}
+            kpi_day_channel_adjustment_by_date[calendar_date][channel] = num.amount(kpi_channel_adjustment)
+            
+            if calendar_date > today and row['forecast'] is not None:
+                if calendar_date not in forecast_top_down_brand:
+                    forecast_top_down_brand[calendar_date] = {}
+                forecast_top_down_brand[calendar_date][channel] = (
+                    forecast_top_down_brand[calendar_date].get(channel, num.zero) + num.amount(row['forecast'], num.zero)
+                )
+            
+            date_channel_combinations.append({
+                'calendar_date': calendar_date,
+                'year': row['year'],
+                'month': row['month'],
+                'day': row['day'],
+                'date_label': row['date_label'],
+                'channel': channel
+            })
+        
+        return kpi_day_channel_adjustment_by_date, forecast_top_down_brand, date_channel_combinations
+    
+    def get_kpi_brand_with_brand_metadata_from_results(
+        self,
+        kpi_channel_data: List[Dict],
+        kpi_brand_metadata: List[Dict]
+    ) -> List[Dict]:
+        """
+        CROSS JOIN kết quả kpi_channel với kpi_brand_metadata trong bộ nhớ,
+        cùng output với RevenueQueryHelper.get_kpi_brand_with_brand_metadata
+        """
+        num = self.numeric
+        brands = sorted(
+            (row['brand_name'], num.ratio(row['per_of_rev_by_brand_adj']))
+            for row in kpi_brand_metadata
+        )
+        kpi_brand_data = []
+        for row in sorted(kpi_channel_data, key=lambda r: (r['calendar_date'], r['channel'])):
+            kpi_channel_initial = num.amount(row['kpi_channel_initial'])
+            for brand_name, per_of_rev_by_brand_adj in brands:
+                kpi_brand_data.append({
+                    'calendar_date': row['calendar_date'],
+                    'year': row['year'],
+                    'month': row['month'],
+                    'day': row['day'],
+                    'date_label': row['date_label'],
+                    'channel': row['channel'],
+                    'brand_name': brand_name,
+                    'per_of_rev_by_brand_adj': per_of_rev_by_brand_adj,
+                    'kpi_channel_initial': kpi_channel_initial
+                })
+        return kpi_brand_data
     
     def calculate_kpi_brand(
         self,
         target_year: int,
-        target_month: int
+        target_month: int,
+        kpi_channel_data: Optional[List[Dict]] = None,
+        kpi_brand_metadata: Optional[List[Dict]] = None
     ) -> List[Dict]:
-        kpi_brand_data = self.revenue_helper.get_kpi_brand_with_brand_metadata(
-            target_year=target_year,
-            target_month=target_month
-        )
+        # Các query độc lập chạy song song (latency = query chậm nhất thay vì tổng)
+        calls = {
+            # Actual dạng cột, lookup bằng dict phẳng (date, channel, brand) thay vì dict lồng
+            'actual_columns': partial(
+                self.revenue_helper.get_actual_by_brand_channel_and_date_columns,
+                target_year=target_year,
+                target_month=target_month
+            ),
+            'forecast_by_brand_today': self.revenue_helper.get_forecast_by_brand_for_today,
+            'new_brand_this_month': self.revenue_helper.get_new_brand_this_month,
+        }
+        if kpi_channel_data is None or kpi_brand_metadata is None:
+            calls['kpi_brand_data'] = partial(
+                self.revenue_helper.get_kpi_brand_with_brand_metadata,
+                target_year=target_year,
+                target_month=target_month
+            )
+        if kpi_channel_data is None:
+            calls['kpi_day_channel_adjustment_by_date'] = partial(
+                self.revenue_helper.get_kpi_day_channel_adjustment_by_date_and_channel,
+                target_year=target_year,
+                target_month=target_month
+            )
+            calls['forecast_top_down_brand'] = partial(
+                self.revenue_helper.get_forecast_top_down_from_channel,
+                target_year=target_year,
+                target_month=target_month
+            )
+        query_results = self.revenue_helper.gather(calls)
+
+        num = self.numeric
+        if num.vectorized:
+            return self.calculate_kpi_brand_vectorized(
+                target_year,
+                target_month,
+                query_results,
+                kpi_channel_data=kpi_channel_data,
+                kpi_brand_metadata=kpi_brand_metadata
+            )
+
+        if kpi_channel_data is not None and kpi_brand_metadata is not None:
+            kpi_brand_data = self.get_kpi_brand_with_brand_metadata_from_results(
+                kpi_channel_data,
+                kpi_brand_metadata
+            )
+        else:
+            kpi_brand_data = query_results['kpi_brand_data']
         
-        actual_by_date = self.revenue_helper.get_actual_by_brand_channel_and_date(
-            target_year=target_year,
-            target_month=target_month
-        )
+        actual_columns = query_results['actual_columns']
+        actual_lookup = actual_columns.to_lookup(['calendar_date', 'channel', 'brand_name'], 'actual_amount')
         
-        kpi_day_channel_adjustment_by_date = self.revenue_helper.get_kpi_day_channel_adjustment_by_date_and_channel(
-            target_year=target_year,
-            target_month=target_month
-        )
-
-        forecast_by_brand_today = self.revenue_helper.get_forecast_by_brand_for_today()
+        date_channel_combinations = None
+        if kpi_channel_data is not None:
+            # Kết quả kpi_channel từ stage trước trong cùng process
+            (
+                kpi_day_channel_adjustment_by_date,
+                forecast_top_down_brand,
+                date_channel_combinations
+            ) = self.get_kpi_channel_maps_from_results(kpi_channel_data)
+        else:
+            kpi_day_channel_adjustment_by_date = query_results['kpi_day_channel_adjustment_by_date']
+            forecast_top_down_brand = query_results['forecast_top_down_brand']
 
-        forecast_top_down_brand = self.revenue_helper.get_forecast_top_down_from_channel(
-            target_year=target_year,
-            target_month=target_month
-        )
+        forecast_by_brand_today = query_results['forecast_by_brand_today']
         
-        new_brand_this_month = self.revenue_helper.get_new_brand_this_month()
+        new_brand_this_month = query_results['new_brand_this_month']
+
+        # Convert 1 lần sang kiểu số của policy, vòng lặp chỉ còn phép tính
+        actual_lookup = {key: num.amount(value, num.zero) for key, value in actual_lookup.items()}
+        kpi_day_channel_adjustment_by_date = self.convert_nested_amounts(kpi_day_channel_adjustment_by_date)
+        forecast_top_down_brand = self.convert_nested_amounts(forecast_top_down_brand)
+        forecast_by_brand_today = self.convert_nested_amounts(forecast_by_brand_today)
         
         results = []
         today = date.today()
@@ -53,36 +194,39 @@ class KPIBrandCalculator:
             date_label = row['date_label']
             channel = row['channel']
             brand_name = row['brand_name']
-            per_of_rev_by_brand_adj = row['per_of_rev_by_brand_adj']
-            kpi_channel_initial = row['kpi_channel_initial']
+            per_of_rev_by_brand_adj = num.ratio(row['per_of_rev_by_brand_adj'])
+            kpi_channel_initial = num.amount(row['kpi_channel_initial'])
             
-            kpi_brand_initial = kpi_channel_initial * per_of_rev_by_brand_adj
+            kpi_brand_initial = num.scale(kpi_channel_initial, per_of_rev_by_brand_adj)
             
-            actual = Decimal(actual_by_date.get(calendar_date, {}).get(channel, {}).get(brand_name, 0.0))
+            actual = actual_lookup.get((calendar_date, channel, brand_name), num.zero)
             
             if calendar_date < today:
                 kpi_brand_adjustment = actual
             else:
                 kpi_day_channel_adjustment = kpi_day_channel_adjustment_by_date.get(calendar_date, {}).get(channel)
                 if kpi_day_channel_adjustment is not None:
-                    kpi_brand_adjustment = Decimal(kpi_day_channel_adjustment) * Decimal(per_of_rev_by_brand_adj)
+                    kpi_brand_adjustment = num.scale(kpi_day_channel_adjustment, per_of_rev_by_brand_adj)
                 else:
                     kpi_brand_adjustment = None
 
             if calendar_date < today:
-                gap = actual - Decimal(kpi_brand_initial)
+                gap = actual - kpi_brand_initial
             else:
-                gap = Decimal('0')
+                gap = num.zero
 
             forecast = None
             if calendar_date < today:
                 forecast = actual
             elif calendar_date == today:
                 # forecast bottom-up
-                forecast = forecast_by_brand_today.get(channel, {}).get(brand_name, Decimal('0'))
+                forecast = forecast_by_brand_today.get(channel, {}).get(brand_name, num.zero)
             else:
                 # forecast top-down
-                forecast = forecast_top_down_brand.get(calendar_date, {}).get(channel, Decimal("0")) * per_of_rev_by_brand_adj
+                forecast = num.scale(
+                    forecast_top_down_brand.get(calendar_date, {}).get(channel, num.zero),
+                    per_of_rev_by_brand_adj
+                )
 
             results.append({
                 'calendar_date': calendar_date,
@@ -92,37 +236,217 @@ class KPIBrandCalculator:
                 'date_label': date_label,
                 'channel': channel,
                 'brand_name': brand_name,
-                'pct_of_rev_by_brand': Decimal(per_of_rev_by_brand_adj),
-                'kpi_brand_initial': Decimal(kpi_brand_initial),
+                'pct_of_rev_by_brand': per_of_rev_by_brand_adj,
+                'kpi_brand_initial': kpi_brand_initial,
                 'actual': actual,
                 'gap': gap,
                 'kpi_brand_adjustment': kpi_brand_adjustment,
                 'forecast': forecast
             })
         
+        # Brand mới + brand có actual nhưng không có trong metadata
+        results.extend(self.get_extra_brand_records(
+            target_year=target_year,
+            target_month=target_month,
+            brands_in_metadata={row['brand_name'] for row in kpi_brand_data},
+            actual_columns=actual_columns,
+            actual_lookup=actual_lookup,
+            new_brand_this_month=new_brand_this_month,
+            forecast_by_brand_today=forecast_by_brand_today,
+            today=today,
+            kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date,
+            date_channel_combinations=date_channel_combinations
+        ))
+        
+        return results
+    
+    def calculate_kpi_brand_vectorized(
+        self,
+        target_year: int,
+        target_month: int,
+        query_results: Dict,
+        kpi_channel_data: Optional[List[Dict]] = None,
+        kpi_brand_metadata: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """
+        Cùng logic với vòng lặp trong calculate_kpi_brand (policy float / fixed), tính trên mảng:
+            - kết quả kpi_channel × kpi_brand_metadata được CROSS JOIN bằng np.repeat / np.tile trên các cột
+              (không tạo dict trung gian cho từng dòng brand), actual join bằng join_values trên cột actual
+            - chỉ tạo dict cho từng dòng ở bước cuối. NaN = None.
+        Brand mới / brand ngoài metadata vẫn qua get_extra_brand_records (ít dòng).
+        """
+        num = self.numeric
+        actual_columns = query_results['actual_columns']
+        new_brand_this_month = query_results['new_brand_this_month']
+        forecast_by_brand_today = self.convert_nested_amounts(query_results['forecast_by_brand_today'])
+
+        date_channel_combinations = None
+        if kpi_channel_data is not None and kpi_brand_metadata is not None:
+            # Dòng gốc = dòng kpi_channel (sắp theo date, channel), mỗi dòng nhân với toàn bộ brand (sắp theo tên)
+            channel_rows = sorted(kpi_channel_data, key=lambda r: (r['calendar_date'], r['channel']))
+            brands = sorted(
+                (row['brand_name'], num.ratio(row['per_of_rev_by_brand_adj'], np.nan))
+                for row in kpi_brand_metadata
+            )
+            n_brands = len(brands)
+            channel_index = np.repeat(np.arange(len(channel_rows)), n_brands)
+            brand_names = [brand_name for brand_name, _ in brands] * len(channel_rows)
+            ratios = np.tile(num.amounts([ratio for _, ratio in brands]), len(channel_rows))
+        else:
+            # Kết quả query get_kpi_brand_with_brand_metadata: mỗi dòng là 1 dòng gốc
+            channel_rows = query_results['kpi_brand_data']
+            channel_index = np.arange(len(channel_rows))
+            brand_names = [row['brand_name'] for row in channel_rows]
+            ratios = num.amounts([row['per_of_rev_by_brand_adj'] for row in channel_rows])
+
+        if kpi_channel_data is not None:
+            (
+                kpi_day_channel_adjustment_by_date,
+                forecast_top_down_brand,
+                date_channel_combinations
+            ) = self.get_kpi_channel_maps_from_results(kpi_channel_data)
+        else:
+            kpi_day_channel_adjustment_by_date = self.convert_nested_amounts(
+                query_results['kpi_day_channel_adjustment_by_date']
+            )
+            forecast_top_down_brand = self.convert_nested_amounts(query_results['forecast_top_down_brand'])
+
+        # Giá trị theo dòng gốc (ít dòng), rồi expand theo channel_index
+        calendar_dates = [row['calendar_date'] for row in channel_rows]
+        channels = [row['channel'] for row in channel_rows]
+        day_numbers = np.fromiter(
+            (calendar_date.toordinal() for calendar_date in calendar_dates),
+            dtype=np.int64,
+            count=len(calendar_dates)
+        )
+        kpi_channel_initial = num.amounts([row['kpi_channel_initial'] for row in channel_rows])
+        kpi_day_channel_adjustment = num.amounts([
+            kpi_day_channel_adjustment_by_date.get(calendar_date, {}).get(channel)
+            for calendar_date, channel in zip(calendar_dates, channels)
+        ])
+        top_down = num.amounts([
+            forecast_top_down_brand.get(calendar_date, {}).get(channel, 0.0)
+            for calendar_date, channel in zip(calendar_dates, channels)
+        ])
+
+        today = date.today()
+        row_days = day_numbers[channel_index]
+        is_past = row_days < today.toordinal()
+        is_today = row_days == today.toordinal()
+
+        epoch = date(1970, 1, 1).toordinal()
+        channel_values = np.empty(len(channels), dtype=object)
+        channel_values[:] = channels
+        brand_values = np.empty(len(brand_names), dtype=object)
+        brand_values[:] = brand_names
+        actual = join_values(
+            [(row_days - epoch).astype('datetime64[D]'), channel_values[channel_index], brand_values],
+            [actual_columns['calendar_date'], actual_columns['channel'], actual_columns['brand_name']],
+            actual_columns['actual_amount']
+        )
+        actual[~np.isfinite(actual)] = 0.0
+
+        kpi_brand_initial = kpi_channel_initial[channel_index] * ratios
+        kpi_brand_adjustment = np.where(is_past, actual, kpi_day_channel_adjustment[channel_index] * ratios)
+        gap = np.where(is_past, actual - kpi_brand_initial, 0.0)
+        forecast = np.where(is_past, actual, top_down[channel_index] * ratios)
+        today_rows = np.flatnonzero(is_today)
+        if len(today_rows):
+            today_channels = channel_values[channel_index[today_rows]].tolist()
+            forecast[today_rows] = num.amounts([
+                forecast_by_brand_today.get(channel, {}).get(brand_name, 0.0)
+                for channel, brand_name in zip(today_channels, brand_values[today_rows].tolist())
+            ])
+
+        results = []
+        for row_index, brand_name, ratio, initial_value, actual_value, gap_value, adjustment_value, forecast_value in zip(
+            channel_index.tolist(),
+            brand_names,
+            ratios.tolist(),
+            num.outputs(kpi_brand_initial),
+            num.outputs(actual),
+            num.outputs(gap),
+            num.outputs(kpi_brand_adjustment),
+            num.outputs(forecast)
+        ):
+            row = channel_rows[row_index]
+            results.append({
+                'calendar_date': row['calendar_date'],
+                'year': row['year'],
+                'month': row['month'],
+                'day': row['day'],
+                'date_label': row['date_label'],
+                'channel': row['channel'],
+                'brand_name': brand_name,
+                'pct_of_rev_by_brand': ratio,
+                'kpi_brand_initial': initial_value,
+                'actual': actual_value,
+                'gap': gap_value,
+                'kpi_brand_adjustment': adjustment_value,
+                'forecast': forecast_value
+            })
+
+        # Brand mới + brand có actual nhưng không có trong metadata
+        results.extend(self.get_extra_brand_records(
+            target_year=target_year,
+            target_month=target_month,
+            brands_in_metadata=set(brand_names),
+            actual_columns=actual_columns,
+            actual_lookup=actual_columns.to_lookup(['calendar_date', 'channel', 'brand_name'], 'actual_amount'),
+            new_brand_this_month=new_brand_this_month,
+            forecast_by_brand_today=forecast_by_brand_today,
+            today=today,
+            kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date,
+            date_channel_combinations=date_channel_combinations
+        ))
+        
+        return results
+    
+    def convert_nested_amounts(self, values: Dict) -> Dict:
+        """
+        {k1: {k2: value}} -> cùng cấu trúc, value theo self.numeric (None giữ None)
+        """
+        num = self.numeric
+        return {
+            outer: {inner: num.amount(value) for inner, value in inner_values.items()}
+            for outer, inner_values in values.items()
+        }
+    
+    def get_extra_brand_records(
+        self,
+        target_year: int,
+        target_month: int,
+        brands_in_metadata: set,
+        actual_columns: ColumnarResult,
+        actual_lookup: Dict,
+        new_brand_this_month: set,
+        forecast_by_brand_today: Dict,
+        today: date,
+        kpi_day_channel_adjustment_by_date: Dict,
+        date_channel_combinations: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """
+        Records của brand không đi theo kpi_brand_metadata: brand mới trong tháng và
+        brand có actual nhưng không có trong metadata (xử lý giống brand mới)
+        """
+        results = []
         # Xử lý brand mới: tạo records cho tất cả ngày/channel trong tháng
         if new_brand_this_month:
             new_brand_records = self.get_new_brand_records(
                 target_year=target_year,
                 target_month=target_month,
                 new_brands=new_brand_this_month,
-                actual_by_date=actual_by_date,
+                actual_lookup=actual_lookup,
                 forecast_by_brand_today=forecast_by_brand_today,
                 today=today,
-                kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date
+                kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date,
+                date_channel_combinations=date_channel_combinations
             )
             results.extend(new_brand_records)
         
         # Xác định brand có actual nhưng không có trong metadata và không phải brand mới
-        # Lấy brand từ metadata (đã xử lý)
-        brands_in_metadata = {row['brand_name'] for row in kpi_brand_data}
-        
         # Lấy brand có actual revenue
-        brands_with_actual = set()
-        for calendar_date, channels in actual_by_date.items():
-            for channel, brands in channels.items():
-                for brand_name in brands.keys():
-                    brands_with_actual.add(brand_name)
+        brands_with_actual = actual_columns.unique_keys(['brand_name'])
         
         # Brand cần xử lý = có actual nhưng không có trong metadata và không phải brand mới
         brands_to_process = brands_with_actual - brands_in_metadata - new_brand_this_month
@@ -133,10 +457,11 @@ class KPIBrandCalculator:
                 target_year=target_year,
                 target_month=target_month,
                 new_brands=brands_to_process,
-                actual_by_date=actual_by_date,
+                actual_lookup=actual_lookup,
                 forecast_by_brand_today=forecast_by_brand_today,
                 today=today,
-                kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date
+                kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date,
+                date_channel_combinations=date_channel_combinations
             )
             results.extend(other_brand_records)
         
@@ -147,16 +472,19 @@ class KPIBrandCalculator:
         target_year: int,
         target_month: int,
         new_brands: set,
-        actual_by_date: Dict,
+        actual_lookup: Dict,
         forecast_by_brand_today: Dict,
         today: date,
-        kpi_day_channel_adjustment_by_date: Dict
+        kpi_day_channel_adjustment_by_date: Dict,
+        date_channel_combinations: Optional[List[Dict]] = None
     ) -> List[Dict]:
-        date_channel_combinations = self.revenue_helper.get_all_date_channel_combinations(
-            target_year=target_year,
-            target_month=target_month
-        )
+        if date_channel_combinations is None:
+            date_channel_combinations = self.revenue_helper.get_all_date_channel_combinations(
+                target_year=target_year,
+                target_month=target_month
+            )
         
+        num = self.numeric
         results = []
         
         for brand_name in new_brands:
@@ -168,10 +496,10 @@ class KPIBrandCalculator:
                 date_label = combo['date_label']
                 channel = combo['channel']
                 
-                actual = Decimal(actual_by_date.get(calendar_date, {}).get(channel, {}).get(brand_name, 0.0))
+                actual = num.amount(actual_lookup.get((calendar_date, channel, brand_name), 0.0), num.zero)
                 
                 # Logic cho brand mới: per_of_rev_by_brand_adj = 0, kpi_brand_initial = 0
-                kpi_brand_initial = Decimal('0')
+                kpi_brand_initial = num.zero
                 
                 # Chỉ tạo records cho ngày quá khứ và ngày hôm nay (không tạo cho ngày tương lai)
                 # Vì ngày tương lai kpi_brand_adjustment phải = 0 theo business logic
@@ -194,10 +522,10 @@ class KPIBrandCalculator:
                     forecast = actual
                 elif calendar_date == today:
                     # forecast bottom-up
-                    forecast = forecast_by_brand_today.get(channel, {}).get(brand_name, Decimal('0'))
+                    forecast = num.amount(forecast_by_brand_today.get(channel, {}).get(brand_name), num.zero)
                 else:
                     # forecast top-down
-                    forecast = Decimal('0')
+                    forecast = num.zero
                 
                 results.append({
                     'calendar_date': calendar_date,
@@ -207,12 +535,12 @@ class KPIBrandCalculator:
                     'date_label': date_label,
                     'channel': channel,
                     'brand_name': brand_name,
-                    'pct_of_rev_by_brand': Decimal('0'),
-                    'kpi_brand_initial': kpi_brand_initial,
-                    'actual': actual,
-                    'gap': gap,
-                    'kpi_brand_adjustment': kpi_brand_adjustment,
-                    'forecast': forecast
+                    'pct_of_rev_by_brand': num.zero,
+                    'kpi_brand_initial': num.output(kpi_brand_initial),
+                    'actual': num.output(actual),
+                    'gap': num.output(gap),
+                    'kpi_brand_adjustment': num.output(kpi_brand_adjustment),
+                    'forecast': num.output(forecast)
                 })
         
         return results
@@ -223,49 +551,196 @@ class KPIBrandCalculator:
         
         now = datetime.now()
         
-        data = []
-        for row in kpi_brand_data:
-            data.append([
-                row['calendar_date'],
-                row['year'],
-                row['month'],
-                row['day'],
-                row['date_label'],
-                row['channel'],
-                row['brand_name'],
-                row['pct_of_rev_by_brand'],
-                row['kpi_brand_initial'],
-                row['actual'],
-                row['gap'],
-                row['kpi_brand_adjustment'],
-                row['forecast'],
-                now,
-                now
-            ])
-        
-        columns = [
-            'calendar_date', 'year', 'month', 'day', 'date_label',
-            'channel', 'brand_name', 'pct_of_rev_by_brand', 
-            'kpi_brand_initial',
-            'actual', 'gap', 'kpi_brand_adjustment', 'forecast', 
-            'created_at', 'updated_at'
-        ]
-        
-        self.client.insert("hskcdp.kpi_brand", data, column_names=columns)
+        # Insert theo block (column-oriented), không giữ cả list dòng đã convert trong bộ nhớ
+        with BulkInsertWriter(self.writer, "hskcdp.kpi_brand", KPI_BRAND_INSERT_COLUMNS) as writer:
+            for row in kpi_brand_data:
+                writer.append([
+                    row['calendar_date'],
+                    row['year'],
+                    row['month'],
+                    row['day'],
+                    row['date_label'],
+                    row['channel'],
+                    row['brand_name'],
+                    row['pct_of_rev_by_brand'],
+                    row['kpi_brand_initial'],
+                    row['actual'],
+                    row['gap'],
+                    row['kpi_brand_adjustment'],
+                    row['forecast'],
+                    now,
+                    now
+                ])
     
     def calculate_and_save_kpi_brand(
         self,
         target_year: int,
-        target_month: int
+        target_month: int,
+        kpi_channel_data: Optional[List[Dict]] = None,
+        kpi_brand_metadata: Optional[List[Dict]] = None
     ) -> List[Dict]:
         kpi_brand_data = self.calculate_kpi_brand(
             target_year=target_year,
-            target_month=target_month
+            target_month=target_month,
+            kpi_channel_data=kpi_channel_data,
+            kpi_brand_metadata=kpi_brand_metadata
         )
         
         self.save_kpi_brand(kpi_brand_data)
         
         return kpi_brand_data
+    
+    def get_kpi_brand_server_side_query(self, target_year: int, target_month: int, today: date, now: datetime) -> str:
+        """
+        SELECT trả về dòng kpi_brand của các brand trong kpi_brand_metadata (cột KPI_BRAND_INSERT_COLUMNS),
+        cùng logic với vòng lặp trong calculate_kpi_brand nhưng chạy trong ClickHouse:
+            kpi_channel × kpi_brand_metadata × actual tháng × kpi_channel_adjustment
+            × forecast hôm nay (kpi_forecast) × forecast top-down (kpi_channel)
+        Tính bằng Float64 (bản Python theo self.numeric, mặc định Decimal). join_use_nulls để channel không có
+        kpi_channel_adjustment vẫn ra kpi_brand_adjustment = NULL như bản Python.
+        """
+        now_sql = now.strftime('%Y-%m-%d %H:%M:%S')
+        
+        return f"""
+            SELECT
+                v_date AS calendar_date,
+                v_year AS year,
+                v_month AS month,
+                v_day AS day,
+                v_date_label AS date_label,
+                v_channel AS channel,
+                v_brand_name AS brand_name,
+                v_pct AS pct_of_rev_by_brand,
+                v_initial AS kpi_brand_initial,
+                v_actual AS actual,
+                if(v_date < '{today}', v_actual - v_initial, 0.0) AS gap,
+                if(v_date < '{today}', toNullable(v_actual), v_channel_adjustment * v_pct) AS kpi_brand_adjustment,
+                multiIf(
+                    v_date < '{today}', v_actual,
+                    v_date = '{today}', v_forecast_today,
+                    v_top_down * v_pct
+                ) AS forecast,
+                toDateTime('{now_sql}') AS created_at,
+                toDateTime('{now_sql}') AS updated_at
+            FROM (
+                SELECT
+                    b.calendar_date AS v_date,
+                    b.year AS v_year,
+                    b.month AS v_month,
+                    b.day AS v_day,
+                    b.date_label AS v_date_label,
+                    b.channel AS v_channel,
+                    b.brand_name AS v_brand_name,
+                    toFloat64(b.per_of_rev_by_brand_adj) AS v_pct,
+                    toFloat64(b.kpi_channel_initial) * v_pct AS v_initial,
+                    ifNull(toFloat64(a.actual_amount), 0.0) AS v_actual,
+                    toFloat64(ch.kpi_channel_adjustment) AS v_channel_adjustment,
+                    ifNull(toFloat64(ft.forecast_sum), 0.0) AS v_forecast_today,
+                    ifNull(toFloat64(td.sum_forecast), 0.0) AS v_top_down
+                FROM (
+                    {self.revenue_helper.get_kpi_brand_with_brand_metadata_query(target_year, target_month)}
+                ) AS b
+                LEFT JOIN (
+                    {self.revenue_helper.get_actual_by_brand_channel_and_date_columns_query(target_year, target_month)}
+                ) AS a
+                    ON a.calendar_date = b.calendar_date
+                    AND a.channel = b.channel
+                    AND a.brand_name = b.brand_name
+                LEFT JOIN (
+                    {self.revenue_helper.get_kpi_day_channel_adjustment_by_date_and_channel_query(target_year, target_month)}
+                ) AS ch
+                    ON ch.calendar_date = b.calendar_date
+                    AND ch.channel = b.channel
+                LEFT JOIN (
+                    {self.revenue_helper.get_forecast_by_brand_for_today_query(today=today)}
+                ) AS ft
+                    ON ft.channel = b.channel
+                    AND ft.brand_name = b.brand_name
+                LEFT JOIN (
+                    {self.revenue_helper.get_forecast_top_down_from_channel_query(target_year, target_month, today=today)}
+                ) AS td
+                    ON td.calendar_date = b.calendar_date
+                    AND td.channel = b.channel
+            )
+            SETTINGS join_use_nulls = 1
+        """
+    
+    def calculate_and_save_kpi_brand_server_side(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_channel_data: Optional[List[Dict]] = None,
+        kpi_brand_metadata: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Server-side mode: dòng kpi_brand của brand trong metadata được tính và ghi bằng
+        1 lệnh INSERT INTO hskcdp.kpi_brand SELECT ... (không kéo date × channel × brand về Python).
+        Brand mới / brand có actual nhưng không có metadata vẫn tính bằng Python (get_extra_brand_records).
+        Không đi qua self.writer (incremental) vì dữ liệu không qua client.
+        Returns: {'rows': số dòng INSERT ... SELECT (None nếu server không trả về), 'new_brand_rows': ...}
+        """
+        metadata_query = f"""
+            SELECT DISTINCT brand_name
+            FROM hskcdp.kpi_brand_metadata FINAL
+            WHERE year = {target_year}
+              AND month = {target_month}
+        """
+        calls = {
+            'actual_columns': partial(
+                self.revenue_helper.get_actual_by_brand_channel_and_date_columns,
+                target_year=target_year,
+                target_month=target_month
+            ),
+            'forecast_by_brand_today': self.revenue_helper.get_forecast_by_brand_for_today,
+            'new_brand_this_month': self.revenue_helper.get_new_brand_this_month,
+        }
+        if kpi_brand_metadata is None:
+            calls['metadata_result'] = partial(self.client.query, metadata_query)
+        if kpi_channel_data is None:
+            calls['kpi_day_channel_adjustment_by_date'] = partial(
+                self.revenue_helper.get_kpi_day_channel_adjustment_by_date_and_channel,
+                target_year=target_year,
+                target_month=target_month
+            )
+        query_results = self.revenue_helper.gather(calls)
+        
+        today = date.today()
+        now = datetime.now()
+        summary = self.client.command(
+            f"INSERT INTO hskcdp.kpi_brand ({', '.join(KPI_BRAND_INSERT_COLUMNS)}) "
+            f"{self.get_kpi_brand_server_side_query(target_year, target_month, today, now)}"
+        )
+        rows = getattr(summary, 'written_rows', None)
+        
+        if kpi_brand_metadata is not None:
+            brands_in_metadata = {row['brand_name'] for row in kpi_brand_metadata}
+        else:
+            brands_in_metadata = {str(row[0]) for row in query_results['metadata_result'].result_rows}
+        
+        date_channel_combinations = None
+        if kpi_channel_data is not None:
+            kpi_day_channel_adjustment_by_date, _, date_channel_combinations = (
+                self.get_kpi_channel_maps_from_results(kpi_channel_data)
+            )
+        else:
+            kpi_day_channel_adjustment_by_date = query_results['kpi_day_channel_adjustment_by_date']
+        
+        actual_columns = query_results['actual_columns']
+        extra_brand_records = self.get_extra_brand_records(
+            target_year=target_year,
+            target_month=target_month,
+            brands_in_metadata=brands_in_metadata,
+            actual_columns=actual_columns,
+            actual_lookup=actual_columns.to_lookup(['calendar_date', 'channel', 'brand_name'], 'actual_amount'),
+            new_brand_this_month=query_results['new_brand_this_month'],
+            forecast_by_brand_today=query_results['forecast_by_brand_today'],
+            today=today,
+            kpi_day_channel_adjustment_by_date=kpi_day_channel_adjustment_by_date,
+            date_channel_combinations=date_channel_combinations
+        )
+        self.save_kpi_brand(extra_brand_records)
+        
+        return {'rows': rows, 'new_brand_rows': len(extra_brand_records)}
 
 
 if __name__ == "__main__":
@@ -276,6 +751,7 @@ if __name__ == "__main__":
     
     target_month = None
     target_year = constants.KPI_YEAR_2026
+    server_side = False
     
     if len(sys.argv) > 1:
         i = 1
@@ -286,6 +762,10 @@ if __name__ == "__main__":
             elif sys.argv[i] == "--target-year" and i + 1 < len(sys.argv):
                 target_year = int(sys.argv[i + 1])
                 i += 2
+            elif sys.argv[i] == "--server-side":
+                # INSERT ... SELECT trong ClickHouse, không kéo dữ liệu về Python
+                server_side = True
+                i += 1
             else:
                 i += 1
     
@@ -301,7 +781,14 @@ if __name__ == "__main__":
         sys.exit(1)
     
     print(f"Calculating kpi_brand for month {target_month}/{target_year}...")
-    kpi_brand_data = calculator.calculate_and_save_kpi_brand(
-        target_year=target_year,
-        target_month=target_month
-    )
\ No newline at end of file
+    if server_side:
+        stats = calculator.calculate_and_save_kpi_brand_server_side(
+            target_year=target_year,
+            target_month=target_month
+        )
+        print(f"Successfully saved kpi_brand server-side: {stats['rows']} rows + {stats['new_brand_rows']} new brand rows")
+    else:
+        kpi_brand_data = calculator.calculate_and_save_kpi_brand(
+            target_year=target_year,
+            target_month=target_month
+        )
\ No newline at end of file
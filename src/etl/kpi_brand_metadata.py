@@ -4,13 +4,16 @@ from typing import List, Dict
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 class KPIBrandMetadataCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
     
     def calculate_kpi_brand_metadata(
         self,
@@ -64,7 +67,7 @@ class KPIBrandMetadataCalculator:
                 'pic': '',
                 'per_of_rev_by_brand_adj': float(per_of_rev_by_brand_adj)
             })
-        print("=========sum_check========= ", sum_check)
+        logger.debug("Sum of per_of_rev_by_brand: %s", sum_check)
         return results
     
     def save_kpi_brand_metadata(self, metadata_data: List[Dict]) -> None:
@@ -1,47 +1,110 @@
-from decimal import Decimal
+import numpy as np
 from datetime import datetime, date
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.bulk_writer import BulkInsertWriter
+from src.utils.numeric_policy import get_numeric_policy
+from src.utils.columnar import ColumnarResult, factorize, join_values
 
 
 class KPIDayChannelCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None, writer=None, numeric=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        # Đích insert (cùng signature client.insert), vd IncrementalWriter; mặc định ghi thẳng client
+        self.writer = writer if writer is not None else self.client
+        # Kiểu số trong vòng lặp (decimal / float / fixed), xem src/utils/numeric_policy.py
+        self.numeric = numeric if numeric is not None else get_numeric_policy('kpi_channel')
+    
+    def get_kpi_day_maps_from_results(
+        self,
+        kpi_day_data: List[Dict]
+    ) -> Tuple[Dict[date, object], Dict[str, object]]:
+        """
+        Dựng lại kpi_day_adjustment_by_date và forecast top-down (eod của các ngày tương lai)
+        từ kết quả stage kpi_day, thay cho get_kpi_day_adjustment_by_date / get_forecast_top_down_from_day
+        """
+        today = date.today()
+        num = self.numeric
+        kpi_day_adjustment_by_date = {}
+        forecast_top_down = {}
+        for row in kpi_day_data:
+            calendar_date = row['calendar_date']
+            kpi_day_adjustment_by_date[calendar_date] = num.amount(row.get('kpi_day_adjustment'))
+            
+            if calendar_date > today and row.get('eod') is not None:
+                forecast_top_down[str(calendar_date)] = num.amount(row['eod'])
+        
+        return kpi_day_adjustment_by_date, forecast_top_down
     
     def calculate_kpi_day_channel(
         self,
         target_year: int,
-        target_month: int
+        target_month: int,
+        kpi_day_data: Optional[List[Dict]] = None
     ) -> List[Dict]:
-        kpi_day_channel_data = self.revenue_helper.get_kpi_day_with_channel_metadata(
-            target_year=target_year,
-            target_month=target_month
-        )
-        
-        actual_by_date = self.revenue_helper.get_actual_by_channel_and_date(
-            target_year=target_year,
-            target_month=target_month
-        )
+        num = self.numeric
+        if num.vectorized:
+            # Policy float / fixed: đọc dạng cột, tính trên mảng (calculate_kpi_day_channel_vectorized)
+            kpi_day_channel_data = self.revenue_helper.get_kpi_day_with_channel_metadata_columns(
+                target_year=target_year,
+                target_month=target_month
+            )
+            actual_by_date = self.revenue_helper.get_actual_by_channel_and_date_columns(
+                target_year=target_year,
+                target_month=target_month
+            )
+        else:
+            kpi_day_channel_data = self.revenue_helper.get_kpi_day_with_channel_metadata(
+                target_year=target_year,
+                target_month=target_month
+            )
+            actual_by_date = self.revenue_helper.get_actual_by_channel_and_date(
+                target_year=target_year,
+                target_month=target_month
+            )
         
-        kpi_day_adjustment_by_date = self.revenue_helper.get_kpi_day_adjustment_by_date(
-            target_year=target_year,
-            target_month=target_month
-        )
+        if kpi_day_data is not None:
+            # Kết quả kpi_day từ stage trước trong cùng process
+            kpi_day_adjustment_by_date, forecast_top_down = self.get_kpi_day_maps_from_results(kpi_day_data)
+        else:
+            kpi_day_adjustment_by_date = self.revenue_helper.get_kpi_day_adjustment_by_date(
+                target_year=target_year,
+                target_month=target_month
+            )
+            
+            forecast_top_down = self.revenue_helper.get_forecast_top_down_from_day(
+                target_year=target_year, 
+                target_month=target_month
+            )
 
         forecast_by_channel_for_today = self.revenue_helper.get_forecast_by_channel_for_today()
-        
-        forecast_top_down = self.revenue_helper.get_forecast_top_down_from_day(
-            target_year=target_year, 
-            target_month=target_month
-        )
 
-        results = []
+        # Convert 1 lần sang kiểu số của policy, vòng lặp chỉ còn phép tính
+        kpi_day_adjustment_by_date = {
+            calendar_date: num.amount(value) for calendar_date, value in kpi_day_adjustment_by_date.items()
+        }
+        forecast_top_down = {key: num.amount(value) for key, value in forecast_top_down.items()}
+        forecast_by_channel_for_today = {
+            channel: num.amount(value) for channel, value in forecast_by_channel_for_today.items()
+        }
+
         today = date.today()
         
+        if num.vectorized:
+            return self.calculate_kpi_day_channel_vectorized(
+                kpi_day_channel_data,
+                actual_by_date,
+                kpi_day_adjustment_by_date,
+                forecast_top_down,
+                forecast_by_channel_for_today,
+                today
+            )
+        
+        results = []
         for row in kpi_day_channel_data:
             calendar_date = row['calendar_date']
             year = row['year']
@@ -49,23 +112,23 @@ class KPIDayChannelCalculator:
             day = row['day']
             date_label = row['date_label']
             channel = row['channel']
-            rev_pct_adjustment = row['rev_pct_adjustment']
-            kpi_day_initial = row['kpi_day_initial']
+            rev_pct_adjustment = num.ratio(row['rev_pct_adjustment'])
+            kpi_day_initial = num.amount(row['kpi_day_initial'])
             
             # Calculate kpi_channel_initial using rev_pct_adjustment
-            kpi_channel_initial = kpi_day_initial * rev_pct_adjustment
+            kpi_channel_initial = num.scale(kpi_day_initial, rev_pct_adjustment)
             
             # Get actual revenue for this channel on this date
-            actual = actual_by_date.get(calendar_date, {}).get(channel, 0.0)       
+            actual = num.amount(actual_by_date.get(calendar_date, {}).get(channel, 0.0), num.zero)
             
             if calendar_date < today:
-                kpi_channel_adjustment = Decimal(str(actual))
-                gap = Decimal(str(actual)) - kpi_channel_initial
+                kpi_channel_adjustment = actual
+                gap = actual - kpi_channel_initial
             else:
-                gap = Decimal('0')
+                gap = num.zero
                 kpi_day_adjustment = kpi_day_adjustment_by_date.get(calendar_date)
                 if kpi_day_adjustment is not None:
-                    kpi_channel_adjustment = kpi_day_adjustment * rev_pct_adjustment
+                    kpi_channel_adjustment = num.scale(kpi_day_adjustment, rev_pct_adjustment)
                 else:
                     kpi_channel_adjustment = None
             
@@ -74,10 +137,10 @@ class KPIDayChannelCalculator:
                 forecast = actual 
             elif calendar_date == today:
                 # forecast bottom-up
-                forecast = forecast_by_channel_for_today.get(channel, Decimal('0'))
+                forecast = forecast_by_channel_for_today.get(channel, num.zero)
             else:
                 # forecast top-down
-                forecast = forecast_top_down[str(calendar_date)] * rev_pct_adjustment
+                forecast = num.scale(forecast_top_down[str(calendar_date)], rev_pct_adjustment)
 
             results.append({
                 'calendar_date': calendar_date,
@@ -88,39 +151,106 @@ class KPIDayChannelCalculator:
                 'channel': channel,
                 'rev_pct': rev_pct_adjustment,
                 'kpi_channel_initial': kpi_channel_initial,
-                'actual': Decimal(str(actual)) if actual is not None else None,
-                'gap': Decimal(str(gap)) if gap is not None else None,
-                'kpi_channel_adjustment': kpi_channel_adjustment if kpi_channel_adjustment is not None else None,
+                'actual': actual,
+                'gap': gap,
+                'kpi_channel_adjustment': kpi_channel_adjustment,
                 'forecast': forecast
             })
         
         return results
     
+    def calculate_kpi_day_channel_vectorized(
+        self,
+        kpi_day_channel_columns: ColumnarResult,
+        actual_columns: ColumnarResult,
+        kpi_day_adjustment_by_date: Dict,
+        forecast_top_down: Dict,
+        forecast_by_channel_for_today: Dict,
+        today: date
+    ) -> List[Dict]:
+        """
+        Cùng logic với vòng lặp trong calculate_kpi_day_channel nhưng input dạng cột (float64)
+        và tính trên mảng (policy float / fixed); chỉ tạo dict cho từng dòng ở bước cuối. NaN = None.
+        """
+        num = self.numeric
+        calendar_dates = kpi_day_channel_columns['calendar_date']
+        channels = kpi_day_channel_columns['channel']
+        rev_pct = kpi_day_channel_columns['rev_pct_adjustment']
+        kpi_day_initial = kpi_day_channel_columns['kpi_day_initial']
+        today_value = np.datetime64(today, 'D')
+        is_past = calendar_dates < today_value
+        is_today = calendar_dates == today_value
+
+        actual = join_values(
+            [calendar_dates, channels],
+            [actual_columns['calendar_date'], actual_columns['channel']],
+            actual_columns['actual_amount']
+        )
+        actual[~np.isfinite(actual)] = 0.0
+
+        # Giá trị theo ngày / channel: lấy 1 lần cho mỗi giá trị khác nhau rồi expand theo mã
+        unique_days, day_codes = np.unique(calendar_dates, return_inverse=True)
+        unique_dates = unique_days.tolist()
+        kpi_day_adjustment = num.amounts(
+            [kpi_day_adjustment_by_date.get(calendar_date) for calendar_date in unique_dates]
+        )[day_codes]
+        top_down = num.amounts([
+            forecast_top_down[str(calendar_date)] if calendar_date > today else None
+            for calendar_date in unique_dates
+        ])[day_codes]
+        n_channels, channel_codes = factorize(channels)
+        unique_channels = [None] * n_channels
+        for channel, code in zip(channels.tolist(), channel_codes.tolist()):
+            unique_channels[code] = channel
+        today_forecast = num.amounts(
+            [forecast_by_channel_for_today.get(channel, 0.0) for channel in unique_channels]
+        )[channel_codes]
+
+        kpi_channel_initial = kpi_day_initial * rev_pct
+        kpi_channel_adjustment = np.where(is_past, actual, kpi_day_adjustment * rev_pct)
+        gap = np.where(is_past, actual - kpi_channel_initial, 0.0)
+        forecast = np.select([is_past, is_today], [actual, today_forecast], default=top_down * rev_pct)
+
+        return [
+            {
+                'calendar_date': calendar_date,
+                'year': year,
+                'month': month,
+                'day': day,
+                'date_label': date_label,
+                'channel': channel,
+                'rev_pct': rev_pct_value,
+                'kpi_channel_initial': initial_value,
+                'actual': actual_value,
+                'gap': gap_value,
+                'kpi_channel_adjustment': adjustment_value,
+                'forecast': forecast_value
+            }
+            for (
+                calendar_date, year, month, day, date_label, channel, rev_pct_value,
+                initial_value, actual_value, gap_value, adjustment_value, forecast_value
+            ) in zip(
+                calendar_dates.tolist(),
+                kpi_day_channel_columns['year'].tolist(),
+                kpi_day_channel_columns['month'].tolist(),
+                kpi_day_channel_columns['day'].tolist(),
+                kpi_day_channel_columns['date_label'].tolist(),
+                channels.tolist(),
+                rev_pct.tolist(),
+                num.outputs(kpi_channel_initial),
+                num.outputs(actual),
+                num.outputs(gap),
+                num.outputs(kpi_channel_adjustment),
+                num.outputs(forecast)
+            )
+        ]
+    
     def save_kpi_day_channel(self, kpi_day_channel_data: List[Dict]) -> None:
         if not kpi_day_channel_data:
             return
         
         now = datetime.now()
         
-        data = []
-        for row in kpi_day_channel_data:
-            data.append([
-                row['calendar_date'],
-                row['year'],
-                row['month'],
-                row['day'],
-                row['date_label'],
-                row['channel'],
-                row['rev_pct'],
-                row['kpi_channel_initial'],
-                row['actual'],
-                row['gap'],
-                row['kpi_channel_adjustment'],
-                row['forecast'],
-                now,
-                now
-            ])
-        
         columns = [
             'calendar_date', 'year', 'month', 'day', 'date_label',
             'channel', 'rev_pct', 'kpi_channel_initial',
@@ -128,17 +258,37 @@ class KPIDayChannelCalculator:
             'created_at', 'updated_at'
         ]
         
-        self.client.insert("hskcdp.kpi_channel", data, column_names=columns)
+        # Insert theo block (column-oriented), không giữ cả list dòng đã convert trong bộ nhớ
+        with BulkInsertWriter(self.writer, "hskcdp.kpi_channel", columns) as writer:
+            for row in kpi_day_channel_data:
+                writer.append([
+                    row['calendar_date'],
+                    row['year'],
+                    row['month'],
+                    row['day'],
+                    row['date_label'],
+                    row['channel'],
+                    row['rev_pct'],
+                    row['kpi_channel_initial'],
+                    row['actual'],
+                    row['gap'],
+                    row['kpi_channel_adjustment'],
+                    row['forecast'],
+                    now,
+                    now
+                ])
     
     def calculate_and_save_kpi_day_channel(
         self,
         target_year: int,
-        target_month: int
+        target_month: int,
+        kpi_day_data: Optional[List[Dict]] = None
     ) -> List[Dict]:
         # Calculate kpi_day_channel
         kpi_day_channel_data = self.calculate_kpi_day_channel(
             target_year=target_year,
-            target_month=target_month
+            target_month=target_month,
+            kpi_day_data=kpi_day_data
         )
         
         self.save_kpi_day_channel(kpi_day_channel_data)
@@ -5,12 +5,19 @@ from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
 
+# Cột % của metadata_annually theo channel
+ANNUALLY_PCT_COLUMNS = {
+    'OFFLINE_HASAKI': 'pct_offline',
+    'ONLINE_HASAKI': 'pct_online',
+    'ECOM': 'pct_ecom',
+}
+
 
 class KPIDayChannelMetadataCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
     
     def calculate_channel_revenue_percentage(
         self,
@@ -121,23 +128,6 @@ class KPIDayChannelMetadataCalculator:
         
         self.client.insert("hskcdp.kpi_channel_metadata", data, column_names=columns)
     
-    def check_metadata_annually_exists(
-        self,
-        target_year: int,
-        target_month: int
-    ) -> bool:
-        query = f"""
-            SELECT COUNT(*) 
-            FROM hskcdp.metadata_annually
-            WHERE year = {target_year}
-              AND month = {target_month}
-        """
-        
-        result = self.client.query(query)
-        count = result.result_rows[0][0] if result.result_rows else 0
-        
-        return count > 0
-    
     def get_metadata_annually_data(
         self,
         target_year: int,
@@ -165,57 +155,27 @@ class KPIDayChannelMetadataCalculator:
         
         return data
     
-    def update_channel_metadata_from_annually(
+    def apply_metadata_annually(
         self,
-        target_year: int,
-        target_month: int
-    ) -> None:
-        annually_data = self.get_metadata_annually_data(target_year, target_month)
-        
-        if not annually_data:
-            return
-        
-        for row in annually_data:
-            priority_label = row['priority_label'].replace("'", "''")
-            pct_offline = row['pct_offline']
-            pct_online = row['pct_online']
-            pct_ecom = row['pct_ecom']
-            
-            update_offline_query = f"""
-                ALTER TABLE hskcdp.kpi_channel_metadata
-                UPDATE 
-                    rev_pct = toDecimal64({pct_offline}, 15),
-                    rev_pct_adjustment = toDecimal64({pct_offline}, 15)
-                WHERE year = {target_year}
-                  AND month = {target_month}
-                  AND date_label = '{priority_label}'
-                  AND channel = 'OFFLINE_HASAKI'
-            """
-            self.client.command(update_offline_query)
-            
-            update_online_query = f"""
-                ALTER TABLE hskcdp.kpi_channel_metadata
-                UPDATE 
-                    rev_pct = toDecimal64({pct_online}, 15),
-                    rev_pct_adjustment = toDecimal64({pct_online}, 15)
-                WHERE year = {target_year}
-                  AND month = {target_month}
-                  AND date_label = '{priority_label}'
-                  AND channel = 'ONLINE_HASAKI'
-            """
-            self.client.command(update_online_query)
-            
-            update_ecom_query = f"""
-                ALTER TABLE hskcdp.kpi_channel_metadata
-                UPDATE 
-                    rev_pct = toDecimal64({pct_ecom}, 15),
-                    rev_pct_adjustment = toDecimal64({pct_ecom}, 15)
-                WHERE year = {target_year}
-                  AND month = {target_month}
-                  AND date_label = '{priority_label}'
-                  AND channel = 'ECOM'
-            """
-            self.client.command(update_ecom_query)
+        metadata_data: List[Dict],
+        annually_data: List[Dict]
+    ) -> int:
+        """
+        Ghi đè rev_pct / rev_pct_adjustment in-memory theo % channel của metadata_annually (theo priority_label),
+        thay cho 3 ALTER TABLE ... UPDATE / priority_label. Trả về số dòng bị ghi đè.
+        """
+        pct_by_label = {row['priority_label']: row for row in annually_data}
+        updated = 0
+        for row in metadata_data:
+            annually_row = pct_by_label.get(row['date_label'])
+            column = ANNUALLY_PCT_COLUMNS.get(row['channel'])
+            if annually_row is None or column is None:
+                continue
+            pct = Decimal(str(annually_row[column]))
+            row['rev_pct'] = pct
+            row['rev_pct_adjustment'] = pct
+            updated += 1
+        return updated
     
     def calculate_and_save_kpi_day_channel_metadata(
         self,
@@ -229,10 +189,13 @@ class KPIDayChannelMetadataCalculator:
             date_labels=date_labels
         )
         
-        self.save_kpi_day_channel_metadata(metadata_data)
+        # Override của metadata_annually được áp in-memory trước khi insert: 1 lần ghi, không mutation,
+        # và kết quả trả về cho stage sau đã có override
+        annually_data = self.get_metadata_annually_data(target_year, target_month)
+        if annually_data:
+            self.apply_metadata_annually(metadata_data, annually_data)
         
-        if self.check_metadata_annually_exists(target_year, target_month):
-            self.update_channel_metadata_from_annually(target_year, target_month)
+        self.save_kpi_day_channel_metadata(metadata_data)
         
         return metadata_data
 
@@ -1,16 +1,26 @@
+import numpy as np
+from functools import partial
 from decimal import Decimal
 from datetime import datetime, date
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.intraday_profile import ALL_KEY
+from src.utils.dim_calendar import DOUBLE_DAY_WINDOW
+from src.utils.redistribution import redistribute_gap, to_optional_floats
+from src.utils.logger import get_logger, TRACE_LOOPS
+
+logger = get_logger(__name__)
 
 
 class KPIDayCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None, writer=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        # Đích insert (cùng signature client.insert), vd IncrementalWriter; mặc định ghi thẳng client
+        self.writer = writer if writer is not None else self.client
     
     def calculate_kpi_day_initial(
         self,
@@ -19,98 +29,104 @@ class KPIDayCalculator:
     ) -> List[Dict]:
         target_version = f"Thang {target_month}"
         
-        query = f"""
+        # Ngày của tháng (trừ double day) và nhãn lấy từ calendar in-memory; chỉ query kpi_month và metadata
+        kpi_month_query = f"""
             SELECT 
-                d.calendar_date,
-                d.priority_label AS date_label,
-                d.year,
-                d.month,
-                d.day,
-                m.kpi_initial AS kpi_month,
-                md.uplift,
-                md.weight,
-                md.total_weight_month
-            FROM hskcdp.dim_date AS d
-            INNER JOIN (
-                SELECT 
-                    year,
-                    month,
-                    kpi_initial
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{target_version}'
-            ) AS m
-                ON d.year = m.year 
-                AND d.month = m.month
-            INNER JOIN (
-                SELECT 
-                    year,
-                    month,
-                    date_label,
-                    uplift,
-                    weight,
-                    total_weight_month
-                FROM hskcdp.kpi_day_metadata FINAL
-            ) AS md
-                ON d.year = md.year
-                AND d.month = md.month
-                AND d.priority_label = md.date_label
-            WHERE d.year = {target_year}
-              AND d.month = {target_month}
-              AND NOT (
-                  (d.month = 6 AND d.day = 6) OR
-                  (d.month = 9 AND d.day = 9) OR
-                  (d.month = 11 AND d.day = 11) OR
-                  (d.month = 12 AND d.day = 12)
-              )
-            ORDER BY d.calendar_date
+                kpi_initial
+            FROM {self.revenue_helper.table('hskcdp.kpi_month')}
+            WHERE year = {target_year}
+              AND month = {target_month}
+              AND version = '{target_version}'
+        """
+        kpi_month_values = [row[0] for row in self.client.query(kpi_month_query).result_rows]
+        
+        return self.build_kpi_day_initial(
+            target_year,
+            target_month,
+            kpi_month_values,
+            self.get_kpi_day_metadata_by_label(target_year, target_month)
+        )
+    
+    def get_kpi_day_metadata_by_label(self, target_year: int, target_month: int) -> Dict[str, List[tuple]]:
+        # {date_label: [(uplift, weight, total_weight_month)]} của kpi_day_metadata FINAL cho tháng
+        metadata_query = f"""
+            SELECT 
+                date_label,
+                uplift,
+                weight,
+                total_weight_month
+            FROM hskcdp.kpi_day_metadata FINAL
+            WHERE year = {target_year}
+              AND month = {target_month}
         """
         
-        result = self.client.query(query)
+        metadata_by_label = {}
+        for row in self.client.query(metadata_query).result_rows:
+            metadata_by_label.setdefault(row[0], []).append(row[1:])
+        return metadata_by_label
+    
+    def build_kpi_day_initial(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_month_values: List,
+        metadata_by_label: Dict[str, List[tuple]]
+    ) -> List[Dict]:
+        """
+        Chia kpi_month cho từng ngày của tháng theo uplift / total_weight_month (không query, ngoài lần load
+        calendar đầu tiên). Giữ đúng kết quả của INNER JOIN dim_date × kpi_month × kpi_day_metadata cũ
+        """
+        calendar = self.revenue_helper.get_calendar()
         results = []
         
-        for row in result.result_rows:
-            calendar_date = row[0]
-            date_label = row[1]
-            year = row[2]
-            month = row[3]
-            day = row[4]
-            kpi_month = Decimal(str(row[5]))
-            uplift = Decimal(str(row[6]))
-            weight = Decimal(str(row[7]))
-            total_weight_month = Decimal(str(row[8]))
-            
-            if total_weight_month > 0:
-                kpi_day_initial = (uplift * kpi_month) / total_weight_month
-            else:
-                kpi_day_initial = Decimal('0')
-            
-            results.append({
-                'calendar_date': calendar_date,
-                'year': year,
-                'month': month,
-                'day': day,
-                'date_label': date_label,
-                'kpi_month': Decimal(kpi_month),
-                'uplift': Decimal(uplift),
-                'weight': Decimal(weight),
-                'total_weight_month': Decimal(total_weight_month),
-                'kpi_day_initial': Decimal(kpi_day_initial)
-            })
+        for dim_date in calendar.get_month_rows(target_year, target_month, DOUBLE_DAY_WINDOW):
+            for kpi_month_value in kpi_month_values:
+                for metadata_row in metadata_by_label.get(dim_date['priority_label'], []):
+                    kpi_month = Decimal(str(kpi_month_value))
+                    uplift = Decimal(str(metadata_row[0]))
+                    weight = Decimal(str(metadata_row[1]))
+                    total_weight_month = Decimal(str(metadata_row[2]))
+                    
+                    if total_weight_month > 0:
+                        kpi_day_initial = (uplift * kpi_month) / total_weight_month
+                    else:
+                        kpi_day_initial = Decimal('0')
+                    
+                    results.append({
+                        'calendar_date': dim_date['calendar_date'],
+                        'year': dim_date['year'],
+                        'month': dim_date['month'],
+                        'day': dim_date['day'],
+                        'date_label': dim_date['priority_label'],
+                        'kpi_month': Decimal(kpi_month),
+                        'uplift': Decimal(uplift),
+                        'weight': Decimal(weight),
+                        'total_weight_month': Decimal(total_weight_month),
+                        'kpi_day_initial': Decimal(kpi_day_initial)
+                    })
         
         return results
     
-    def save_kpi_day(self, kpi_day_data: List[Dict]) -> None:
-        if not kpi_day_data:
-            return
-        now = datetime.now()
-        
-        months_needed = set()
-        for row in kpi_day_data:
-            months_needed.add((row['year'], row['month']))
-        
+    def get_kpi_month_map(
+        self,
+        months_needed: Set[Tuple[int, int]],
+        kpi_month_data: Optional[List[Dict]] = None
+    ) -> Dict[Tuple[int, int], float]:
+        """
+        Lấy kpi_initial của version "Thang {month}" cho từng (year, month).
+        Nếu có kpi_month_data (kết quả stage kpi_month vừa chạy trong cùng process)
+        thì dùng trực tiếp, chỉ query kpi_month cho các tháng còn thiếu.
+        """
         kpi_month_map = {}
+        if kpi_month_data:
+            for row in kpi_month_data:
+                key = (row['year'], row['month'])
+                if key in months_needed and row['version'] == f"Thang {row['month']}":
+                    kpi_month_map[key] = float(row['kpi_initial'])
+        
         for year, month in months_needed:
+            if (year, month) in kpi_month_map:
+                continue
             target_version = f"Thang {month}"
             kpi_month_query = f"""
                 SELECT 
@@ -120,7 +136,7 @@ class KPIDayCalculator:
                         year,
                         month,
                         kpi_initial
-                    FROM hskcdp.kpi_month FINAL
+                    FROM {self.revenue_helper.table('hskcdp.kpi_month')}
                     WHERE year = {year}
                       AND month = {month}
                       AND version = '{target_version}'
@@ -131,6 +147,23 @@ class KPIDayCalculator:
             if kpi_month_result.result_rows:
                 kpi_month_map[(year, month)] = float(kpi_month_result.result_rows[0][0])
         
+        return kpi_month_map
+    
+    def save_kpi_day(
+        self,
+        kpi_day_data: List[Dict],
+        kpi_month_data: Optional[List[Dict]] = None
+    ) -> None:
+        if not kpi_day_data:
+            return
+        now = datetime.now()
+        
+        months_needed = set()
+        for row in kpi_day_data:
+            months_needed.add((row['year'], row['month']))
+        
+        kpi_month_map = self.get_kpi_month_map(months_needed, kpi_month_data)
+        
         calendar_dates = [row['calendar_date'] for row in kpi_day_data]
         actual_map = self.revenue_helper.get_daily_actual_by_dates(calendar_dates)
         
@@ -172,27 +205,28 @@ class KPIDayCalculator:
             'kpi_day_initial', 'actual', 'gap', 'created_at', 'updated_at'
         ]
         
-        self.client.insert("hskcdp.kpi_day", data, column_names=columns)
+        self.writer.insert("hskcdp.kpi_day", data, column_names=columns)
     
     def calculate_and_save_kpi_day_initial(
         self,
         target_year: int,
         target_month: int,
+        kpi_month_data: Optional[List[Dict]] = None
     ) -> List[Dict]:
         kpi_day_data = self.calculate_kpi_day_initial(
             target_year=target_year,
             target_month=target_month
         )
         
-        self.save_kpi_day(kpi_day_data)
+        self.save_kpi_day(kpi_day_data, kpi_month_data=kpi_month_data)
         
         return kpi_day_data
     
-    def calculate_kpi_day_adjustment(
+    def get_all_days_from_kpi_day(
         self,
         target_year: int,
         target_month: int
-    ) -> List[Dict]:
+    ) -> Dict[date, Dict]:
         all_days_query = f"""
             SELECT 
                 kd.calendar_date,
@@ -203,8 +237,10 @@ class KPIDayCalculator:
                 kd.kpi_day_initial,
                 kd.kpi_day_adjustment,
                 kd.uplift,
-                kd.weight
-            FROM (SELECT * FROM hskcdp.kpi_day FINAL) AS kd
+                kd.weight,
+                kd.kpi_month,
+                kd.total_weight_month
+            FROM (SELECT * FROM {self.revenue_helper.table('hskcdp.kpi_day')}) AS kd
             WHERE kd.year = {target_year}
               AND kd.month = {target_month}
             ORDER BY kd.calendar_date
@@ -224,91 +260,95 @@ class KPIDayCalculator:
                 'kpi_day_initial': Decimal(str(row[5])),
                 'kpi_day_adjustment': Decimal(str(kpi_day_adjustment)) if kpi_day_adjustment is not None else None,
                 'uplift': Decimal(str(row[7])),
-                'weight': Decimal(str(row[8]))
+                'weight': Decimal(str(row[8])),
+                'kpi_month': float(row[9]),
+                'total_weight_month': float(row[10])
             }
         
-        actuals_dict = self.revenue_helper.get_daily_actual_by_month(target_year, target_month)
+        return all_days
+    
+    def get_all_days_from_initial(self, kpi_day_initial_data: List[Dict]) -> Dict[date, Dict]:
+        """
+        Dựng map all_days từ kết quả calculate_kpi_day_initial thay vì đọc lại kpi_day FINAL
+        """
+        all_days = {}
+        for row in sorted(kpi_day_initial_data, key=lambda r: r['calendar_date']):
+            all_days[row['calendar_date']] = {
+                'year': row['year'],
+                'month': row['month'],
+                'day': row['day'],
+                'date_label': row['date_label'],
+                'kpi_day_initial': Decimal(str(row['kpi_day_initial'])),
+                'kpi_day_adjustment': None,
+                'uplift': Decimal(str(row['uplift'])),
+                'weight': Decimal(str(row['weight'])),
+                'kpi_month': float(row['kpi_month']),
+                'total_weight_month': float(row['total_weight_month'])
+            }
+        return all_days
+    
+    def calculate_kpi_day_adjustment(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_day_initial_data: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        today = date.today()
+        current_datetime = datetime.now()
+        current_hour = current_datetime.hour
+        is_current_month = today.year == target_year and today.month == target_month
+        
+        # Các query độc lập chạy song song (latency = query chậm nhất thay vì tổng)
+        calls = {
+            'actuals_dict': partial(self.revenue_helper.get_daily_actual_by_month, target_year, target_month),
+            'forecast_by_day': partial(self.revenue_helper.get_forecast_by_day, target_year, target_month),
+        }
+        if kpi_day_initial_data is None:
+            calls['all_days'] = partial(self.get_all_days_from_kpi_day, target_year, target_month)
+        if is_current_month:
+            calls['intraday_profile'] = partial(self.revenue_helper.get_intraday_profile, dimension='all', days_back=30)
+            calls['actual_until_hour'] = partial(self.revenue_helper.get_daily_actual_until_hour, today, current_hour)
+        query_results = self.revenue_helper.gather(calls)
+        
+        if kpi_day_initial_data is not None:
+            all_days = self.get_all_days_from_initial(kpi_day_initial_data)
+        else:
+            all_days = query_results['all_days']
+        
+        actuals_dict = query_results['actuals_dict']
 
-        forecast_by_day = self.revenue_helper.get_forecast_by_day(target_year, target_month)
+        forecast_by_day = query_results['forecast_by_day']
 
 
         actuals = {date: Decimal(str(amount)) for date, amount in actuals_dict.items()}
         
-        days_with_actual = set()
-        total_gap = Decimal('0')
-        today = date.today()
-        
         eod_value = None
-        current_datetime = datetime.now()
-        current_hour = current_datetime.hour
         
-        if today.year == target_year and today.month == target_month and today in all_days:
-            print(f"\n=== DEBUG: Calculating EOD for date {today} ===")
-            print(f"DEBUG: Current datetime = {current_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"DEBUG: Current hour (rounded down) = {current_hour}h")
-            print(f"DEBUG: Get actual from 00:00 to <{current_hour}h (i.e., from 00:00 to {current_hour - 1}h59)")
-            
-            hourly_percentages = self.revenue_helper.get_hourly_revenue_percentage(days_back=30)
-            print(f"DEBUG: Hourly revenue percentages (30 recent days):")
-            for hour in range(24):
-                if hour in hourly_percentages:
-                    percentage = hourly_percentages[hour]
-                    print(f"  - Hour {hour:2d}h: {percentage:.6f} ({percentage * 100:.4f}%)")
+        if is_current_month and today in all_days:
+            logger.debug("Calculating EOD for %s at %s (actual from 00:00 to <%sh)", today, current_datetime, current_hour)
             
-            total_percentage_passed = Decimal('0')
-            print(f"\nDEBUG: Calculate total % of hours passed (0h to {current_hour - 1}h):")
-            for hour in range(current_hour):
-                if hour in hourly_percentages:
-                    percentage = Decimal(str(hourly_percentages[hour]))
-                    total_percentage_passed += percentage
-                    print(f"  - Hour {hour:2d}h: {percentage:.6f} ({float(percentage) * 100:.4f}%)")
+            intraday_profile = query_results['intraday_profile']
+            if TRACE_LOOPS:
+                for hour in range(24):
+                    logger.debug("Hourly revenue percentage (30 recent days) %2dh: %.6f", hour, intraday_profile.hour_pct(ALL_KEY, hour))
             
-            print(f"DEBUG: Total % of hours passed = {total_percentage_passed} ({float(total_percentage_passed) * 100:.4f}%)")
-            
-            actual_until_hour = self.revenue_helper.get_daily_actual_until_hour(today, current_hour)
-            print(f"DEBUG: Actual from 00:00 to <{current_hour}h (i.e., from 00:00 to {current_hour - 1}h59) = {actual_until_hour}")
+            # % cộng dồn các giờ [0, current_hour) lấy từ prefix-sum của profile
+            total_percentage_passed = intraday_profile.share_completed(ALL_KEY, current_hour)
+            actual_until_hour = query_results['actual_until_hour']
+            logger.debug(
+                "Total %% of hours passed (0h to %sh) = %s, actual until %sh = %s",
+                current_hour - 1, total_percentage_passed, current_hour, actual_until_hour
+            )
             
             if total_percentage_passed > 0 and actual_until_hour > 0:
                 eod_value = float(actual_until_hour / total_percentage_passed)
             else:
                 if total_percentage_passed == 0:
-                    print(f"DEBUG: Reason: Total % of hours passed = 0 (no data)")
+                    logger.debug("No EOD: total %% of hours passed = 0 (no data)")
                 if actual_until_hour == 0:
-                    print(f"DEBUG: Reason: Actual from start of day = 0 (no revenue yet)")
+                    logger.debug("No EOD: actual from start of day = 0 (no revenue yet)")
         else:
-            print(f"DEBUG: Current date ({today}) is not in the target month ({target_month}/{target_year})")
-        
-        for calendar_date, actual_amount in actuals.items():
-            if calendar_date in all_days:
-                # Bỏ qua ngày hôm nay, sẽ xử lý riêng ở đoạn sau
-                if calendar_date == today:
-                    continue
-                kpi_day_initial = all_days[calendar_date]['kpi_day_initial']
-                gap = actual_amount - kpi_day_initial
-                total_gap += gap
-                days_with_actual.add(calendar_date)
-        
-        # Xử lý riêng cho ngày hôm nay: dùng forecast_by_day
-        if today in all_days:
-            kpi_day_initial_today = all_days[today]['kpi_day_initial']
-            gap_today = forecast_by_day.get(today, Decimal('0')) - kpi_day_initial_today
-            total_gap += gap_today
-            days_with_actual.add(today)
-            print(f"DEBUG: Gap of today (from forecast_by_day) = {gap_today}")
-        
-        for calendar_date, day_data in all_days.items():
-            if calendar_date not in days_with_actual and calendar_date < today:
-                kpi_day_initial = day_data['kpi_day_initial']
-                gap = Decimal('0') - kpi_day_initial
-                total_gap += gap
-        
-        total_weight_left = Decimal('0')
-        days_in_weighted_left = []
-        for calendar_date, day_data in all_days.items():
-            if calendar_date not in days_with_actual and calendar_date > today:
-                uplift = day_data['uplift']
-                total_weight_left += uplift
-                days_in_weighted_left.append((calendar_date, uplift))
+            logger.debug("Current date (%s) is not in the target month (%s/%s)", today, target_month, target_year)
         
         avg_rev_normal_day = None
         normal_day_metadata_query = f"""
@@ -325,55 +365,39 @@ class KPIDayCalculator:
         if normal_day_result.result_rows and normal_day_result.result_rows[0][0] is not None:
             avg_rev_normal_day = Decimal(str(normal_day_result.result_rows[0][0]))
         
+        # Mảng theo ngày (all_days đã sắp theo calendar_date), gap / adjustment / eod tính 1 lượt bằng redistribute_gap
+        calendar_dates = list(all_days.keys())
+        day_rows = list(all_days.values())
+        uplifts = np.array([float(day_data['uplift']) for day_data in day_rows], dtype=np.float64)
+        today_forecast = float(forecast_by_day.get(today, Decimal('0')))
+        redistribution = redistribute_gap(
+            calendar_dates=np.array(calendar_dates, dtype='datetime64[D]'),
+            initial=np.array([float(day_data['kpi_day_initial']) for day_data in day_rows], dtype=np.float64),
+            actual=np.array([float(actuals[d]) if d in actuals else np.nan for d in calendar_dates], dtype=np.float64),
+            weight=uplifts,
+            today=today,
+            today_forecast=today_forecast,
+            future_eod=uplifts * float(avg_rev_normal_day) if avg_rev_normal_day is not None else None
+        )
+        if len(redistribution):
+            logger.debug(
+                "total_gap = %s, total_weight_left = %s",
+                redistribution['total_gap'][0], redistribution['total_weight_left'][0]
+            )
+        
         results = []
-        for calendar_date, day_data in all_days.items():
-            kpi_day_initial = day_data['kpi_day_initial']
-            weight = day_data['weight']
-            
-            if calendar_date in actuals:
-                actual_amount = actuals[calendar_date]
-                kpi_day_adjustment = actual_amount
-                actual_amount_value = float(actual_amount)
-                gap = kpi_day_adjustment - kpi_day_initial
-                weighted_left = Decimal('0')
-            else:
-                actual_amount_value = None
-                uplift = day_data['uplift']
-                
-                if calendar_date <= today:
-                    kpi_day_adjustment = Decimal('0')
-                    gap = Decimal('0') - kpi_day_initial
-                    weighted_left = Decimal('0')
-                else:
-                    weighted_left = uplift
-                    if total_weight_left > 0:
-                        print(f"DEBUG: total_gap: {total_gap}")
-                        gap_portion = (total_gap * uplift) / total_weight_left
-                        kpi_day_adjustment = kpi_day_initial - gap_portion
-                    else:
-                        kpi_day_adjustment = kpi_day_initial
-                    
-                    gap = None
-            
-            if calendar_date == today:
-                # eod = eod_value
-                eod = forecast_by_day.get(calendar_date, Decimal('0'))
-                kpi_day_adjustment = eod
-                if eod_value is not None:
-                    gap = Decimal(str(eod)) - kpi_day_initial
-                else:
-                    gap = None
-            elif calendar_date < today:
-                if calendar_date in actuals:
-                    eod = float(actuals[calendar_date])
-                else:
-                    eod = 0.0
-            else:
-                if avg_rev_normal_day is not None:
-                    uplift = day_data['uplift']
-                    eod = float(avg_rev_normal_day * uplift)
-                else:
-                    eod = None
+        for calendar_date, day_data, adjustment, gap, weighted_left, eod, actual in zip(
+            calendar_dates,
+            day_rows,
+            redistribution.python_column('adjustment'),
+            to_optional_floats(redistribution['gap']),
+            redistribution.python_column('weighted_left'),
+            to_optional_floats(redistribution['eod']),
+            to_optional_floats(redistribution['actual'])
+        ):
+            if calendar_date == today and eod_value is None:
+                # Chưa ước tính được EOD trong ngày (không có % giờ đã qua / chưa có revenue)
+                gap = None
             
             results.append({
                 'calendar_date': calendar_date,
@@ -381,124 +405,53 @@ class KPIDayCalculator:
                 'month': day_data['month'],
                 'day': day_data['day'],
                 'date_label': day_data['date_label'],
-                'kpi_day_initial': float(kpi_day_initial),
+                'kpi_month': day_data['kpi_month'],
+                'kpi_day_initial': float(day_data['kpi_day_initial']),
                 'uplift': float(day_data['uplift']),
-                'weight': float(weight),
-                'weighted_left': float(weighted_left),
-                'actual_amount': actual_amount_value,
-                'gap': float(gap) if gap is not None else None,
-                'kpi_day_adjustment': float(kpi_day_adjustment),
+                'weight': float(day_data['weight']),
+                'total_weight_month': day_data['total_weight_month'],
+                'weighted_left': weighted_left,
+                'actual_amount': float(actuals[calendar_date]) if calendar_date in actuals else None,
+                # actual ghi vào kpi_day: ngày đã qua / hôm nay không có actual = 0
+                'actual': actual,
+                'gap': gap,
+                'kpi_day_adjustment': adjustment,
                 'eod': eod
             })
         
         return results
     
-    def update_kpi_day_adjustment(self, kpi_day_adjustment_data: List[Dict]) -> None:
+    def update_kpi_day_adjustment(
+        self,
+        kpi_day_adjustment_data: List[Dict],
+        kpi_month_data: Optional[List[Dict]] = None
+    ) -> None:
+        """
+        Ghi kết quả calculate_kpi_day_adjustment vào kpi_day: các dòng đã có đủ cột (initial, uplift, weight,
+        actual, gap, weighted_left, eod) nên không đọc lại kpi_day / actual; kpi_month chỉ query nếu dòng thiếu
+        """
         if not kpi_day_adjustment_data:
             return
         
         now = datetime.now()
+        today = date.today()
         
-        months_needed = set()
-        for row in kpi_day_adjustment_data:
-            months_needed.add((row['year'], row['month']))
-        
-        kpi_month_map = {}
-        for year, month in months_needed:
-            target_version = f"Thang {month}"
-            kpi_month_query = f"""
-                SELECT 
-                    kpi_initial
-                FROM (
-                    SELECT 
-                        year,
-                        month,
-                        kpi_initial
-                    FROM hskcdp.kpi_month FINAL
-                    WHERE year = {year}
-                      AND month = {month}
-                      AND version = '{target_version}'
-                )
-                LIMIT 1
-            """
-            kpi_month_result = self.client.query(kpi_month_query)
-            if kpi_month_result.result_rows:
-                kpi_month_map[(year, month)] = float(kpi_month_result.result_rows[0][0])
-        
-        calendar_dates = [row['calendar_date'] for row in kpi_day_adjustment_data]
-        dates_str = ','.join([f"'{cd}'" for cd in calendar_dates])
-        
-        get_current_query = f"""
-            SELECT 
-                calendar_date,
-                year,
-                month,
-                day,
-                date_label,
-                uplift,
-                weight,
-                total_weight_month,
-                kpi_day_initial
-            FROM hskcdp.kpi_day FINAL
-            WHERE calendar_date IN ({dates_str})
-        """
-        
-        current_result = self.client.query(get_current_query)
-        current_data_map = {}
-        for row in current_result.result_rows:
-            calendar_date = row[0]
-            current_data_map[calendar_date] = {
-                'year': row[1],
-                'month': row[2],
-                'day': row[3],
-                'date_label': row[4],
-                'uplift': float(row[5]),
-                'weight': float(row[6]),
-                'total_weight_month': float(row[7]),
-                'kpi_day_initial': float(row[8])
-            }
-        
-        actual_map = self.revenue_helper.get_daily_actual_by_dates(calendar_dates)
+        months_needed = {
+            (row['year'], row['month']) for row in kpi_day_adjustment_data if row.get('kpi_month') is None
+        }
+        kpi_month_map = self.get_kpi_month_map(months_needed, kpi_month_data) if months_needed else {}
         
         data = []
         for row in kpi_day_adjustment_data:
             calendar_date = row['calendar_date']
-            current_data = current_data_map.get(calendar_date, {})
+            kpi_month = row.get('kpi_month')
+            if kpi_month is None:
+                kpi_month = kpi_month_map.get((row['year'], row['month']), 0)
             
-            year = row['year']
-            month = row['month']
-            kpi_month = kpi_month_map.get((year, month), 0)
-            
-            kpi_day_initial_raw = current_data.get('kpi_day_initial', row['kpi_day_initial'])
-            kpi_day_initial = Decimal(str(kpi_day_initial_raw))
-            uplift = current_data.get('uplift', row.get('uplift', 0))
-            today = date.today()
-            
-            if calendar_date <= today:
-                actual_raw = actual_map.get(calendar_date, 0)
-                actual = Decimal(str(actual_raw)) if actual_raw is not None else None
-            else:
-                actual_raw = actual_map.get(calendar_date)
-                actual = Decimal(str(actual_raw)) if actual_raw is not None else None
-            
-            eod_value = row.get('eod')
-            
-            if calendar_date == today:
-                if eod_value is not None:
-                    gap = Decimal(str(eod_value)) - kpi_day_initial
-                    weighted_left = 0
-                else:
-                    gap = None
-                    weighted_left = 0
-            elif actual is not None and actual != 0:
-                weighted_left = 0
-                gap = actual - kpi_day_initial
-            elif calendar_date < today:
-                weighted_left = 0
-                gap = Decimal('0') - kpi_day_initial
-            else:
-                weighted_left = uplift
-                gap = None
+            gap = row['gap']
+            if calendar_date == today and row['eod'] is not None:
+                # Hôm nay: gap theo eod (forecast_by_day) kể cả khi chưa ước tính được EOD trong ngày
+                gap = float(Decimal(str(row['eod'])) - Decimal(str(row['kpi_day_initial'])))
             
             data.append([
                 calendar_date,
@@ -507,15 +460,15 @@ class KPIDayCalculator:
                 row['day'],
                 row['date_label'],
                 kpi_month,
-                current_data.get('uplift', row.get('uplift', 0)),
-                current_data.get('weight', 0),
-                current_data.get('total_weight_month', 0),
-                current_data.get('kpi_day_initial', row['kpi_day_initial']),
-                float(actual) if actual is not None else None,
-                float(gap) if gap is not None else None,
+                row['uplift'],
+                row['weight'],
+                row['total_weight_month'],
+                row['kpi_day_initial'],
+                row['actual'],
+                gap,
                 row['kpi_day_adjustment'],
-                weighted_left,
-                eod_value,
+                row['weighted_left'],
+                row['eod'],
                 now,
                 now
             ])
@@ -526,19 +479,25 @@ class KPIDayCalculator:
             'kpi_day_initial', 'actual', 'gap', 'kpi_day_adjustment', 'weighted_left', 'eod', 'created_at', 'updated_at'
         ]
         
-        self.client.insert("hskcdp.kpi_day", data, column_names=columns)
+        self.writer.insert("hskcdp.kpi_day", data, column_names=columns)
     
     def calculate_and_save_kpi_day_adjustment(
         self,
         target_year: int,
-        target_month: int
+        target_month: int,
+        kpi_month_data: Optional[List[Dict]] = None,
+        kpi_day_initial_data: Optional[List[Dict]] = None
     ) -> List[Dict]:
         kpi_day_adjustment_data = self.calculate_kpi_day_adjustment(
             target_year=target_year,
-            target_month=target_month
+            target_month=target_month,
+            kpi_day_initial_data=kpi_day_initial_data
         )
         
-        self.update_kpi_day_adjustment(kpi_day_adjustment_data)
+        self.update_kpi_day_adjustment(
+            kpi_day_adjustment_data,
+            kpi_month_data=kpi_month_data
+        )
         
         return kpi_day_adjustment_data
 
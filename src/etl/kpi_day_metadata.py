@@ -7,10 +7,10 @@ from src.utils.query_helper import RevenueQueryHelper
 
 
 class KPIDayMetadataCalculator:    
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
     
     def calculate_uplift_from_historical(
         self, 
@@ -55,29 +55,11 @@ class KPIDayMetadataCalculator:
         if date_labels is None:
             date_labels = self.constants.DATE_LABELS
         
-        query = f"""
-            SELECT 
-                priority_label AS date_label,
-                COUNT(*) as so_ngay
-            FROM dim_date
-            WHERE year = {target_year}
-              AND month = {target_month}
-              AND priority_label IN ({','.join([f"'{dl}'" for dl in date_labels])})
-              AND NOT (
-                  (month = 6 AND day = 6) OR
-                  (month = 9 AND day = 9) OR
-                  (month = 11 AND day = 11) OR
-                  (month = 12 AND day = 12)
-              )
-            GROUP BY date_label
-        """
-        
-        result = self.client.query(query)
+        # Đếm ngày theo priority_label (trừ double day) trên calendar in-memory, không query dim_date
+        counts = self.revenue_helper.get_calendar().count_by_label(target_year, target_month, date_labels)
         weights = {}
         
-        for row in result.result_rows:
-            date_label = row[0]
-            so_ngay = int(row[1])
+        for date_label, so_ngay in counts.items():
             weights[date_label] = {
                 'so_ngay': so_ngay
             }
@@ -176,23 +158,6 @@ class KPIDayMetadataCalculator:
         
         self.client.insert("hskcdp.kpi_day_metadata", data, column_names=columns)
     
-    def check_metadata_annually_exists(
-        self,
-        target_year: int,
-        target_month: int
-    ) -> bool:
-        query = f"""
-            SELECT COUNT(*) 
-            FROM hskcdp.metadata_annually
-            WHERE year = {target_year}
-              AND month = {target_month}
-        """
-        
-        result = self.client.query(query)
-        count = result.result_rows[0][0] if result.result_rows else 0
-        
-        return count > 0
-    
     def get_metadata_annually_data(
         self,
         target_year: int,
@@ -218,79 +183,59 @@ class KPIDayMetadataCalculator:
         
         return data
     
-    def save_metadata_from_annually(
+    def get_metadata_rows_from_annually(
         self,
         target_year: int,
-        target_month: int
-    ) -> None:
-        annually_data = self.get_metadata_annually_data(target_year, target_month)
-        
-        if not annually_data:
-            return
-        
+        target_month: int,
+        annually_data: List[Dict]
+    ) -> List[Dict]:
+        # Mỗi priority_label của metadata_annually là 1 dòng: uplift theo annually, so_ngay = 1, weight = uplift
         # Calculate historical_start_date and historical_end_date (giữ logic hiện tại)
         today = date.today()
         historical_end_date = today
         historical_start_date = today - timedelta(days=90)
         
-        now = datetime.now()
-        
-        data = []
+        results = []
         for row in annually_data:
-            priority_label = row['priority_label']
             uplift = row['uplift']
-            so_ngay = 1
-            weight = uplift
-            
-            data.append([
-                target_year,
-                target_month,
-                priority_label,
-                0.0,
-                float(uplift),
-                so_ngay,
-                float(weight),
-                0.0,
-                historical_start_date,
-                historical_end_date,
-                now,
-                now
-            ])
-        
-        columns = [
-            'year', 'month', 'date_label', 'avg_total', 'uplift',
-            'so_ngay', 'weight', 'total_weight_month',
-            'historical_start_date', 'historical_end_date',
-            'created_at', 'updated_at'
-        ]
+            results.append({
+                'year': target_year,
+                'month': target_month,
+                'date_label': row['priority_label'],
+                'avg_total': 0.0,
+                'uplift': float(uplift),
+                'so_ngay': 1,
+                'weight': float(uplift),
+                'total_weight_month': 0.0,
+                'historical_start_date': historical_start_date,
+                'historical_end_date': historical_end_date
+            })
         
-        self.client.insert("hskcdp.kpi_day_metadata", data, column_names=columns)
+        return results
     
-    def update_total_weight_month(
+    def merge_metadata_annually(
         self,
-        target_year: int,
-        target_month: int
-    ) -> float:
-        query = f"""
-            SELECT SUM(weight)
-            FROM hskcdp.kpi_day_metadata FINAL
-            WHERE year = {target_year}
-              AND month = {target_month}
+        metadata: List[Dict],
+        annually_rows: List[Dict]
+    ) -> List[Dict]:
         """
-        
-        result = self.client.query(query)
-        sum_weight = result.result_rows[0][0] if result.result_rows else 0
-        
-        update_query = f"""
-            ALTER TABLE hskcdp.kpi_day_metadata
-            UPDATE total_weight_month = {sum_weight}
-            WHERE year = {target_year}
-              AND month = {target_month}
+        Dòng annually thay dòng tính từ historical cùng date_label (như ReplacingMergeTree theo key
+        year, month, date_label), rồi tính lại total_weight_month trên kết quả đã merge.
+        Thay cho insert thêm dòng annually + ALTER TABLE ... UPDATE total_weight_month.
         """
+        merged = {row['date_label']: row for row in metadata}
+        for row in annually_rows:
+            merged[row['date_label']] = row
         
-        self.client.command(update_query)
-        
-        return float(sum_weight) if sum_weight else 0.0
+        results = list(merged.values())
+        self.set_total_weight_month(results)
+        return results
+    
+    def set_total_weight_month(self, metadata: List[Dict]) -> float:
+        total_weight = sum((Decimal(str(row['weight'])) for row in metadata), Decimal('0'))
+        for row in metadata:
+            row['total_weight_month'] = float(total_weight)
+        return float(total_weight)
     
     def calculate_and_save_metadata(
         self,
@@ -304,11 +249,13 @@ class KPIDayMetadataCalculator:
             date_labels=date_labels
         )
         
-        self.save_metadata(metadata)
+        # Override của metadata_annually được merge in-memory, tháng chỉ ghi 1 lần insert (không mutation)
+        annually_data = self.get_metadata_annually_data(target_year, target_month)
+        if annually_data:
+            annually_rows = self.get_metadata_rows_from_annually(target_year, target_month, annually_data)
+            metadata = self.merge_metadata_annually(metadata, annually_rows)
         
-        if self.check_metadata_annually_exists(target_year, target_month):
-            self.save_metadata_from_annually(target_year, target_month)
-            self.update_total_weight_month(target_year, target_month)
+        self.save_metadata(metadata)
         
         return metadata
 
@@ -354,4 +301,4 @@ if __name__ == "__main__":
         target_month=target_month
     )
     
-    print(f"Successfully saved {len(metadata) + 1} metadata records")
\ No newline at end of file
+    print(f"Successfully saved {len(metadata)} metadata records")
\ No newline at end of file
@@ -1,32 +1,34 @@
-from decimal import Decimal
 from datetime import datetime, date
-from typing import List, Dict
+from typing import List, Dict, Optional
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.numeric_policy import get_numeric_policy
+from src.utils.logger import get_logger, TRACE_LOOPS
+
+logger = get_logger(__name__)
 
 
 class KPIForecastCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None, numeric=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        # Kiểu số trong vòng lặp (decimal / float / fixed), xem src/utils/numeric_policy.py
+        self.numeric = numeric if numeric is not None else get_numeric_policy('kpi_forecast')
 
-    def calculate_forecast_bottom_up(
+    def get_sku_keys_from_kpi_sku(
         self,
         target_year: int,
         target_month: int
-    ) -> List[Dict]:
-        today = date.today()
-        current_hour = datetime.now().hour
-        
+    ) -> List[tuple]:
         query = f"""
             SELECT 
                 calendar_date,
                 channel,
                 brand_name,
                 sku
-            FROM hskcdp.kpi_sku FINAL
+            FROM {self.revenue_helper.table('hskcdp.kpi_sku')}
             WHERE toYear(calendar_date) = {target_year}
               AND toMonth(calendar_date) = {target_month}
             GROUP BY calendar_date, channel, brand_name, sku
@@ -34,13 +36,34 @@ class KPIForecastCalculator:
         """
         
         result = self.client.query(query)
+        return result.result_rows
+    
+    def calculate_forecast_bottom_up(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_sku_data: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        today = date.today()
+        current_hour = datetime.now().hour
+        
+        if kpi_sku_data is not None:
+            # Kết quả kpi_sku từ stage trước trong cùng process, không đọc lại kpi_sku FINAL
+            sku_keys = sorted({
+                (row['calendar_date'], row['channel'], row['brand_name'], row['sku'])
+                for row in kpi_sku_data
+                if row['calendar_date'].year == target_year and row['calendar_date'].month == target_month
+            })
+        else:
+            sku_keys = self.get_sku_keys_from_kpi_sku(target_year, target_month)
         
         actual_by_date = self.revenue_helper.get_actual_by_sku_brand_channel_and_date(
             target_year=target_year,
             target_month=target_month
         )
         
-        hourly_revenue_pct_by_channel = self.revenue_helper.get_hourly_revenue_percentage_by_channel(days_back=30)
+        # Profile % revenue theo giờ và channel (prefix-sum)
+        intraday_profile = self.revenue_helper.get_intraday_profile(dimension='channel', days_back=30)
         
         # Lấy giờ lớn nhất có transaction trong ngày hôm nay (nếu có)
         max_hour = self.revenue_helper.get_max_hour_from_transaction_details(target_year, target_month)
@@ -53,11 +76,12 @@ class KPIForecastCalculator:
         until_hour = cutoff_hour + 1
 
         actual_by_sku_cache = {}
+        num = self.numeric
         
         now = datetime.now()
         data = []
         sum_check = 0
-        for row in result.result_rows:
+        for row in sku_keys:
             calendar_date = row[0]
             channel = str(row[1])
             brand_name = str(row[2])
@@ -68,14 +92,14 @@ class KPIForecastCalculator:
             day = calendar_date.day
             
             # Tính forecast
-            forecast = Decimal('0')
+            forecast = num.zero
             
             if calendar_date < today:
                 actual = actual_by_date.get(calendar_date, {}).get(channel, {}).get(brand_name, {}).get(sku_name, 0.0)
                 if actual:
-                    forecast = Decimal(str(actual))
+                    forecast = num.amount(actual, num.zero)
                 else:
-                    forecast = Decimal('0')
+                    forecast = num.zero
                 
             elif calendar_date == today:
                 cache_key = calendar_date
@@ -86,26 +110,23 @@ class KPIForecastCalculator:
                         until_hour=until_hour
                     )
                 
-                actual_until_hour = Decimal('0')
+                actual_until_hour = num.zero
                 if channel in actual_by_sku_cache[cache_key] and sku_name in actual_by_sku_cache[cache_key][channel]:
-                    actual_until_hour = Decimal(str(actual_by_sku_cache[cache_key][channel][sku_name]))
+                    actual_until_hour = num.amount(actual_by_sku_cache[cache_key][channel][sku_name], num.zero)
                 
-                sum_check += actual_until_hour
+                if TRACE_LOOPS:
+                    sum_check += actual_until_hour
 
-                # Tính % revenue CỘNG DỒN từ 0h đến giờ cutoff cho channel này
-                channel_pcts = hourly_revenue_pct_by_channel.get(channel, {})
-                cumulative_pct = Decimal('0')
-                for h in range(cutoff_hour + 1):
-                    pct_h_raw = channel_pcts.get(h, 0.0)
-                    cumulative_pct += Decimal(str(pct_h_raw))
+                # % revenue CỘNG DỒN từ 0h đến giờ cutoff cho channel này
+                cumulative_pct = num.ratio(intraday_profile.share_completed(channel, cutoff_hour + 1))
 
-                if cumulative_pct > Decimal('0'):
-                    forecast = actual_until_hour / cumulative_pct
+                if cumulative_pct > 0:
+                    forecast = num.divide(actual_until_hour, cumulative_pct)
                 else:
-                    forecast = Decimal('0')
+                    forecast = num.zero
                     
             else:
-                forecast = Decimal('0')
+                forecast = num.zero
             
             
             data.append([
@@ -116,10 +137,11 @@ class KPIForecastCalculator:
                 channel,
                 brand_name,
                 sku_name,
-                forecast,
+                num.output(forecast),
                 now
             ])
-        print(f"DEBUG============{sum_check}")
+        if TRACE_LOOPS:
+            logger.debug("Sum of today's actual until hour %s: %s", until_hour, sum_check)
         
         if data:
             columns = [
@@ -4,13 +4,18 @@ from typing import List, Dict, Optional
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.kpi_month_version_store import KpiMonthVersionStore, get_version_name, get_next_version
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 class KPIAdjustmentCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        self.version_store = KpiMonthVersionStore(self.client, read_path=self.revenue_helper.read_path)
     
     def get_avg_rev_normal_day_30_days(self) -> Decimal:
         return self.revenue_helper.get_avg_rev_normal_day_30_days()
@@ -20,77 +25,24 @@ class KPIAdjustmentCalculator:
         if today.day < 26 or today.month != target_month or today.year != target_year:
             return
         
-        current_version = f"Thang {target_month}"
-
-        # Determine next version
-        if target_month == 12:
-            next_version_number = 1
-            next_year = target_year + 1
-        else:
-            next_version_number = target_month + 1
-            next_year = target_year
-        
-        next_version = f"Thang {next_version_number}"
-        
-        print(f"DEBUG: Closing on day >= 26 - Creating new version")
-        print(f"  - Current version: {current_version}")
-        print(f"  - Next version: {next_version} (year {next_year})")
-        
-        # Get latest kpi_adjustment from current version for 12 months
-        current_version_query = f"""
-            SELECT
-                month,
-                kpi_adjustment
-            FROM (
-                SELECT
-                    month,
-                    kpi_adjustment,
-                    row_number() OVER (
-                        PARTITION BY year, month, version
-                        ORDER BY updated_at DESC
-                    ) AS rn
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{current_version}'
-            )
-            WHERE rn = 1
-            ORDER BY month
-        """
+        current_version = get_version_name(target_month)
+        next_version, next_year = get_next_version(target_month, target_year)
         
-        current_version_result = self.client.query(current_version_query)
-        current_kpi_adjustments = {int(row[0]): Decimal(row[1]) for row in current_version_result.result_rows}
+        logger.info("Closing on day >= 26: creating version '%s' (year %s) from '%s'", next_version, next_year, current_version)
         
-        print(f"  - Getting kpi_adjustment from version '{current_version}' for 12 months:")
-        for month in sorted(current_kpi_adjustments.keys()):
-            print(f"    Month {month}: {current_kpi_adjustments[month]}")
+        # Load dòng mới nhất của năm hiện tại (và năm sau nếu rollover) trong 1 query
+        self.version_store.load([target_year, next_year])
         
         # Create new version with kpi_initial = kpi_adjustment from old version
-        now = datetime.now()
-        data = []
-        
-        for month in range(1, 13):
-            kpi_initial = current_kpi_adjustments[month]
-            
-            data.append([
-                next_version,
-                next_year,
-                month,
-                kpi_initial,
-                None,
-                None,
-                None, 
-                kpi_initial, 
-                now,
-                now 
-            ])
+        current_kpi_adjustments = self.version_store.stage_version_from(
+            current_version, target_year, next_version, next_year
+        )
         
-        columns = [
-            'version', 'year', 'month', 'kpi_initial', 'actual', 'gap',
-            'eom', 'kpi_adjustment', 'created_at', 'updated_at'
-        ]
+        for month in sorted(current_kpi_adjustments.keys()):
+            logger.debug("kpi_adjustment of '%s' month %s: %s", current_version, month, current_kpi_adjustments[month])
         
-        self.client.insert("hskcdp.kpi_month", data, column_names=columns)
-        print(f"  - Created version '{next_version}' with kpi_initial from version '{current_version}'")
+        self.version_store.flush()
+        logger.info("Created version '%s' with kpi_initial from version '%s'", next_version, current_version)
     
     def create_version_manually(
         self,
@@ -101,31 +53,19 @@ class KPIAdjustmentCalculator:
         if target_year is None:
             target_year = self.constants.KPI_YEAR_2026
         
-        source_version = f"Thang {source_month}"
-        
-        # Determine target version
-        if source_month == 12:
-            next_version_number = 1
-            next_year = target_year + 1
-        else:
-            next_version_number = source_month + 1
-            next_year = target_year
+        source_version = get_version_name(source_month)
+        next_version, next_year = get_next_version(source_month, target_year)
+        next_version_number = 1 if source_month == 12 else source_month + 1
         
-        next_version = f"Thang {next_version_number}"
+        logger.info(
+            "Manually creating version '%s' (month %s, year %s) from '%s' (month %s)",
+            next_version, next_version_number, next_year, source_version, source_month
+        )
         
-        print(f"\n=== MANUALLY CREATING NEW VERSION ===")
-        print(f"  - Source version: {source_version} (month {source_month})")
-        print(f"  - Target version: {next_version} (month {next_version_number}, year {next_year})")
+        self.version_store.load([target_year, next_year])
         
         # Check if target version already exists
-        check_target_version_query = f"""
-            SELECT COUNT(*) as cnt
-            FROM hskcdp.kpi_month FINAL
-            WHERE year = {next_year}
-              AND version = '{next_version}'
-        """
-        check_target_result = self.client.query(check_target_version_query)
-        target_version_exists = check_target_result.result_rows[0][0] > 0 if check_target_result.result_rows else False
+        target_version_exists = self.version_store.version_exists(next_version, next_year)
         
         if target_version_exists and not force:
             raise ValueError(
@@ -134,114 +74,44 @@ class KPIAdjustmentCalculator:
             )
         
         if target_version_exists and force:
-            print(f"  - WARNING: Version '{next_version}' already exists, will overwrite due to --force flag")
-        
-        # Get latest kpi_adjustment from source version for 12 months
-        source_version_query = f"""
-            SELECT
-                month,
-                kpi_adjustment
-            FROM (
-                SELECT
-                    month,
-                    kpi_adjustment,
-                    row_number() OVER (
-                        PARTITION BY year, month, version
-                        ORDER BY updated_at DESC
-                    ) AS rn
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{source_version}'
-            )
-            WHERE rn = 1
-            ORDER BY month
-        """
-        
-        source_version_result = self.client.query(source_version_query)
-        source_kpi_adjustments = {int(row[0]): Decimal(row[1]) for row in source_version_result.result_rows}
-        
-        print(f"  - Getting kpi_adjustment from version '{source_version}' for 12 months:")
-        for month in sorted(source_kpi_adjustments.keys()):
-            print(f"    Month {month}: {source_kpi_adjustments[month]}")
+            logger.warning("Version '%s' already exists, will overwrite due to --force flag", next_version)
         
         # Create new version with kpi_initial = kpi_adjustment from old version
         # kpi_adjustment initially = kpi_initial (no actual yet, so not calculated)
-        now = datetime.now()
-        data = []
-        
-        for month in range(1, 13):
-            kpi_initial = source_kpi_adjustments[month]
-            
-            data.append([
-                next_version,
-                next_year,
-                month,
-                kpi_initial,
-                None,
-                None,
-                None,
-                kpi_initial,
-                now,
-                now
-            ])
+        source_kpi_adjustments = self.version_store.stage_version_from(
+            source_version, target_year, next_version, next_year
+        )
         
-        columns = [
-            'version', 'year', 'month', 'kpi_initial', 'actual', 'gap',
-            'eom', 'kpi_adjustment', 'created_at', 'updated_at'
-        ]
+        for month in sorted(source_kpi_adjustments.keys()):
+            logger.debug("kpi_adjustment of '%s' month %s: %s", source_version, month, source_kpi_adjustments[month])
         
-        self.client.insert("hskcdp.kpi_month", data, column_names=columns)
-        print(f"  - Created version '{next_version}' with kpi_initial from version '{source_version}'")
-        print(f"=== FINISHED CREATING NEW VERSION ===\n")
+        self.version_store.flush()
+        logger.info("Created version '%s' with kpi_initial from version '%s'", next_version, source_version)
     
     def get_sum_gap_from_version(self, version: str, target_year: int) -> Decimal:
-        query = f"""
-            SELECT
-                SUM(gap) as sum_gap
-            FROM (
-                SELECT
-                    gap,
-                    row_number() OVER (
-                        PARTITION BY year, month, version
-                        ORDER BY updated_at DESC
-                    ) AS rn
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{version}'
-            )
-            WHERE rn = 1
-        """
-        
-        result = self.client.query(query)
-        if result.result_rows and result.result_rows[0][0] is not None:
-            return Decimal(str(result.result_rows[0][0]))
-        return Decimal('0')
+        self.version_store.load([target_year])
+        return self.version_store.get_sum_gap(version, target_year)
     
     def get_kpi_initial_from_version(self, version: str, month: int, target_year: int) -> float:
-        query = f"""
-            SELECT
-                kpi_initial
-            FROM (
-                SELECT
-                    kpi_initial,
-                    row_number() OVER (
-                        PARTITION BY year, month, version
-                        ORDER BY updated_at DESC
-                    ) AS rn
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{version}'
-                  AND month = {month}
+        self.version_store.load([target_year])
+        return self.version_store.get_kpi_initial(version, target_year, month)
+
+    def check_version_complete(self, version: str, target_year: int) -> None:
+        # version phải có đủ 12 tháng trong version_store (đã load)
+        if not self.version_store.version_exists(version, target_year):
+            raise ValueError(
+                f"Version '{version}' does not exist in database. "
+                f"Please close numbers first (run on day 26) to create this version."
             )
-            WHERE rn = 1
-            LIMIT 1
-        """
         
-        result = self.client.query(query)
-        if result.result_rows and result.result_rows[0][0] is not None:
-            return float(result.result_rows[0][0])
-        raise ValueError(f"kpi_initial not found for version '{version}', month {month}, year {target_year}")
-
+        months_count = self.version_store.months_count(version, target_year)
+        
+        if months_count != 12:
+            raise ValueError(
+                f"Version '{version}' does not have all 12 months (currently has {months_count} months). "
+                f"Please ensure version has been created completely."
+            )
+    
     def recalculate_version_after_marketing_adjustment(
         self,
         version: str,
@@ -252,65 +122,57 @@ class KPIAdjustmentCalculator:
         if target_year is None:
             target_year = self.constants.KPI_YEAR_2026
         
-        print(f"\n=== RECALCULATING VERSION AFTER MARKETING ADJUSTMENT ===")
-        print(f"  - Version: {version}")
-        print(f"  - Adjusted month: {adjusted_month}")
-        print(f"  - New kpi_initial: {new_kpi_initial}")
-        
-        check_version_query = f"""
-            SELECT COUNT(*) as cnt
-            FROM hskcdp.kpi_month FINAL
-            WHERE year = {target_year}
-              AND version = '{version}'
-        """
-        check_version_result = self.client.query(check_version_query)
-        version_exists = check_version_result.result_rows[0][0] > 0 if check_version_result.result_rows else False
-        
-        if not version_exists:
-            raise ValueError(
-                f"Version '{version}' does not exist in database. "
-                f"Please close numbers first (run on day 26) to create this version."
-            )
-        
-        check_months_query = f"""
-            SELECT COUNT(DISTINCT month) as cnt
-            FROM (
-                SELECT
-                    month,
-                    row_number() OVER (
-                        PARTITION BY year, month, version
-                        ORDER BY updated_at DESC
-                    ) AS rn
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{version}'
-            )
-            WHERE rn = 1
-        """
-        check_months_result = self.client.query(check_months_query)
-        months_count = check_months_result.result_rows[0][0] if check_months_result.result_rows else 0
+        logger.info(
+            "Recalculating version '%s' after marketing adjustment: month %s, new kpi_initial %s",
+            version, adjusted_month, new_kpi_initial
+        )
         
-        if months_count != 12:
-            raise ValueError(
-                f"Version '{version}' does not have all 12 months (currently has {months_count} months). "
-                f"Please ensure version has been created completely."
-            )
+        # 1 query cho toàn bộ version, các bước sau tính in-memory
+        self.version_store.load([target_year])
+        self.check_version_complete(version, target_year)
         
         today = date.today()
         current_month = today.month
         expected_adjusted_month = current_month + 1 if current_month < 12 else 1
         
         if adjusted_month != expected_adjusted_month:
-            print(f"  WARNING: Adjusted month ({adjusted_month}) is not the next month ({expected_adjusted_month})")
-            print(f"  Continuing calculation with month {adjusted_month}...")
+            logger.warning(
+                "Adjusted month (%s) is not the next month (%s), continuing with month %s",
+                adjusted_month, expected_adjusted_month, adjusted_month
+            )
         
-        # Lấy kpi_initial ban đầu của tháng được chỉnh trong CHÍNH version đang thao tác
-        original_kpi_initial_adjusted = self.get_kpi_initial_from_version(
-            version, adjusted_month, target_year
+        # kpi_initial ban đầu (CHÍNH version đang thao tác) đọc hết trước khi stage (stage cập nhật luôn bản in-memory)
+        original_kpi_initials = {
+            month: self.version_store.get_kpi_initial(version, target_year, month)
+            for month in range(adjusted_month, 13)
+        }
+        new_kpi_initials = self.get_marketing_adjusted_kpi_initials(
+            original_kpi_initials, adjusted_month, new_kpi_initial
         )
         
+        now = datetime.now()
+        
+        # created_at giữ nguyên theo dòng mới nhất của từng tháng
+        for month, kpi_initial_new in new_kpi_initials.items():
+            logger.debug("Month %s: %s -> %s", month, original_kpi_initials[month], kpi_initial_new)
+            self.version_store.stage(version, target_year, month, kpi_initial_new, updated_at=now)
+        
+        updated_count = self.version_store.flush()
+        logger.info("Updated %s records to version '%s'", updated_count, version)
+    
+    def get_marketing_adjusted_kpi_initials(
+        self,
+        original_kpi_initials: Dict[int, float],
+        adjusted_month: int,
+        new_kpi_initial: float
+    ) -> Dict[int, float]:
+        """
+        kpi_initial mới sau khi marketing chỉnh tháng `adjusted_month`: phần chênh lệch với kpi_initial ban đầu
+        chia đều (trừ đi) cho các tháng còn lại trong năm. original_kpi_initials: {month: kpi_initial}
+        từ adjusted_month tới 12. Returns: {month: kpi_initial mới} cho adjusted_month..12
+        """
         # Phần chênh lệch giữa kpi_initial mới và kpi_initial ban đầu của tháng đó
-        adjusted_month_diff = Decimal(str(new_kpi_initial)) - Decimal(str(original_kpi_initial_adjusted))
+        adjusted_month_diff = Decimal(str(new_kpi_initial)) - Decimal(str(original_kpi_initials[adjusted_month]))
         
         # Danh sách các tháng còn lại (sau adjusted_month) trong năm
         remaining_months = [m for m in range(adjusted_month + 1, 13)]
@@ -321,102 +183,15 @@ class KPIAdjustmentCalculator:
         else:
             gap_per_remaining_month = Decimal('0')
         
-        now = datetime.now()
-        data_to_update = []
-        
-        get_created_at_adjusted_query = f"""
-            SELECT created_at
-            FROM (
-                SELECT
-                    created_at,
-                    row_number() OVER (
-                        PARTITION BY year, month, version
-                        ORDER BY updated_at DESC
-                    ) AS rn
-                FROM hskcdp.kpi_month FINAL
-                WHERE year = {target_year}
-                  AND version = '{version}'
-                  AND month = {adjusted_month}
-            )
-            WHERE rn = 1
-            LIMIT 1
-        """
-        created_at_adjusted_result = self.client.query(get_created_at_adjusted_query)
-        created_at_adjusted = created_at_adjusted_result.result_rows[0][0] if created_at_adjusted_result.result_rows else now
-        
-        data_to_update.append([
-            version,
-            target_year,
-            adjusted_month,
-            new_kpi_initial,
-            None,
-            None,
-            None,
-            new_kpi_initial,
-            created_at_adjusted,
-            now
-        ])
-        
-        print(f"\n  - Recalculating kpi_initial for months after month {adjusted_month}:")
+        new_kpi_initials = {adjusted_month: new_kpi_initial}
         for month in remaining_months:
-            # Lấy kpi_initial ban đầu của tháng này trong CHÍNH version đang thao tác
-            original_kpi_initial = self.get_kpi_initial_from_version(
-                version, month, target_year
-            )
-            kpi_initial_new = float(Decimal(str(original_kpi_initial)) - gap_per_remaining_month)
-            
-            print(f"    Month {month}: {original_kpi_initial} - {gap_per_remaining_month} = {kpi_initial_new}")
-            
-            get_created_at_query = f"""
-                SELECT created_at
-                FROM (
-                    SELECT
-                        created_at,
-                        row_number() OVER (
-                            PARTITION BY year, month, version
-                            ORDER BY updated_at DESC
-                        ) AS rn
-                    FROM hskcdp.kpi_month FINAL
-                    WHERE year = {target_year}
-                      AND version = '{version}'
-                      AND month = {month}
-                )
-                WHERE rn = 1
-                LIMIT 1
-            """
-            created_at_result = self.client.query(get_created_at_query)
-            created_at = created_at_result.result_rows[0][0] if created_at_result.result_rows else now
-            
-            data_to_update.append([
-                version,
-                target_year,
-                month,
-                kpi_initial_new,
-                None,
-                None,
-                None,
-                kpi_initial_new,
-                created_at,
-                now
-            ])
-        
-        columns = [
-            'version', 'year', 'month', 'kpi_initial', 'actual', 'gap',
-            'eom', 'kpi_adjustment', 'created_at', 'updated_at'
-        ]
-        
-        self.client.insert("hskcdp.kpi_month", data_to_update, column_names=columns)
-        print(f"\n  - Updated {len(data_to_update)} records to version '{version}'")
-        print(f"=== FINISHED RECALCULATION ===\n")
+            new_kpi_initials[month] = float(Decimal(str(original_kpi_initials[month])) - gap_per_remaining_month)
+        return new_kpi_initials
     
-    def calculate_kpi_adjustment(self, target_month: Optional[int] = None) -> List[Dict]:
-        if target_month is None:
-            today = date.today()
-            if today.year == self.constants.KPI_YEAR_2026:
-                target_month = today.month
-            
-        version = f"Thang {target_month}"
-
+    def get_base_kpi(self, version: str) -> Dict[int, Dict]:
+        """
+        kpi_initial của 12 tháng: của `version` nếu đã đủ 12 tháng, không thì lấy từ baseline "Thang 1"
+        """
         current_version_query = f"""
             SELECT
                 month,
@@ -429,7 +204,7 @@ class KPIAdjustmentCalculator:
                         PARTITION BY year, month, version
                         ORDER BY updated_at DESC
                     ) AS rn
-                FROM hskcdp.kpi_month FINAL
+                FROM {self.revenue_helper.table('hskcdp.kpi_month')}
                 WHERE year = {self.constants.KPI_YEAR_2026}
                   AND version = '{version}'
             )
@@ -440,7 +215,7 @@ class KPIAdjustmentCalculator:
         current_version_kpi = {int(row[0]): Decimal(row[1]) for row in current_version_result.result_rows}
         
         if len(current_version_kpi) == 12:
-            print(f"DEBUG: Version '{version}' already has kpi_initial, keeping current values")
+            logger.debug("Version '%s' already has kpi_initial, keeping current values", version)
             base_kpi = {}
             for month in range(1, 13):
                 kpi_initial = current_version_kpi[month]
@@ -451,7 +226,7 @@ class KPIAdjustmentCalculator:
                 SELECT
                     month,
                     kpi_initial
-                FROM hskcdp.kpi_month FINAL
+                FROM {self.revenue_helper.table('hskcdp.kpi_month')}
                 WHERE year = {self.constants.KPI_YEAR_2026}
                   AND version = '{baseline_version}'
                 ORDER BY month
@@ -471,16 +246,19 @@ class KPIAdjustmentCalculator:
                 kpi_initial = baseline_kpi[month]
                 base_kpi[month] = {'year': self.constants.KPI_YEAR_2026, 'month': month, 'kpi_initial': kpi_initial}
         
+        return base_kpi
+    
+    def get_kpi_adjustment_inputs(self, target_month: int) -> Dict[str, Dict]:
+        """
+        Số liệu thực tế dùng cho kpi_adjustment (không phụ thuộc kpi_initial):
+            actuals_month: {month: actual}, eoms: {month: eom} (forecast > 0 của các tháng <= target_month),
+            actuals_day: {month: actual các ngày đã qua} của các tháng có eom
+        """
         actuals_month = self.revenue_helper.get_monthly_actual(self.constants.KPI_YEAR_2026)
         
         eoms = {}
         actuals_day = {}
-        gaps = {}
-        total_gap = Decimal('0')
-        
         for month in range(1, target_month + 1):
-            kpi_initial = Decimal(str(base_kpi[month]['kpi_initial']))
-            
             # EOM giờ được lấy từ forecast (bảng kpi_forecast) thay vì tính từ actual + remaining days
             eom = self.revenue_helper.get_forecast_by_month(
                 self.constants.KPI_YEAR_2026, 
@@ -489,13 +267,49 @@ class KPIAdjustmentCalculator:
             
             if eom is not None and eom > 0:
                 eoms[month] = eom
-                gap = eom - kpi_initial
-                gaps[month] = gap
-                
                 actuals_day[month] = self.revenue_helper.get_daily_actual_sum(
                     self.constants.KPI_YEAR_2026, month
                 )
-                
+        
+        return {'actuals_month': actuals_month, 'eoms': eoms, 'actuals_day': actuals_day}
+    
+    def calculate_kpi_adjustment(self, target_month: Optional[int] = None) -> List[Dict]:
+        if target_month is None:
+            today = date.today()
+            if today.year == self.constants.KPI_YEAR_2026:
+                target_month = today.month
+            
+        version = f"Thang {target_month}"
+        
+        return self.compute_kpi_adjustment(
+            version,
+            target_month,
+            self.get_base_kpi(version),
+            self.get_kpi_adjustment_inputs(target_month)
+        )
+    
+    def compute_kpi_adjustment(
+        self,
+        version: str,
+        target_month: int,
+        base_kpi: Dict[int, Dict],
+        inputs: Dict[str, Dict]
+    ) -> List[Dict]:
+        """
+        Tính 12 dòng kpi_month in-memory (không query) từ base_kpi (get_base_kpi) và inputs (get_kpi_adjustment_inputs)
+        """
+        actuals_month = inputs['actuals_month']
+        eoms = inputs['eoms']
+        actuals_day = inputs['actuals_day']
+        gaps = {}
+        total_gap = Decimal('0')
+        
+        for month in range(1, target_month + 1):
+            kpi_initial = Decimal(str(base_kpi[month]['kpi_initial']))
+            
+            if month in eoms:
+                gap = eoms[month] - kpi_initial
+                gaps[month] = gap
                 total_gap += gap
             elif month in actuals_month:
                 actual = Decimal(str(actuals_month[month]))
@@ -567,7 +381,7 @@ class KPIAdjustmentCalculator:
         version = results[0]['version'] if results else None
         existing_created_at_query = f"""
             SELECT month, created_at
-            FROM hskcdp.kpi_month FINAL
+            FROM {self.revenue_helper.table('hskcdp.kpi_month')}
             WHERE year = {self.constants.KPI_YEAR_2026}
               AND version = '{version}'
         """
@@ -601,9 +415,7 @@ class KPIAdjustmentCalculator:
         
         today = date.today()
         if today.day >= 26 and today.month == target_month and today.year == self.constants.KPI_YEAR_2026:
-            print(f"Create new version from day 26")
             self.create_new_version_from_day_26(self.constants.KPI_YEAR_2026, target_month)
-            print(f"Successfully created new version")
         
         return results
 
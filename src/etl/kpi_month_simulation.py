@@ -0,0 +1,197 @@
+import json
+import time
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+from src.utils.clickhouse_client import get_client
+from src.utils.constants import Constants
+from src.utils.query_helper import RevenueQueryHelper
+from src.etl.kpi_month import KPIAdjustmentCalculator
+from src.etl.kpi_day import KPIDayCalculator
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class KpiMonthSimulator:
+    """
+    What-if cho marketing chỉnh kpi_initial 1 tháng của version kpi_month, KHÔNG ghi ClickHouse
+    (không insert nên không kích hoạt cascade downstream):
+        load(): đọc 1 lần snapshot version (KpiMonthVersionStore) + actual / eom theo tháng của kpi_adjustment,
+                kpi_day_metadata + calendar nếu cần chia theo ngày
+        simulate() / simulate_batch(): cùng công thức với recalculate_version_after_marketing_adjustment và
+                calculate_kpi_adjustment nhưng tính in-memory, không query
+    """
+
+    def __init__(
+        self,
+        constants: Constants,
+        client=None,
+        revenue_helper=None,
+        version: Optional[str] = None,
+        target_year: Optional[int] = None
+    ):
+        self.client = client if client is not None else get_client()
+        self.constants = constants
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        self.month_calculator = KPIAdjustmentCalculator(constants, client=self.client, revenue_helper=self.revenue_helper)
+        self.day_calculator = KPIDayCalculator(constants, client=self.client, revenue_helper=self.revenue_helper)
+        self.version = version
+        self.target_year = target_year if target_year is not None else constants.KPI_YEAR_2026
+        # Version "Thang M": kpi_adjustment tính với target_month = M, phần chia ngày là tháng M
+        self.version_month = int(version.split()[-1]) if version else None
+        self.original_kpi_initials: Dict[int, float] = {}
+        self.adjustment_inputs: Optional[Dict[str, Dict]] = None
+        self.metadata_by_label: Optional[Dict[str, List[tuple]]] = None
+
+    def load(self, include_days: bool = False) -> None:
+        store = self.month_calculator.version_store
+        store.load([self.target_year])
+        self.month_calculator.check_version_complete(self.version, self.target_year)
+        self.original_kpi_initials = {
+            month: store.get_kpi_initial(self.version, self.target_year, month) for month in range(1, 13)
+        }
+        self.adjustment_inputs = self.month_calculator.get_kpi_adjustment_inputs(self.version_month)
+        if include_days:
+            self.load_days()
+
+    def load_days(self) -> None:
+        self.metadata_by_label = self.day_calculator.get_kpi_day_metadata_by_label(self.target_year, self.version_month)
+        self.revenue_helper.get_calendar()
+
+    def simulate(self, adjusted_month: int, new_kpi_initial: float, include_days: bool = False) -> Dict:
+        """
+        1 scenario: kpi_initial / kpi_adjustment 12 tháng (list theo tháng 1..12) sau khi chỉnh
+        kpi_initial của adjusted_month; include_days: thêm kpi_day_initial từng ngày của tháng version
+        """
+        if self.adjustment_inputs is None:
+            self.load(include_days=include_days)
+        if include_days and self.metadata_by_label is None:
+            self.load_days()
+        if adjusted_month < 1 or adjusted_month > 12:
+            raise ValueError(f"adjusted_month must be between 1 and 12, received: {adjusted_month}")
+
+        started = time.perf_counter()
+        kpi_initials = dict(self.original_kpi_initials)
+        kpi_initials.update(self.month_calculator.get_marketing_adjusted_kpi_initials(
+            {month: kpi_initials[month] for month in range(adjusted_month, 13)},
+            adjusted_month,
+            new_kpi_initial
+        ))
+        base_kpi = {
+            month: {'year': self.target_year, 'month': month, 'kpi_initial': kpi_initials[month]}
+            for month in range(1, 13)
+        }
+        rows = self.month_calculator.compute_kpi_adjustment(
+            self.version, self.version_month, base_kpi, self.adjustment_inputs
+        )
+
+        result = {
+            'version': self.version,
+            'year': self.target_year,
+            'adjusted_month': adjusted_month,
+            'new_kpi_initial': new_kpi_initial,
+            'kpi_initial': [float(kpi_initials[month]) for month in range(1, 13)],
+            'kpi_adjustment': [float(row['kpi_adjustment']) for row in rows],
+        }
+        if include_days:
+            days = self.day_calculator.build_kpi_day_initial(
+                self.target_year,
+                self.version_month,
+                [kpi_initials[self.version_month]],
+                self.metadata_by_label
+            )
+            result['days'] = [
+                {
+                    'calendar_date': day['calendar_date'],
+                    'date_label': day['date_label'],
+                    'kpi_day_initial': float(day['kpi_day_initial'])
+                }
+                for day in days
+            ]
+        result['seconds'] = round(time.perf_counter() - started, 6)
+        return result
+
+    def simulate_batch(
+        self,
+        scenarios: Sequence[Tuple[int, float]],
+        include_days: bool = False
+    ) -> List[Dict]:
+        # scenarios: [(adjusted_month, new_kpi_initial)], load 1 lần cho cả batch
+        return [
+            self.simulate(adjusted_month, new_kpi_initial, include_days=include_days)
+            for adjusted_month, new_kpi_initial in scenarios
+        ]
+
+
+def print_simulation(result: Dict) -> None:
+    print(
+        f"\nScenario: month {result['adjusted_month']} -> kpi_initial {result['new_kpi_initial']:,.0f} "
+        f"({result['seconds'] * 1000:.2f} ms)"
+    )
+    print(f"  {'month':>5} {'kpi_initial':>20} {'kpi_adjustment':>20}")
+    for month, (kpi_initial, kpi_adjustment) in enumerate(zip(result['kpi_initial'], result['kpi_adjustment']), start=1):
+        print(f"  {month:>5} {kpi_initial:>20,.0f} {kpi_adjustment:>20,.0f}")
+    if 'days' in result:
+        total = sum(Decimal(str(day['kpi_day_initial'])) for day in result['days'])
+        print(f"  {len(result['days'])} days, sum kpi_day_initial = {total:,.0f}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    usage = (
+        "Usage: python -m src.etl.kpi_month_simulation --version <version> --month <month> "
+        "--new-kpi-initial <value>[,<value>...] [--year <year>] [--days] [--output <file.json>]"
+    )
+    version = None
+    adjusted_month = None
+    new_kpi_initials = []
+    target_year = None
+    include_days = False
+    output_path = None
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--version" and i + 1 < len(sys.argv):
+            version = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--month" and i + 1 < len(sys.argv):
+            adjusted_month = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--new-kpi-initial" and i + 1 < len(sys.argv):
+            new_kpi_initials = [float(value) for value in sys.argv[i + 1].split(",") if value.strip()]
+            i += 2
+        elif sys.argv[i] == "--year" and i + 1 < len(sys.argv):
+            target_year = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--days":
+            include_days = True
+            i += 1
+        elif sys.argv[i] == "--output" and i + 1 < len(sys.argv):
+            output_path = sys.argv[i + 1]
+            i += 2
+        else:
+            i += 1
+
+    if version is None or adjusted_month is None or not new_kpi_initials:
+        print("Missing parameters!")
+        print(usage)
+        print("Example: python -m src.etl.kpi_month_simulation --version 'Thang 2' --month 3 --new-kpi-initial 15e9,16e9,17e9")
+        sys.exit(1)
+
+    simulator = KpiMonthSimulator(Constants(), version=version, target_year=target_year)
+    load_started = time.perf_counter()
+    simulator.load(include_days=include_days)
+    print(f"Loaded version '{version}' in {time.perf_counter() - load_started:.2f}s")
+
+    results = simulator.simulate_batch(
+        [(adjusted_month, value) for value in new_kpi_initials],
+        include_days=include_days
+    )
+    for result in results:
+        print_simulation(result)
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False, default=str)
+        print(f"\nResults written to {output_path}")
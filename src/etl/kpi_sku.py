@@ -1,30 +1,127 @@
+import os
+import numpy as np
+from functools import partial
 from decimal import Decimal
 from datetime import datetime, date
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.bulk_writer import BulkInsertWriter
 from src.utils.numeric_helper import safe_decimal, safe_float
+from src.utils.intraday_profile import IntradayProfile
+from src.utils.columnar import ColumnarResult, join_values, to_array, DATE_DTYPE, FLOAT_DTYPE, INT_DTYPE
+
+# Cột của get_kpi_sku_base_query (theo thứ tự SELECT) và dtype cho columnar mode
+KPI_SKU_BASE_COLUMNS = [
+    'calendar_date', 'date_label', 'channel', 'brand_name',
+    'kpi_brand_initial', 'kpi_brand_adjustment',
+    'sku', 'sku_classification', 'revenue_share_in_class',
+    'hero_count', 'core_count',
+    'kpi_brand', 'revenue_by_group_sku', 'kpi_sku_initial', 'category_name'
+]
+KPI_SKU_BASE_DTYPES = {
+    'calendar_date': DATE_DTYPE,
+    'kpi_brand_initial': FLOAT_DTYPE,
+    'kpi_brand_adjustment': FLOAT_DTYPE,
+    'revenue_share_in_class': FLOAT_DTYPE,
+    'hero_count': INT_DTYPE,
+    'core_count': INT_DTYPE,
+    'kpi_brand': FLOAT_DTYPE,
+    'revenue_by_group_sku': FLOAT_DTYPE,
+    'kpi_sku_initial': FLOAT_DTYPE,
+}
+
+# Cột kết quả của calculate_kpi_sku_columns_vectorized
+KPI_SKU_OUTPUT_COLUMNS = [
+    'calendar_date', 'date_label', 'channel', 'brand_name', 'sku', 'sku_classification',
+    'category_name', 'revenue_share_in_class', 'kpi_sku_initial',
+    'actual', 'gap', 'kpi_sku_adjustment', 'forecast'
+]
+
+# Cột insert vào hskcdp.kpi_sku và các cột số (convert bằng safe_float)
+KPI_SKU_INSERT_COLUMNS = [
+    'calendar_date', 'year', 'month', 'date_label',
+    'channel', 'brand_name', 'sku', 'sku_classification', 'category_name',
+    'revenue_share_in_class',
+    'kpi_sku_initial',
+    'actual', 'gap', 'kpi_sku_adjustment', 'forecast',
+    'created_at', 'updated_at'
+]
+KPI_SKU_NUMERIC_COLUMNS = [
+    'revenue_share_in_class', 'kpi_sku_initial',
+    'actual', 'gap', 'kpi_sku_adjustment', 'forecast'
+]
+
+# Số dòng base query / block ở chế độ streaming (max_block_size của ClickHouse)
+KPI_SKU_STREAM_BLOCK_ROWS = int(os.getenv("KPI_SKU_STREAM_BLOCK_ROWS", "200000"))
+
+# Sai số cho phép giữa engine vectorized (float64) và engine từng dòng (Decimal)
+KPI_SKU_VECTORIZED_REL_TOL = 1e-9
+KPI_SKU_VECTORIZED_ABS_TOL = 1e-6
 
 
 class KPISKUCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None, writer=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
+        # Đích insert (cùng signature client.insert), vd IncrementalWriter; mặc định ghi thẳng client
+        self.writer = writer if writer is not None else self.client
     
-    def calculate_kpi_sku(
+    def get_forecast_top_down_from_brand_results(
         self,
-        target_year: int,
-        target_month: int
-    ) -> List[Dict]:
-        # Lấy actual revenue theo sku, brand, channel và date
-        actual_by_date = self.revenue_helper.get_actual_by_sku_brand_channel_and_date(
-            target_year=target_year,
-            target_month=target_month
-        )
-        
-        query = f"""
+        kpi_brand_data: List[Dict]
+    ) -> Dict[date, Dict[str, Dict[str, Decimal]]]:
+        """
+        Forecast top-down {calendar_date: {channel: {brand_name: forecast}}} cho các ngày tương lai,
+        dựng từ kết quả stage kpi_brand thay cho get_forecast_top_down_from_brand
+        """
+        today = date.today()
+        forecast_top_down_sku = {}
+        for row in kpi_brand_data:
+            calendar_date = row['calendar_date']
+            if calendar_date <= today or row['forecast'] is None:
+                continue
+            channel = row['channel']
+            brand_name = row['brand_name']
+            if calendar_date not in forecast_top_down_sku:
+                forecast_top_down_sku[calendar_date] = {}
+            if channel not in forecast_top_down_sku[calendar_date]:
+                forecast_top_down_sku[calendar_date][channel] = {}
+            forecast_top_down_sku[calendar_date][channel][brand_name] = (
+                forecast_top_down_sku[calendar_date][channel].get(brand_name, Decimal('0'))
+                + Decimal(str(row['forecast']))
+            )
+        return forecast_top_down_sku
+    
+    def get_brand_date_channel_grid_from_results(
+        self,
+        kpi_brand_data: List[Dict],
+        brand_names: set
+    ) -> Dict[str, List[tuple]]:
+        """
+        Giống RevenueQueryHelper.get_brand_date_channel_grid nhưng dựng từ kết quả stage kpi_brand
+        """
+        grid_by_brand = {}
+        for row in kpi_brand_data:
+            brand_name = row['brand_name']
+            if brand_name not in brand_names:
+                continue
+            if brand_name not in grid_by_brand:
+                grid_by_brand[brand_name] = set()
+            grid_by_brand[brand_name].add((row['calendar_date'], str(row['date_label']), str(row['channel'])))
+        return {
+            brand_name: sorted(grid, key=lambda item: (item[0], item[2]))
+            for brand_name, grid in grid_by_brand.items()
+        }
+    
+    def get_kpi_sku_base_query(self, target_year: int, target_month: int) -> str:
+        """
+        kpi_brand × kpi_sku_metadata (+ category), 1 dòng / (date, channel, brand, sku)
+        Thứ tự cột + tên cột: KPI_SKU_BASE_COLUMNS (dùng làm subquery trong get_kpi_sku_server_side_query)
+        """
+        return f"""
             WITH brand_data AS (
                 SELECT
                     calendar_date,
@@ -33,7 +130,7 @@ class KPISKUCalculator:
                     brand_name,
                     kpi_brand_initial,
                     kpi_brand_adjustment
-                FROM hskcdp.kpi_brand FINAL
+                FROM {self.revenue_helper.table('hskcdp.kpi_brand')}
                 WHERE year = {target_year}
                     AND month = {target_month}
             ),
@@ -116,57 +213,266 @@ class KPISKUCalculator:
                 INNER JOIN brand_sku_stats stats ON cj.brand_name = stats.brand_name
             )
             SELECT 
-                sku.calendar_date, 
-                sku.date_label,
-                sku.channel,
-                sku.brand_name,
-                sku.kpi_brand_initial,
-                sku.kpi_brand_adjustment,
-                sku.sku, 
-                sku.sku_classification, 
-                sku.revenue_share_in_class,
-                sku.hero_count,
-                sku.core_count,
+                acj.calendar_date AS calendar_date, 
+                acj.date_label AS date_label,
+                acj.channel AS channel,
+                acj.brand_name AS brand_name,
+                acj.kpi_brand_initial AS kpi_brand_initial,
+                acj.kpi_brand_adjustment AS kpi_brand_adjustment,
+                acj.sku AS sku, 
+                acj.sku_classification AS sku_classification, 
+                acj.revenue_share_in_class AS revenue_share_in_class,
+                acj.hero_count AS hero_count,
+                acj.core_count AS core_count,
                 bt.kpi_brand_total AS kpi_brand,
-                sku.kpi_brand_initial * sku.group_percentage AS revenue_by_group_sku,
-                (sku.revenue_share_in_class / 100.0) * sku.kpi_brand_initial * sku.group_percentage AS kpi_sku_initial, 
-                sku.category_name AS category_name
-            FROM adjusted_cross_join AS sku
+                acj.kpi_brand_initial * acj.group_percentage AS revenue_by_group_sku,
+                (acj.revenue_share_in_class / 100.0) * acj.kpi_brand_initial * acj.group_percentage AS kpi_sku_initial, 
+                acj.category_name AS category_name
+            FROM adjusted_cross_join AS acj
             INNER JOIN brand_total_by_date bt 
-                ON sku.calendar_date = bt.calendar_date
-                AND sku.brand_name = bt.brand_name
-            ORDER BY sku.calendar_date, sku.channel, sku.brand_name, sku.sku
+                ON acj.calendar_date = bt.calendar_date
+                AND acj.brand_name = bt.brand_name
+            ORDER BY acj.calendar_date, acj.channel, acj.brand_name, acj.sku
+        """
+    
+    def get_kpi_sku_inputs(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_brand_data: Optional[List[Dict]] = None,
+        base_mode: Optional[str] = 'columns'
+    ) -> Dict:
+        """
+        Input dùng chung cho calculate_kpi_sku và calculate_and_save_kpi_sku_streaming.
+        base_mode: 'columns' (ColumnarResult), 'rows' (result của client.query) hoặc None
+        (không đọc base query, bản streaming tự đọc theo block)
+        """
+        query = self.get_kpi_sku_base_query(target_year, target_month)
+        metadata_query = f"""
+            SELECT DISTINCT brand_name, CAST(sku AS String) AS sku
+            FROM hskcdp.kpi_sku_metadata FINAL
+            WHERE year = {target_year}
+              AND month = {target_month}
         """
         
-        result = self.client.query(query)
+        # Các query độc lập chạy song song (latency = query chậm nhất thay vì tổng)
+        calls = {
+            # Actual revenue theo sku, brand, channel và date (dạng cột)
+            'actual_columns': partial(
+                self.revenue_helper.get_actual_by_sku_brand_channel_and_date_columns,
+                target_year=target_year,
+                target_month=target_month
+            ),
+            # Profile % revenue theo giờ và channel (prefix-sum) để tính forecast
+            'intraday_profile': partial(self.revenue_helper.get_intraday_profile, dimension='channel', days_back=30),
+            # Giờ lớn nhất có transaction trong ngày hôm nay (nếu có)
+            'max_hour': partial(self.revenue_helper.get_max_hour_from_transaction_details, target_year, target_month),
+            # SKU mới: xuất hiện lần đầu trong tháng hiện tại (giống logic brand)
+            'new_skus': self.revenue_helper.get_new_sku_this_month,
+            # (brand_name, sku) có trong metadata kpi_sku_metadata
+            'metadata_result': partial(self.client.query, metadata_query),
+        }
+        if base_mode == 'columns':
+            calls['base'] = partial(
+                self.revenue_helper.query_columns,
+                query,
+                dtypes=KPI_SKU_BASE_DTYPES,
+                column_names=KPI_SKU_BASE_COLUMNS
+            )
+        elif base_mode == 'rows':
+            calls['base'] = partial(self.client.query, query)
+        if kpi_brand_data is None:
+            calls['forecast_top_down_sku'] = partial(
+                self.revenue_helper.get_forecast_top_down_from_brand,
+                target_year=target_year,
+                target_month=target_month
+            )
+        query_results = self.revenue_helper.gather(calls)
         
-        results = []
-        today = date.today()
-        current_hour = datetime.now().hour
+        # lookup bằng dict phẳng (date, channel, brand, sku) thay vì dict lồng 4 cấp
+        actual_columns = query_results['actual_columns']
+        actual_lookup = actual_columns.to_lookup(
+            ['calendar_date', 'channel', 'brand_name', 'sku'], 'actual_amount'
+        )
         
-        # Lấy % revenue theo giờ và channel để tính forecast
-        hourly_revenue_pct_by_channel = self.revenue_helper.get_hourly_revenue_percentage_by_channel(days_back=30)
-
-        # Lấy giờ lớn nhất có transaction trong ngày hôm nay (nếu có)
-        max_hour = self.revenue_helper.get_max_hour_from_transaction_details(target_year, target_month)
+        max_hour = query_results['max_hour']
         if max_hour is not None:
             cutoff_hour = max_hour
         else:
-            cutoff_hour = current_hour
+            cutoff_hour = datetime.now().hour
 
-        forecast_top_down_sku = self.revenue_helper.get_forecast_top_down_from_brand(
-            target_year=target_year,
-            target_month=target_month
-        )
+        if kpi_brand_data is not None:
+            # Kết quả kpi_brand từ stage trước trong cùng process
+            forecast_top_down_sku = self.get_forecast_top_down_from_brand_results(kpi_brand_data)
+        else:
+            forecast_top_down_sku = query_results['forecast_top_down_sku']
+
+        skus_in_metadata = set()
+        for row in query_results['metadata_result'].result_rows:
+            brand_name_meta = str(row[0])
+            sku_meta = str(row[1])
+            skus_in_metadata.add((brand_name_meta, sku_meta))
         
-        # until_hour dùng cho get_daily_actual_until_hour: lấy từ 00:00 tới <until_hour
-        until_hour = cutoff_hour + 1
+        return {
+            'query': query,
+            'base': query_results.get('base'),
+            'actual_columns': actual_columns,
+            'actual_lookup': actual_lookup,
+            'today': date.today(),
+            'intraday_profile': query_results['intraday_profile'],
+            'cutoff_hour': cutoff_hour,
+            # until_hour dùng cho get_daily_actual_until_hour: lấy từ 00:00 tới <until_hour
+            'until_hour': cutoff_hour + 1,
+            'forecast_top_down_sku': forecast_top_down_sku,
+            'new_skus': query_results['new_skus'],
+            'skus_in_metadata': skus_in_metadata,
+            # Cache để lưu actual_by_sku cho mỗi date (hàm trả về tất cả channel)
+            'actual_by_sku_cache': {},
+        }
+    
+    def get_new_sku_records_from_inputs(
+        self,
+        target_year: int,
+        target_month: int,
+        inputs: Dict,
+        kpi_brand_data: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        new_skus = inputs['new_skus']
+
+        # Lấy danh sách (brand_name, sku) có actual trong tháng target
+        skus_with_actual = inputs['actual_columns'].unique_keys(['brand_name', 'sku'])
+
+        # SKU cần xử lý thêm: có actual nhưng không có trong metadata và không phải SKU mới
+        skus_to_process = skus_with_actual - inputs['skus_in_metadata'] - new_skus
 
+        # Gộp cả SKU mới và SKU cần xử lý thêm, xử lý chung giống logic SKU mới
+        skus_for_new_logic = set()
+        if new_skus:
+            skus_for_new_logic |= new_skus
+        if skus_to_process:
+            skus_for_new_logic |= skus_to_process
 
-        # Cache để lưu actual_by_sku cho mỗi date (hàm trả về tất cả channel)
-        actual_by_sku_cache = {}
+        if not skus_for_new_logic:
+            return []
+        return self.get_new_sku_records(
+            target_year=target_year,
+            target_month=target_month,
+            new_skus=skus_for_new_logic,
+            actual_lookup=inputs['actual_lookup'],
+            today=inputs['today'],
+            intraday_profile=inputs['intraday_profile'],
+            until_hour=inputs['until_hour'],
+            actual_by_sku_cache=inputs['actual_by_sku_cache'],
+            kpi_brand_data=kpi_brand_data
+        )
+    
+    def calculate_kpi_sku(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_brand_data: Optional[List[Dict]] = None,
+        vectorized: bool = True
+    ) -> List[Dict]:
+        """
+        vectorized=True: tính kpi_sku_adjustment / gap / forecast bằng numpy trên toàn bộ cột
+        (calculate_kpi_sku_rows_vectorized); False: engine cũ tính từng dòng (calculate_kpi_sku_rows)
+        """
+        inputs = self.get_kpi_sku_inputs(
+            target_year,
+            target_month,
+            kpi_brand_data=kpi_brand_data,
+            base_mode='columns' if vectorized else 'rows'
+        )
+        
+        if vectorized:
+            results = self.calculate_kpi_sku_rows_vectorized(
+                base_columns=inputs['base'],
+                actual_columns=inputs['actual_columns'],
+                today=inputs['today'],
+                cutoff_hour=inputs['cutoff_hour'],
+                intraday_profile=inputs['intraday_profile'],
+                forecast_top_down_sku=inputs['forecast_top_down_sku'],
+                until_hour=inputs['until_hour'],
+                actual_by_sku_cache=inputs['actual_by_sku_cache']
+            )
+        else:
+            results = self.calculate_kpi_sku_rows(
+                rows=inputs['base'].result_rows,
+                actual_lookup=inputs['actual_lookup'],
+                today=inputs['today'],
+                cutoff_hour=inputs['cutoff_hour'],
+                intraday_profile=inputs['intraday_profile'],
+                forecast_top_down_sku=inputs['forecast_top_down_sku'],
+                until_hour=inputs['until_hour'],
+                actual_by_sku_cache=inputs['actual_by_sku_cache']
+            )
+        
+        results.extend(self.get_new_sku_records_from_inputs(
+            target_year, target_month, inputs, kpi_brand_data=kpi_brand_data
+        ))
+        
+        return results
+    
+    def iter_kpi_sku_blocks(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_brand_data: Optional[List[Dict]] = None,
+        block_rows: Optional[int] = None
+    ) -> Iterator[ColumnarResult]:
+        """
+        Bản streaming của calculate_kpi_sku (engine vectorized): đọc base query theo block cột,
+        tính từng block và yield các cột KPI_SKU_OUTPUT_COLUMNS; block cuối là SKU mới.
+        Chỉ giữ 1 block kết quả trong bộ nhớ thay vì list dict của cả tháng.
+        """
+        inputs = self.get_kpi_sku_inputs(target_year, target_month, kpi_brand_data=kpi_brand_data, base_mode=None)
+        
+        for base_columns in self.revenue_helper.iter_column_blocks(
+            inputs['query'],
+            dtypes=KPI_SKU_BASE_DTYPES,
+            column_names=KPI_SKU_BASE_COLUMNS,
+            block_rows=block_rows or KPI_SKU_STREAM_BLOCK_ROWS
+        ):
+            yield self.calculate_kpi_sku_columns_vectorized(
+                base_columns=base_columns,
+                actual_columns=inputs['actual_columns'],
+                today=inputs['today'],
+                cutoff_hour=inputs['cutoff_hour'],
+                intraday_profile=inputs['intraday_profile'],
+                forecast_top_down_sku=inputs['forecast_top_down_sku'],
+                until_hour=inputs['until_hour'],
+                actual_by_sku_cache=inputs['actual_by_sku_cache']
+            )
+        
+        new_sku_records = self.get_new_sku_records_from_inputs(
+            target_year, target_month, inputs, kpi_brand_data=kpi_brand_data
+        )
+        if new_sku_records:
+            yield ColumnarResult(KPI_SKU_OUTPUT_COLUMNS, {
+                name: to_array(
+                    [row[name] for row in new_sku_records],
+                    DATE_DTYPE if name == 'calendar_date' else None
+                )
+                for name in KPI_SKU_OUTPUT_COLUMNS
+            })
+    
+    def calculate_kpi_sku_rows(
+        self,
+        rows: List,
+        actual_lookup: Dict,
+        today: date,
+        cutoff_hour: int,
+        intraday_profile: IntradayProfile,
+        forecast_top_down_sku: Dict,
+        until_hour: int,
+        actual_by_sku_cache: Dict
+    ) -> List[Dict]:
+        """
+        Engine tính theo từng dòng (row-by-row) cho kết quả query get_kpi_sku_base_query
+        """
+        results = []
         
-        for row in result.result_rows:
+        for row in rows:
             calendar_date = row[0]
             date_label = str(row[1])
             channel = str(row[2])
@@ -189,7 +495,7 @@ class KPISKUCalculator:
                 else:
                     category_name = cleaned
             # Lấy actual revenue cho sku này
-            actual = actual_by_date.get(calendar_date, {}).get(channel, {}).get(brand_name, {}).get(sku_name, 0.0)
+            actual = actual_lookup.get((calendar_date, channel, brand_name, sku_name), 0.0)
             # Với Tail: kpi_sku_initial = 0 cho tất cả các ngày
             if sku_classification == 'Tail':
                 kpi_sku_initial = Decimal('0')
@@ -247,12 +553,8 @@ class KPISKUCalculator:
                 
                 # sum_check += actual_until_hour
 
-                # Tính % revenue CỘNG DỒN từ 0h đến giờ cutoff cho channel này
-                channel_pcts = hourly_revenue_pct_by_channel.get(channel, {})
-                cumulative_pct = Decimal('0')
-                for h in range(cutoff_hour + 1):
-                    pct_h_raw = channel_pcts.get(h, 0.0)
-                    cumulative_pct += Decimal(str(pct_h_raw))
+                # % revenue CỘNG DỒN từ 0h đến giờ cutoff cho channel này
+                cumulative_pct = intraday_profile.share_completed(channel, cutoff_hour + 1)
 
                 if cumulative_pct > Decimal('0'):
                     forecast = actual_until_hour / cumulative_pct
@@ -303,111 +605,247 @@ class KPISKUCalculator:
                 'forecast': forecast
             })
         
-        # Lấy SKU mới: xuất hiện lần đầu trong tháng hiện tại (giống logic brand)
-        new_skus = self.revenue_helper.get_new_sku_this_month()
-
-        # Lấy danh sách (brand_name, sku) có trong metadata kpi_sku_metadata
-        skus_in_metadata = set()
-        metadata_query = f"""
-            SELECT DISTINCT brand_name, CAST(sku AS String) AS sku
-            FROM hskcdp.kpi_sku_metadata FINAL
-            WHERE year = {target_year}
-              AND month = {target_month}
+        return results
+    
+    def calculate_kpi_sku_rows_vectorized(
+        self,
+        base_columns: ColumnarResult,
+        actual_columns: ColumnarResult,
+        today: date,
+        cutoff_hour: int,
+        intraday_profile: IntradayProfile,
+        forecast_top_down_sku: Dict,
+        until_hour: int,
+        actual_by_sku_cache: Dict
+    ) -> List[Dict]:
         """
-        metadata_result = self.client.query(metadata_query)
-        for row in metadata_result.result_rows:
-            brand_name_meta = str(row[0])
-            sku_meta = str(row[1])
-            skus_in_metadata.add((brand_name_meta, sku_meta))
-
-        # Lấy danh sách (brand_name, sku) có actual trong tháng target
-        skus_with_actual = set()
-        for calendar_date, channels in actual_by_date.items():
-            for channel_name, brands in channels.items():
-                for brand_name_actual, skus in brands.items():  
-                    for sku_actual in skus.keys():
-                        skus_with_actual.add((brand_name_actual, sku_actual))
-
-        # SKU cần xử lý thêm: có actual nhưng không có trong metadata và không phải SKU mới
-        skus_to_process = skus_with_actual - skus_in_metadata - new_skus
-
-        # Gộp cả SKU mới và SKU cần xử lý thêm, xử lý chung giống logic SKU mới
-        skus_for_new_logic = set()
-        if new_skus:
-            skus_for_new_logic |= new_skus
-        if skus_to_process:
-            skus_for_new_logic |= skus_to_process
-
-        if skus_for_new_logic:
-            new_sku_records = self.get_new_sku_records(
-                target_year=target_year,
-                target_month=target_month,
-                new_skus=skus_for_new_logic,
-                actual_by_date=actual_by_date,
-                today=today,
-                hourly_revenue_pct_by_channel=hourly_revenue_pct_by_channel,
-                until_hour=until_hour,
-                actual_by_sku_cache=actual_by_sku_cache
-            )
-            results.extend(new_sku_records)
+        Giống calculate_kpi_sku_rows nhưng tính bằng calculate_kpi_sku_columns_vectorized,
+        chỉ tạo dict cho từng dòng ở bước cuối (format của save_kpi_sku / các stage sau)
+        """
+        kpi_sku_columns = self.calculate_kpi_sku_columns_vectorized(
+            base_columns=base_columns,
+            actual_columns=actual_columns,
+            today=today,
+            cutoff_hour=cutoff_hour,
+            intraday_profile=intraday_profile,
+            forecast_top_down_sku=forecast_top_down_sku,
+            until_hour=until_hour,
+            actual_by_sku_cache=actual_by_sku_cache
+        )
+        
+        results = []
+        for (
+            calendar_date, date_label, channel, brand_name, sku_name, sku_classification,
+            category_name, share, initial, actual, gap, adjustment, forecast
+        ) in zip(*[kpi_sku_columns.python_column(name) for name in KPI_SKU_OUTPUT_COLUMNS]):
+            results.append({
+                'calendar_date': calendar_date,
+                'year': calendar_date.year,
+                'month': calendar_date.month,
+                'date_label': date_label,
+                'channel': channel,
+                'brand_name': brand_name,
+                'sku': sku_name,
+                'sku_classification': sku_classification,
+                'category_name': category_name,
+                'revenue_share_in_class': share,
+                'kpi_sku_initial': initial,
+                'actual': actual,
+                'gap': gap,
+                'kpi_sku_adjustment': adjustment,
+                'forecast': forecast
+            })
         
         return results
     
+    def calculate_kpi_sku_columns_vectorized(
+        self,
+        base_columns: ColumnarResult,
+        actual_columns: ColumnarResult,
+        today: date,
+        cutoff_hour: int,
+        intraday_profile: IntradayProfile,
+        forecast_top_down_sku: Dict,
+        until_hour: int,
+        actual_by_sku_cache: Dict
+    ) -> ColumnarResult:
+        """
+        Engine vectorized (numpy) cho kết quả query get_kpi_sku_base_query, cùng logic với
+        calculate_kpi_sku_rows nhưng tính trên toàn bộ cột một lần. Trả về các cột KPI_SKU_OUTPUT_COLUMNS.
+        Sai số so với engine từng dòng: engine cũ tính forecast hôm nay / tương lai bằng Decimal,
+        ở đây dùng float64 -> chênh lệch <= KPI_SKU_VECTORIZED_REL_TOL (tương đối)
+        hoặc KPI_SKU_VECTORIZED_ABS_TOL (tuyệt đối, VND).
+        Giá trị số trả về là float (revenue_share_in_class, forecast, ... không còn là Decimal).
+        """
+        n_rows = len(base_columns)
+        if n_rows == 0:
+            return ColumnarResult(
+                KPI_SKU_OUTPUT_COLUMNS,
+                {name: np.empty(0, dtype=KPI_SKU_BASE_DTYPES.get(name, object)) for name in KPI_SKU_OUTPUT_COLUMNS}
+            )
+        
+        calendar_dates = base_columns['calendar_date']
+        channels = base_columns['channel']
+        brand_names = base_columns['brand_name']
+        skus = base_columns['sku']
+        sku_classifications = base_columns['sku_classification']
+        hero_counts = np.nan_to_num(base_columns['hero_count'].astype(np.float64), nan=0.0)
+        core_counts = np.nan_to_num(base_columns['core_count'].astype(np.float64), nan=0.0)
+        revenue_share_in_class = np.nan_to_num(base_columns['revenue_share_in_class'], nan=0.0)
+        kpi_brand_adjustment = np.nan_to_num(base_columns['kpi_brand_adjustment'], nan=0.0)
+        kpi_sku_initial = np.nan_to_num(base_columns['kpi_sku_initial'], nan=0.0)
+        
+        is_hero = sku_classifications == 'Hero'
+        is_core = sku_classifications == 'Core'
+        is_tail = sku_classifications == 'Tail'
+        
+        # class_pct: Hero 0.85 / Core 0.15 / Tail 0; brand chỉ có Hero (không có Core): Hero 1.00, còn lại 0
+        hero_only = (hero_counts > 0) & (core_counts == 0)
+        class_pct = np.where(
+            is_hero,
+            np.where(hero_only, 1.0, 0.85),
+            np.where(is_core & ~hero_only, 0.15, 0.0)
+        )
+        rev_distribution = revenue_share_in_class / 100.0
+        
+        # Với Tail: kpi_sku_initial = 0 cho tất cả các ngày
+        kpi_sku_initial = np.where(is_tail, 0.0, kpi_sku_initial)
+        
+        actual = join_values(
+            [calendar_dates, channels, brand_names, skus],
+            [
+                actual_columns['calendar_date'],
+                actual_columns['channel'],
+                actual_columns['brand_name'],
+                actual_columns['sku']
+            ],
+            actual_columns['actual_amount']
+        )
+        
+        today_value = np.datetime64(today, 'D')
+        is_past = calendar_dates < today_value
+        is_today = calendar_dates == today_value
+        is_future = calendar_dates > today_value
+        
+        future_adjustment = np.where(
+            kpi_brand_adjustment > 0,
+            kpi_brand_adjustment * rev_distribution * class_pct,
+            0.0
+        )
+        kpi_sku_adjustment = np.where(is_past, actual, future_adjustment)
+        gap = np.where(is_past, actual - kpi_sku_initial, 0.0)
+        
+        forecast = np.where(is_past, actual, 0.0)
+        
+        if is_today.any():
+            if today not in actual_by_sku_cache:
+                # Data return: {channel: {sku: actual}}
+                actual_by_sku_cache[today] = self.revenue_helper.get_daily_actual_until_hour_by_sku(
+                    target_date=today,
+                    until_hour=until_hour
+                )
+            today_actual_items = [
+                (channel, sku_name, float(amount))
+                for channel, sku_amounts in actual_by_sku_cache[today].items()
+                for sku_name, amount in sku_amounts.items()
+            ]
+            today_channels = channels[is_today]
+            actual_until_hour = join_values(
+                [today_channels, skus[is_today]],
+                [
+                    to_array([item[0] for item in today_actual_items]),
+                    to_array([item[1] for item in today_actual_items])
+                ],
+                np.array([item[2] for item in today_actual_items], dtype=np.float64)
+            )
+            
+            # % revenue CỘNG DỒN từ 0h đến giờ cutoff cho channel của từng dòng
+            cumulative_pct = intraday_profile.share_completed_array(today_channels, cutoff_hour + 1)
+            
+            forecast[is_today] = np.divide(
+                actual_until_hour,
+                cumulative_pct,
+                out=np.zeros(len(cumulative_pct), dtype=np.float64),
+                where=cumulative_pct > 0
+            )
+        
+        if is_future.any():
+            # forecast top-down
+            top_down_items = [
+                (calendar_date, channel, brand_name, float(amount))
+                for calendar_date, channel_amounts in forecast_top_down_sku.items()
+                for channel, brand_amounts in channel_amounts.items()
+                for brand_name, amount in brand_amounts.items()
+            ]
+            top_down_forecast = join_values(
+                [calendar_dates[is_future], channels[is_future], brand_names[is_future]],
+                [
+                    to_array([item[0] for item in top_down_items], DATE_DTYPE),
+                    to_array([item[1] for item in top_down_items]),
+                    to_array([item[2] for item in top_down_items])
+                ],
+                np.array([item[3] for item in top_down_items], dtype=np.float64)
+            )
+            forecast[is_future] = top_down_forecast * rev_distribution[is_future] * class_pct[is_future]
+        
+        category_names = np.empty(n_rows, dtype=object)
+        category_names[:] = [
+            '' if str(raw_category).strip().lower() == 'none' else str(raw_category).strip()
+            for raw_category in base_columns['category_name'].tolist()
+        ]
+        
+        return ColumnarResult(KPI_SKU_OUTPUT_COLUMNS, {
+            'calendar_date': calendar_dates,
+            'date_label': base_columns['date_label'],
+            'channel': channels,
+            'brand_name': brand_names,
+            'sku': skus,
+            'sku_classification': sku_classifications,
+            'category_name': category_names,
+            'revenue_share_in_class': revenue_share_in_class,
+            'kpi_sku_initial': kpi_sku_initial,
+            'actual': actual,
+            'gap': gap,
+            'kpi_sku_adjustment': kpi_sku_adjustment,
+            'forecast': forecast
+        })
+    
     def get_new_sku_records(
         self,
         target_year: int,
         target_month: int,
         new_skus: set,
-        actual_by_date: Dict,
+        actual_lookup: Dict,
         today: date,
-        hourly_revenue_pct_by_channel: Dict,
+        intraday_profile: IntradayProfile,
         until_hour: int,
-        actual_by_sku_cache: Dict
+        actual_by_sku_cache: Dict,
+        kpi_brand_data: Optional[List[Dict]] = None
     ) -> List[Dict]:
         """
         Tạo records cho SKU mới (xuất hiện lần đầu trong tháng hiện tại)
         """
         results = []
         
-        # Lấy category_name từ raw_ecom_products
-        ecom_products_query = """
-            SELECT sku, category_name
-            FROM hskcdp.raw_ecom_products FINAL
-        """
-        ecom_result = self.client.query(ecom_products_query)
-        category_by_sku = {}
-        for row in ecom_result.result_rows:
-            sku = str(row[0])
-            raw_category = str(row[1]) if row[1] else None
-            if raw_category is None:
-                category_name = ''
-            else:
-                cleaned = str(raw_category).strip()
-                if cleaned.lower() == 'none':
-                    category_name = ''
-                else:
-                    category_name = cleaned
-            category_by_sku[sku] = category_name
+        # Category của các SKU mới: 1 query (có cache trong revenue_helper)
+        category_by_sku = self.revenue_helper.get_category_by_skus({sku_name for _, sku_name in new_skus})
+        
+        # Grid (calendar_date, date_label, channel) của tất cả brand liên quan: 1 query thay vì 1 query / SKU
+        new_sku_brands = {brand_name for brand_name, _ in new_skus}
+        if kpi_brand_data is not None:
+            grid_by_brand = self.get_brand_date_channel_grid_from_results(kpi_brand_data, new_sku_brands)
+        else:
+            grid_by_brand = self.revenue_helper.get_brand_date_channel_grid(
+                target_year=target_year,
+                target_month=target_month,
+                brand_names=new_sku_brands
+            )
         
         for brand_name, sku_name in new_skus:
-            # Lấy tất cả (calendar_date, channel) từ kpi_brand cho brand này
-            brand_query = f"""
-                SELECT DISTINCT calendar_date, date_label, channel
-                FROM hskcdp.kpi_brand FINAL
-                WHERE year = {target_year}
-                  AND month = {target_month}
-                  AND brand_name = '{brand_name.replace("'", "''")}'
-                ORDER BY calendar_date, channel
-            """
-            brand_result = self.client.query(brand_query)
-            
-            for row in brand_result.result_rows:
-                calendar_date = row[0]
-                date_label = str(row[1])
-                channel = str(row[2])
+            for calendar_date, date_label, channel in grid_by_brand.get(brand_name, []):
                 
                 # Lấy actual revenue
-                actual = Decimal(str(actual_by_date.get(calendar_date, {}).get(channel, {}).get(brand_name, {}).get(sku_name, 0.0)))
+                actual = Decimal(str(actual_lookup.get((calendar_date, channel, brand_name, sku_name), 0.0)))
                 
                 # Logic cho SKU mới: kpi_sku_initial = 0, không tạo record cho ngày tương lai
                 kpi_sku_initial = Decimal('0')
@@ -439,14 +877,8 @@ class KPISKUCalculator:
                     if channel in actual_by_sku_cache[cache_key] and sku_name in actual_by_sku_cache[cache_key][channel]:
                         actual_until_hour = Decimal(str(actual_by_sku_cache[cache_key][channel][sku_name]))
                     
-                    # Tính % revenue CỘNG DỒN từ 0h đến giờ cutoff cho channel này
-                    channel_pcts = hourly_revenue_pct_by_channel.get(channel, {})
-                    cumulative_pct = Decimal('0')
-                    # until_hour = cutoff_hour + 1, nên cutoff_hour = until_hour - 1
-                    cutoff_hour_for_forecast = until_hour - 1
-                    for h in range(cutoff_hour_for_forecast + 1):
-                        pct_h_raw = channel_pcts.get(h, 0.0)
-                        cumulative_pct += Decimal(str(pct_h_raw))
+                    # % revenue CỘNG DỒN từ 0h đến giờ cutoff (= until_hour - 1) cho channel này
+                    cumulative_pct = intraday_profile.share_completed(channel, until_hour)
                     
                     if cumulative_pct > Decimal('0'):
                         forecast = actual_until_hour / cumulative_pct
@@ -481,53 +913,227 @@ class KPISKUCalculator:
         
         now = datetime.now()
         
-        data = []
-        for row in kpi_sku_data:
-            
-            data.append([
-                row['calendar_date'],
-                row['year'],
-                row['month'],
-                row['date_label'],
-                row['channel'],
-                row['brand_name'],
-                row['sku'],
-                row['sku_classification'],
-                row['category_name'],
-                safe_float(row['revenue_share_in_class']),
-                safe_float(row['kpi_sku_initial']),
-                safe_float(row.get('actual')),
-                safe_float(row.get('gap')),
-                safe_float(row.get('kpi_sku_adjustment')),
-                safe_float(row.get('forecast')),
-                now,
-                now
-            ])
-        
-        columns = [
-            'calendar_date', 'year', 'month', 'date_label',
-            'channel', 'brand_name', 'sku', 'sku_classification', 'category_name',
-            'revenue_share_in_class',
-            'kpi_sku_initial',
-            'actual', 'gap', 'kpi_sku_adjustment', 'forecast',
-            'created_at', 'updated_at'
-        ]
-        
-        self.client.insert("hskcdp.kpi_sku", data, column_names=columns)
+        # Insert theo block (column-oriented), không giữ cả list dòng đã convert trong bộ nhớ
+        with BulkInsertWriter(self.writer, "hskcdp.kpi_sku", KPI_SKU_INSERT_COLUMNS) as writer:
+            for row in kpi_sku_data:
+                writer.append([
+                    row['calendar_date'],
+                    row['year'],
+                    row['month'],
+                    row['date_label'],
+                    row['channel'],
+                    row['brand_name'],
+                    row['sku'],
+                    row['sku_classification'],
+                    row['category_name'],
+                    safe_float(row['revenue_share_in_class']),
+                    safe_float(row['kpi_sku_initial']),
+                    safe_float(row.get('actual')),
+                    safe_float(row.get('gap')),
+                    safe_float(row.get('kpi_sku_adjustment')),
+                    safe_float(row.get('forecast')),
+                    now,
+                    now
+                ])
     
     def calculate_and_save_kpi_sku(
         self,
         target_year: int,
-        target_month: int
+        target_month: int,
+        kpi_brand_data: Optional[List[Dict]] = None,
+        vectorized: bool = True
     ) -> List[Dict]:
         kpi_sku_data = self.calculate_kpi_sku(
             target_year=target_year,
-            target_month=target_month
+            target_month=target_month,
+            kpi_brand_data=kpi_brand_data,
+            vectorized=vectorized
         )
         
         self.save_kpi_sku(kpi_sku_data)
         
         return kpi_sku_data
+    
+    def get_kpi_sku_insert_columns(self, kpi_sku_columns: ColumnarResult, now: datetime) -> Dict[str, list]:
+        # 1 block kết quả (KPI_SKU_OUTPUT_COLUMNS) -> cột của KPI_SKU_INSERT_COLUMNS, giống save_kpi_sku
+        calendar_dates = kpi_sku_columns.python_column('calendar_date')
+        n_rows = len(calendar_dates)
+        columns = {
+            'calendar_date': calendar_dates,
+            'year': [calendar_date.year for calendar_date in calendar_dates],
+            'month': [calendar_date.month for calendar_date in calendar_dates],
+            'created_at': [now] * n_rows,
+            'updated_at': [now] * n_rows,
+        }
+        for name in ['date_label', 'channel', 'brand_name', 'sku', 'sku_classification', 'category_name']:
+            columns[name] = kpi_sku_columns.python_column(name)
+        for name in KPI_SKU_NUMERIC_COLUMNS:
+            columns[name] = [safe_float(value) for value in kpi_sku_columns.python_column(name)]
+        return columns
+    
+    def calculate_and_save_kpi_sku_streaming(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_brand_data: Optional[List[Dict]] = None,
+        block_rows: Optional[int] = None
+    ) -> Dict:
+        """
+        Tính và insert kpi_sku theo từng block (iter_kpi_sku_blocks), không trả về list dòng.
+        Returns: stats của BulkInsertWriter (rows, blocks, seconds, rows_per_sec)
+        """
+        now = datetime.now()
+        with BulkInsertWriter(self.writer, "hskcdp.kpi_sku", KPI_SKU_INSERT_COLUMNS) as writer:
+            for kpi_sku_columns in self.iter_kpi_sku_blocks(
+                target_year,
+                target_month,
+                kpi_brand_data=kpi_brand_data,
+                block_rows=block_rows
+            ):
+                writer.write_columns(self.get_kpi_sku_insert_columns(kpi_sku_columns, now))
+        return writer.get_stats()
+    
+    def get_kpi_sku_server_side_query(
+        self,
+        target_year: int,
+        target_month: int,
+        today: date,
+        cutoff_hour: int,
+        intraday_profile: IntradayProfile,
+        now: datetime
+    ) -> str:
+        """
+        SELECT trả về dòng kpi_sku cuối cùng (cột KPI_SKU_INSERT_COLUMNS), cùng logic với
+        calculate_kpi_sku_columns_vectorized nhưng chạy trong ClickHouse:
+            base query × actual tháng × actual hôm nay tới cutoff × forecast top-down của kpi_brand
+        Profile intraday (vài channel) được đưa vào dạng literal để dùng đúng profile của lần chạy
+        (query hoặc bảng kpi_intraday_profile).
+        """
+        until_hour = cutoff_hour + 1
+        share_items = [
+            (key, float(intraday_profile.share_completed(key, until_hour)))
+            for key in intraday_profile.keys
+        ]
+        if share_items:
+            channels_sql = ", ".join("'" + key.replace("'", "''") + "'" for key, _ in share_items)
+            shares_sql = ", ".join(repr(share) for _, share in share_items)
+            share_completed_sql = f"transform(b.channel, [{channels_sql}], [{shares_sql}], 0.0)"
+        else:
+            share_completed_sql = "0.0"
+        now_sql = now.strftime('%Y-%m-%d %H:%M:%S')
+        
+        return f"""
+            SELECT
+                v_date AS calendar_date,
+                toYear(v_date) AS year,
+                toMonth(v_date) AS month,
+                v_date_label AS date_label,
+                v_channel AS channel,
+                v_brand_name AS brand_name,
+                v_sku AS sku,
+                v_sku_classification AS sku_classification,
+                v_category_name AS category_name,
+                v_share AS revenue_share_in_class,
+                v_initial AS kpi_sku_initial,
+                v_actual AS actual,
+                if(v_date < '{today}', v_actual - v_initial, 0.0) AS gap,
+                if(v_date < '{today}', v_actual, v_future_adjustment) AS kpi_sku_adjustment,
+                multiIf(
+                    v_date < '{today}', v_actual,
+                    v_date = '{today}', if(v_share_completed > 0, v_actual_until_hour / v_share_completed, 0.0),
+                    v_top_down * v_rev_distribution * v_class_pct
+                ) AS forecast,
+                toDateTime('{now_sql}') AS created_at,
+                toDateTime('{now_sql}') AS updated_at
+            FROM (
+                SELECT
+                    b.calendar_date AS v_date,
+                    b.date_label AS v_date_label,
+                    b.channel AS v_channel,
+                    b.brand_name AS v_brand_name,
+                    b.sku AS v_sku,
+                    b.sku_classification AS v_sku_classification,
+                    if(
+                        b.category_name IS NULL OR lower(trimBoth(toString(b.category_name))) = 'none',
+                        '',
+                        trimBoth(toString(b.category_name))
+                    ) AS v_category_name,
+                    ifNull(toFloat64(b.revenue_share_in_class), 0.0) AS v_share,
+                    v_share / 100.0 AS v_rev_distribution,
+                    -- Hero 0.85 / Core 0.15 / Tail 0; brand chỉ có Hero (không có Core): Hero 1.00
+                    (ifNull(b.hero_count, 0) > 0 AND ifNull(b.core_count, 0) = 0) AS v_hero_only,
+                    multiIf(
+                        b.sku_classification = 'Hero', if(v_hero_only, 1.0, 0.85),
+                        b.sku_classification = 'Core' AND NOT v_hero_only, 0.15,
+                        0.0
+                    ) AS v_class_pct,
+                    -- Tail: kpi_sku_initial = 0 cho tất cả các ngày
+                    if(b.sku_classification = 'Tail', 0.0, ifNull(toFloat64(b.kpi_sku_initial), 0.0)) AS v_initial,
+                    ifNull(toFloat64(b.kpi_brand_adjustment), 0.0) AS v_brand_adjustment,
+                    if(v_brand_adjustment > 0, v_brand_adjustment * v_rev_distribution * v_class_pct, 0.0) AS v_future_adjustment,
+                    ifNull(toFloat64(a.actual_amount), 0.0) AS v_actual,
+                    ifNull(toFloat64(t.actual_amount), 0.0) AS v_actual_until_hour,
+                    {share_completed_sql} AS v_share_completed,
+                    ifNull(toFloat64(td.sum_forecast), 0.0) AS v_top_down
+                FROM (
+                    {self.get_kpi_sku_base_query(target_year, target_month)}
+                ) AS b
+                LEFT JOIN (
+                    {self.revenue_helper.get_actual_by_sku_brand_channel_and_date_columns_query(target_year, target_month)}
+                ) AS a
+                    ON a.calendar_date = b.calendar_date
+                    AND a.channel = b.channel
+                    AND a.brand_name = b.brand_name
+                    AND a.sku = b.sku
+                LEFT JOIN (
+                    {self.revenue_helper.get_daily_actual_until_hour_by_sku_query(today, until_hour)}
+                ) AS t
+                    ON t.platform = b.channel
+                    AND t.sku = b.sku
+                LEFT JOIN (
+                    {self.revenue_helper.get_forecast_top_down_from_brand_query(target_year, target_month, today=today)}
+                ) AS td
+                    ON td.calendar_date = b.calendar_date
+                    AND td.channel = b.channel
+                    AND td.brand_name = b.brand_name
+            )
+        """
+    
+    def calculate_and_save_kpi_sku_server_side(
+        self,
+        target_year: int,
+        target_month: int,
+        kpi_brand_data: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Server-side mode: dòng kpi_sku của các SKU trong kpi_sku_metadata được tính và ghi bằng
+        1 lệnh INSERT INTO hskcdp.kpi_sku SELECT ... (không kéo base query về Python).
+        SKU mới / SKU có actual nhưng chưa có metadata (ít dòng) vẫn tính bằng Python như cũ.
+        Không đi qua self.writer (incremental) vì dữ liệu không qua client.
+        Returns: {'rows': số dòng INSERT ... SELECT (None nếu server không trả về), 'new_sku_rows': ...}
+        """
+        inputs = self.get_kpi_sku_inputs(target_year, target_month, kpi_brand_data=kpi_brand_data, base_mode=None)
+        now = datetime.now()
+        
+        select_query = self.get_kpi_sku_server_side_query(
+            target_year,
+            target_month,
+            today=inputs['today'],
+            cutoff_hour=inputs['cutoff_hour'],
+            intraday_profile=inputs['intraday_profile'],
+            now=now
+        )
+        summary = self.client.command(
+            f"INSERT INTO hskcdp.kpi_sku ({', '.join(KPI_SKU_INSERT_COLUMNS)}) {select_query}"
+        )
+        rows = getattr(summary, 'written_rows', None)
+        
+        new_sku_records = self.get_new_sku_records_from_inputs(
+            target_year, target_month, inputs, kpi_brand_data=kpi_brand_data
+        )
+        self.save_kpi_sku(new_sku_records)
+        
+        return {'rows': rows, 'new_sku_rows': len(new_sku_records)}
 
 
 if __name__ == "__main__":
@@ -538,6 +1144,10 @@ if __name__ == "__main__":
     
     target_month = None
     target_year = constants.KPI_YEAR_2026
+    vectorized = True
+    stream = False
+    server_side = False
+    block_rows = None
     
     if len(sys.argv) > 1:
         i = 1
@@ -548,6 +1158,21 @@ if __name__ == "__main__":
             elif sys.argv[i] == "--target-year" and i + 1 < len(sys.argv):
                 target_year = int(sys.argv[i + 1])
                 i += 2
+            elif sys.argv[i] == "--loop-engine":
+                # Dùng engine cũ tính từng dòng thay cho engine vectorized
+                vectorized = False
+                i += 1
+            elif sys.argv[i] == "--stream":
+                # Tính và insert theo block, không giữ kết quả cả tháng trong bộ nhớ
+                stream = True
+                i += 1
+            elif sys.argv[i] == "--server-side":
+                # INSERT ... SELECT trong ClickHouse, không kéo dữ liệu về Python
+                server_side = True
+                i += 1
+            elif sys.argv[i] == "--block-rows" and i + 1 < len(sys.argv):
+                block_rows = int(sys.argv[i + 1])
+                i += 2
             else:
                 i += 1
     
@@ -563,9 +1188,24 @@ if __name__ == "__main__":
         sys.exit(1)
     
     print(f"Calculating kpi_sku for month {target_month}/{target_year}...")
-    kpi_sku_data = calculator.calculate_and_save_kpi_sku(
-        target_year=target_year,
-        target_month=target_month
-    )
-    
-    print(f"Successfully saved {len(kpi_sku_data)} kpi_sku records")
\ No newline at end of file
+    if server_side:
+        stats = calculator.calculate_and_save_kpi_sku_server_side(
+            target_year=target_year,
+            target_month=target_month
+        )
+        print(f"Successfully saved kpi_sku server-side: {stats['rows']} rows + {stats['new_sku_rows']} new SKU rows")
+    elif stream:
+        stats = calculator.calculate_and_save_kpi_sku_streaming(
+            target_year=target_year,
+            target_month=target_month,
+            block_rows=block_rows
+        )
+        print(f"Successfully saved {stats['rows']} kpi_sku records ({stats['blocks']} blocks)")
+    else:
+        kpi_sku_data = calculator.calculate_and_save_kpi_sku(
+            target_year=target_year,
+            target_month=target_month,
+            vectorized=vectorized
+        )
+        
+        print(f"Successfully saved {len(kpi_sku_data)} kpi_sku records")
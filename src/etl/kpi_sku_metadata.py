@@ -1,16 +1,17 @@
 from decimal import Decimal
 from datetime import datetime, date
-from typing import List, Dict
+from typing import List, Dict, Optional, Set, Tuple
 from src.utils.clickhouse_client import get_client
 from src.utils.constants import Constants
 from src.utils.query_helper import RevenueQueryHelper
+from src.utils.numeric_helper import clickhouse_decimal_divide
 
 
 class KPISKUMetadataCalculator:
-    def __init__(self, constants: Constants):
-        self.client = get_client()
+    def __init__(self, constants: Constants, client=None, revenue_helper=None):
+        self.client = client if client is not None else get_client()
         self.constants = constants
-        self.revenue_helper = RevenueQueryHelper()
+        self.revenue_helper = revenue_helper if revenue_helper is not None else RevenueQueryHelper(client=self.client)
     
     def calculate_kpi_sku_metadata(
         self,
@@ -34,6 +35,16 @@ class KPISKUMetadataCalculator:
         if not skus_in_recent_month:
             return []
 
+        history_cache = self.revenue_helper.history_cache
+        if history_cache is not None:
+            return self.classify_skus(
+                target_year,
+                target_month,
+                set(skus_in_recent_month),
+                self.revenue_helper.get_revenue_by_brand_and_sku_last_3_months(),
+                decimal_scale=history_cache.get_decimal_scale()
+            )
+
         # Build tuple IN list cho (brand_name, sku)
         sku_filter_list = []
         for brand_name, sku in skus_in_recent_month:
@@ -135,6 +146,84 @@ class KPISKUMetadataCalculator:
 
         return results
     
+    def classify_skus(
+        self,
+        target_year: int,
+        target_month: int,
+        skus_in_recent_month: Set[Tuple[str, str]],
+        revenue_by_sku: Dict[tuple, Decimal],
+        decimal_scale: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Giống query CTE (rev_by_sku -> sku_with_share -> classified -> final_calc) nhưng tính từ
+        revenue {(brand_name, sku): amount} 3 tháng của history_cache:
+            cum_rev_share <= 80 hoặc revenue_distribution_by_sku >= 40 -> Hero, <= 95 hoặc >= 10 -> Core, còn lại Tail
+        decimal_scale: scale của SUM(total_amount) khi cột là Decimal; phép chia Decimal của ClickHouse cắt
+        thương về scale này trước khi * 100 (vd 0.3333 -> 0.33 -> 33.00), None = chia chính xác (cột Int / Float)
+        """
+        total_revenue_by_brand: Dict[str, Decimal] = {}
+        revenue_by_brand_sku: Dict[str, Dict] = {}
+        for (brand_name, sku), revenue in revenue_by_sku.items():
+            total_revenue_by_brand[brand_name] = total_revenue_by_brand.get(brand_name, Decimal('0')) + revenue
+            if (brand_name, sku) not in skus_in_recent_month:
+                continue
+            # CAST(sku AS UInt64): '0123' và '123' là cùng 1 sku
+            sku_key = int(sku) if sku.isdigit() else sku
+            skus = revenue_by_brand_sku.setdefault(brand_name, {})
+            skus[sku_key] = skus.get(sku_key, Decimal('0')) + revenue
+
+        results: List[Dict] = []
+        for brand_name in sorted(revenue_by_brand_sku):
+            total_revenue = total_revenue_by_brand[brand_name]
+            ranked = sorted(
+                revenue_by_brand_sku[brand_name].items(),
+                key=lambda item: (-item[1], isinstance(item[0], str), item[0])
+            )
+
+            rows = []
+            cum_revenue = Decimal('0')
+            for sku_key, revenue in ranked:
+                cum_revenue += revenue
+                # Brand có tổng revenue = 0: share = 0 (query gốc lỗi chia cho 0)
+                if total_revenue:
+                    distribution = clickhouse_decimal_divide(revenue, total_revenue, decimal_scale) * 100
+                    cum_rev_share = clickhouse_decimal_divide(cum_revenue, total_revenue, decimal_scale) * 100
+                else:
+                    distribution = Decimal('0')
+                    cum_rev_share = Decimal('0')
+                if cum_rev_share <= 80 or distribution >= 40:
+                    classification = 'Hero'
+                elif cum_rev_share <= 95 or distribution >= 10:
+                    classification = 'Core'
+                else:
+                    classification = 'Tail'
+                rows.append({
+                    "year": target_year,
+                    "month": target_month,
+                    "brand_name": brand_name,
+                    "sku": str(sku_key),
+                    "revenue": revenue,
+                    "total_revenue_by_brand": total_revenue,
+                    "revenue_distribution_by_sku": distribution,
+                    "cum_rev_share": cum_rev_share,
+                    "sku_classification": classification,
+                })
+
+            class_revenue: Dict[str, Decimal] = {}
+            for row in rows:
+                class_revenue[row['sku_classification']] = (
+                    class_revenue.get(row['sku_classification'], Decimal('0')) + row['revenue']
+                )
+            for row in rows:
+                row['class_revenue'] = class_revenue[row['sku_classification']]
+                row['revenue_share_in_class'] = (
+                    clickhouse_decimal_divide(row['revenue'], row['class_revenue'], decimal_scale) * 100
+                    if row['class_revenue'] else Decimal('0')
+                )
+            results.extend(rows)
+
+        return results
+    
     def save_kpi_sku_metadata(self, metadata_data: List[Dict]) -> None:
         if not metadata_data:
             return
@@ -0,0 +1,604 @@
+import os
+import json
+import time
+from datetime import datetime, date
+from typing import Callable, Dict, List, Optional
+from src.utils.clickhouse_client import get_client
+from src.utils.constants import Constants
+from src.utils.query_helper import RevenueQueryHelper
+from src.utils.transaction_snapshot import TransactionSnapshotCache
+from src.utils.numeric_policy import get_numeric_policy, parse_numeric_policies
+from src.utils.logger import get_logger, configure_logging, parse_log_levels
+from src.utils.query_instrumentation import (
+    InstrumentedClient, get_stage_query_report, print_query_summary, write_query_report
+)
+from src.utils.incremental import (
+    IncrementalWriter, get_changed_cells, get_transaction_watermark, load_watermark, save_watermark
+)
+from src.etl.kpi_day_metadata import KPIDayMetadataCalculator
+from src.etl.kpi_month import KPIAdjustmentCalculator
+from src.etl.kpi_day import KPIDayCalculator
+from src.etl.kpi_channel_metadata import KPIDayChannelMetadataCalculator
+from src.etl.kpi_channel import KPIDayChannelCalculator
+from src.etl.kpi_brand_metadata import KPIBrandMetadataCalculator
+from src.etl.kpi_brand import KPIBrandCalculator
+from src.etl.kpi_sku import KPISKUCalculator
+from src.etl.kpi_forecast import KPIForecastCalculator
+
+logger = get_logger(__name__)
+
+
+class PipelineStage:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        depends_on: List[str],
+        run: Callable[['PipelineRunner'], List[Dict]]
+    ):
+        self.name = name
+        self.description = description
+        self.depends_on = depends_on
+        self.run = run
+
+
+def run_kpi_day_metadata(runner: 'PipelineRunner') -> List[Dict]:
+    # Giữ default của module: metadata được tính cho tháng kế tiếp
+    target_year, target_month = runner.get_day_metadata_target()
+    calculator = KPIDayMetadataCalculator(runner.constants, client=runner.client, revenue_helper=runner.revenue_helper)
+    return calculator.calculate_and_save_metadata(
+        target_year=target_year,
+        target_month=target_month
+    )
+
+
+def run_kpi_month(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIAdjustmentCalculator(runner.constants, client=runner.client, revenue_helper=runner.revenue_helper)
+    return calculator.save_kpi_adjustment(target_month=runner.target_month)
+
+
+def run_kpi_day(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIDayCalculator(
+        runner.constants,
+        client=runner.client,
+        revenue_helper=runner.revenue_helper,
+        writer=runner.writer
+    )
+    kpi_month_data = runner.results.get('kpi_month')
+
+    kpi_day_initial_data = calculator.calculate_and_save_kpi_day_initial(
+        target_year=runner.target_year,
+        target_month=runner.target_month,
+        kpi_month_data=kpi_month_data
+    )
+    runner.results['kpi_day_initial'] = kpi_day_initial_data
+
+    return calculator.calculate_and_save_kpi_day_adjustment(
+        target_year=runner.target_year,
+        target_month=runner.target_month,
+        kpi_month_data=kpi_month_data,
+        kpi_day_initial_data=kpi_day_initial_data
+    )
+
+
+def run_kpi_channel_metadata(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIDayChannelMetadataCalculator(runner.constants, client=runner.client, revenue_helper=runner.revenue_helper)
+    return calculator.calculate_and_save_kpi_day_channel_metadata(
+        target_year=runner.target_year,
+        target_month=runner.target_month
+    )
+
+
+def run_kpi_channel(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIDayChannelCalculator(
+        runner.constants,
+        client=runner.client,
+        revenue_helper=runner.revenue_helper,
+        writer=runner.writer,
+        numeric=runner.get_numeric_policy('kpi_channel')
+    )
+    return calculator.calculate_and_save_kpi_day_channel(
+        target_year=runner.target_year,
+        target_month=runner.target_month,
+        kpi_day_data=runner.results.get('kpi_day')
+    )
+
+
+def run_kpi_brand_metadata(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIBrandMetadataCalculator(runner.constants, client=runner.client, revenue_helper=runner.revenue_helper)
+    return calculator.calculate_and_save_kpi_brand_metadata(
+        target_year=runner.target_year,
+        target_month=runner.target_month
+    )
+
+
+def run_kpi_brand(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIBrandCalculator(
+        runner.constants,
+        client=runner.client,
+        revenue_helper=runner.revenue_helper,
+        writer=runner.writer,
+        numeric=runner.get_numeric_policy('kpi_brand')
+    )
+    if runner.server_side_brand:
+        # Server-side: INSERT ... SELECT trong ClickHouse -> kpi_sku đọc kpi_brand từ ClickHouse
+        stats = calculator.calculate_and_save_kpi_brand_server_side(
+            target_year=runner.target_year,
+            target_month=runner.target_month,
+            kpi_channel_data=runner.results.get('kpi_channel'),
+            kpi_brand_metadata=runner.results.get('kpi_brand_metadata')
+        )
+        logger.info("Server-side kpi_brand: %s rows + %s new brand rows", stats['rows'], stats['new_brand_rows'])
+        return None
+    return calculator.calculate_and_save_kpi_brand(
+        target_year=runner.target_year,
+        target_month=runner.target_month,
+        kpi_channel_data=runner.results.get('kpi_channel'),
+        kpi_brand_metadata=runner.results.get('kpi_brand_metadata')
+    )
+
+
+def run_kpi_sku(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPISKUCalculator(
+        runner.constants,
+        client=runner.client,
+        revenue_helper=runner.revenue_helper,
+        writer=runner.writer
+    )
+    if runner.server_side_sku:
+        # Server-side: INSERT ... SELECT trong ClickHouse -> kpi_forecast đọc kpi_sku từ ClickHouse
+        stats = calculator.calculate_and_save_kpi_sku_server_side(
+            target_year=runner.target_year,
+            target_month=runner.target_month,
+            kpi_brand_data=runner.results.get('kpi_brand')
+        )
+        logger.info("Server-side kpi_sku: %s rows + %s new SKU rows", stats['rows'], stats['new_sku_rows'])
+        return None
+    if runner.stream_sku:
+        # Streaming: insert theo block, không giữ kết quả -> kpi_forecast đọc kpi_sku từ ClickHouse
+        stats = calculator.calculate_and_save_kpi_sku_streaming(
+            target_year=runner.target_year,
+            target_month=runner.target_month,
+            kpi_brand_data=runner.results.get('kpi_brand')
+        )
+        logger.info("Streamed %s kpi_sku rows in %s blocks", stats['rows'], stats['blocks'])
+        return None
+    return calculator.calculate_and_save_kpi_sku(
+        target_year=runner.target_year,
+        target_month=runner.target_month,
+        kpi_brand_data=runner.results.get('kpi_brand')
+    )
+
+
+def run_kpi_forecast(runner: 'PipelineRunner') -> List[Dict]:
+    calculator = KPIForecastCalculator(
+        runner.constants,
+        client=runner.client,
+        revenue_helper=runner.revenue_helper,
+        numeric=runner.get_numeric_policy('kpi_forecast')
+    )
+    return calculator.calculate_forecast_bottom_up(
+        target_year=runner.target_year,
+        target_month=runner.target_month,
+        kpi_sku_data=runner.results.get('kpi_sku')
+    )
+
+
+# Thứ tự chạy = thứ tự trong list (đã sắp theo dependency)
+STAGES = [
+    PipelineStage('kpi_day_metadata', 'Tính toán KPI Day Metadata', [], run_kpi_day_metadata),
+    PipelineStage('kpi_month', 'Tính toán KPI Month', ['kpi_day_metadata'], run_kpi_month),
+    PipelineStage('kpi_day', 'Tính toán KPI Day', ['kpi_month'], run_kpi_day),
+    PipelineStage('kpi_channel_metadata', 'Tính toán KPI Channel Metadata', ['kpi_day'], run_kpi_channel_metadata),
+    PipelineStage('kpi_channel', 'Tính toán KPI Channel', ['kpi_day', 'kpi_channel_metadata'], run_kpi_channel),
+    PipelineStage('kpi_brand_metadata', 'Tính toán KPI Brand Metadata', ['kpi_channel'], run_kpi_brand_metadata),
+    PipelineStage('kpi_brand', 'Tính toán KPI Brand', ['kpi_channel', 'kpi_brand_metadata'], run_kpi_brand),
+    PipelineStage('kpi_sku', 'Tính toán KPI SKU', ['kpi_brand'], run_kpi_sku),
+    PipelineStage('kpi_forecast', 'Tính toán KPI Forecast', ['kpi_sku'], run_kpi_forecast),
+]
+
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+class PipelineRunner:
+    """
+    Chạy các stage KPI trong cùng 1 process: dùng chung client ClickHouse và
+    chuyển kết quả in-memory của stage trước cho stage sau (không đọc lại từ ClickHouse).
+    """
+
+    def __init__(
+        self,
+        constants: Constants,
+        client=None,
+        target_year: Optional[int] = None,
+        target_month: Optional[int] = None,
+        use_snapshot: bool = True,
+        read_path: Optional[str] = None,
+        incremental: bool = False,
+        stream_sku: bool = False,
+        server_side_sku: bool = False,
+        server_side_brand: bool = False,
+        numeric_policies: Optional[Dict[str, str]] = None,
+        query_log: Optional[str] = None
+    ):
+        self.constants = constants
+        self.client = client if client is not None else get_client()
+        # Query log (JSON lines, 1 dòng / stage): bọc client để ghi call-site, thời gian, rows / bytes, query_id
+        # của từng query; mặc định theo env KPI_QUERY_LOG
+        self.query_log = query_log if query_log is not None else os.getenv("KPI_QUERY_LOG")
+        if self.query_log:
+            self.client = InstrumentedClient(self.client)
+        # Các stage dùng chung 1 RevenueQueryHelper; với snapshot cache, transaction của
+        # mỗi tháng chỉ scan 1 lần và các aggregation được rollup local
+        self.snapshot_cache = TransactionSnapshotCache(self.client) if use_snapshot else None
+        self.revenue_helper = RevenueQueryHelper(
+            client=self.client,
+            snapshot_cache=self.snapshot_cache,
+            read_path=read_path
+        )
+        self.target_month_explicit = target_month is not None
+
+        today = date.today()
+        if target_year is None:
+            target_year = constants.KPI_YEAR_2026
+        if target_month is None:
+            target_month = today.month if today.year == target_year else 1
+
+        self.target_year = target_year
+        self.target_month = target_month
+        self.results: Dict[str, List[Dict]] = {}
+        self.timings: List[Dict] = []
+
+        # Incremental: kpi_day / kpi_channel / kpi_brand / kpi_sku chỉ insert dòng thay đổi
+        self.incremental = incremental
+        self.writer = None
+        self.watermark = None
+        self.changed_cells = None
+
+        # kpi_sku tính + insert theo block (bộ nhớ giới hạn theo block thay vì cả tháng)
+        self.stream_sku = stream_sku
+        # kpi_sku tính + ghi bằng 1 INSERT ... SELECT trong ClickHouse
+        self.server_side_sku = server_side_sku
+        self.server_side_brand = server_side_brand
+        if (server_side_sku or server_side_brand) and incremental:
+            raise ValueError("server-side kpi_sku / kpi_brand cannot be combined with incremental mode")
+
+        # Kiểu số theo stage ({stage: 'decimal' | 'float' | 'fixed'}, '*' = mọi stage), không có thì theo env
+        self.numeric_policies = numeric_policies or {}
+
+    def get_numeric_policy(self, stage_name: str):
+        name = self.numeric_policies.get(stage_name, self.numeric_policies.get('*'))
+        return get_numeric_policy(stage_name, name)
+
+    def prepare_incremental(self) -> None:
+        """
+        Lấy watermark transaction hiện tại (trước khi tính, transaction đến sau sẽ vào lần chạy sau)
+        và các cell (date, channel, brand, sku) có transaction mới kể từ watermark lần chạy trước (log / report;
+        IncrementalWriter chỉ ghi dòng có giá trị khác)
+        """
+        previous_watermark = load_watermark(self.client, self.target_year, self.target_month)
+        self.watermark = get_transaction_watermark(self.client, self.target_year, self.target_month)
+        if previous_watermark is not None:
+            self.changed_cells = get_changed_cells(
+                self.client, self.target_year, self.target_month, previous_watermark
+            )
+        self.writer = IncrementalWriter(self.client, read_path=self.revenue_helper.read_path)
+        changed_cells_count = len(self.changed_cells) if self.changed_cells is not None else 'all'
+        logger.info(
+            "Incremental mode: watermark %s -> %s, changed cells: %s",
+            previous_watermark, self.watermark, changed_cells_count
+        )
+
+    def get_day_metadata_target(self) -> tuple:
+        if self.target_month_explicit:
+            return self.target_year, self.target_month
+
+        target_month = self.target_month + 1
+        target_year = self.target_year
+        if target_month > 12:
+            target_month = 1
+            target_year += 1
+        return target_year, target_month
+
+    def resolve_stages(self, stage_names: Optional[List[str]] = None) -> List[PipelineStage]:
+        if not stage_names:
+            return list(STAGES)
+
+        unknown = [name for name in stage_names if name not in STAGES_BY_NAME]
+        if unknown:
+            raise ValueError(
+                f"Unknown stages: {unknown}. Available stages: {[stage.name for stage in STAGES]}"
+            )
+        return [stage for stage in STAGES if stage.name in stage_names]
+
+    def run(
+        self,
+        stage_names: Optional[List[str]] = None,
+        continue_on_error: bool = False
+    ) -> List[Dict]:
+        stages = self.resolve_stages(stage_names)
+
+        # Snapshot transaction giữ nguyên trong cả lần chạy (mọi stage thấy cùng actual),
+        # TTL (KPI_SNAPSHOT_TTL_SECONDS) chỉ áp dụng giữa các lần chạy
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.pin()
+        try:
+            failed = self.run_stages(stages, continue_on_error)
+        finally:
+            if self.snapshot_cache is not None:
+                self.snapshot_cache.unpin()
+
+        # Chỉ lưu watermark khi cả lần chạy thành công, lỗi thì lần sau tính lại từ watermark cũ
+        if self.incremental and not failed and self.watermark is not None:
+            save_watermark(self.client, self.target_year, self.target_month, self.watermark)
+
+        return self.timings
+
+    def run_stages(self, stages: List[PipelineStage], continue_on_error: bool = False) -> set:
+        # Returns: tên các stage lỗi / bị bỏ qua
+        selected = {stage.name for stage in stages}
+        failed = set()
+
+        if self.incremental:
+            self.prepare_incremental()
+
+        for stage in stages:
+            logger.info("==== %s (%s) ====", stage.description, stage.name)
+
+            # Stage phụ thuộc vào stage lỗi trong cùng lần chạy thì bỏ qua
+            failed_deps = [dep for dep in stage.depends_on if dep in selected and dep in failed]
+            if failed_deps:
+                logger.warning("[SKIP] %s: dependency failed %s", stage.name, failed_deps)
+                failed.add(stage.name)
+                self.timings.append({
+                    'stage': stage.name,
+                    'status': 'skipped',
+                    'seconds': 0.0,
+                    'rows': None,
+                    'error': f"dependency failed: {failed_deps}"
+                })
+                continue
+
+            started = time.perf_counter()
+            try:
+                stage_result = stage.run(self)
+            except Exception as e:
+                seconds = time.perf_counter() - started
+                logger.exception("[ERROR] %s failed after %.2fs: %s", stage.name, seconds, e)
+                failed.add(stage.name)
+                self.timings.append({
+                    'stage': stage.name,
+                    'status': 'failed',
+                    'seconds': round(seconds, 3),
+                    'rows': None,
+                    'error': str(e)
+                })
+                self.emit_query_report(stage.name)
+                if not continue_on_error:
+                    break
+                continue
+
+            seconds = time.perf_counter() - started
+            self.results[stage.name] = stage_result
+            rows = len(stage_result) if stage_result is not None else 0
+            logger.info("[OK] %s: %s rows in %.2fs", stage.name, rows, seconds)
+            self.timings.append({
+                'stage': stage.name,
+                'status': 'ok',
+                'seconds': round(seconds, 3),
+                'rows': rows,
+                'error': None
+            })
+            self.emit_query_report(stage.name)
+
+        return failed
+
+    def emit_query_report(self, stage_name: str) -> Optional[Dict]:
+        """
+        Ghi query log của stage vừa chạy (append 1 dòng JSON vào self.query_log), in top call-site
+        và thêm số query / tổng thời gian query vào timing của stage
+        """
+        if not self.query_log or not isinstance(self.client, InstrumentedClient):
+            return None
+        report = get_stage_query_report(
+            stage_name,
+            self.client.drain(),
+            target_year=self.target_year,
+            target_month=self.target_month,
+            status=self.timings[-1]['status']
+        )
+        write_query_report(self.query_log, report)
+        print_query_summary(report)
+        self.timings[-1]['queries'] = report['queries']
+        self.timings[-1]['query_seconds'] = report['seconds']
+        return report
+
+    def get_report(self) -> Dict:
+        return {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'target_year': self.target_year,
+            'target_month': self.target_month,
+            'snapshot_loads': self.snapshot_cache.load_count if self.snapshot_cache is not None else None,
+            'read_path': self.revenue_helper.read_path,
+            'numeric_policies': self.numeric_policies or None,
+            'query_log': self.query_log or None,
+            'incremental': self.writer.stats if self.writer is not None else None,
+            'changed_cells': len(self.changed_cells) if self.changed_cells is not None else None,
+            'total_seconds': round(sum(t['seconds'] for t in self.timings), 3),
+            'stages': self.timings
+        }
+
+    def write_report(self, path: str) -> Dict:
+        report = self.get_report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+
+if __name__ == "__main__":
+    import sys
+    from src.backfill import parse_months, run_backfill, write_backfill_report
+
+    constants = Constants()
+
+    target_month = None
+    target_year = None
+    stage_names = None
+    report_path = "pipeline_report.json"
+    continue_on_error = False
+    use_snapshot = True
+    read_path = None
+    incremental = False
+    stream_sku = False
+    server_side_sku = False
+    server_side_brand = False
+    numeric_policies = None
+    query_log = None
+    log_levels = None
+    months = None
+    max_workers = None
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--target-month" and i + 1 < len(sys.argv):
+            target_month = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--target-year" and i + 1 < len(sys.argv):
+            target_year = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--stages" and i + 1 < len(sys.argv):
+            stage_names = [name.strip() for name in sys.argv[i + 1].split(",") if name.strip()]
+            i += 2
+        elif sys.argv[i] == "--report" and i + 1 < len(sys.argv):
+            report_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--continue-on-error":
+            continue_on_error = True
+            i += 1
+        elif sys.argv[i] == "--no-snapshot":
+            use_snapshot = False
+            i += 1
+        elif sys.argv[i] == "--read-path" and i + 1 < len(sys.argv):
+            read_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--incremental":
+            incremental = True
+            i += 1
+        elif sys.argv[i] == "--stream-sku":
+            stream_sku = True
+            i += 1
+        elif sys.argv[i] == "--server-side-sku":
+            server_side_sku = True
+            i += 1
+        elif sys.argv[i] == "--server-side-brand":
+            server_side_brand = True
+            i += 1
+        elif sys.argv[i] == "--numeric" and i + 1 < len(sys.argv):
+            # vd --numeric float hoặc --numeric kpi_channel=float,kpi_brand=fixed
+            numeric_policies = parse_numeric_policies(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--log-level" and i + 1 < len(sys.argv):
+            # vd --log-level debug hoặc --log-level kpi_day=debug,kpi_sku=warning
+            log_levels = parse_log_levels(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--query-log" and i + 1 < len(sys.argv):
+            query_log = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--months" and i + 1 < len(sys.argv):
+            months = parse_months(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--backfill":
+            months = list(range(1, 13))
+            i += 1
+        elif sys.argv[i] == "--max-workers" and i + 1 < len(sys.argv):
+            max_workers = int(sys.argv[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    if log_levels:
+        configure_logging(log_levels)
+        # Process con của backfill cấu hình level qua env
+        for name, level in log_levels.items():
+            os.environ["KPI_LOG_LEVEL" if name == '*' else f"KPI_LOG_LEVEL_{name.upper()}"] = level
+
+    if target_month is not None and (target_month < 1 or target_month > 12):
+        print(f"Error: target_month must be between 1 and 12, received: {target_month}")
+        sys.exit(1)
+
+    if (server_side_sku or server_side_brand) and incremental:
+        print("Error: --server-side-sku / --server-side-brand cannot be combined with --incremental")
+        sys.exit(1)
+
+    if months:
+        # Backfill: mỗi tháng 1 process, chạy song song (tối đa --max-workers / KPI_BACKFILL_MAX_WORKERS)
+        backfill_year = target_year if target_year is not None else constants.KPI_YEAR_2026
+        if query_log:
+            # Process của từng tháng đọc KPI_QUERY_LOG (append vào cùng file)
+            os.environ["KPI_QUERY_LOG"] = query_log
+        print("============================================================")
+        print(f"BAT DAU BACKFILL KPI PIPELINE (thang {months[0]}-{months[-1]}/{backfill_year})")
+        print("============================================================")
+
+        backfill_report = run_backfill(
+            backfill_year,
+            months,
+            stage_names=stage_names,
+            continue_on_error=continue_on_error,
+            use_snapshot=use_snapshot,
+            read_path=read_path,
+            max_workers=max_workers,
+            numeric_policies=numeric_policies,
+            incremental=incremental,
+            stream_sku=stream_sku,
+            server_side_sku=server_side_sku,
+            server_side_brand=server_side_brand
+        )
+        write_backfill_report(backfill_report, report_path)
+
+        print("")
+        print("============================================================")
+        print("KET THUC BACKFILL")
+        print("============================================================")
+        for result in backfill_report['results']:
+            seconds = result['seconds'] if result['seconds'] is not None else 0.0
+            print(f"  - Thang {result['month']:<4} {result['status']:<8} {seconds:>9.2f}s")
+            for timing in result['stages']:
+                print(f"      {timing['stage']:<22} {timing['status']:<8} {timing['seconds']:>9.2f}s")
+        print(f"Total: {backfill_report['total_seconds']:.2f}s, {backfill_report['max_workers']} workers (report: {report_path})")
+
+        if any(result['status'] != 'ok' for result in backfill_report['results']):
+            sys.exit(1)
+        sys.exit(0)
+
+    runner = PipelineRunner(
+        constants,
+        target_year=target_year,
+        target_month=target_month,
+        use_snapshot=use_snapshot,
+        read_path=read_path,
+        incremental=incremental,
+        stream_sku=stream_sku,
+        server_side_sku=server_side_sku,
+        server_side_brand=server_side_brand,
+        numeric_policies=numeric_policies,
+        query_log=query_log
+    )
+
+    print("============================================================")
+    print(f"BAT DAU CHAY KPI PIPELINE ({runner.target_month}/{runner.target_year})")
+    print("============================================================")
+
+    timings = runner.run(stage_names=stage_names, continue_on_error=continue_on_error)
+    report = runner.write_report(report_path)
+
+    print("")
+    print("============================================================")
+    print("KET THUC PIPELINE")
+    print("============================================================")
+    for timing in timings:
+        print(f"  - {timing['stage']:<22} {timing['status']:<8} {timing['seconds']:>9.2f}s")
+    print(f"Total: {report['total_seconds']:.2f}s (report: {report_path})")
+
+    if any(timing['status'] != 'ok' for timing in timings):
+        sys.exit(1)
@@ -0,0 +1,127 @@
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Số dòng / block insert và compression (lz4, zstd, gzip, ...; None = theo client)
+INSERT_BLOCK_SIZE = int(os.getenv("KPI_INSERT_BLOCK_SIZE", "100000"))
+INSERT_COMPRESSION = os.getenv("KPI_INSERT_COMPRESSION") or None
+
+
+class BulkInsertWriter:
+    """
+    Insert theo block cố định (column-oriented) thay cho 1 lần client.insert cả list dòng:
+        append(row) / extend(rows) / write_batches(iter): buffer tối đa block_size dòng rồi gửi
+        write_columns({name: array}): cắt cột thành từng block
+    Bộ nhớ chỉ giữ 1 block dù tháng có bao nhiêu dòng. Dùng với `with` để flush block cuối.
+
+    target: client ClickHouse (insert bằng InsertContext, DESCRIBE bảng 1 lần cho cả writer),
+    hoặc object có insert(table, data, column_names) như IncrementalWriter (insert từng block theo dòng).
+    """
+
+    def __init__(
+        self,
+        target,
+        table: str,
+        column_names: Sequence[str],
+        block_size: Optional[int] = None,
+        compression: Optional[str] = None
+    ):
+        self.target = target
+        self.table = table
+        self.column_names = list(column_names)
+        self.block_size = block_size or INSERT_BLOCK_SIZE
+        self.compression = compression if compression is not None else INSERT_COMPRESSION
+        self.buffer: List[List] = []
+        self.context = None
+        self.rows = 0
+        self.blocks = 0
+        self.seconds = 0.0
+
+    def __enter__(self) -> 'BulkInsertWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Có lỗi thì không gửi block đang dở
+        if exc_type is None:
+            self.close()
+
+    def append(self, row: List) -> None:
+        self.buffer.append(row)
+        if len(self.buffer) >= self.block_size:
+            self.flush()
+
+    def extend(self, rows: Iterable[List]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def write_batches(self, batches: Iterable[Iterable[List]]) -> None:
+        for batch in batches:
+            self.extend(batch)
+
+    def write_columns(self, columns: Dict[str, Sequence]) -> None:
+        self.flush()
+        n_rows = len(columns[self.column_names[0]]) if self.column_names else 0
+        for start in range(0, n_rows, self.block_size):
+            block = [to_list(columns[name][start:start + self.block_size]) for name in self.column_names]
+            self.send_columns(block)
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        rows = self.buffer
+        self.buffer = []
+        self.send_columns([list(column) for column in zip(*rows)])
+
+    def send_columns(self, block: List[list]) -> None:
+        n_rows = len(block[0]) if block else 0
+        if n_rows == 0:
+            return
+
+        started = time.perf_counter()
+        if hasattr(self.target, 'create_insert_context'):
+            if self.context is None:
+                self.context = self.target.create_insert_context(
+                    self.table,
+                    column_names=self.column_names,
+                    column_oriented=True
+                )
+                if self.compression:
+                    self.context.compression = self.compression
+            self.context.data = block
+            self.target.insert(context=self.context)
+        else:
+            self.target.insert(self.table, [list(row) for row in zip(*block)], column_names=self.column_names)
+        self.seconds += time.perf_counter() - started
+        self.rows += n_rows
+        self.blocks += 1
+
+    def close(self) -> Dict:
+        self.flush()
+        stats = self.get_stats()
+        if self.rows:
+            logger.info(
+                "Inserted %s rows into %s in %.2fs (%.0f rows/s, %s blocks of <= %s)",
+                stats['rows'], self.table, stats['seconds'], stats['rows_per_sec'], stats['blocks'], self.block_size
+            )
+        return stats
+
+    def get_stats(self) -> Dict:
+        return {
+            'table': self.table,
+            'rows': self.rows,
+            'blocks': self.blocks,
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': self.rows / self.seconds if self.seconds > 0 else 0.0,
+        }
+
+
+def to_list(values) -> list:
+    # numpy -> list Python (datetime64[D] -> date, float64 -> float) để client tự convert theo kiểu cột
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return list(values)
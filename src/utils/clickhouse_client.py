@@ -1,61 +1,157 @@
 import os
+import atexit
+import threading
+from typing import Dict
 from dotenv import load_dotenv
 from clickhouse_connect import get_client as ch_get_client
+from clickhouse_connect.driver.httputil import get_pool_manager
+from src.utils.logger import get_logger
 
-def get_client():
-    print("-----Test 005-----")
+ENV_PATH = '/opt/airflow/.env'
+DEFAULT_CLIENT_NAME = 'default'
+
+# Registry client dùng chung trong process: mỗi name chỉ tạo 1 client (lazy),
+# tất cả client dùng chung 1 pool manager (keep-alive) nên chi phí kết nối chỉ trả 1 lần
+_clients: Dict[str, object] = {}
+_pool_mgr = None
+_env_loaded = False
+_lock = threading.RLock()
+logger = get_logger(__name__)
+
+
+def load_env() -> None:
+    global _env_loaded
+    if _env_loaded:
+        return
 
     # Load environment variables from .env file
-    print("Debug 000: Starting to load .env file")
-    env_path = '/opt/airflow/.env'
-    print(f"Debug 001: Looking for .env file at {env_path}")
-    print(f"Debug 002: File exists: {os.path.exists(env_path)}")
-
-    if os.path.exists(env_path):
-        print("Debug 003: Loading .env file")
-        load_dotenv(env_path)
-        print("Debug 004: .env file loaded")
+    if os.path.exists(ENV_PATH):
+        load_dotenv(ENV_PATH)
+        logger.debug("Loaded .env file from %s", ENV_PATH)
     else:
-        print("Debug 005: .env file not found, trying current directory")
         load_dotenv()
-        print("Debug 006: Tried loading from current directory")
-    
+        logger.debug(".env file not found at %s, loaded from current directory", ENV_PATH)
+
+    _env_loaded = True
+
+
+def get_pool_config() -> Dict[str, int]:
+    """
+    Cấu hình connection pool, đọc từ env:
+        CLICKHOUSE_POOL_MAXSIZE: số connection giữ lại cho mỗi host (default 8)
+        CLICKHOUSE_POOL_NUM_POOLS: số host pool tối đa (default 4)
+        CLICKHOUSE_KEEP_IDLE: số giây idle trước khi gửi TCP keep-alive (default 30)
+    """
+    load_env()
+    return {
+        'maxsize': int(os.getenv("CLICKHOUSE_POOL_MAXSIZE", "8")),
+        'num_pools': int(os.getenv("CLICKHOUSE_POOL_NUM_POOLS", "4")),
+        'keep_idle': int(os.getenv("CLICKHOUSE_KEEP_IDLE", "30")),
+    }
+
+
+def get_shared_pool_manager():
+    global _pool_mgr
+    with _lock:
+        if _pool_mgr is None:
+            pool_config = get_pool_config()
+            _pool_mgr = get_pool_manager(
+                keep_idle=pool_config['keep_idle'],
+                maxsize=pool_config['maxsize'],
+                num_pools=pool_config['num_pools'],
+                block=False
+            )
+        return _pool_mgr
+
+
+def create_client(pool_mgr=None):
+    """
+    Tạo client MỚI (không qua registry). Dùng get_client() cho trường hợp thông thường.
+    """
+    load_env()
+
     host = os.getenv("CLICKHOUSE_HOST", "localhost")
     port = int(os.getenv("CLICKHOUSE_PORT", "8123"))
     user = os.getenv("CLICKHOUSE_USER", "default")
     password = os.getenv("CLICKHOUSE_PASSWORD", "")
     database = os.getenv("CLICKHOUSE_DATABASE", "default")
 
-    print(f"CLICKHOUSE_HOST: {host}")
-    print(f"CLICKHOUSE_PORT: {port}")
-    print(f"CLICKHOUSE_USER: {user}")
-    print(f"CLICKHOUSE_PASSWORD: {password}")
-    print(f"CLICKHOUSE_DATABASE: {database}")
-    
+    # Không bao giờ log password
+    logger.debug("Creating ClickHouse client %s@%s:%s/%s", user, host, port, database)
+
     try:
         client = ch_get_client(
-            host=host, 
-            port=port, 
-            username=user, 
-            password=password, 
+            host=host,
+            port=port,
+            username=user,
+            password=password,
             database=database,
-            secure=False  # Use HTTP instead of HTTPS
+            secure=False,  # Use HTTP instead of HTTPS
+            pool_mgr=pool_mgr,
+            # Không gắn session_id: ClickHouse không cho chạy nhiều query cùng lúc trong 1 session,
+            # còn RevenueQueryHelper.gather() chạy song song các query trên cùng client
+            autogenerate_session_id=False
         )
-        print("ClickHouse client created successfully")
+        logger.info("ClickHouse client created (%s:%s/%s)", host, port, database)
         return client
     except Exception as e:
-        print(f"Error creating ClickHouse client: {e}")
+        logger.error("Error creating ClickHouse client: %s", e)
         raise
 
+
+def get_client(name: str = DEFAULT_CLIENT_NAME):
+    """
+    Trả về client dùng chung của process cho `name`, tạo lazy ở lần gọi đầu tiên.
+    Các calculator / RevenueQueryHelper chạy trong cùng process dùng chung client này.
+    """
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = create_client(pool_mgr=get_shared_pool_manager())
+            _clients[name] = client
+        return client
+
+
+def set_client(client, name: str = DEFAULT_CLIENT_NAME) -> None:
+    """
+    Đăng ký client có sẵn cho `name` (vd client ClickHouse local của benchmark): các get_client()
+    sau đó trong process trả về client này thay vì tạo client từ .env
+    """
+    with _lock:
+        _clients[name] = client
+
+
+def close_client(name: str = DEFAULT_CLIENT_NAME) -> None:
+    with _lock:
+        client = _clients.pop(name, None)
+    if client is not None:
+        client.close()
+
+
+def close_all_clients() -> None:
+    global _pool_mgr
+    with _lock:
+        names = list(_clients.keys())
+    for name in names:
+        close_client(name)
+    with _lock:
+        if _pool_mgr is not None:
+            _pool_mgr.clear()
+            _pool_mgr = None
+
+
+atexit.register(close_all_clients)
+
+
 def run_sql(sql: str):
     client = get_client()
     client.command(sql)
 
 def run_sql_file(path: str):
-    print(f"Running SQL file: {path}")
+    logger.info("Running SQL file: %s", path)
     with open(path, "r", encoding="utf-8") as f:
         sql = f.read()
-    print(f"SQL content: {sql}")
+    logger.debug("SQL content: %s", sql)
     
     client = get_client()
     
@@ -73,13 +169,13 @@ def run_sql_file(path: str):
     clean_sql = '\n'.join(clean_lines)
     statements = [s.strip() for s in clean_sql.split(';') if s.strip()]
     
-    print(f"Executing {len(statements)} statements")
+    logger.info("Executing %s statements", len(statements))
     
     for i, stmt in enumerate(statements):
-        print(f"Executing statement {i+1}: {stmt[:100]}...")
+        logger.debug("Executing statement %s: %s...", i + 1, stmt[:100])
         try:
             client.command(stmt)
-            print(f"Statement {i+1} executed successfully")
+            logger.debug("Statement %s executed successfully", i + 1)
         except Exception as e:
-            print(f"Error executing statement {i+1}: {e}")
+            logger.error("Error executing statement %s: %s", i + 1, e)
             raise
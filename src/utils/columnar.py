@@ -0,0 +1,189 @@
+import numpy as np
+from datetime import date
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+
+# dtype mặc định theo loại cột; cột không khai báo dtype sẽ là object (string)
+DATE_DTYPE = 'datetime64[D]'
+FLOAT_DTYPE = 'f8'
+INT_DTYPE = 'i8'
+
+
+class ColumnarResult:
+    """
+    Kết quả query dạng cột: mỗi cột là 1 numpy array (float64 / int64 / datetime64[D] / object).
+    Dùng thay cho result_rows + Decimal(str(x)) khi số dòng lớn.
+    """
+
+    def __init__(self, column_names: Sequence[str], columns: Dict[str, np.ndarray]):
+        self.column_names = list(column_names)
+        self.columns = columns
+
+    def __len__(self) -> int:
+        if not self.column_names:
+            return 0
+        return len(self.columns[self.column_names[0]])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def filter(self, mask: np.ndarray) -> 'ColumnarResult':
+        return ColumnarResult(
+            self.column_names,
+            {name: column[mask] for name, column in self.columns.items()}
+        )
+
+    def python_column(self, name: str) -> list:
+        # datetime64[D] -> datetime.date, float64 -> float, ... (dùng làm key dict)
+        return self.columns[name].tolist()
+
+    def to_lookup(self, keys: Sequence[str], value: str) -> Dict[Tuple, float]:
+        """
+        Dict phẳng {tuple(keys): value}, thay cho dict lồng {k1: {k2: {...: value}}}
+        """
+        key_columns = [self.python_column(key) for key in keys]
+        return dict(zip(zip(*key_columns), self.python_column(value)))
+
+    def to_nested_dict(self, keys: Sequence[str], value: str) -> Dict:
+        """
+        Dict lồng {k1: {k2: ... {kn: value}}} giống format của các helper cũ
+        """
+        nested = {}
+        key_columns = [self.python_column(key) for key in keys]
+        for key_values, amount in zip(zip(*key_columns), self.python_column(value)):
+            level = nested
+            for key_value in key_values[:-1]:
+                if key_value not in level:
+                    level[key_value] = {}
+                level = level[key_value]
+            level[key_values[-1]] = amount
+        return nested
+
+    def unique_keys(self, keys: Sequence[str]) -> set:
+        key_columns = [self.python_column(key) for key in keys]
+        if len(keys) == 1:
+            return set(key_columns[0])
+        return set(zip(*key_columns))
+
+
+def to_array(values, dtype: Optional[str] = None) -> np.ndarray:
+    if dtype is None:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    if dtype == DATE_DTYPE and len(values) and isinstance(values[0], date):
+        return np.array(values, dtype=DATE_DTYPE)
+    return np.asarray(values, dtype=dtype)
+
+
+def iter_column_blocks(
+    client,
+    query: str,
+    dtypes: Optional[Dict[str, str]] = None,
+    column_names: Optional[Sequence[str]] = None,
+    block_rows: Optional[int] = None
+) -> Iterator[ColumnarResult]:
+    """
+    Chạy query và yield từng block dạng ColumnarResult (query_column_block_stream),
+    bộ nhớ chỉ giữ 1 block. block_rows: max_block_size phía server (None = mặc định của server).
+    """
+    dtypes = dtypes or {}
+    settings = {'max_block_size': block_rows} if block_rows else None
+    with client.query_column_block_stream(query, settings=settings) as stream:
+        if column_names is None:
+            column_names = stream.source.column_names
+        column_names = list(column_names)
+        for block in stream:
+            yield ColumnarResult(
+                column_names,
+                {name: to_array(values, dtypes.get(name)) for name, values in zip(column_names, block)}
+            )
+
+
+def query_columns(
+    client,
+    query: str,
+    dtypes: Optional[Dict[str, str]] = None,
+    column_names: Optional[Sequence[str]] = None
+) -> ColumnarResult:
+    """
+    Chạy query và trả về ColumnarResult, đọc theo block cột (query_column_block_stream)
+    nên không tạo tuple / Decimal cho từng dòng.
+    dtypes: {column_name: numpy dtype}; cột không có trong dtypes giữ dạng object.
+    column_names: đặt lại tên cột theo vị trí (vd khi SELECT có prefix alias `t.col`).
+    Không dùng query_np vì chỉ cần 1 cột string là cả structured array thành object.
+    """
+    dtypes = dtypes or {}
+    blocks = list(iter_column_blocks(client, query, dtypes=dtypes, column_names=column_names))
+    if blocks:
+        column_names = blocks[0].column_names
+    elif column_names is None:
+        return ColumnarResult([], {})
+
+    columns = {}
+    for name in column_names:
+        if blocks:
+            columns[name] = np.concatenate([block[name] for block in blocks])
+        else:
+            columns[name] = np.empty(0, dtype=dtypes.get(name, object))
+    return ColumnarResult(list(column_names), columns)
+
+
+def encode_keys(
+    left_columns: Sequence[np.ndarray],
+    right_columns: Sequence[np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mã hóa key nhiều cột của 2 bên thành 1 mã int64 chung (factorize từng cột rồi ghép),
+    để join bằng searchsorted thay vì dict lookup từng dòng.
+    """
+    n_left = len(left_columns[0]) if left_columns else 0
+    left_codes = np.zeros(n_left, dtype=np.int64)
+    right_codes = np.zeros(len(right_columns[0]) if right_columns else 0, dtype=np.int64)
+    for left, right in zip(left_columns, right_columns):
+        n_uniques, inverse = factorize(np.concatenate([left, right]))
+        left_codes = left_codes * n_uniques + inverse[:n_left]
+        right_codes = right_codes * n_uniques + inverse[n_left:]
+    return left_codes, right_codes
+
+
+def factorize(values: np.ndarray) -> Tuple[int, np.ndarray]:
+    """
+    Trả về (số giá trị khác nhau, mã int64 của từng phần tử).
+    Cột object (string) dùng dict thay cho np.unique vì sort string object rất chậm.
+    """
+    if values.dtype == object:
+        codes: Dict[object, int] = {}
+        inverse = np.fromiter(
+            (codes.setdefault(value, len(codes)) for value in values.tolist()),
+            dtype=np.int64,
+            count=len(values)
+        )
+        return len(codes), inverse
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return len(uniques), inverse.reshape(-1).astype(np.int64)
+
+
+def join_values(
+    left_columns: Sequence[np.ndarray],
+    right_columns: Sequence[np.ndarray],
+    right_values: np.ndarray,
+    default: float = 0.0
+) -> np.ndarray:
+    """
+    Với mỗi dòng bên trái, lấy value bên phải có cùng key (key bên phải phải unique),
+    không có thì trả về default. Tương đương LEFT JOIN ... USING(keys).
+    """
+    n_left = len(left_columns[0]) if left_columns else 0
+    values = np.full(n_left, default, dtype=np.asarray(right_values).dtype if len(right_values) else np.float64)
+    if n_left == 0 or len(right_values) == 0:
+        return values
+
+    left_codes, right_codes = encode_keys(left_columns, right_columns)
+    order = np.argsort(right_codes, kind='stable')
+    sorted_codes = right_codes[order]
+    positions = np.searchsorted(sorted_codes, left_codes)
+    positions_clipped = np.minimum(positions, len(sorted_codes) - 1)
+    matched = (positions < len(sorted_codes)) & (sorted_codes[positions_clipped] == left_codes)
+    values[matched] = np.asarray(right_values)[order][positions_clipped[matched]]
+    return values
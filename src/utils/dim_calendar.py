@@ -0,0 +1,221 @@
+import os
+import json
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.utils.logger import get_logger
+
+DIM_DATE_TABLE = 'hskcdp.dim_date'
+DIM_DATE_COLUMNS = ['calendar_date', 'year', 'month', 'day', 'date_label', 'priority_label', 'event_type']
+LABEL_COLUMNS = ['date_label', 'priority_label', 'event_type']
+CALENDAR_FILE_FORMAT = 1
+
+# Quy tắc loại double day (6/6, 9/9, 11/11, 12/12) khỏi historical / weight / kpi_day: chỉ định nghĩa ở đây.
+# window = số ngày loại thêm mỗi bên: 0 = đúng ngày double day, 1 = double day ±1 (kpi_channel_metadata)
+DOUBLE_DAY_MONTHS = (6, 9, 11, 12)
+DOUBLE_DAY_WINDOW = 0
+DOUBLE_DAY_WINDOW_CHANNEL = 1
+
+logger = get_logger(__name__)
+
+
+def is_double_day_excluded(month: int, day: int, window: int = DOUBLE_DAY_WINDOW) -> bool:
+    return month in DOUBLE_DAY_MONTHS and abs(day - month) <= window
+
+
+class DimDateCalendar:
+    """
+    dim_date in-memory, load 1 lần / run: index date -> dòng (label), label -> dates, (year, month) -> dates.
+    Các calculator lấy nhãn ngày / danh sách ngày của tháng từ đây thay vì query (hoặc JOIN) dim_date lại.
+    """
+
+    def __init__(self, rows: Iterable[Dict], version: Optional[str] = None):
+        self.version = version
+        self.rows_by_date: Dict[date, Dict] = {}
+        for row in rows:
+            self.rows_by_date[row['calendar_date']] = row
+
+        self.dates: List[date] = sorted(self.rows_by_date)
+        self.dates_by_month: Dict[Tuple[int, int], List[date]] = {}
+        self.dates_by_label: Dict[str, Dict[str, List[date]]] = {column: {} for column in LABEL_COLUMNS}
+        for calendar_date in self.dates:
+            row = self.rows_by_date[calendar_date]
+            self.dates_by_month.setdefault((row['year'], row['month']), []).append(calendar_date)
+            for column in LABEL_COLUMNS:
+                self.dates_by_label[column].setdefault(row[column], []).append(calendar_date)
+
+    def __len__(self) -> int:
+        return len(self.rows_by_date)
+
+    def __contains__(self, calendar_date: date) -> bool:
+        return calendar_date in self.rows_by_date
+
+    def get_label(self, calendar_date: date, column: str = 'priority_label') -> Optional[str]:
+        # None nếu ngày không có trong dim_date (giống INNER JOIN dim_date bỏ ngày đó)
+        row = self.rows_by_date.get(calendar_date)
+        return row[column] if row is not None else None
+
+    def is_excluded(self, calendar_date: date, window: int = DOUBLE_DAY_WINDOW) -> bool:
+        return is_double_day_excluded(calendar_date.month, calendar_date.day, window)
+
+    def get_month_dates(
+        self,
+        year: int,
+        month: int,
+        double_day_window: Optional[int] = None
+    ) -> List[date]:
+        """
+        Các ngày của tháng (tăng dần); double_day_window != None: bỏ double day theo window đó
+        """
+        dates = self.dates_by_month.get((year, month), [])
+        if double_day_window is None:
+            return list(dates)
+        return [d for d in dates if not self.is_excluded(d, double_day_window)]
+
+    def get_month_rows(
+        self,
+        year: int,
+        month: int,
+        double_day_window: Optional[int] = None
+    ) -> List[Dict]:
+        return [self.rows_by_date[d] for d in self.get_month_dates(year, month, double_day_window)]
+
+    def get_dates_by_label(
+        self,
+        label: str,
+        column: str = 'priority_label',
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> List[date]:
+        # Ngày có nhãn `label` trong [start_date, end_date]
+        return [
+            d for d in self.dates_by_label[column].get(label, [])
+            if (start_date is None or d >= start_date) and (end_date is None or d <= end_date)
+        ]
+
+    def get_dates_between(self, start_date: date, end_date: date) -> List[date]:
+        return [d for d in self.dates if start_date <= d <= end_date]
+
+    def count_by_label(
+        self,
+        year: int,
+        month: int,
+        labels: List[str],
+        column: str = 'priority_label',
+        double_day_window: Optional[int] = DOUBLE_DAY_WINDOW
+    ) -> Dict[str, int]:
+        """
+        Số ngày theo nhãn trong tháng, chỉ các nhãn có ít nhất 1 ngày (giống GROUP BY)
+        """
+        counts: Dict[str, int] = {}
+        for d in self.get_month_dates(year, month, double_day_window):
+            label = self.rows_by_date[d][column]
+            if label in labels:
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
+
+def get_calendar_version(client) -> str:
+    """
+    Version của dim_date (số dòng, ngày đầu / cuối, hash nội dung) để kiểm tra file cache còn đúng không
+    """
+    result = client.query(f"""
+        SELECT
+            count(),
+            min(calendar_date),
+            max(calendar_date),
+            sum(cityHash64(calendar_date, date_label, priority_label, event_type))
+        FROM {DIM_DATE_TABLE} FINAL
+    """)
+    count, min_date, max_date, content_hash = result.result_rows[0]
+    return f"{count}:{min_date}:{max_date}:{content_hash}"
+
+
+def query_calendar_rows(client) -> List[Dict]:
+    result = client.query(f"""
+        SELECT {', '.join(DIM_DATE_COLUMNS)}
+        FROM {DIM_DATE_TABLE} FINAL
+        ORDER BY calendar_date
+    """)
+    return [
+        {
+            'calendar_date': row[0],
+            'year': int(row[1]),
+            'month': int(row[2]),
+            'day': int(row[3]),
+            'date_label': str(row[4]),
+            'priority_label': str(row[5]),
+            'event_type': str(row[6]),
+        }
+        for row in result.result_rows
+    ]
+
+
+def read_calendar_file(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot read dim_date cache %s: %s", path, e)
+        return None
+    if data.get('format') != CALENDAR_FILE_FORMAT:
+        return None
+    return data
+
+
+def write_calendar_file(path: str, calendar: DimDateCalendar) -> None:
+    data = {
+        'format': CALENDAR_FILE_FORMAT,
+        'version': calendar.version,
+        'columns': DIM_DATE_COLUMNS,
+        'rows': [
+            [row['calendar_date'].isoformat()] + [row[column] for column in DIM_DATE_COLUMNS[1:]]
+            for row in (calendar.rows_by_date[d] for d in calendar.dates)
+        ],
+    }
+    # Ghi file tạm rồi rename để process khác không đọc phải file ghi dở
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_calendar(client, cache_path: Optional[str] = None) -> DimDateCalendar:
+    """
+    Load dim_date thành DimDateCalendar. cache_path (mặc định env KPI_DIM_DATE_CACHE, rỗng = không dùng file):
+    nếu file có cùng version với dim_date hiện tại thì đọc file (chỉ tốn 1 query version), không thì query
+    toàn bộ dim_date và ghi lại file
+    """
+    if cache_path is None:
+        cache_path = os.getenv("KPI_DIM_DATE_CACHE", "")
+
+    if not cache_path:
+        return DimDateCalendar(query_calendar_rows(client))
+
+    version = get_calendar_version(client)
+    data = read_calendar_file(cache_path)
+    if data is not None and data.get('version') == version:
+        rows = [dict(zip(data['columns'], row)) for row in data['rows']]
+        for row in rows:
+            row['calendar_date'] = date.fromisoformat(row['calendar_date'])
+        logger.debug("Loaded %s dim_date rows from %s", len(rows), cache_path)
+        return DimDateCalendar(rows, version=version)
+
+    calendar = DimDateCalendar(query_calendar_rows(client), version=version)
+    try:
+        write_calendar_file(cache_path, calendar)
+        logger.info("dim_date cache %s refreshed (%s rows, version %s)", cache_path, len(calendar), version)
+    except OSError as e:
+        logger.warning("Cannot write dim_date cache %s: %s", cache_path, e)
+    return calendar
+
+
+def get_padded_window(days_back: int, end_offset: int = 1) -> Tuple[date, date]:
+    """
+    [today - days_back, today - end_offset] theo giờ local, nới thêm 1 ngày mỗi bên: dùng cho danh sách ngày
+    IN (...) đi kèm điều kiện today() phía ClickHouse (timezone server có thể lệch ngày)
+    """
+    today = date.today()
+    return today - timedelta(days=days_back + 1), today - timedelta(days=end_offset - 1)
@@ -0,0 +1,345 @@
+"""
+Cache trên đĩa cho aggregation lịch sử (3 tháng gần nhất) của object_sql_transaction_details:
+1 file .npy / ngày đã chốt, grain (calendar_date, platform, brand_name, sku), đọc bằng memory-map.
+
+    python -m src.utils.history_cache --warm [--months 3]
+    python -m src.utils.history_cache --invalidate-from 2026-09-01
+    python -m src.utils.history_cache --stats
+
+Thư mục: env KPI_HISTORY_CACHE_DIR (rỗng = tắt cache, các helper query ClickHouse như cũ).
+"""
+import os
+import sys
+import calendar
+import threading
+from decimal import Decimal
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from src.utils.columnar import ColumnarResult, query_columns, factorize, DATE_DTYPE, INT_DTYPE
+from src.utils.transaction_snapshot import (
+    get_channel_from_platform, get_amount_type, get_amount_decimals, get_decimal_scale
+)
+from src.utils.logger import get_logger
+
+# Đổi khi đổi layout / dtype của file ngày: thư mục format cũ bị bỏ qua
+HISTORY_CACHE_FORMAT = 'v1'
+HISTORY_CACHE_COLUMNS = ['calendar_date', 'platform', 'channel', 'brand_name', 'sku']
+HISTORY_MONTHS = 3
+
+logger = get_logger(__name__)
+
+
+def subtract_months(day: date, months: int) -> date:
+    # Giống today() - INTERVAL n MONTH của ClickHouse: ngày vượt quá cuối tháng lùi về ngày cuối tháng
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def get_history_start(today: Optional[date] = None, months: int = HISTORY_MONTHS) -> date:
+    return subtract_months(today if today is not None else date.today(), months)
+
+
+def get_history_cache(client) -> Optional['HistoryCache']:
+    cache_dir = os.getenv("KPI_HISTORY_CACHE_DIR", "")
+    return HistoryCache(client, cache_dir) if cache_dir else None
+
+
+class HistoryCache:
+    """
+    Ngày đã chốt (< today - settle_days) được query 1 lần rồi ghi ra file, các lần sau chỉ đọc file (mmap);
+    các ngày gần hơn (có thể còn cancel / cập nhật) luôn query trực tiếp và không ghi.
+    settle_days: env KPI_HISTORY_CACHE_SETTLE_DAYS (default 2); fetch_days: số ngày / query khi điền cache
+    (env KPI_HISTORY_CACHE_FETCH_DAYS, default 7) để giới hạn bộ nhớ lần đầu.
+    Nhãn ngày (date_label / priority_label) không lưu trong file mà map khi đọc (DimDateCalendar),
+    nên sửa dim_date không làm cache sai.
+    Amount lưu int64 đơn vị 10^-S, S = scale của total_amount theo DESCRIBE TABLE (get_amount_decimals):
+    cột Decimal / Int thì tổng chính xác như SUM trong ClickHouse, cột Float bị làm tròn về 2 chữ số.
+    Thư mục cache gồm cả S (vd v1-s2) nên đổi kiểu cột không đọc nhầm file cũ.
+    """
+
+    def __init__(
+        self,
+        client,
+        cache_dir: str,
+        settle_days: Optional[int] = None,
+        fetch_days: Optional[int] = None,
+        amount_type: Optional[str] = None
+    ):
+        self.client = client
+        self.root_dir = cache_dir
+        # Kiểu cột total_amount (DESCRIBE TABLE) và scale tương ứng, đọc lazy ở lần dùng đầu
+        self.amount_type = amount_type
+        self.amount_decimals: Optional[int] = None
+        self.settle_days = settle_days if settle_days is not None else int(os.getenv("KPI_HISTORY_CACHE_SETTLE_DAYS", "2"))
+        self.fetch_days = fetch_days if fetch_days is not None else int(os.getenv("KPI_HISTORY_CACHE_FETCH_DAYS", "7"))
+        self.lock = threading.Lock()
+        self.fetched_days = 0
+
+    def get_amount_type(self) -> str:
+        if self.amount_type is None:
+            self.amount_type = get_amount_type(self.client)
+        return self.amount_type
+
+    def get_amount_decimals(self) -> int:
+        if self.amount_decimals is None:
+            self.amount_decimals = get_amount_decimals(self.client, column_type=self.get_amount_type())
+        return self.amount_decimals
+
+    def get_decimal_scale(self) -> Optional[int]:
+        # Scale của SUM(total_amount) khi cột là Decimal (phép chia Decimal cắt về scale này), còn lại None
+        return get_decimal_scale(self.get_amount_type())
+
+    def get_cache_dir(self) -> str:
+        return os.path.join(self.root_dir, f"{HISTORY_CACHE_FORMAT}-s{self.get_amount_decimals()}")
+
+    def get_path(self, day: date) -> str:
+        return os.path.join(self.get_cache_dir(), f"{day:%Y-%m}", f"{day.isoformat()}.npy")
+
+    def get_last_closed_day(self, today: Optional[date] = None) -> date:
+        today = today if today is not None else date.today()
+        return today - timedelta(days=self.settle_days + 1)
+
+    def get_aggregate_query(self, where: str) -> str:
+        return f"""
+            SELECT
+                toDate(created_at) AS calendar_date,
+                platform,
+                brand_name,
+                CAST(sku AS String) AS sku,
+                toInt64(round(SUM(COALESCE(total_amount, 0)) * {10 ** self.get_amount_decimals()})) AS amount
+            FROM hskcdp.object_sql_transaction_details FINAL
+            WHERE {where}
+              AND status NOT IN ('Canceled', 'Cancel')
+            GROUP BY calendar_date, platform, brand_name, sku
+        """
+
+    def query_aggregates(self, where: str) -> ColumnarResult:
+        return query_columns(
+            self.client,
+            self.get_aggregate_query(where),
+            dtypes={'calendar_date': DATE_DTYPE, 'amount': INT_DTYPE},
+            column_names=['calendar_date', 'platform', 'brand_name', 'sku', 'amount']
+        )
+
+    def write_day(self, day: date, platforms, brand_names, skus, amounts) -> None:
+        encoded = [np.char.encode(np.asarray(values, dtype=str), 'utf-8') for values in (platforms, brand_names, skus)]
+        widths = [max(int(values.dtype.itemsize), 1) for values in encoded]
+        records = np.zeros(len(amounts), dtype=[
+            ('platform', f'S{widths[0]}'),
+            ('brand_name', f'S{widths[1]}'),
+            ('sku', f'S{widths[2]}'),
+            ('amount', 'i8'),
+        ])
+        records['platform'] = encoded[0]
+        records['brand_name'] = encoded[1]
+        records['sku'] = encoded[2]
+        records['amount'] = amounts
+
+        path = self.get_path(day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Ghi file tạm rồi rename: process khác không bao giờ đọc phải file ghi dở
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}.npy"
+        np.save(tmp_path, records)
+        os.replace(tmp_path, path)
+
+    def fill(self, days: List[date]) -> int:
+        """
+        Query và ghi file cho các ngày chưa có trong cache (theo lô fetch_days ngày); ngày không có
+        transaction vẫn ghi file rỗng để không query lại. Returns: số ngày đã ghi
+        """
+        missing = [day for day in days if not os.path.exists(self.get_path(day))]
+        for i in range(0, len(missing), max(self.fetch_days, 1)):
+            batch = missing[i:i + max(self.fetch_days, 1)]
+            dates_str = ','.join([f"'{day}'" for day in batch])
+            result = self.query_aggregates(f"toDate(created_at) IN ({dates_str})")
+            day_values = result['calendar_date'] if len(result) else np.empty(0, dtype=DATE_DTYPE)
+            for day in batch:
+                mask = day_values == np.datetime64(day, 'D')
+                self.write_day(
+                    day,
+                    result['platform'][mask] if len(result) else [],
+                    result['brand_name'][mask] if len(result) else [],
+                    result['sku'][mask] if len(result) else [],
+                    result['amount'][mask] if len(result) else np.empty(0, dtype=np.int64)
+                )
+            logger.debug("History cache: fetched %s days (%s rows)", len(batch), len(result))
+        self.fetched_days += len(missing)
+        return len(missing)
+
+    def load_day(self, day: date) -> np.ndarray:
+        return np.load(self.get_path(day), mmap_mode='r')
+
+    def get_columns(self, start_date: date, today: Optional[date] = None) -> ColumnarResult:
+        """
+        Aggregate từ start_date tới hết (giống toDate(created_at) >= start_date): ngày đã chốt đọc từ file
+        (query các ngày còn thiếu), ngày gần đây query trực tiếp. Cột platform / brand_name / sku là bytes utf-8.
+        """
+        last_closed_day = self.get_last_closed_day(today)
+        closed_days = [start_date + timedelta(days=i) for i in range((last_closed_day - start_date).days + 1)]
+        with self.lock:
+            self.fill(closed_days)
+
+        parts = []
+        for day in closed_days:
+            records = self.load_day(day)
+            if len(records):
+                parts.append((np.full(len(records), np.datetime64(day, 'D')), records['platform'],
+                              records['brand_name'], records['sku'], records['amount']))
+
+        recent_start = max(start_date, last_closed_day + timedelta(days=1))
+        recent = self.query_aggregates(f"toDate(created_at) >= '{recent_start}'")
+        if len(recent):
+            parts.append((
+                recent['calendar_date'],
+                np.char.encode(recent['platform'].astype(str), 'utf-8'),
+                np.char.encode(recent['brand_name'].astype(str), 'utf-8'),
+                np.char.encode(recent['sku'].astype(str), 'utf-8'),
+                recent['amount']
+            ))
+
+        names = ['calendar_date', 'platform', 'brand_name', 'sku', 'amount']
+        if not parts:
+            return ColumnarResult(names, {
+                'calendar_date': np.empty(0, dtype=DATE_DTYPE),
+                'platform': np.empty(0, dtype='S1'),
+                'brand_name': np.empty(0, dtype='S1'),
+                'sku': np.empty(0, dtype='S1'),
+                'amount': np.empty(0, dtype=np.int64),
+            })
+        return ColumnarResult(names, {
+            name: np.concatenate([part[i] for part in parts]) for i, name in enumerate(names)
+        })
+
+    def rollup(
+        self,
+        keys: Sequence[str],
+        start_date: Optional[date] = None,
+        today: Optional[date] = None
+    ) -> Dict[Tuple, Decimal]:
+        """
+        SUM(total_amount) GROUP BY keys (HISTORY_CACHE_COLUMNS) từ start_date (mặc định today - 3 tháng),
+        tổng cộng bằng int64 đơn vị 10^-S; Returns: {tuple(keys): Decimal} đúng scale S
+        """
+        for key in keys:
+            if key not in HISTORY_CACHE_COLUMNS:
+                raise ValueError(f"Unknown history cache column: {key}")
+        if start_date is None:
+            start_date = get_history_start(today)
+
+        columns = self.get_columns(start_date, today)
+        n_rows = len(columns)
+        if n_rows == 0:
+            return {}
+
+        codes = np.zeros(n_rows, dtype=np.int64)
+        uniques_by_key = []
+        for key in keys:
+            values = columns['platform'] if key == 'channel' else columns[key]
+            n_uniques, inverse = factorize(values)
+            codes = codes * n_uniques + inverse
+            uniques_by_key.append((key, values, inverse))
+
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        sums = np.add.reduceat(columns['amount'][order], starts)
+        first_rows = order[starts]
+
+        key_values = []
+        for key, values, _ in uniques_by_key:
+            if key == 'calendar_date':
+                key_values.append(values[first_rows].tolist())
+            else:
+                decoded = [value.decode('utf-8') for value in values[first_rows].tolist()]
+                if key == 'channel':
+                    decoded = [get_channel_from_platform(value) for value in decoded]
+                key_values.append(decoded)
+
+        amount_decimals = self.get_amount_decimals()
+        totals: Dict[Tuple, Decimal] = {}
+        for group, amount in zip(zip(*key_values), sums.tolist()):
+            # channel gộp nhiều platform (ECOM): cộng các nhóm platform về cùng channel
+            totals[group] = totals.get(group, Decimal('0')) + Decimal(amount).scaleb(-amount_decimals)
+        return totals
+
+    def invalidate_from(self, start_date: date) -> int:
+        # Xoá file của các ngày >= start_date (vd sau khi sửa / backfill transaction cũ)
+        removed = 0
+        cache_dir = self.get_cache_dir()
+        if not os.path.isdir(cache_dir):
+            return 0
+        for month_dir in sorted(os.listdir(cache_dir)):
+            month_path = os.path.join(cache_dir, month_dir)
+            for name in sorted(os.listdir(month_path)):
+                if name.endswith('.npy') and date.fromisoformat(name[:10]) >= start_date:
+                    os.remove(os.path.join(month_path, name))
+                    removed += 1
+        return removed
+
+    def get_stats(self) -> Dict[str, object]:
+        days = []
+        total_bytes = 0
+        cache_dir = self.get_cache_dir()
+        if os.path.isdir(cache_dir):
+            for month_dir in sorted(os.listdir(cache_dir)):
+                month_path = os.path.join(cache_dir, month_dir)
+                for name in sorted(os.listdir(month_path)):
+                    if name.endswith('.npy') and '.tmp.' not in name:
+                        days.append(name[:10])
+                        total_bytes += os.path.getsize(os.path.join(month_path, name))
+        return {
+            'cache_dir': cache_dir,
+            'amount_type': self.get_amount_type(),
+            'days': len(days),
+            'first_day': days[0] if days else None,
+            'last_day': days[-1] if days else None,
+            'mb': round(total_bytes / 1024 / 1024, 1),
+        }
+
+
+if __name__ == "__main__":
+    from src.utils.clickhouse_client import get_client
+
+    warm = False
+    months = HISTORY_MONTHS
+    invalidate_from = None
+    show_stats = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--warm":
+            warm = True
+            i += 1
+        elif sys.argv[i] == "--months" and i + 1 < len(sys.argv):
+            months = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--invalidate-from" and i + 1 < len(sys.argv):
+            invalidate_from = date.fromisoformat(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--stats":
+            show_stats = True
+            i += 1
+        else:
+            i += 1
+
+    if not os.getenv("KPI_HISTORY_CACHE_DIR"):
+        print("Error: KPI_HISTORY_CACHE_DIR is not set")
+        sys.exit(1)
+    if not (warm or invalidate_from or show_stats):
+        print("Usage: python -m src.utils.history_cache [--warm [--months 3]] [--invalidate-from YYYY-MM-DD] [--stats]")
+        sys.exit(1)
+
+    cache = get_history_cache(get_client())
+    if invalidate_from is not None:
+        print(f"Removed {cache.invalidate_from(invalidate_from)} cached days from {invalidate_from}")
+    if warm:
+        start_date = get_history_start(months=months)
+        last_closed_day = cache.get_last_closed_day()
+        days = [start_date + timedelta(days=i) for i in range((last_closed_day - start_date).days + 1)]
+        print(f"Fetched {cache.fill(days)} days ({start_date} -> {last_closed_day})")
+    if show_stats:
+        for key, value in cache.get_stats().items():
+            print(f"  {key}: {value}")
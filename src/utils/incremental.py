@@ -0,0 +1,166 @@
+import os
+import math
+from decimal import Decimal
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from src.utils.latest_state import READ_PATH_FINAL, latest_table
+from src.utils.transaction_snapshot import get_channel_from_platform
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+WATERMARK_TABLE = 'hskcdp.kpi_incremental_watermark'
+# Cột dùng làm watermark của object_sql_transaction_details (updated_at nếu bảng có cột này)
+WATERMARK_COLUMN = os.getenv("KPI_WATERMARK_COLUMN", "created_at")
+
+# Grain của 1 cell thay đổi trong transaction
+CELL_COLUMNS = ['calendar_date', 'channel', 'brand_name', 'sku']
+
+# Key logic của các bảng ghi incremental (prefix của CELL_COLUMNS)
+INCREMENTAL_KEYS: Dict[str, List[str]] = {
+    'hskcdp.kpi_day': ['calendar_date'],
+    'hskcdp.kpi_channel': ['calendar_date', 'channel'],
+    'hskcdp.kpi_brand': ['calendar_date', 'channel', 'brand_name'],
+    'hskcdp.kpi_sku': ['calendar_date', 'channel', 'brand_name', 'sku'],
+}
+# Không so sánh các cột thời gian ghi
+IGNORED_COLUMNS = {'created_at', 'updated_at'}
+
+# Sai số coi như không đổi (VND), giống tolerance của benchmark kpi_sku
+INCREMENTAL_REL_TOL = 1e-9
+INCREMENTAL_ABS_TOL = 1e-6
+
+
+def get_transaction_watermark(client, year: int, month: int) -> Optional[datetime]:
+    query = f"""
+        SELECT max({WATERMARK_COLUMN})
+        FROM hskcdp.object_sql_transaction_details
+        WHERE toYear(created_at) = {year}
+          AND toMonth(created_at) = {month}
+    """
+    result = client.query(query)
+    if result.result_rows and result.result_rows[0][0] is not None:
+        return result.result_rows[0][0]
+    return None
+
+
+def load_watermark(client, year: int, month: int) -> Optional[datetime]:
+    query = f"""
+        SELECT watermark
+        FROM {WATERMARK_TABLE} FINAL
+        WHERE year = {year}
+          AND month = {month}
+        LIMIT 1
+    """
+    result = client.query(query)
+    if result.result_rows:
+        return result.result_rows[0][0]
+    return None
+
+
+def save_watermark(client, year: int, month: int, watermark: datetime) -> None:
+    client.insert(
+        WATERMARK_TABLE,
+        [[year, month, watermark, datetime.now()]],
+        column_names=['year', 'month', 'watermark', 'updated_at']
+    )
+
+
+def get_changed_cells(client, year: int, month: int, since: datetime) -> Set[Tuple]:
+    """
+    Các cell (calendar_date, channel, brand_name, sku) có transaction mới sau watermark `since`
+    (không lọc status để transaction bị hủy cũng được tính là thay đổi)
+    """
+    query = f"""
+        SELECT DISTINCT
+            toDate(created_at) AS calendar_date,
+            platform,
+            brand_name,
+            CAST(sku AS String) AS sku
+        FROM hskcdp.object_sql_transaction_details
+        WHERE toYear(created_at) = {year}
+          AND toMonth(created_at) = {month}
+          AND {WATERMARK_COLUMN} > '{since.strftime('%Y-%m-%d %H:%M:%S')}'
+    """
+    result = client.query(query)
+    return {
+        (row[0], get_channel_from_platform(str(row[1])), str(row[2]), str(row[3]))
+        for row in result.result_rows
+    }
+
+
+def values_differ(left, right, rel_tol: float = INCREMENTAL_REL_TOL, abs_tol: float = INCREMENTAL_ABS_TOL) -> bool:
+    if left is None or right is None:
+        return (left is None) != (right is None)
+    if isinstance(left, (int, float, Decimal)) and isinstance(right, (int, float, Decimal)):
+        return not math.isclose(float(left), float(right), rel_tol=rel_tol, abs_tol=abs_tol)
+    return left != right
+
+
+class IncrementalWriter:
+    """
+    Thay cho client.insert trong chế độ incremental (cùng signature insert(table, data, column_names)):
+    chỉ insert các dòng mới hoặc có giá trị khác với dòng hiện tại trong bảng (so sánh có tolerance).
+    Cell có transaction mới nhưng giá trị tính lại không đổi thì không ghi lại.
+    Bảng không nằm trong INCREMENTAL_KEYS thì insert bình thường.
+    """
+
+    def __init__(self, client, read_path: str = READ_PATH_FINAL):
+        self.client = client
+        self.read_path = read_path
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def load_current_rows(
+        self,
+        table: str,
+        key_columns: Sequence[str],
+        value_columns: Sequence[str],
+        calendar_dates: Set[date]
+    ) -> Dict[Tuple, Tuple]:
+        # Dòng hiện tại (mới nhất) của các ngày đang ghi, {key: values}
+        dates_str = ", ".join(f"'{d}'" for d in sorted(calendar_dates))
+        select_columns = ", ".join(list(key_columns) + list(value_columns))
+        query = f"""
+            SELECT {select_columns}
+            FROM {latest_table(table, self.read_path)}
+            WHERE calendar_date IN ({dates_str})
+        """
+        result = self.client.query(query)
+        n_keys = len(key_columns)
+        return {tuple(row[:n_keys]): tuple(row[n_keys:]) for row in result.result_rows}
+
+    def filter_changed_rows(self, table: str, data: List[List], column_names: Sequence[str]) -> List[List]:
+        key_columns = INCREMENTAL_KEYS[table]
+        value_columns = [c for c in column_names if c not in key_columns and c not in IGNORED_COLUMNS]
+        key_index = [list(column_names).index(c) for c in key_columns]
+        value_index = [list(column_names).index(c) for c in value_columns]
+
+        calendar_dates = {row[key_index[0]] for row in data}
+        current_rows = self.load_current_rows(table, key_columns, value_columns, calendar_dates)
+
+        changed = []
+        for row in data:
+            key = tuple(row[i] for i in key_index)
+            current = current_rows.get(key)
+            if current is None:
+                changed.append(row)
+                continue
+            for i, current_value in zip(value_index, current):
+                if values_differ(row[i], current_value):
+                    changed.append(row)
+                    break
+        return changed
+
+    def insert(self, table: str, data: List[List], column_names: Sequence[str]) -> None:
+        if table not in INCREMENTAL_KEYS or not data:
+            self.client.insert(table, data, column_names=column_names)
+            return
+
+        changed = self.filter_changed_rows(table, data, column_names)
+        stats = self.stats.setdefault(table, {'rows': 0, 'inserted': 0})
+        stats['rows'] += len(data)
+        stats['inserted'] += len(changed)
+        logger.info("[incremental] %s: %s/%s rows changed", table, len(changed), len(data))
+
+        if changed:
+            self.client.insert(table, changed, column_names=column_names)
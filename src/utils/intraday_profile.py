@@ -0,0 +1,188 @@
+import numpy as np
+from decimal import Decimal
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+HOURS_PER_DAY = 24
+# Key của profile không chia theo dimension (toàn bộ transaction)
+ALL_KEY = 'ALL'
+INTRADAY_PROFILE_TABLE = 'hskcdp.kpi_intraday_profile'
+INTRADAY_PROFILE_DIMENSIONS = ['all', 'channel', 'brand_name', 'date_label']
+
+
+class IntradayProfile:
+    """
+    Tỷ trọng revenue theo giờ trong ngày (profile intraday) theo key của 1 dimension
+    (ALL / channel / brand_name / date_label), lưu kèm prefix-sum để trả lời
+    "đã qua bao nhiêu % doanh thu của ngày tính tới giờ h" trong O(1).
+
+    cumulative[key][h] = tổng % của các giờ [0, h)  (h = 0..24),
+    cộng dồn bằng Decimal(str(pct)) giống các vòng lặp cũ nên kết quả không đổi.
+    """
+
+    def __init__(
+        self,
+        dimension: str,
+        hourly_pct_by_key: Dict[str, Dict[int, object]],
+        days_back: int = 30,
+        profile_date: Optional[date] = None
+    ):
+        self.dimension = dimension
+        self.days_back = days_back
+        self.profile_date = profile_date if profile_date is not None else date.today()
+        self.hourly_pct: Dict[str, List[Decimal]] = {}
+        self.cumulative: Dict[str, List[Decimal]] = {}
+
+        for key, pcts in hourly_pct_by_key.items():
+            hourly = [Decimal(str(pcts.get(hour, 0.0))) for hour in range(HOURS_PER_DAY)]
+            cumulative = [Decimal('0')]
+            for pct in hourly:
+                cumulative.append(cumulative[-1] + pct)
+            self.hourly_pct[key] = hourly
+            self.cumulative[key] = cumulative
+
+        # Bản float64 cho engine vectorized: 1 dòng / key, 25 cột (h = 0..24)
+        self.keys = list(self.cumulative.keys())
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.cumulative_array = np.zeros((len(self.keys) + 1, HOURS_PER_DAY + 1), dtype=np.float64)
+        for i, key in enumerate(self.keys):
+            self.cumulative_array[i] = [float(value) for value in self.cumulative[key]]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.cumulative
+
+    def hour_pct(self, key: str, hour: int) -> Decimal:
+        hourly = self.hourly_pct.get(key)
+        if hourly is None or hour < 0 or hour >= HOURS_PER_DAY:
+            return Decimal('0')
+        return hourly[hour]
+
+    def share_completed(self, key: str, until_hour: int) -> Decimal:
+        """
+        Tổng % revenue của các giờ [0, until_hour) cho key; key không có trong profile -> 0
+        (giống get_daily_actual_until_hour: lấy từ 00:00 tới < until_hour)
+        """
+        cumulative = self.cumulative.get(key)
+        if cumulative is None:
+            return Decimal('0')
+        return cumulative[min(max(until_hour, 0), HOURS_PER_DAY)]
+
+    def share_completed_array(self, keys: np.ndarray, until_hour: int) -> np.ndarray:
+        """
+        share_completed cho cả mảng key (float64), key không có trong profile -> 0
+        """
+        hour = min(max(until_hour, 0), HOURS_PER_DAY)
+        missing_index = len(self.keys)
+        row_index = np.fromiter(
+            (self.key_index.get(key, missing_index) for key in keys.tolist()),
+            dtype=np.int64,
+            count=len(keys)
+        )
+        return self.cumulative_array[row_index, hour]
+
+    def to_rows(self, updated_at: Optional[datetime] = None) -> List[List]:
+        # Format insert vào INTRADAY_PROFILE_TABLE
+        updated_at = updated_at if updated_at is not None else datetime.now()
+        rows = []
+        for key in self.keys:
+            for hour in range(HOURS_PER_DAY):
+                rows.append([
+                    self.profile_date,
+                    self.dimension,
+                    key,
+                    self.days_back,
+                    hour,
+                    self.hourly_pct[key][hour],
+                    self.cumulative[key][hour + 1],
+                    updated_at
+                ])
+        return rows
+
+
+def build_intraday_profile(revenue_helper, dimension: str, days_back: int = 30) -> IntradayProfile:
+    """
+    Tính profile từ transaction `days_back` ngày gần nhất (cùng query với các stage hiện tại):
+        all: get_hourly_revenue_percentage (kpi_day)
+        channel: get_hourly_revenue_percentage_by_channel (kpi_sku, kpi_forecast)
+        brand_name / date_label: get_hourly_revenue_percentage_by_dimension
+    """
+    if dimension == 'all':
+        hourly_pct_by_key = {ALL_KEY: revenue_helper.get_hourly_revenue_percentage(days_back=days_back)}
+    elif dimension == 'channel':
+        hourly_pct_by_key = revenue_helper.get_hourly_revenue_percentage_by_channel(days_back=days_back)
+    elif dimension in ('brand_name', 'date_label'):
+        hourly_pct_by_key = revenue_helper.get_hourly_revenue_percentage_by_dimension(
+            dimension=dimension,
+            days_back=days_back
+        )
+    else:
+        raise ValueError(f"Unknown intraday profile dimension: {dimension}. Available: {INTRADAY_PROFILE_DIMENSIONS}")
+    return IntradayProfile(dimension, hourly_pct_by_key, days_back=days_back)
+
+
+def load_intraday_profile(client, dimension: str, days_back: int = 30) -> Optional[IntradayProfile]:
+    """
+    Đọc profile mới nhất (trong ngày hôm nay) từ INTRADAY_PROFILE_TABLE, không có thì trả về None
+    """
+    query = f"""
+        SELECT
+            key,
+            hour,
+            hour_pct
+        FROM {INTRADAY_PROFILE_TABLE} FINAL
+        WHERE dimension = '{dimension}'
+          AND days_back = {days_back}
+          AND profile_date = today()
+        ORDER BY key, hour
+    """
+    result = client.query(query)
+    if not result.result_rows:
+        return None
+
+    hourly_pct_by_key = {}
+    for row in result.result_rows:
+        key = str(row[0])
+        if key not in hourly_pct_by_key:
+            hourly_pct_by_key[key] = {}
+        hourly_pct_by_key[key][int(row[1])] = Decimal(str(row[2]))
+    return IntradayProfile(dimension, hourly_pct_by_key, days_back=days_back)
+
+
+def save_intraday_profile(client, profile: IntradayProfile) -> None:
+    rows = profile.to_rows()
+    if not rows:
+        return
+
+    columns = [
+        'profile_date', 'dimension', 'key', 'days_back',
+        'hour', 'hour_pct', 'cumulative_pct', 'updated_at'
+    ]
+    client.insert(INTRADAY_PROFILE_TABLE, rows, column_names=columns)
+
+
+if __name__ == "__main__":
+    # Refresh profile hằng ngày: python -m src.utils.intraday_profile [--dimensions all,channel] [--days-back 30]
+    import sys
+    from src.utils.clickhouse_client import get_client
+    from src.utils.query_helper import RevenueQueryHelper
+
+    dimensions = ['all', 'channel']
+    days_back = 30
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--dimensions" and i + 1 < len(sys.argv):
+            dimensions = [name.strip() for name in sys.argv[i + 1].split(",") if name.strip()]
+            i += 2
+        elif sys.argv[i] == "--days-back" and i + 1 < len(sys.argv):
+            days_back = int(sys.argv[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    client = get_client()
+    revenue_helper = RevenueQueryHelper(client=client)
+    for dimension in dimensions:
+        profile = build_intraday_profile(revenue_helper, dimension, days_back=days_back)
+        save_intraday_profile(client, profile)
+        print(f"Saved intraday profile '{dimension}' ({len(profile.keys)} keys, days_back={days_back})")
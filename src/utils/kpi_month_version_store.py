@@ -0,0 +1,220 @@
+from decimal import Decimal
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from src.utils.latest_state import READ_PATH_FINAL, latest_table
+
+KPI_MONTH_TABLE = 'hskcdp.kpi_month'
+KPI_MONTH_COLUMNS = [
+    'version', 'year', 'month', 'kpi_initial', 'actual', 'gap',
+    'eom', 'kpi_adjustment', 'created_at', 'updated_at'
+]
+
+
+def get_version_name(month: int) -> str:
+    return f"Thang {month}"
+
+
+def get_next_version(month: int, year: int) -> Tuple[str, int]:
+    """
+    Version kế tiếp của version tháng `month`: Thang 12 -> Thang 1 của năm sau
+    Returns: (next_version, next_year)
+    """
+    if month == 12:
+        return get_version_name(1), year + 1
+    return get_version_name(month + 1), year
+
+
+class KpiMonthVersionStore:
+    """
+    Read-modify-write theo lô cho hskcdp.kpi_month:
+        load(): 1 query lấy dòng mới nhất (updated_at lớn nhất) của mọi (year, month, version)
+        get_* / version_exists / months_count: đọc in-memory
+        stage(): ghi nhận dòng mới (cập nhật luôn bản in-memory)
+        flush(): insert tất cả dòng đã stage trong 1 lần
+    """
+
+    def __init__(self, client, read_path: str = READ_PATH_FINAL):
+        self.client = client
+        self.read_path = read_path
+        # {(year, version): {month: row_dict}}
+        self.rows: Dict[Tuple[int, str], Dict[int, Dict]] = {}
+        self.loaded_years = set()
+        self.pending: List[List] = []
+        self.load_count = 0
+
+    def load(self, years: Sequence[int]) -> None:
+        """
+        Load lại (bỏ cache cũ) dòng mới nhất của các year trong `years`
+        """
+        years = sorted(set(int(year) for year in years))
+        if not years:
+            return
+
+        query = f"""
+            SELECT
+                version,
+                year,
+                month,
+                kpi_initial,
+                actual,
+                gap,
+                eom,
+                kpi_adjustment,
+                created_at,
+                updated_at
+            FROM (
+                SELECT
+                    version,
+                    year,
+                    month,
+                    kpi_initial,
+                    actual,
+                    gap,
+                    eom,
+                    kpi_adjustment,
+                    created_at,
+                    updated_at,
+                    row_number() OVER (
+                        PARTITION BY year, month, version
+                        ORDER BY updated_at DESC
+                    ) AS rn
+                FROM {latest_table(KPI_MONTH_TABLE, self.read_path)}
+                WHERE year IN ({', '.join(str(year) for year in years)})
+            )
+            WHERE rn = 1
+        """
+        result = self.client.query(query)
+        self.load_count += 1
+
+        for key in [key for key in self.rows if key[0] in years]:
+            del self.rows[key]
+        for row in result.result_rows:
+            values = dict(zip(KPI_MONTH_COLUMNS, row))
+            values['year'] = int(values['year'])
+            values['month'] = int(values['month'])
+            self.rows.setdefault((values['year'], values['version']), {})[values['month']] = values
+        self.loaded_years.update(years)
+
+    def ensure_loaded(self, years: Sequence[int]) -> None:
+        missing_years = [year for year in years if year not in self.loaded_years]
+        if missing_years:
+            self.load(missing_years)
+
+    def get_version(self, version: str, year: int) -> Dict[int, Dict]:
+        self.ensure_loaded([year])
+        return self.rows.get((year, version), {})
+
+    def version_exists(self, version: str, year: int) -> bool:
+        return len(self.get_version(version, year)) > 0
+
+    def months_count(self, version: str, year: int) -> int:
+        return len(self.get_version(version, year))
+
+    def get_row(self, version: str, year: int, month: int) -> Optional[Dict]:
+        return self.get_version(version, year).get(month)
+
+    def get_values(self, version: str, year: int, column: str) -> Dict[int, object]:
+        # {month: value} của 1 cột, bỏ qua giá trị NULL
+        return {
+            month: row[column]
+            for month, row in sorted(self.get_version(version, year).items())
+            if row[column] is not None
+        }
+
+    def get_kpi_initial(self, version: str, year: int, month: int) -> float:
+        row = self.get_row(version, year, month)
+        if row is not None and row['kpi_initial'] is not None:
+            return float(row['kpi_initial'])
+        raise ValueError(f"kpi_initial not found for version '{version}', month {month}, year {year}")
+
+    def get_sum_gap(self, version: str, year: int) -> Decimal:
+        gaps = self.get_values(version, year, 'gap')
+        if not gaps:
+            return Decimal('0')
+        return sum((Decimal(str(gap)) for gap in gaps.values()), Decimal('0'))
+
+    def stage(
+        self,
+        version: str,
+        year: int,
+        month: int,
+        kpi_initial,
+        kpi_adjustment=None,
+        actual=None,
+        gap=None,
+        eom=None,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Ghi nhận 1 dòng mới cho (version, year, month).
+        created_at mặc định giữ created_at của dòng hiện tại (không có thì = updated_at),
+        kpi_adjustment mặc định = kpi_initial.
+        """
+        updated_at = updated_at if updated_at is not None else datetime.now()
+        if created_at is None:
+            current = self.rows.get((year, version), {}).get(month)
+            created_at = current['created_at'] if current is not None else updated_at
+
+        values = {
+            'version': version,
+            'year': year,
+            'month': month,
+            'kpi_initial': kpi_initial,
+            'actual': actual,
+            'gap': gap,
+            'eom': eom,
+            'kpi_adjustment': kpi_adjustment if kpi_adjustment is not None else kpi_initial,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+        self.rows.setdefault((year, version), {})[month] = values
+        self.pending.append([values[column] for column in KPI_MONTH_COLUMNS])
+        return values
+
+    def stage_version_from(
+        self,
+        source_version: str,
+        source_year: int,
+        target_version: str,
+        target_year: int,
+        now: Optional[datetime] = None
+    ) -> Dict[int, object]:
+        """
+        Tạo version mới cho 12 tháng với kpi_initial = kpi_adjustment mới nhất của source version
+        Returns: {month: kpi_adjustment của source}
+        """
+        now = now if now is not None else datetime.now()
+        source_kpi_adjustments = self.get_values(source_version, source_year, 'kpi_adjustment')
+
+        missing_months = [m for m in range(1, 13) if m not in source_kpi_adjustments]
+        if missing_months:
+            raise ValueError(
+                f"Missing kpi_adjustment for version '{source_version}' (year {source_year}) "
+                f"in months: {missing_months}"
+            )
+
+        for month in range(1, 13):
+            self.stage(
+                target_version,
+                target_year,
+                month,
+                source_kpi_adjustments[month],
+                created_at=now,
+                updated_at=now
+            )
+        return source_kpi_adjustments
+
+    def discard(self) -> None:
+        # Bỏ các dòng đã stage và load lại từ DB ở lần đọc sau
+        self.pending = []
+        self.rows = {}
+        self.loaded_years = set()
+
+    def flush(self) -> int:
+        if not self.pending:
+            return 0
+        data = self.pending
+        self.client.insert(KPI_MONTH_TABLE, data, column_names=KPI_MONTH_COLUMNS)
+        self.pending = []
+        return len(data)
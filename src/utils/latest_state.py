@@ -0,0 +1,189 @@
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Read path cho các bảng KPI (ReplacingMergeTree, insert mỗi giờ):
+#   final:  đọc thẳng `<table> FINAL` (+ row_number() với kpi_month) như trước
+#   latest: đọc view `<table>_latest`, chỉ còn 1 dòng / key (argMax theo updated_at)
+READ_PATH_FINAL = 'final'
+READ_PATH_LATEST = 'latest'
+READ_PATHS = [READ_PATH_FINAL, READ_PATH_LATEST]
+
+LATEST_SUFFIX = '_latest'
+LATEST_STATE_SUFFIX = '_latest_state'
+LATEST_MV_SUFFIX = '_latest_mv'
+VERSION_COLUMN = 'updated_at'
+
+# Key logic (1 dòng / key) của từng bảng
+LATEST_STATE_KEYS: Dict[str, List[str]] = {
+    'hskcdp.kpi_month': ['version', 'year', 'month'],
+    'hskcdp.kpi_day': ['year', 'month', 'calendar_date'],
+    'hskcdp.kpi_channel': ['year', 'month', 'calendar_date', 'channel'],
+    'hskcdp.kpi_brand': ['year', 'month', 'calendar_date', 'channel', 'brand_name'],
+    'hskcdp.kpi_sku': ['calendar_date', 'channel', 'brand_name', 'sku'],
+    'hskcdp.kpi_forecast': ['calendar_date', 'channel', 'brand_name', 'sku'],
+}
+
+
+def get_read_path(read_path: Optional[str] = None) -> str:
+    read_path = read_path or os.getenv("KPI_READ_PATH", READ_PATH_FINAL)
+    if read_path not in READ_PATHS:
+        raise ValueError(f"Unknown read path: {read_path}. Available: {READ_PATHS}")
+    return read_path
+
+
+def get_table_name(table: str) -> str:
+    return table if '.' in table else f"hskcdp.{table}"
+
+
+def latest_table(table: str, read_path: str = READ_PATH_FINAL, alias: Optional[str] = None) -> str:
+    """
+    Tên bảng dùng trong FROM / JOIN theo read path:
+        final:  hskcdp.kpi_day [AS alias] FINAL
+        latest: hskcdp.kpi_day_latest [AS alias]
+    """
+    table = get_table_name(table)
+    alias_sql = f" AS {alias}" if alias else ""
+    if read_path == READ_PATH_LATEST and table in LATEST_STATE_KEYS:
+        return f"{table}{LATEST_SUFFIX}{alias_sql}"
+    return f"{table}{alias_sql} FINAL"
+
+
+def describe_columns(client, table: str) -> List[Tuple[str, str]]:
+    # [(name, type)] theo thứ tự cột của bảng gốc (bỏ cột MATERIALIZED / ALIAS)
+    result = client.query(f"DESCRIBE TABLE {get_table_name(table)}")
+    return [
+        (str(row[0]), str(row[1]))
+        for row in result.result_rows
+        if len(row) < 3 or row[2] not in ('MATERIALIZED', 'ALIAS')
+    ]
+
+
+def get_latest_state_ddl(table: str, columns: Sequence[Tuple[str, str]]) -> List[str]:
+    """
+    DDL cho latest-state của 1 bảng:
+        <table>_latest_state: AggregatingMergeTree, 1 dòng / key sau merge,
+            latest = argMaxState(tuple(các cột còn lại), updated_at)
+            (gói trong tuple để argMax không bỏ qua giá trị NULL của cột Nullable)
+        <table>_latest_mv: materialized view đẩy mỗi lần insert vào bảng gốc sang state
+        <table>_latest: view argMaxMerge, trả về đúng các cột của bảng gốc
+    """
+    table = get_table_name(table)
+    keys = LATEST_STATE_KEYS[table]
+    column_types = dict(columns)
+    missing_keys = [key for key in keys + [VERSION_COLUMN] if key not in column_types]
+    if missing_keys:
+        raise ValueError(f"Table {table} is missing columns: {missing_keys}")
+
+    value_columns = [(name, column_type) for name, column_type in columns if name not in keys]
+    value_names = [name for name, _ in value_columns]
+    tuple_type = ', '.join(column_type for _, column_type in value_columns)
+    key_list = ', '.join(keys)
+    key_definitions = ',\n  '.join(f"`{key}` {column_types[key]}" for key in keys)
+    value_tuple = ', '.join(f"`{name}`" for name in value_names)
+    value_select = ',\n  '.join(
+        f"tupleElement(latest_row, {i + 1}) AS `{name}`" for i, name in enumerate(value_names)
+    )
+    state_table = f"{table}{LATEST_STATE_SUFFIX}"
+
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {state_table} (
+  {key_definitions},
+  `latest` AggregateFunction(argMax, Tuple({tuple_type}), {column_types[VERSION_COLUMN]})
+) ENGINE = AggregatingMergeTree
+ORDER BY ({key_list})
+SETTINGS index_granularity = 8192""",
+        f"""CREATE MATERIALIZED VIEW IF NOT EXISTS {table}{LATEST_MV_SUFFIX}
+TO {state_table} AS
+SELECT
+  {key_list},
+  argMaxState(tuple({value_tuple}), `{VERSION_COLUMN}`) AS latest
+FROM {table}
+GROUP BY {key_list}""",
+        f"""CREATE VIEW IF NOT EXISTS {table}{LATEST_SUFFIX} AS
+SELECT
+  {key_list},
+  {value_select}
+FROM (
+  SELECT
+    {key_list},
+    argMaxMerge(latest) AS latest_row
+  FROM {state_table}
+  GROUP BY {key_list}
+)""",
+    ]
+
+
+def get_backfill_query(table: str, columns: Sequence[Tuple[str, str]]) -> str:
+    # Đổ lịch sử hiện có vào state; chạy sau khi tạo MV nên không mất dòng insert xen giữa
+    # (argMax merge lại nên dòng trùng không ảnh hưởng kết quả)
+    table = get_table_name(table)
+    keys = LATEST_STATE_KEYS[table]
+    key_list = ', '.join(keys)
+    value_tuple = ', '.join(f"`{name}`" for name, _ in columns if name not in keys)
+    return f"""INSERT INTO {table}{LATEST_STATE_SUFFIX}
+SELECT
+  {key_list},
+  argMaxState(tuple({value_tuple}), `{VERSION_COLUMN}`) AS latest
+FROM {table}
+GROUP BY {key_list}"""
+
+
+def migrate_latest_state(
+    client,
+    tables: Optional[Sequence[str]] = None,
+    backfill: bool = True,
+    dry_run: bool = False
+) -> List[str]:
+    """
+    Tạo state table + MV + view cho các bảng (mặc định: tất cả LATEST_STATE_KEYS),
+    backfill từ bảng gốc. Schema lấy từ DESCRIBE TABLE nên khớp bảng đang chạy.
+    Returns: danh sách statement đã chạy (dry_run: chỉ trả về, không chạy)
+    """
+    tables = [get_table_name(table) for table in (tables or LATEST_STATE_KEYS.keys())]
+    unknown_tables = [table for table in tables if table not in LATEST_STATE_KEYS]
+    if unknown_tables:
+        raise ValueError(f"Unknown latest-state tables: {unknown_tables}. Available: {list(LATEST_STATE_KEYS.keys())}")
+
+    statements = []
+    for table in tables:
+        columns = describe_columns(client, table)
+        statements.extend(get_latest_state_ddl(table, columns))
+        if backfill:
+            statements.append(get_backfill_query(table, columns))
+
+    if not dry_run:
+        for statement in statements:
+            client.command(statement)
+    return statements
+
+
+if __name__ == "__main__":
+    # python -m src.utils.latest_state [--tables kpi_day,kpi_sku] [--no-backfill] [--dry-run]
+    import sys
+    from src.utils.clickhouse_client import get_client
+
+    tables = None
+    backfill = True
+    dry_run = False
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--tables" and i + 1 < len(sys.argv):
+            tables = [name.strip() for name in sys.argv[i + 1].split(",") if name.strip()]
+            i += 2
+        elif sys.argv[i] == "--no-backfill":
+            backfill = False
+            i += 1
+        elif sys.argv[i] == "--dry-run":
+            dry_run = True
+            i += 1
+        else:
+            i += 1
+
+    statements = migrate_latest_state(get_client(), tables=tables, backfill=backfill, dry_run=dry_run)
+    for statement in statements:
+        print(f"{statement};\n")
+    if dry_run:
+        print(f"Dry run: {len(statements)} statements not executed")
+    else:
+        print(f"Executed {len(statements)} statements")
@@ -0,0 +1,116 @@
+import os
+import re
+import sys
+import logging
+import threading
+from typing import Dict, Optional
+
+# Level mặc định: KPI_LOG_LEVEL (default INFO); theo stage / module: KPI_LOG_LEVEL_<NAME>,
+# NAME là phần cuối của tên logger, vd KPI_LOG_LEVEL_KPI_DAY=DEBUG cho src.etl.kpi_day
+DEFAULT_LOG_LEVEL = 'INFO'
+ROOT_LOGGER_NAME = 'src'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Log trong vòng lặp nóng (từng giờ / ngày / dòng): chỉ chạy khi KPI_TRACE_LOOPS=1. Đọc 1 lần lúc import,
+# code dùng `if TRACE_LOOPS: logger.debug(...)` nên khi tắt chỉ tốn 1 lần đọc biến global, không format gì
+TRACE_LOOPS = os.getenv("KPI_TRACE_LOOPS", "0") == "1"
+
+# Giá trị của các env này không bao giờ được ghi ra log
+SECRET_ENV_NAMES = ['CLICKHOUSE_PASSWORD', 'BENCHMARK_CLICKHOUSE_PASSWORD']
+SECRET_PATTERN = re.compile(r"(?i)\b(password|passwd|pwd|secret|token|api_key)(\s*[:=]\s*)([^\s,;&'\"]+)")
+REDACTED = '***'
+
+_configured = False
+_lock = threading.Lock()
+
+
+class RedactFilter(logging.Filter):
+    """
+    Che credential trong message đã format: giá trị của SECRET_ENV_NAMES và `password=...` / `token: ...`.
+    Chỉ chạy cho record đã qua level check nên không làm mất lazy formatting.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = redact(record.getMessage())
+        record.msg = message
+        record.args = None
+        return True
+
+
+def redact(message: str) -> str:
+    for name in SECRET_ENV_NAMES:
+        value = os.getenv(name)
+        if value:
+            message = message.replace(value, REDACTED)
+    return SECRET_PATTERN.sub(lambda m: f"{m.group(1)}{m.group(2)}{REDACTED}", message)
+
+
+def parse_log_levels(value: str) -> Dict[str, str]:
+    """
+    "debug" -> {'*': 'DEBUG'}; "kpi_day=debug,kpi_sku=warning" -> {'kpi_day': 'DEBUG', 'kpi_sku': 'WARNING'}
+    """
+    levels = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, level = part.rpartition("=")
+        level = level.strip().upper()
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Unknown log level: {level}")
+        levels[name.strip() or '*'] = level
+    return levels
+
+
+def get_level_name(logger_name: str) -> str:
+    return logger_name.rsplit('.', 1)[-1]
+
+
+def configure_logging(levels: Optional[Dict[str, str]] = None) -> None:
+    """
+    Gắn handler stdout cho logger 'src' (nếu process chưa cấu hình logging, vd chạy python -m ...)
+    và set level. levels: {name: level}, '*' = mọi logger 'src.*'; ghi đè env, gọi lại được (vd từ --log-level).
+    """
+    global _configured
+    with _lock:
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        if not _configured:
+            if not logging.getLogger().handlers and not root.handlers:
+                handler = logging.StreamHandler(sys.stdout)
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                handler.addFilter(RedactFilter())
+                root.addHandler(handler)
+                root.propagate = False
+            root.setLevel(os.getenv("KPI_LOG_LEVEL", DEFAULT_LOG_LEVEL).upper())
+            _configured = True
+
+        if levels:
+            if '*' in levels:
+                root.setLevel(levels['*'])
+            for name, logger in logging.Logger.manager.loggerDict.items():
+                if isinstance(logger, logging.Logger) and name.startswith(f"{ROOT_LOGGER_NAME}."):
+                    level = levels.get(get_level_name(name))
+                    if level is not None:
+                        logger.setLevel(level)
+                    elif '*' in levels:
+                        logger.setLevel(logging.NOTSET)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger của module (truyền __name__), level riêng theo KPI_LOG_LEVEL_<NAME> nếu có.
+    Dùng format lazy: logger.info("Saved %s rows", n), không dùng f-string.
+    """
+    configure_logging()
+    if name == '__main__':
+        # python -m src.etl.kpi_day: dùng tên module thật để level / handler theo 'src.*' vẫn áp dụng
+        spec = getattr(sys.modules['__main__'], '__spec__', None)
+        name = spec.name if spec is not None else name
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, RedactFilter) for f in logger.filters):
+        # Filter trên logger (không chỉ handler) để cả khi log đi qua handler của Airflow vẫn được che
+        logger.addFilter(RedactFilter())
+    level = os.getenv(f"KPI_LOG_LEVEL_{get_level_name(name).upper()}")
+    if level:
+        logger.setLevel(level.upper())
+    return logger
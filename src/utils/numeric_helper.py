@@ -1,4 +1,4 @@
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
 import math
 
 
@@ -15,6 +15,13 @@ def safe_decimal(value, default='0'):
     """
     if value is None:
         return Decimal(default)
+    # Fast path: Decimal / int / float không cần đi qua string 2 lần
+    if isinstance(value, Decimal):
+        return value if value.is_finite() else Decimal(default)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return Decimal(value)
+    if isinstance(value, float):
+        return Decimal(str(value)) if math.isfinite(value) else Decimal(default)
     try:
         val_str = str(value).strip()
         if val_str.lower() in ('nan', 'none', '', 'inf', '-inf'):
@@ -45,6 +52,8 @@ def safe_float(value, default=0.0):
     """
     if value is None:
         return default
+    if isinstance(value, float):
+        return value if math.isfinite(value) else default
     try:
         val = float(value)
         if math.isnan(val) or math.isinf(val):
@@ -52,3 +61,23 @@ def safe_float(value, default=0.0):
         return val
     except (ValueError, TypeError, OverflowError):
         return default
+
+
+def clickhouse_decimal_divide(dividend: Decimal, divisor: Decimal, scale=None) -> Decimal:
+    """
+    Divide like ClickHouse does for Decimal columns: the quotient keeps the dividend's scale
+    and is truncated (not rounded), e.g. Decimal(38, 2) 1.00 / 3.00 -> 0.33.
+    
+    Args:
+        dividend: Decimal dividend
+        divisor: Decimal divisor (non-zero)
+        scale: Scale of the dividend column; None = exact division (Int / Float columns
+            are divided as Float64 in ClickHouse)
+    
+    Returns:
+        Decimal: Quotient truncated to `scale` decimals
+    """
+    quotient = dividend / divisor
+    if scale is None:
+        return quotient
+    return quotient.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_DOWN)
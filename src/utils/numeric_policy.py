@@ -0,0 +1,124 @@
+import os
+import math
+import numpy as np
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+# Kiểu số dùng trong tính toán của từng stage:
+#   decimal: Decimal, vòng lặp từng dòng như hiện tại (mặc định, kết quả không đổi)
+#   float:   float64, kpi_channel / kpi_brand tính trên mảng numpy (convert cột 1 lần), sai số ~1e-16 tương đối
+#   fixed:   như float nhưng số tiền ghi ra được làm tròn 1 lần về int VND (half-even),
+#            lệch so với decimal <= 0.5 VND (+ sai số float64); tỷ lệ giữ float64
+NUMERIC_DECIMAL = 'decimal'
+NUMERIC_FLOAT = 'float'
+NUMERIC_FIXED = 'fixed'
+NUMERIC_POLICIES = [NUMERIC_DECIMAL, NUMERIC_FLOAT, NUMERIC_FIXED]
+
+
+class DecimalPolicy:
+    """
+    amount(): số tiền, ratio(): tỷ lệ (%), convert 1 lần khi load vào vòng lặp
+    scale(amount, ratio) / divide(amount, ratio): phép tính giữa số tiền và tỷ lệ
+    output(): số tiền ghi ra (insert / stage sau)
+    None và NaN / Inf -> default
+    vectorized: stage dùng đường tính trên mảng (amounts() / outputs()) thay cho vòng lặp từng dòng
+    """
+    name = NUMERIC_DECIMAL
+    zero = Decimal('0')
+    vectorized = False
+
+    def amount(self, value, default=None):
+        if value is None:
+            return default
+        if isinstance(value, Decimal):
+            return value if value.is_finite() else default
+        if isinstance(value, float) and not math.isfinite(value):
+            return default
+        return Decimal(str(value))
+
+    def ratio(self, value, default=None):
+        return self.amount(value, default)
+
+    def scale(self, amount, ratio):
+        return amount * ratio
+
+    def divide(self, amount, ratio):
+        return amount / ratio
+
+    def output(self, value):
+        return value
+
+
+class FloatPolicy(DecimalPolicy):
+    name = NUMERIC_FLOAT
+    zero = 0.0
+    vectorized = True
+
+    def amount(self, value, default=None):
+        if value is None:
+            return default
+        value = float(value)
+        return value if math.isfinite(value) else default
+
+    def amounts(self, values: Sequence, default: float = np.nan) -> np.ndarray:
+        """
+        Cột giá trị (Decimal / float / None) -> float64; None và NaN / Inf -> default (NaN = không có giá trị)
+        """
+        array = np.array(values, dtype=np.float64)
+        array[~np.isfinite(array)] = default
+        return array
+
+    def outputs(self, values: np.ndarray) -> List[Optional[float]]:
+        # Cột số tiền ghi ra, NaN -> None
+        return [None if value != value else value for value in values.tolist()]
+
+
+class FixedPointPolicy(FloatPolicy):
+    name = NUMERIC_FIXED
+
+    def output(self, value):
+        # Làm tròn 1 lần ở output (half-even), không làm tròn giữa các phép tính để không cộng dồn sai số
+        if value is None:
+            return None
+        return round(value)
+
+    def outputs(self, values: np.ndarray) -> List[Optional[int]]:
+        return [None if value != value else int(value) for value in np.round(values).tolist()]
+
+
+POLICY_CLASSES = {
+    NUMERIC_DECIMAL: DecimalPolicy,
+    NUMERIC_FLOAT: FloatPolicy,
+    NUMERIC_FIXED: FixedPointPolicy,
+}
+
+
+def get_numeric_policy(stage: Optional[str] = None, name: Optional[str] = None) -> DecimalPolicy:
+    """
+    name, nếu không có: KPI_NUMERIC_POLICY_<STAGE> (vd KPI_NUMERIC_POLICY_KPI_BRAND=float),
+    rồi KPI_NUMERIC_POLICY, mặc định decimal
+    """
+    if name is None and stage is not None:
+        name = os.getenv(f"KPI_NUMERIC_POLICY_{stage.upper()}")
+    if name is None:
+        name = os.getenv("KPI_NUMERIC_POLICY", NUMERIC_DECIMAL)
+    if name not in POLICY_CLASSES:
+        raise ValueError(f"Unknown numeric policy: {name}. Available: {NUMERIC_POLICIES}")
+    return POLICY_CLASSES[name]()
+
+
+def parse_numeric_policies(value: str) -> Dict[str, str]:
+    """
+    "float" -> {'*': 'float'}; "kpi_channel=float,kpi_brand=fixed" -> {'kpi_channel': 'float', 'kpi_brand': 'fixed'}
+    """
+    policies = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        stage, _, name = part.rpartition("=")
+        name = name.strip()
+        if name not in POLICY_CLASSES:
+            raise ValueError(f"Unknown numeric policy: {name}. Available: {NUMERIC_POLICIES}")
+        policies[stage.strip() or '*'] = name
+    return policies
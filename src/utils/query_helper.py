@@ -1,16 +1,118 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from datetime import date, timedelta, datetime
-from typing import Dict, Set, List, Optional
+from typing import Callable, Dict, Iterator, Set, List, Optional
 from src.utils.clickhouse_client import get_client
+from src.utils.transaction_snapshot import TransactionSnapshotCache
+from src.utils.intraday_profile import (
+    IntradayProfile, build_intraday_profile, load_intraday_profile
+)
+from src.utils.latest_state import get_read_path, latest_table
+from src.utils.columnar import (
+    ColumnarResult, query_columns, iter_column_blocks, DATE_DTYPE, FLOAT_DTYPE, INT_DTYPE
+)
+from src.utils.dim_calendar import (
+    DimDateCalendar, load_calendar, get_padded_window, DOUBLE_DAY_WINDOW, DOUBLE_DAY_WINDOW_CHANNEL
+)
+from src.utils.history_cache import HistoryCache, get_history_cache
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 class RevenueQueryHelper:
-    def __init__(self):
-        self.client = get_client()
+    def __init__(
+        self,
+        client=None,
+        snapshot_cache: Optional[TransactionSnapshotCache] = None,
+        read_path: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        history_cache: Optional[HistoryCache] = None
+    ):
+        self.client = client if client is not None else get_client()
+        # Số query chạy song song tối đa trong gather(); 1 = chạy tuần tự
+        self.max_workers = max_workers if max_workers is not None else int(os.getenv("KPI_QUERY_MAX_WORKERS", "4"))
+        # Read path cho các bảng KPI: 'final' (<table> FINAL) hoặc 'latest' (view <table>_latest,
+        # 1 dòng / key, xem src/utils/latest_state.py); mặc định theo env KPI_READ_PATH
+        self.read_path = get_read_path(read_path)
+        # Nếu có snapshot_cache: các aggregation trên object_sql_transaction_details của 1 tháng
+        # được tính local từ snapshot (1 lần scan / tháng) thay vì query lại từng GROUP BY
+        self.snapshot_cache = snapshot_cache
+        # Profile intraday (prefix-sum % revenue theo giờ) build 1 lần / helper, key (dimension, days_back)
+        # KPI_INTRADAY_PROFILE_SOURCE=table: đọc profile đã refresh trong ngày từ hskcdp.kpi_intraday_profile
+        self.intraday_profiles: Dict[tuple, IntradayProfile] = {}
+        self.intraday_profile_source = os.getenv("KPI_INTRADAY_PROFILE_SOURCE", "query")
+        # Cache category_name theo sku (raw_ecom_products), chỉ query các sku chưa có trong cache
+        self.category_by_sku: Dict[str, str] = {}
+        # dim_date in-memory (load 1 lần / helper, xem get_calendar) và revenue theo ngày × channel
+        # của 3 tháng gần nhất (dùng chung cho kpi_day_metadata và kpi_channel_metadata), key = ngày chạy
+        self.calendar: Optional[DimDateCalendar] = None
+        self.daily_revenue_last_3_months: Dict[date, Dict[tuple, Decimal]] = {}
+        self.cache_lock = threading.Lock()
+        # Cache trên đĩa cho aggregation 3 tháng gần nhất (1 file / ngày đã chốt, xem src/utils/history_cache.py),
+        # mặc định theo env KPI_HISTORY_CACHE_DIR; None = query ClickHouse như cũ
+        self.history_cache = history_cache if history_cache is not None else get_history_cache(self.client)
+    
+    def gather(self, calls: Dict[str, Callable[[], object]]) -> Dict[str, object]:
+        """
+        Chạy song song các query độc lập (thread pool) và trả về {name: kết quả}.
+        calls: {name: hàm không tham số}, vd functools.partial(self.get_forecast_by_day, year, month).
+        Latency = query chậm nhất thay vì tổng các query; call lỗi thì raise lại lỗi đó
+        sau khi các call khác chạy xong.
+        """
+        if self.max_workers <= 1 or len(calls) <= 1:
+            return {name: call() for name, call in calls.items()}
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(calls)),
+            thread_name_prefix="kpi-query"
+        ) as executor:
+            futures = {name: executor.submit(call) for name, call in calls.items()}
+            return {name: future.result() for name, future in futures.items()}
+    
+    def get_calendar(self) -> DimDateCalendar:
+        with self.cache_lock:
+            if self.calendar is None:
+                self.calendar = load_calendar(self.client)
+            return self.calendar
+
+    def table(self, table: str, alias: Optional[str] = None) -> str:
+        return latest_table(table, self.read_path, alias=alias)
+    
+    def get_snapshot_for_date(self, target_date: date):
+        return self.snapshot_cache.get(target_date.year, target_date.month)
+    
+    def query_columns(
+        self,
+        query: str,
+        dtypes: Optional[Dict[str, str]] = None,
+        column_names: Optional[List[str]] = None
+    ) -> ColumnarResult:
+        # Columnar mode: trả về numpy array theo cột thay vì result_rows
+        return query_columns(self.client, query, dtypes=dtypes, column_names=column_names)
+    
+    def iter_column_blocks(
+        self,
+        query: str,
+        dtypes: Optional[Dict[str, str]] = None,
+        column_names: Optional[List[str]] = None,
+        block_rows: Optional[int] = None
+    ) -> Iterator[ColumnarResult]:
+        # Như query_columns nhưng yield từng block (tối đa block_rows dòng) thay vì nối cả kết quả
+        return iter_column_blocks(self.client, query, dtypes=dtypes, column_names=column_names, block_rows=block_rows)
 
     # KPI MONTH RELATED QUERIES
     
     def get_avg_rev_normal_day_30_days(self) -> Decimal:
+        # Ngày 'Normal day' lấy từ calendar in-memory thay vì JOIN dim_date
+        start_date, end_date = get_padded_window(30, end_offset=0)
+        normal_dates = self.get_calendar().get_dates_by_label('Normal day', 'date_label', start_date, end_date)
+        if not normal_dates:
+            raise ValueError("Cannot calculate avg rev normal day: no data found")
+        dates_str = ','.join([f"'{d}'" for d in normal_dates])
+        
         query = f"""
             SELECT
                 AVG(daily_revenue) AS avg_rev_normal_day
@@ -19,9 +121,7 @@ class RevenueQueryHelper:
                     toDate(t.created_at) as calendar_date,
                     SUM(t.total_amount) AS daily_revenue
                 FROM hskcdp.object_sql_transaction_details AS t FINAL
-                INNER JOIN hskcdp.dim_date d
-                    ON toDate(t.created_at) = d.calendar_date
-                WHERE d.date_label = 'Normal day'
+                WHERE toDate(t.created_at) IN ({dates_str})
                     AND toDate(t.created_at) >= today() - 30
                     AND t.status NOT IN ('Canceled', 'Cancel')
                 GROUP BY calendar_date
@@ -35,6 +135,11 @@ class RevenueQueryHelper:
             raise ValueError("Cannot calculate avg rev normal day: no data found")
     
     def get_daily_actual_sum(self, target_year: int, target_month: int) -> Decimal:
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            totals = snapshot.rollup([], before=date.today())
+            return totals.get((), Decimal('0'))
+        
         query = f"""
             SELECT 
                 SUM(COALESCE(total_amount, 0)) as sum_actual
@@ -57,30 +162,29 @@ class RevenueQueryHelper:
         target_month: int, 
         actual_dates: Set[date]
     ) -> Dict[str, int]:
+        calendar = self.get_calendar()
+        actual_dates = [d for d in actual_dates if not calendar.is_excluded(d, DOUBLE_DAY_WINDOW)]
         if not actual_dates:
             return {}
         
         dates_str = ','.join([f"'{d}'" for d in actual_dates])
         
         query = f"""
-            SELECT 
-                d.date_label,
-                COUNT(DISTINCT toDate(t.created_at)) as so_ngay
-            FROM hskcdp.object_sql_transaction_details AS t FINAL
-            INNER JOIN hskcdp.dim_date d
-                ON toDate(t.created_at) = d.calendar_date
-            WHERE toYear(t.created_at) = {target_year}
-              AND toMonth(t.created_at) = {target_month}
-              AND toDate(t.created_at) IN ({dates_str})
-              AND t.status NOT IN ('Canceled', 'Cancel')
-              AND (toMonth(t.created_at), toDayOfMonth(t.created_at)) NOT IN (
-                    (6,6), (9,9), (11,11), (12,12)
-            )
-            GROUP BY d.date_label
+            SELECT DISTINCT
+                toDate(created_at) as calendar_date
+            FROM hskcdp.object_sql_transaction_details FINAL
+            WHERE toYear(created_at) = {target_year}
+              AND toMonth(created_at) = {target_month}
+              AND toDate(created_at) IN ({dates_str})
+              AND status NOT IN ('Canceled', 'Cancel')
         """
         
         result = self.client.query(query)
-        actual_days_by_label = {row[0]: int(row[1]) for row in result.result_rows}
+        actual_days_by_label = {}
+        for row in result.result_rows:
+            date_label = calendar.get_label(row[0], 'date_label')
+            if date_label is not None:
+                actual_days_by_label[date_label] = actual_days_by_label.get(date_label, 0) + 1
         return actual_days_by_label
 
     def get_monthly_actual(self, target_year: int) -> Dict[int, Decimal]:
@@ -102,48 +206,63 @@ class RevenueQueryHelper:
     
     # KPI DAY METADATA RELATED QUERIES (HISTORICAL REVENUE QUERIES)
 
+    def get_daily_revenue_by_channel_last_3_months(self) -> Dict[tuple, Decimal]:
+        """
+        Revenue {(calendar_date, channel): amount} từ today() - 3 tháng, query 1 lần / ngày chạy và dùng chung
+        cho historical theo date_label (kpi_day_metadata) và theo priority_label × channel (kpi_channel_metadata).
+        Nhãn ngày và loại double day áp dụng sau, theo calendar in-memory.
+        """
+        today = date.today()
+        with self.cache_lock:
+            daily_revenue = self.daily_revenue_last_3_months.get(today)
+            if daily_revenue is not None:
+                return daily_revenue
+            
+            if self.history_cache is not None:
+                daily_revenue = self.history_cache.rollup(['calendar_date', 'channel'], today=today)
+                self.daily_revenue_last_3_months = {today: daily_revenue}
+                return daily_revenue
+
+            query = """
+                SELECT 
+                    toDate(created_at) as calendar_date,
+                    CASE 
+                        WHEN platform = 'ONLINE_HASAKI' THEN 'ONLINE_HASAKI'
+                        WHEN platform = 'OFFLINE_HASAKI' THEN 'OFFLINE_HASAKI'
+                        ELSE 'ECOM'
+                    END as channel,
+                    SUM(total_amount) as revenue
+                FROM hskcdp.object_sql_transaction_details FINAL
+                WHERE toDate(created_at) >= today() - INTERVAL 3 MONTH
+                  AND status NOT IN ('Canceled', 'Cancel')
+                GROUP BY calendar_date, channel
+            """
+            
+            result = self.client.query(query)
+            daily_revenue = {(row[0], row[1]): Decimal(row[2]) for row in result.result_rows}
+            self.daily_revenue_last_3_months = {today: daily_revenue}
+            return daily_revenue
+
     def get_historical_revenue_by_date_label(
         self,
         date_labels: List[str]
     ) -> Dict[str, Dict]:
-        date_labels_str = ','.join([f"'{dl}'" for dl in date_labels])
+        calendar = self.get_calendar()
+        revenue_by_date = {}
+        for (calendar_date, _), revenue in self.get_daily_revenue_by_channel_last_3_months().items():
+            revenue_by_date[calendar_date] = revenue_by_date.get(calendar_date, Decimal('0')) + revenue
         
-        query = f"""
-            SELECT 
-                a.date_label,
-                AVG(a.daily_revenue) as avg_total,
-                COUNT(DISTINCT a.calendar_date) as so_ngay_historical
-            FROM (
-                SELECT 
-                    d.calendar_date,
-                    d.date_label,
-                    SUM(t.total_amount) as daily_revenue
-                FROM hskcdp.object_sql_transaction_details AS t FINAL
-                INNER JOIN hskcdp.dim_date d
-                    ON toDate(t.created_at) = d.calendar_date
-                WHERE toDate(t.created_at) >= today() - INTERVAL 3 MONTH
-                  AND d.date_label IN ({date_labels_str})
-                  AND t.status NOT IN ('Cancel', 'Canceled')
-                  AND (toMonth(t.created_at), toDayOfMonth(t.created_at)) NOT IN (
-                        (6,6), (9,9), (11,11), (12,12)
-                    )
-                GROUP BY 
-                    d.calendar_date,
-                    d.date_label
-            ) as a
-            GROUP BY a.date_label
-        """
+        revenues_by_label = {}
+        for calendar_date, revenue in revenue_by_date.items():
+            date_label = calendar.get_label(calendar_date, 'date_label')
+            if date_label in date_labels and not calendar.is_excluded(calendar_date, DOUBLE_DAY_WINDOW):
+                revenues_by_label.setdefault(date_label, []).append(revenue)
         
-        result = self.client.query(query)
         historical_data = {}
-        
-        for row in result.result_rows:
-            date_label = row[0]
-            avg_total = Decimal(row[1])
-            so_ngay_historical = int(row[2])
+        for date_label, revenues in revenues_by_label.items():
             historical_data[date_label] = {
-                'avg_total': avg_total,
-                'so_ngay_historical': so_ngay_historical
+                'avg_total': sum(revenues, Decimal('0')) / len(revenues),
+                'so_ngay_historical': len(revenues)
             }
         
         return historical_data
@@ -155,6 +274,17 @@ class RevenueQueryHelper:
         if not calendar_dates:
             return {}
         
+        if self.snapshot_cache is not None:
+            actual_map = {}
+            dates_by_month = {}
+            for d in calendar_dates:
+                dates_by_month.setdefault((d.year, d.month), set()).add(d)
+            for (year, month), dates in dates_by_month.items():
+                snapshot = self.snapshot_cache.get(year, month)
+                for (calendar_date,), amount in snapshot.rollup(['calendar_date'], dates=dates).items():
+                    actual_map[calendar_date] = amount
+            return actual_map
+        
         dates_str = ','.join([f"'{d}'" for d in calendar_dates])
         
         query = f"""
@@ -176,6 +306,11 @@ class RevenueQueryHelper:
         target_year: int,
         target_month: int
     ) -> Dict[date, Decimal]:
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            totals = snapshot.rollup(['calendar_date'])
+            return {calendar_date: totals[(calendar_date,)] for (calendar_date,) in sorted(totals)}
+        
         query = f"""
             SELECT 
                 toDate(created_at) as calendar_date,
@@ -201,7 +336,7 @@ class RevenueQueryHelper:
             SELECT 
                 calendar_date,
                 SUM(COALESCE(forecast, 0)) as forecast_sum
-            FROM hskcdp.kpi_forecast FINAL
+            FROM {self.table('hskcdp.kpi_forecast')}
             WHERE year = {target_year}
               AND month = {target_month}
             GROUP BY calendar_date
@@ -256,6 +391,11 @@ class RevenueQueryHelper:
         return hourly_percentages
     
     def get_daily_actual_until_hour(self, target_date: date, until_hour: int) -> Decimal:
+        if self.snapshot_cache is not None:
+            snapshot = self.get_snapshot_for_date(target_date)
+            totals = snapshot.rollup([], dates={target_date}, until_hour=until_hour)
+            return totals.get((), Decimal('0'))
+        
         query = f"""
             SELECT 
                 SUM(COALESCE(total_amount, 0)) as actual_amount
@@ -272,6 +412,12 @@ class RevenueQueryHelper:
             return Decimal('0')
 
     def get_hourly_revenue_percentage_by_channel(self, days_back: int = 30) -> Dict[str, Dict[int, float]]:
+        # Ngày event_type 'Normal Day' lấy từ calendar in-memory thay vì JOIN dim_date
+        start_date, end_date = get_padded_window(days_back)
+        normal_dates = self.get_calendar().get_dates_by_label('Normal Day', 'event_type', start_date, end_date)
+        if not normal_dates:
+            return {}
+        dates_str = ','.join([f"'{d}'" for d in normal_dates])
 
         query = f"""
             SELECT 
@@ -279,9 +425,8 @@ class RevenueQueryHelper:
                 platform,
                 SUM(COALESCE(total_amount, 0)) as hour_revenue
             FROM hskcdp.object_sql_transaction_details AS td FINAL
-            JOIN hskcdp.dim_date AS dd FINAL
-                ON toDate(td.created_at) = dd.calendar_date AND dd.event_type = 'Normal Day'
-            WHERE toDate(created_at) BETWEEN today() - INTERVAL {days_back} DAY AND today() - INTERVAL 1 DAY
+            WHERE toDate(created_at) IN ({dates_str})
+              AND toDate(created_at) BETWEEN today() - INTERVAL {days_back} DAY AND today() - INTERVAL 1 DAY
               AND status NOT IN ('Canceled', 'Cancel')
             GROUP BY hour, platform 
             ORDER BY hour, platform
@@ -337,6 +482,83 @@ class RevenueQueryHelper:
         
         return channel_hourly_percentages
 
+    def get_hourly_revenue_percentage_by_dimension(
+        self,
+        dimension: str,
+        days_back: int = 30
+    ) -> Dict[str, Dict[int, float]]:
+        """
+        % revenue theo giờ cho từng brand_name hoặc date_label (dim_date), `days_back` ngày gần nhất
+        Returns: dict {key: {hour: pct}}
+        """
+        if dimension not in ('brand_name', 'date_label'):
+            raise ValueError(f"Unsupported dimension: {dimension}")
+        
+        # Chỉ các ngày có trong dim_date (như JOIN cũ); date_label map từ calendar in-memory theo calendar_date
+        calendar = self.get_calendar()
+        start_date, end_date = get_padded_window(days_back)
+        dates = calendar.get_dates_between(start_date, end_date)
+        if not dates:
+            return {}
+        dates_str = ','.join([f"'{d}'" for d in dates])
+        key_expression = 'td.brand_name' if dimension == 'brand_name' else 'toDate(td.created_at)'
+        
+        query = f"""
+            SELECT 
+                {key_expression} AS key,
+                toHour(td.created_at) AS hour,
+                SUM(COALESCE(td.total_amount, 0)) AS hour_revenue
+            FROM hskcdp.object_sql_transaction_details AS td FINAL
+            WHERE toDate(td.created_at) IN ({dates_str})
+              AND toDate(td.created_at) BETWEEN today() - INTERVAL {days_back} DAY AND today() - INTERVAL 1 DAY
+              AND td.status NOT IN ('Canceled', 'Cancel')
+            GROUP BY key, hour
+            ORDER BY key, hour
+        """
+        
+        result = self.client.query(query)
+        
+        hour_revenues = {}
+        totals = {}
+        for row in result.result_rows:
+            key = calendar.get_label(row[0], 'date_label') if dimension == 'date_label' else str(row[0])
+            revenue = Decimal(str(row[2]))
+            hour = int(row[1])
+            if key not in hour_revenues:
+                hour_revenues[key] = {}
+                totals[key] = Decimal('0')
+            hour_revenues[key][hour] = hour_revenues[key].get(hour, Decimal('0')) + revenue
+            totals[key] += revenue
+        
+        hourly_percentages = {}
+        for key, revenues in hour_revenues.items():
+            total_revenue = totals[key]
+            hourly_percentages[key] = {
+                hour: float(revenues[hour] / total_revenue) if total_revenue > 0 and hour in revenues else 0.0
+                for hour in range(24)
+            }
+        return hourly_percentages
+    
+    def get_intraday_profile(self, dimension: str = 'channel', days_back: int = 30) -> IntradayProfile:
+        """
+        Profile intraday dùng chung trong run: build 1 lần (hoặc đọc từ bảng đã refresh trong ngày)
+        dimension: all / channel / brand_name / date_label
+        """
+        cache_key = (dimension, days_back)
+        profile = self.intraday_profiles.get(cache_key)
+        if profile is not None:
+            return profile
+        
+        if self.intraday_profile_source == 'table':
+            profile = load_intraday_profile(self.client, dimension, days_back=days_back)
+            if profile is None:
+                logger.info("Intraday profile '%s' not refreshed today, computing from transactions", dimension)
+        if profile is None:
+            profile = build_intraday_profile(self, dimension, days_back=days_back)
+        
+        self.intraday_profiles[cache_key] = profile
+        return profile
+
     def get_daily_actual_until_hour_by_sku(
         self, 
         target_date: date, 
@@ -346,17 +568,17 @@ class RevenueQueryHelper:
         Returns: dict {channel: {sku: actual_amount}} - tổng actual của mỗi SKU từ 0h00 đến <until_hour theo từng channel
         Platform trong DB thực chất là channel (ONLINE_HASAKI, OFFLINE_HASAKI, ECOM)
         """
-        query = f"""
-            SELECT 
-                CAST(sku AS String) AS sku,
-                platform,
-                SUM(COALESCE(total_amount, 0)) as actual_amount
-            FROM hskcdp.object_sql_transaction_details FINAL
-            WHERE toDate(created_at) = '{target_date}'
-              AND toHour(created_at) < {until_hour}
-              AND status NOT IN ('Canceled', 'Cancel')
-            GROUP BY sku, platform
-        """
+        if self.snapshot_cache is not None:
+            snapshot = self.get_snapshot_for_date(target_date)
+            channel_sku_actuals = {}
+            totals = snapshot.rollup(['platform', 'sku'], dates={target_date}, until_hour=until_hour)
+            for (channel, sku), actual_amount in totals.items():
+                if channel not in channel_sku_actuals:
+                    channel_sku_actuals[channel] = {}
+                channel_sku_actuals[channel][sku] = actual_amount
+            return channel_sku_actuals
+        
+        query = self.get_daily_actual_until_hour_by_sku_query(target_date, until_hour)
         result = self.client.query(query)
         channel_sku_actuals = {}
         for row in result.result_rows:
@@ -371,11 +593,28 @@ class RevenueQueryHelper:
         
         return channel_sku_actuals        
     
+    def get_daily_actual_until_hour_by_sku_query(self, target_date: date, until_hour: int) -> str:
+        # Cột: sku, platform, actual_amount (dùng lại trong INSERT ... SELECT server-side của kpi_sku)
+        return f"""
+            SELECT 
+                CAST(sku AS String) AS sku,
+                platform,
+                SUM(COALESCE(total_amount, 0)) as actual_amount
+            FROM hskcdp.object_sql_transaction_details FINAL
+            WHERE toDate(created_at) = '{target_date}'
+              AND toHour(created_at) < {until_hour}
+              AND status NOT IN ('Canceled', 'Cancel')
+            GROUP BY sku, platform
+        """
+    
     def get_max_hour_from_transaction_details(
         self, 
         target_year: int, 
         target_month: int
     ) -> Optional[int]:
+        if self.snapshot_cache is not None:
+            return self.get_snapshot_for_date(date.today()).max_hour(date.today())
+        
         query = f"""
             SELECT
                 max(toHour(created_at)) AS max_hour
@@ -396,67 +635,26 @@ class RevenueQueryHelper:
         self,
         date_labels: List[str]
     ) -> Dict[str, Decimal]:
-        date_labels_str = ','.join([f"'{dl}'" for dl in date_labels])
-        
-        query = f"""
-            SELECT 
-                d.priority_label AS date_label, 
-                SUM(t.total_amount) as total_revenue 
-            FROM hskcdp.object_sql_transaction_details AS t FINAL
-            INNER JOIN hskcdp.dim_date d
-                ON toDate(t.created_at) = d.calendar_date
-            WHERE toDate(t.created_at) >= today() - INTERVAL 3 MONTH
-              AND d.priority_label IN ({date_labels_str})
-              AND t.status NOT IN ('Canceled', 'Cancel')
-              AND (toMonth(t.created_at), toDayOfMonth(t.created_at)) NOT IN (
-                    (6,6), (9,9), (11,11), (12,12)
-              )
-            GROUP BY d.priority_label
-        """
-        
-        result = self.client.query(query)
-        total_revenue_by_label = {row[0]: Decimal(row[1]) for row in result.result_rows}
+        total_revenue_by_label = {}
+        for date_label, channel_revenue in self.get_revenue_by_date_label_and_channel_from_platform_last_3_months(date_labels).items():
+            total_revenue_by_label[date_label] = sum(channel_revenue.values(), Decimal('0'))
         return total_revenue_by_label
     
     def get_revenue_by_date_label_and_channel_from_platform_last_3_months(
         self,
         date_labels: List[str]
     ) -> Dict[str, Dict[str, Decimal]]:
-        date_labels_str = ','.join([f"'{dl}'" for dl in date_labels])
-        
-        query = f"""
-            SELECT 
-                d.priority_label AS date_label,
-                CASE 
-                    WHEN t.platform = 'ONLINE_HASAKI' THEN 'ONLINE_HASAKI'
-                    WHEN t.platform = 'OFFLINE_HASAKI' THEN 'OFFLINE_HASAKI'
-                    ELSE 'ECOM'
-                END as channel,
-                SUM(t.total_amount) as revenue
-            FROM hskcdp.object_sql_transaction_details AS t FINAL
-            INNER JOIN hskcdp.dim_date d
-                ON toDate(t.created_at) = d.calendar_date
-            WHERE toDate(t.created_at) >= today() - INTERVAL 3 MONTH
-              AND d.priority_label IN ({date_labels_str})
-              AND t.status NOT IN ('Canceled', 'Cancel')
-              AND (toMonth(t.created_at), toDayOfMonth(t.created_at)) NOT IN (
-                    (6,6), (9,9), (11,11), (12,12)
-              )
-            GROUP BY d.priority_label, channel
-        """
-        
-        result = self.client.query(query)
-        
+        calendar = self.get_calendar()
         channel_revenue = {}
-        for row in result.result_rows:
-            date_label = row[0]
-            channel = row[1]
-            revenue = Decimal(row[2])
+        for (calendar_date, channel), revenue in self.get_daily_revenue_by_channel_last_3_months().items():
+            date_label = calendar.get_label(calendar_date, 'priority_label')
+            if date_label not in date_labels or calendar.is_excluded(calendar_date, DOUBLE_DAY_WINDOW):
+                continue
             
             if date_label not in channel_revenue:
                 channel_revenue[date_label] = {}
             
-            channel_revenue[date_label][channel] = revenue
+            channel_revenue[date_label][channel] = channel_revenue[date_label].get(channel, Decimal('0')) + revenue
         
         return channel_revenue
     
@@ -465,47 +663,68 @@ class RevenueQueryHelper:
         target_year: int,
         target_month: int
     ) -> List[Dict]:
-        query = f"""
-            SELECT 
-                calendar_date,
-                year,
-                month,
-                day,
-                priority_label AS date_label
-            FROM dim_date
-            WHERE year = {target_year}
-              AND month = {target_month}
-              AND NOT (
-                  (month = 6 AND day BETWEEN 5 AND 7) OR
-                  (month = 9 AND day BETWEEN 8 AND 10) OR
-                  (month = 11 AND day BETWEEN 10 AND 12) OR
-                  (month = 12 AND day BETWEEN 11 AND 13)
-              )
-            ORDER BY calendar_date
-        """
+        # Ngày của tháng trừ double day ±1, từ calendar in-memory
+        return [
+            {
+                'calendar_date': row['calendar_date'],
+                'year': row['year'],
+                'month': row['month'],
+                'day': row['day'],
+                'date_label': row['priority_label']
+            }
+            for row in self.get_calendar().get_month_rows(target_year, target_month, DOUBLE_DAY_WINDOW_CHANNEL)
+        ]
+    
+    # KPI CHANNEL RELATED QUERIES
+    
+    def get_kpi_day_with_channel_metadata(
+        self,
+        target_year: int,
+        target_month: int
+    ) -> List[Dict]:
+        query = self.get_kpi_day_with_channel_metadata_query(target_year, target_month)
         
         result = self.client.query(query)
         
-        dim_dates = []
+        kpi_day_channel_data = []
         for row in result.result_rows:
-            dim_dates.append({
+            kpi_day_channel_data.append({
                 'calendar_date': row[0],
                 'year': int(row[1]),
                 'month': int(row[2]),
                 'day': int(row[3]),
-                'date_label': str(row[4])
+                'date_label': str(row[4]),
+                'channel': str(row[5]),
+                'rev_pct_adjustment': Decimal(str(row[6])),
+                'kpi_day_initial': Decimal(str(row[7]))
             })
         
-        return dim_dates
-    
-    # KPI CHANNEL RELATED QUERIES
+        return kpi_day_channel_data
     
-    def get_kpi_day_with_channel_metadata(
+    def get_kpi_day_with_channel_metadata_columns(
         self,
         target_year: int,
         target_month: int
-    ) -> List[Dict]:
-        query = f"""
+    ) -> ColumnarResult:
+        """
+        Giống get_kpi_day_with_channel_metadata nhưng trả về dạng cột (numeric policy float / fixed):
+            calendar_date (datetime64[D]), year, month, day (int64), date_label, channel,
+            rev_pct_adjustment, kpi_day_initial (float64)
+        """
+        query = self.get_kpi_day_with_channel_metadata_query(target_year, target_month)
+        return self.query_columns(query, dtypes={
+            'calendar_date': DATE_DTYPE,
+            'year': INT_DTYPE,
+            'month': INT_DTYPE,
+            'day': INT_DTYPE,
+            'rev_pct_adjustment': FLOAT_DTYPE,
+            'kpi_day_initial': FLOAT_DTYPE,
+        })
+    
+    def get_kpi_day_with_channel_metadata_query(self, target_year: int, target_month: int) -> str:
+        # kpi_day × kpi_channel_metadata, cột: calendar_date, year, month, day, date_label,
+        # channel, rev_pct_adjustment, kpi_day_initial
+        return f"""
             SELECT 
                 kd.calendar_date,
                 kd.year,
@@ -515,7 +734,7 @@ class RevenueQueryHelper:
                 md.channel,
                 md.rev_pct_adjustment,
                 kd.kpi_day_initial
-            FROM (SELECT * FROM hskcdp.kpi_day FINAL) AS kd
+            FROM (SELECT * FROM {self.table('hskcdp.kpi_day')}) AS kd
             INNER JOIN (SELECT * FROM hskcdp.kpi_channel_metadata FINAL) AS md
                 ON kd.calendar_date = md.calendar_date
                 AND kd.year = md.year
@@ -532,30 +751,57 @@ class RevenueQueryHelper:
               )
             ORDER BY kd.calendar_date, md.channel
         """
+    
+    def get_actual_by_channel_and_date(
+        self,
+        target_year: int,
+        target_month: int
+    ) -> Dict[date, Dict[str, Decimal]]:
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            actual_by_date = {}
+            for (calendar_date, channel), actual_amount in snapshot.rollup(['calendar_date', 'channel']).items():
+                if calendar_date not in actual_by_date:
+                    actual_by_date[calendar_date] = {}
+                actual_by_date[calendar_date][channel] = actual_amount
+            return actual_by_date
+        
+        query = self.get_actual_by_channel_and_date_query(target_year, target_month)
         
         result = self.client.query(query)
         
-        kpi_day_channel_data = []
+        actual_by_date = {}
         for row in result.result_rows:
-            kpi_day_channel_data.append({
-                'calendar_date': row[0],
-                'year': int(row[1]),
-                'month': int(row[2]),
-                'day': int(row[3]),
-                'date_label': str(row[4]),
-                'channel': str(row[5]),
-                'rev_pct_adjustment': Decimal(str(row[6])),
-                'kpi_day_initial': Decimal(str(row[7]))
-            })
+            calendar_date = row[0]
+            channel = row[1]
+            actual_amount = Decimal(row[2])
+            
+            if calendar_date not in actual_by_date:
+                actual_by_date[calendar_date] = {}
+            
+            actual_by_date[calendar_date][channel] = actual_amount
         
-        return kpi_day_channel_data
+        return actual_by_date
     
-    def get_actual_by_channel_and_date(
+    def get_actual_by_channel_and_date_columns(
         self,
         target_year: int,
         target_month: int
-    ) -> Dict[date, Dict[str, Decimal]]:
-        query = f"""
+    ) -> ColumnarResult:
+        """
+        Giống get_actual_by_channel_and_date nhưng trả về dạng cột:
+            calendar_date (datetime64[D]), channel, actual_amount (float64)
+        """
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            return snapshot.rollup_columns(['calendar_date', 'channel'], 'actual_amount')
+        
+        query = self.get_actual_by_channel_and_date_query(target_year, target_month)
+        return self.query_columns(query, dtypes={'calendar_date': DATE_DTYPE, 'actual_amount': FLOAT_DTYPE})
+    
+    def get_actual_by_channel_and_date_query(self, target_year: int, target_month: int) -> str:
+        # Cột: calendar_date, channel, actual_amount
+        return f"""
             SELECT 
                 toDate(created_at) as calendar_date,
                 CASE 
@@ -570,21 +816,6 @@ class RevenueQueryHelper:
               AND status NOT IN ('Canceled', 'Cancel')
             GROUP BY calendar_date, channel
         """
-        
-        result = self.client.query(query)
-        
-        actual_by_date = {}
-        for row in result.result_rows:
-            calendar_date = row[0]
-            channel = row[1]
-            actual_amount = Decimal(row[2])
-            
-            if calendar_date not in actual_by_date:
-                actual_by_date[calendar_date] = {}
-            
-            actual_by_date[calendar_date][channel] = actual_amount
-        
-        return actual_by_date
     
     def get_kpi_day_adjustment_by_date(
         self,
@@ -595,7 +826,7 @@ class RevenueQueryHelper:
             SELECT 
                 calendar_date,
                 kpi_day_adjustment
-            FROM hskcdp.kpi_day FINAL
+            FROM {self.table('hskcdp.kpi_day')}
             WHERE year = {target_year}
               AND month = {target_month}
             ORDER BY calendar_date
@@ -622,7 +853,7 @@ class RevenueQueryHelper:
             SELECT
                 channel, 
                 SUM(COALESCE(forecast, 0)) AS forecast_sum 
-            FROM hskcdp.kpi_forecast FINAL 
+            FROM {self.table('hskcdp.kpi_forecast')} 
             WHERE calendar_date = today()
             GROUP BY channel
         """
@@ -641,7 +872,7 @@ class RevenueQueryHelper:
             SELECT
                 calendar_date,
                 eod
-            FROM hskcdp.kpi_day FINAL
+            FROM {self.table('hskcdp.kpi_day')}
             WHERE year = {target_year}
             AND month = {target_month}
             AND calendar_date > today()
@@ -662,6 +893,14 @@ class RevenueQueryHelper:
         Lấy revenue theo brand từ object_sql_transaction_details (3 tháng gần nhất)
         Returns: dict {brand_name: revenue}
         """
+        if self.history_cache is not None:
+            revenue_by_brand = {
+                brand_name: float(revenue)
+                for (brand_name,), revenue in self.history_cache.rollup(['brand_name']).items()
+                if revenue > 0
+            }
+            return dict(sorted(revenue_by_brand.items()))
+
         query = f"""
             SELECT 
                 brand_name,
@@ -684,6 +923,14 @@ class RevenueQueryHelper:
         
         return revenue_by_brand
     
+    def get_revenue_by_brand_and_sku_last_3_months(self) -> Dict[tuple, Decimal]:
+        """
+        Revenue {(brand_name, sku): amount} 3 tháng gần nhất từ history_cache (kpi_sku_metadata khi bật cache)
+        """
+        if self.history_cache is None:
+            raise ValueError("get_revenue_by_brand_and_sku_last_3_months requires KPI_HISTORY_CACHE_DIR")
+        return self.history_cache.rollup(['brand_name', 'sku'])
+    
     def get_brands_with_revenue_in_month(
         self,
         target_year: int,
@@ -699,6 +946,10 @@ class RevenueQueryHelper:
         Returns:
             Set các brand_name có revenue > 0 trong tháng đó
         """
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            return {brand_name for (brand_name,), revenue in snapshot.rollup(['brand_name']).items() if revenue > 0}
+        
         query = f"""
             SELECT DISTINCT brand_name
             FROM hskcdp.object_sql_transaction_details FINAL
@@ -727,7 +978,30 @@ class RevenueQueryHelper:
         Returns: list of dicts với keys: calendar_date, year, month, day, date_label, 
                  channel, brand_name, per_of_rev_by_brand_adj, kpi_channel_initial
         """
-        query = f"""
+        query = self.get_kpi_brand_with_brand_metadata_query(target_year, target_month)
+        
+        result = self.client.query(query)
+        
+        kpi_brand_data = []
+        for row in result.result_rows:
+            kpi_brand_data.append({
+                'calendar_date': row[0],
+                'year': int(row[1]),
+                'month': int(row[2]),
+                'day': int(row[3]),
+                'date_label': str(row[4]),
+                'channel': str(row[5]),
+                'brand_name': str(row[6]),
+                'per_of_rev_by_brand_adj': Decimal(str(row[7])),
+                'kpi_channel_initial': Decimal(str(row[8]))
+            })
+        
+        return kpi_brand_data
+    
+    def get_kpi_brand_with_brand_metadata_query(self, target_year: int, target_month: int) -> str:
+        # kpi_channel × kpi_brand_metadata, cột: calendar_date, year, month, day, date_label,
+        # channel, brand_name, per_of_rev_by_brand_adj, kpi_channel_initial
+        return f"""
             WITH rev AS (
                 SELECT
                     CASE
@@ -757,16 +1031,16 @@ class RevenueQueryHelper:
                 CROSS JOIN totals t
             )
             SELECT
-                c.calendar_date,
-                c.year,
-                c.month,
-                c.day,
-                c.date_label,
-                c.channel,
-                b.brand_name,
-                b.per_of_rev_by_brand_adj,
-                c.kpi_channel_initial
-            FROM (SELECT * FROM hskcdp.kpi_channel FINAL) AS c 
+                c.calendar_date AS calendar_date,
+                c.year AS year,
+                c.month AS month,
+                c.day AS day,
+                c.date_label AS date_label,
+                c.channel AS channel,
+                b.brand_name AS brand_name,
+                b.per_of_rev_by_brand_adj AS per_of_rev_by_brand_adj,
+                c.kpi_channel_initial AS kpi_channel_initial
+            FROM (SELECT * FROM {self.table('hskcdp.kpi_channel')}) AS c 
             CROSS JOIN (
                 SELECT 
                     brand_name,
@@ -785,24 +1059,6 @@ class RevenueQueryHelper:
               )
             ORDER BY c.calendar_date, c.channel, b.brand_name
         """
-        
-        result = self.client.query(query)
-        
-        kpi_brand_data = []
-        for row in result.result_rows:
-            kpi_brand_data.append({
-                'calendar_date': row[0],
-                'year': int(row[1]),
-                'month': int(row[2]),
-                'day': int(row[3]),
-                'date_label': str(row[4]),
-                'channel': str(row[5]),
-                'brand_name': str(row[6]),
-                'per_of_rev_by_brand_adj': Decimal(str(row[7])),
-                'kpi_channel_initial': Decimal(str(row[8]))
-            })
-        
-        return kpi_brand_data
     
     def get_actual_by_brand_channel_and_date(
         self,
@@ -814,6 +1070,18 @@ class RevenueQueryHelper:
         Platform được map thành channel: ONLINE_HASAKI, OFFLINE_HASAKI, ECOM
         Returns: dict {calendar_date: {channel: {brand_name: actual_amount}}}
         """
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            actual_by_date = {}
+            totals = snapshot.rollup(['calendar_date', 'channel', 'brand_name'])
+            for (calendar_date, channel, brand_name), actual_amount in totals.items():
+                if calendar_date not in actual_by_date:
+                    actual_by_date[calendar_date] = {}
+                if channel not in actual_by_date[calendar_date]:
+                    actual_by_date[calendar_date][channel] = {}
+                actual_by_date[calendar_date][channel][brand_name] = float(actual_amount)
+            return actual_by_date
+        
         query = f"""
             SELECT 
                 toDate(created_at) as calendar_date,
@@ -850,6 +1118,44 @@ class RevenueQueryHelper:
         
         return actual_by_date
     
+    def get_actual_by_brand_channel_and_date_columns(
+        self,
+        target_year: int,
+        target_month: int
+    ) -> ColumnarResult:
+        """
+        Giống get_actual_by_brand_channel_and_date nhưng trả về dạng cột:
+            calendar_date (datetime64[D]), channel, brand_name, actual_amount (float64)
+        """
+        keys = ['calendar_date', 'channel', 'brand_name']
+        dtypes = {'calendar_date': DATE_DTYPE, 'actual_amount': FLOAT_DTYPE}
+        
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            return snapshot.rollup_columns(keys, 'actual_amount')
+        
+        query = self.get_actual_by_brand_channel_and_date_columns_query(target_year, target_month)
+        return self.query_columns(query, dtypes=dtypes)
+    
+    def get_actual_by_brand_channel_and_date_columns_query(self, target_year: int, target_month: int) -> str:
+        # Cột: calendar_date, channel, brand_name, actual_amount (Float64)
+        return f"""
+            SELECT 
+                toDate(created_at) as calendar_date,
+                CASE 
+                    WHEN platform = 'ONLINE_HASAKI' THEN 'ONLINE_HASAKI'
+                    WHEN platform = 'OFFLINE_HASAKI' THEN 'OFFLINE_HASAKI'
+                    ELSE 'ECOM'
+                END as channel,
+                brand_name,
+                toFloat64(SUM(COALESCE(total_amount, 0))) as actual_amount
+            FROM hskcdp.object_sql_transaction_details FINAL
+            WHERE toYear(created_at) = {target_year}
+              AND toMonth(created_at) = {target_month}
+              AND status NOT IN ('Canceled', 'Cancel')
+            GROUP BY calendar_date, channel, brand_name
+        """
+    
     def get_kpi_day_channel_adjustment_by_date_and_channel(
         self,
         target_year: int,
@@ -859,17 +1165,7 @@ class RevenueQueryHelper:
         Lấy kpi_channel_adjustment từ kpi_channel theo date và channel
         Returns: dict {calendar_date: {channel: kpi_channel_adjustment}}
         """
-        query = f"""
-            SELECT 
-                calendar_date,
-                channel,
-                kpi_channel_adjustment
-            FROM hskcdp.kpi_channel FINAL
-            WHERE year = {target_year}
-              AND month = {target_month}
-            ORDER BY calendar_date, channel
-        """
-        
+        query = self.get_kpi_day_channel_adjustment_by_date_and_channel_query(target_year, target_month)
         result = self.client.query(query)
         
         kpi_day_channel_adjustment_by_date = {}
@@ -888,6 +1184,19 @@ class RevenueQueryHelper:
         
         return kpi_day_channel_adjustment_by_date
     
+    def get_kpi_day_channel_adjustment_by_date_and_channel_query(self, target_year: int, target_month: int) -> str:
+        # Cột: calendar_date, channel, kpi_channel_adjustment
+        return f"""
+            SELECT 
+                calendar_date,
+                channel,
+                kpi_channel_adjustment
+            FROM {self.table('hskcdp.kpi_channel')}
+            WHERE year = {target_year}
+              AND month = {target_month}
+            ORDER BY calendar_date, channel
+        """
+    
     def get_all_date_channel_combinations(
         self,
         target_year: int,
@@ -911,7 +1220,7 @@ class RevenueQueryHelper:
                 day,
                 date_label,
                 channel
-            FROM hskcdp.kpi_channel FINAL
+            FROM {self.table('hskcdp.kpi_channel')}
             WHERE year = {target_year}
               AND month = {target_month}
               AND NOT (
@@ -940,17 +1249,7 @@ class RevenueQueryHelper:
     def get_forecast_by_brand_for_today(
         self
     ) -> Dict[str, Dict[str, Decimal]]:
-        today = date.today()
-        
-        query = f"""
-            SELECT 
-                channel, 
-                brand_name,
-                SUM(COALESCE(forecast, 0)) AS forecast_sum
-            FROM hskcdp.kpi_forecast FINAL
-            WHERE calendar_date = today()
-            GROUP BY channel, brand_name
-        """
+        query = self.get_forecast_by_brand_for_today_query()
         
         result = self.client.query(query)
         
@@ -966,18 +1265,41 @@ class RevenueQueryHelper:
 
         return forecast_by_channel_brand
     
-    def get_forecast_top_down_from_channel(self, target_year:int, target_month: int) -> Dict[date, Dict[str, Decimal]]:
-        query = f"""
+    def get_forecast_by_brand_for_today_query(self, today: Optional[date] = None) -> str:
+        # Cột: channel, brand_name, forecast_sum; today=None -> today() của server
+        today_sql = f"'{today}'" if today is not None else "today()"
+        return f"""
+            SELECT 
+                channel, 
+                brand_name,
+                SUM(COALESCE(forecast, 0)) AS forecast_sum
+            FROM {self.table('hskcdp.kpi_forecast')}
+            WHERE calendar_date = {today_sql}
+            GROUP BY channel, brand_name
+        """
+    
+    def get_forecast_top_down_from_channel_query(
+        self,
+        target_year: int,
+        target_month: int,
+        today: Optional[date] = None
+    ) -> str:
+        # Cột: calendar_date, channel, sum_forecast; today=None -> today() của server
+        today_sql = f"'{today}'" if today is not None else "today()"
+        return f"""
             SELECT
                 calendar_date, 
                 channel, 
                 SUM(forecast) as sum_forecast
-            FROM hskcdp.kpi_channel FINAL
+            FROM {self.table('hskcdp.kpi_channel')}
             WHERE year = {target_year}
             AND month = {target_month}
-            AND calendar_date > today()
+            AND calendar_date > {today_sql}
             GROUP BY calendar_date, channel 
         """
+    
+    def get_forecast_top_down_from_channel(self, target_year:int, target_month: int) -> Dict[date, Dict[str, Decimal]]:
+        query = self.get_forecast_top_down_from_channel_query(target_year, target_month)
 
         result = self.client.query(query)
 
@@ -1028,6 +1350,10 @@ class RevenueQueryHelper:
         Returns:
             Set các tuple (brand_name, sku) có revenue > 0 trong tháng đó
         """
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            return {key for key, revenue in snapshot.rollup(['brand_name', 'sku']).items() if revenue > 0}
+        
         query = f"""
             SELECT DISTINCT brand_name, CAST(sku AS String) AS sku
             FROM hskcdp.object_sql_transaction_details FINAL
@@ -1055,6 +1381,20 @@ class RevenueQueryHelper:
         Platform được map thành channel: ONLINE_HASAKI, OFFLINE_HASAKI, ECOM
         Returns: dict {calendar_date: {channel: {brand_name: {sku: actual_amount}}}}
         """
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            actual_by_date = {}
+            totals = snapshot.rollup(['calendar_date', 'channel', 'brand_name', 'sku'])
+            for (calendar_date, channel, brand_name, sku), actual_amount in totals.items():
+                if calendar_date not in actual_by_date:
+                    actual_by_date[calendar_date] = {}
+                if channel not in actual_by_date[calendar_date]:
+                    actual_by_date[calendar_date][channel] = {}
+                if brand_name not in actual_by_date[calendar_date][channel]:
+                    actual_by_date[calendar_date][channel][brand_name] = {}
+                actual_by_date[calendar_date][channel][brand_name][sku] = float(actual_amount)
+            return actual_by_date
+        
         query = f"""
             SELECT 
                 toDate(created_at) as calendar_date,
@@ -1093,6 +1433,45 @@ class RevenueQueryHelper:
         
         return actual_by_date
     
+    def get_actual_by_sku_brand_channel_and_date_columns(
+        self,
+        target_year: int,
+        target_month: int
+    ) -> ColumnarResult:
+        """
+        Giống get_actual_by_sku_brand_channel_and_date nhưng trả về dạng cột:
+            calendar_date (datetime64[D]), channel, brand_name, sku, actual_amount (float64)
+        """
+        keys = ['calendar_date', 'channel', 'brand_name', 'sku']
+        dtypes = {'calendar_date': DATE_DTYPE, 'actual_amount': FLOAT_DTYPE}
+        
+        if self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(target_year, target_month)
+            return snapshot.rollup_columns(keys, 'actual_amount')
+        
+        query = self.get_actual_by_sku_brand_channel_and_date_columns_query(target_year, target_month)
+        return self.query_columns(query, dtypes=dtypes)
+    
+    def get_actual_by_sku_brand_channel_and_date_columns_query(self, target_year: int, target_month: int) -> str:
+        # Cột: calendar_date, channel, brand_name, sku, actual_amount (Float64)
+        return f"""
+            SELECT 
+                toDate(created_at) as calendar_date,
+                CASE 
+                    WHEN platform = 'ONLINE_HASAKI' THEN 'ONLINE_HASAKI'
+                    WHEN platform = 'OFFLINE_HASAKI' THEN 'OFFLINE_HASAKI'
+                    ELSE 'ECOM'
+                END as channel,
+                brand_name,
+                CAST(sku AS String) AS sku,
+                toFloat64(SUM(COALESCE(total_amount, 0))) as actual_amount
+            FROM hskcdp.object_sql_transaction_details FINAL
+            WHERE toYear(created_at) = {target_year}
+              AND toMonth(created_at) = {target_month}
+              AND status NOT IN ('Canceled', 'Cancel')
+            GROUP BY calendar_date, channel, brand_name, sku
+        """
+    
     def get_forecast_by_month(
         self,
         target_year: int,
@@ -1104,7 +1483,7 @@ class RevenueQueryHelper:
                     COALESCE(f.forecast, 0) +
                     IF(d.calendar_date > today(), COALESCE(d.eod, 0), 0)
                 ) AS eom_forecast
-            FROM hskcdp.kpi_forecast f FINAL
+            FROM {self.table('hskcdp.kpi_forecast', alias='f')}
             LEFT JOIN hskcdp.kpi_day d
                 ON f.calendar_date = d.calendar_date
             WHERE f.year = {target_year}
@@ -1146,19 +1525,29 @@ class RevenueQueryHelper:
         return new_skus
     
 
-    def get_forecast_top_down_from_brand(self, target_year: int, target_month: int) -> Dict[date, Dict[str, Dict[str, Decimal]]]:
-        query = f"""
+    def get_forecast_top_down_from_brand_query(
+        self,
+        target_year: int,
+        target_month: int,
+        today: Optional[date] = None
+    ) -> str:
+        # Cột: calendar_date, channel, brand_name, sum_forecast; today=None -> today() của server
+        today_sql = f"'{today}'" if today is not None else "today()"
+        return f"""
             SELECT
                 calendar_date, 
                 channel, 
                 brand_name, 
                 SUM(forecast) AS sum_forecast
-            FROM hskcdp.kpi_brand FINAL
+            FROM {self.table('hskcdp.kpi_brand')}
             WHERE year = {target_year}
             AND month = {target_month}
-            AND calendar_date > today()
+            AND calendar_date > {today_sql}
             GROUP BY calendar_date, channel, brand_name
         """
+
+    def get_forecast_top_down_from_brand(self, target_year: int, target_month: int) -> Dict[date, Dict[str, Dict[str, Decimal]]]:
+        query = self.get_forecast_top_down_from_brand_query(target_year, target_month)
     
         result = self.client.query(query)
 
@@ -1170,4 +1559,74 @@ class RevenueQueryHelper:
                 forecast_top_down_sku[calendar_date][channel] = {}
             forecast_top_down_sku[calendar_date][channel][brand_name] = Decimal(sum_forecast)
     
-        return forecast_top_down_sku
\ No newline at end of file
+        return forecast_top_down_sku
+    
+    def get_brand_date_channel_grid(
+        self,
+        target_year: int,
+        target_month: int,
+        brand_names: Set[str]
+    ) -> Dict[str, List[tuple]]:
+        """
+        Lấy tất cả (calendar_date, date_label, channel) từ kpi_brand cho nhiều brand trong 1 query
+        Returns: dict {brand_name: [(calendar_date, date_label, channel), ...]} (sort theo date, channel)
+        """
+        if not brand_names:
+            return {}
+        
+        brands_str = ','.join(["'" + brand_name.replace("'", "''") + "'" for brand_name in sorted(brand_names)])
+        
+        query = f"""
+            SELECT DISTINCT brand_name, calendar_date, date_label, channel
+            FROM {self.table('hskcdp.kpi_brand')}
+            WHERE year = {target_year}
+              AND month = {target_month}
+              AND brand_name IN ({brands_str})
+            ORDER BY brand_name, calendar_date, channel
+        """
+        
+        result = self.client.query(query)
+        
+        grid_by_brand = {}
+        for row in result.result_rows:
+            brand_name = str(row[0])
+            if brand_name not in grid_by_brand:
+                grid_by_brand[brand_name] = []
+            grid_by_brand[brand_name].append((row[1], str(row[2]), str(row[3])))
+        
+        return grid_by_brand
+    
+    def get_category_by_skus(self, skus: Set[str]) -> Dict[str, str]:
+        """
+        Lấy category_name từ raw_ecom_products cho các sku (đã làm sạch: None / 'none' -> '')
+        Có cache trong helper: sku đã lấy rồi không query lại
+        """
+        missing_skus = {sku for sku in skus if sku not in self.category_by_sku}
+        
+        if missing_skus:
+            skus_str = ','.join(["'" + sku.replace("'", "''") + "'" for sku in sorted(missing_skus)])
+            query = f"""
+                SELECT CAST(sku AS String) AS sku, category_name
+                FROM hskcdp.raw_ecom_products FINAL
+                WHERE CAST(sku AS String) IN ({skus_str})
+            """
+            result = self.client.query(query)
+            
+            for row in result.result_rows:
+                raw_category = str(row[1]) if row[1] else None
+                if raw_category is None:
+                    category_name = ''
+                else:
+                    cleaned = str(raw_category).strip()
+                    if cleaned.lower() == 'none':
+                        category_name = ''
+                    else:
+                        category_name = cleaned
+                self.category_by_sku[str(row[0])] = category_name
+            
+            # sku không có trong raw_ecom_products -> ''
+            for sku in missing_skus:
+                if sku not in self.category_by_sku:
+                    self.category_by_sku[sku] = ''
+        
+        return {sku: self.category_by_sku[sku] for sku in skus}
\ No newline at end of file
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.utils.logger import get_logger
+
+# Frame bỏ qua khi tìm call-site: wrapper chung (columnar, bulk_writer, IncrementalWriter.insert, ...)
+# để query được gán cho method helper / calculator gọi nó
+SKIPPED_FILES = ('query_instrumentation.py', 'columnar.py', 'bulk_writer.py')
+SKIPPED_FUNCTIONS = {
+    'RevenueQueryHelper.query_columns',
+    'RevenueQueryHelper.iter_column_blocks',
+    'IncrementalWriter.insert',
+}
+SKIPPED_PACKAGES = ('clickhouse_connect', 'concurrent', 'threading')
+SQL_PREVIEW_CHARS = 160
+TOP_CALL_SITES = 5
+
+logger = get_logger(__name__)
+
+
+def get_call_site() -> Dict[str, str]:
+    """
+    Frame đầu tiên (từ trong ra ngoài) không thuộc wrapper / thư viện: tên method (Class.method) + file:line
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        path = code.co_filename
+        name = getattr(code, 'co_qualname', code.co_name)
+        skipped = (
+            os.path.basename(path) in SKIPPED_FILES
+            or name in SKIPPED_FUNCTIONS
+            or any(f"{os.sep}{package}{os.sep}" in path or path.endswith(f"{os.sep}{package}.py") for package in SKIPPED_PACKAGES)
+        )
+        if not skipped:
+            return {'call_site': name, 'location': f"{os.path.relpath(path, root)}:{frame.f_lineno}"}
+        frame = frame.f_back
+    return {'call_site': 'unknown', 'location': ''}
+
+
+def get_summary_int(summary: Optional[Dict], key: str) -> Optional[int]:
+    if not summary or summary.get(key) in (None, ''):
+        return None
+    return int(summary[key])
+
+
+def get_query_id(source) -> Optional[str]:
+    # QuerySummary.query_id là method, QueryResult.query_id là property
+    query_id = getattr(source, 'query_id', None)
+    return (query_id() if callable(query_id) else query_id) or None
+
+
+class InstrumentedStream:
+    """
+    Bọc stream của query_column_block_stream: đếm dòng khi đọc block, ghi record khi đóng stream
+    (thời gian = tới khi đọc xong, không chỉ lúc mở)
+    """
+
+    def __init__(self, owner: 'InstrumentedClient', stream, record: Dict, started: float):
+        self.owner = owner
+        self.stream = stream
+        self.record = record
+        self.started = started
+
+    def __enter__(self) -> 'InstrumentedStream':
+        self.stream.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self.stream.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.record['seconds'] = round(time.perf_counter() - self.started, 6)
+            self.record['error'] = str(exc_value) if exc_value is not None else None
+            self.owner.add_record(self.record)
+
+    def __iter__(self):
+        for block in self.stream:
+            self.record['rows'] += len(block[0]) if block else 0
+            yield block
+
+
+class InstrumentedClient:
+    """
+    Bọc client ClickHouse, ghi 1 record cho mỗi query / command / insert:
+        call_site (method helper / calculator gọi, vd RevenueQueryHelper.get_actual_by_channel_and_date), location,
+        kind, seconds (wall time), rows / bytes trả về (insert: rows / bytes ghi), read_rows / read_bytes,
+        query_id (join với system.query_log), sql (rút gọn), error
+    read_* / result_bytes lấy từ header X-ClickHouse-Summary, có thể thiếu với query trả kết quả dạng stream;
+    số chính xác: system.query_log theo query_id. Các attribute khác chuyển thẳng cho client gốc.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.records: List[Dict] = []
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def add_record(self, record: Dict) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def new_record(self, kind: str, sql) -> Dict:
+        record = get_call_site()
+        record.update({
+            'kind': kind,
+            'seconds': None,
+            'rows': None,
+            'bytes': None,
+            'read_rows': None,
+            'read_bytes': None,
+            'query_id': None,
+            'sql': ' '.join(str(sql).split())[:SQL_PREVIEW_CHARS] if sql is not None else None,
+            'error': None,
+        })
+        return record
+
+    def call(self, kind: str, sql, method, *args, **kwargs):
+        record = self.new_record(kind, sql)
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        else:
+            self.fill_result(record, result)
+            return result
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 6)
+            self.add_record(record)
+
+    def fill_result(self, record: Dict, result) -> None:
+        summary = getattr(result, 'summary', None)
+        if not isinstance(summary, dict):
+            return
+        record['query_id'] = summary.get('query_id') or get_query_id(result)
+        record['read_rows'] = get_summary_int(summary, 'read_rows')
+        record['read_bytes'] = get_summary_int(summary, 'read_bytes')
+        if record['kind'] == 'insert':
+            record['rows'] = get_summary_int(summary, 'written_rows')
+            record['bytes'] = get_summary_int(summary, 'written_bytes')
+        elif hasattr(result, 'row_count'):
+            record['rows'] = result.row_count
+            record['bytes'] = get_summary_int(summary, 'result_bytes')
+
+    def query(self, query: str = None, *args, **kwargs):
+        return self.call('query', query, self.client.query, query, *args, **kwargs)
+
+    def command(self, cmd, *args, **kwargs):
+        return self.call('command', cmd, self.client.command, cmd, *args, **kwargs)
+
+    def insert(self, table: Optional[str] = None, *args, **kwargs):
+        context = kwargs.get('context')
+        target = table if table is not None else getattr(context, 'table', None)
+        return self.call('insert', f"INSERT INTO {target}", self.client.insert, table, *args, **kwargs)
+
+    def query_column_block_stream(self, query: str = None, *args, **kwargs):
+        record = self.new_record('stream', query)
+        record['rows'] = 0
+        started = time.perf_counter()
+        try:
+            stream = self.client.query_column_block_stream(query, *args, **kwargs)
+        except Exception as e:
+            record['seconds'] = round(time.perf_counter() - started, 6)
+            record['error'] = str(e)
+            self.add_record(record)
+            raise
+        source = getattr(stream, 'source', None)
+        record['query_id'] = get_query_id(source)
+        return InstrumentedStream(self, stream, record, started)
+
+    def drain(self) -> List[Dict]:
+        # Lấy và xoá các record đã ghi (gọi ở cuối mỗi stage)
+        with self.lock:
+            records = self.records
+            self.records = []
+        return records
+
+
+def summarize_records(records: List[Dict]) -> List[Dict]:
+    """
+    Gộp record theo call_site, sắp xếp giảm dần theo tổng thời gian
+    """
+    by_call_site: Dict[str, Dict] = {}
+    for record in records:
+        summary = by_call_site.setdefault(record['call_site'], {
+            'call_site': record['call_site'],
+            'location': record['location'],
+            'count': 0,
+            'seconds': 0.0,
+            'max_seconds': 0.0,
+            'rows': 0,
+            'bytes': 0,
+            'read_rows': 0,
+            'errors': 0,
+        })
+        summary['count'] += 1
+        summary['seconds'] += record['seconds'] or 0.0
+        summary['max_seconds'] = max(summary['max_seconds'], record['seconds'] or 0.0)
+        for key in ('rows', 'bytes', 'read_rows'):
+            summary[key] += record[key] or 0
+        if record['error'] is not None:
+            summary['errors'] += 1
+
+    result = sorted(by_call_site.values(), key=lambda s: s['seconds'], reverse=True)
+    for summary in result:
+        summary['seconds'] = round(summary['seconds'], 3)
+        summary['max_seconds'] = round(summary['max_seconds'], 3)
+    return result
+
+
+def get_stage_query_report(stage: str, records: List[Dict], **extra) -> Dict:
+    report = {
+        'stage': stage,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    report.update(extra)
+    report.update({
+        'queries': len(records),
+        'seconds': round(sum(record['seconds'] or 0.0 for record in records), 3),
+        'by_call_site': summarize_records(records),
+        'records': records,
+    })
+    return report
+
+
+def write_query_report(path: str, report: Dict) -> None:
+    # JSON lines: 1 dòng / stage, append để giữ log của các lần chạy trước
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False, default=str) + "\n")
+
+
+def print_query_summary(report: Dict, top: int = TOP_CALL_SITES) -> None:
+    logger.info("Queries in %s: %s (%.2fs total ClickHouse time)", report['stage'], report['queries'], report['seconds'])
+    for summary in report['by_call_site'][:top]:
+        logger.info(
+            "  %8.2fs %4sx %10s rows  %s (%s)",
+            summary['seconds'], summary['count'], summary['rows'], summary['call_site'], summary['location']
+        )
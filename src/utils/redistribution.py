@@ -0,0 +1,98 @@
+import numpy as np
+from datetime import date
+from typing import List, Optional
+from src.utils.columnar import ColumnarResult
+
+# Cột kết quả của redistribute_gap (NaN = None khi ghi ra)
+REDISTRIBUTION_COLUMNS = ['adjustment', 'gap', 'weighted_left', 'eod', 'actual', 'total_gap', 'total_weight_left']
+
+
+def redistribute_gap(
+    calendar_dates: np.ndarray,
+    initial: np.ndarray,
+    actual: np.ndarray,
+    weight: np.ndarray,
+    today: date,
+    today_forecast: np.ndarray,
+    future_eod: Optional[np.ndarray] = None,
+    groups: Optional[np.ndarray] = None
+) -> ColumnarResult:
+    """
+    Phân bổ phần gap còn lại của tháng cho các ngày tương lai theo weight, tính 1 lần trên toàn bộ mảng
+    (các mảng cùng độ dài, 1 phần tử / ngày × nhóm; actual / future_eod NaN = không có).
+    groups: mã nhóm int64 0..n-1 (vd factorize) để mỗi nhóm phân bổ gap riêng; None = 1 nhóm.
+
+        gap đã phát sinh = actual - initial (ngày có actual, trừ hôm nay) + today_forecast - initial (hôm nay)
+                           - initial (ngày đã qua không có actual)
+        weight còn lại   = tổng weight các ngày tương lai chưa có actual
+        ngày tương lai:    adjustment = initial - total_gap * weight / total_weight_left (initial nếu weight còn lại = 0)
+        ngày có actual:    adjustment = actual; ngày đã qua không actual: 0; hôm nay: today_forecast
+        eod:               đã qua: actual (0 nếu không có), hôm nay: today_forecast, tương lai: future_eod
+        actual (ghi ra):   tương lai chưa có actual: NaN, còn lại actual (0 nếu không có)
+
+    Giống vòng lặp Decimal cũ của kpi_day (3 lượt), sai số float64 ~1e-15 tương đối.
+    """
+    calendar_dates = np.asarray(calendar_dates, dtype='datetime64[D]')
+    initial = np.asarray(initial, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+    today_forecast = np.broadcast_to(np.asarray(today_forecast, dtype=np.float64), initial.shape)
+    n_rows = len(initial)
+    if groups is None:
+        groups = np.zeros(n_rows, dtype=np.int64)
+    n_groups = int(groups.max()) + 1 if n_rows else 0
+
+    today_value = np.datetime64(today, 'D')
+    is_past = calendar_dates < today_value
+    is_today = calendar_dates == today_value
+    is_future = calendar_dates > today_value
+    has_actual = ~np.isnan(actual)
+    actual_or_zero = np.where(has_actual, actual, 0.0)
+
+    contributed_gap = np.select(
+        [is_today, has_actual, is_past],
+        [today_forecast - initial, actual - initial, -initial],
+        default=0.0
+    )
+    is_left = is_future & ~has_actual
+    weighted_left = np.where(is_left, weight, 0.0)
+
+    total_gap = np.bincount(groups, weights=contributed_gap, minlength=n_groups)[groups]
+    total_weight_left = np.bincount(groups, weights=weighted_left, minlength=n_groups)[groups]
+
+    gap_portion = np.divide(
+        total_gap * weight,
+        total_weight_left,
+        out=np.zeros(n_rows, dtype=np.float64),
+        where=total_weight_left > 0
+    )
+    adjustment = np.select(
+        [is_today, has_actual, is_left],
+        [today_forecast, actual, initial - gap_portion],
+        default=0.0
+    )
+    gap = np.where(is_left, np.nan, np.where(is_today, today_forecast, actual_or_zero) - initial)
+
+    if future_eod is None:
+        future_eod = np.full(n_rows, np.nan)
+    eod = np.select(
+        [is_past, is_today],
+        [actual_or_zero, today_forecast],
+        default=np.asarray(future_eod, dtype=np.float64)
+    )
+
+    return ColumnarResult(['calendar_date'] + REDISTRIBUTION_COLUMNS, {
+        'calendar_date': calendar_dates,
+        'adjustment': adjustment,
+        'gap': gap,
+        'weighted_left': weighted_left,
+        'eod': eod,
+        'actual': np.where(is_left, np.nan, actual_or_zero),
+        'total_gap': total_gap,
+        'total_weight_left': total_weight_left,
+    })
+
+
+def to_optional_floats(values: np.ndarray) -> List[Optional[float]]:
+    # NaN -> None (cột Nullable khi insert)
+    return [None if value != value else value for value in values.tolist()]
@@ -0,0 +1,324 @@
+import os
+import re
+import time
+import threading
+from decimal import Decimal
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from src.utils.columnar import ColumnarResult, query_columns, DATE_DTYPE, INT_DTYPE
+from src.utils.logger import get_logger
+
+TRANSACTION_TABLE = 'hskcdp.object_sql_transaction_details'
+# Số chữ số thập phân của total_amount khi không đọc được từ DESCRIBE TABLE (Decimal(18, 2))
+DEFAULT_AMOUNT_DECIMALS = 2
+DECIMAL_TYPE_PATTERN = re.compile(r"Decimal(?:32|64|128|256)?\((?:\s*\d+\s*,)?\s*(\d+)\s*\)")
+INTEGER_TYPE_PATTERN = re.compile(r"U?Int\d+")
+# rollup cộng thẳng vào mảng dày khi số nhóm có thể có <= factor × số dòng, còn lại sort + reduceat
+DENSE_GROUPS_FACTOR = 4
+
+logger = get_logger(__name__)
+
+
+def get_channel_from_platform(platform: str) -> str:
+    # Giống CASE WHEN platform ... END as channel trong các query
+    if platform == 'ONLINE_HASAKI':
+        return 'ONLINE_HASAKI'
+    elif platform == 'OFFLINE_HASAKI':
+        return 'OFFLINE_HASAKI'
+    return 'ECOM'
+
+
+def get_amount_type(client, table: str = TRANSACTION_TABLE, column: str = 'total_amount') -> str:
+    # Kiểu của cột amount theo DESCRIBE TABLE, vd 'Decimal(18, 2)' / 'Nullable(Decimal(18, 2))'
+    result = client.query(f"DESCRIBE TABLE {table}")
+    return next((str(row[1]) for row in result.result_rows if row[0] == column), '')
+
+
+def get_decimal_scale(column_type: str) -> Optional[int]:
+    # Decimal(P, S) / Decimal64(S) -> S; kiểu khác (Int / Float) -> None
+    match = DECIMAL_TYPE_PATTERN.search(column_type)
+    return int(match.group(1)) if match else None
+
+
+def get_amount_decimals(
+    client,
+    table: str = TRANSACTION_TABLE,
+    column: str = 'total_amount',
+    column_type: Optional[str] = None
+) -> int:
+    """
+    Scale của cột amount theo DESCRIBE TABLE (hoặc column_type đã đọc): Decimal(P, S) -> S, Int -> 0.
+    Amount được lưu local dạng int64 đơn vị 10^-S nên SUM cộng lại chính xác như ClickHouse;
+    kiểu khác (Float) thì làm tròn về DEFAULT_AMOUNT_DECIMALS chữ số (không còn chính xác tuyệt đối)
+    """
+    if column_type is None:
+        column_type = get_amount_type(client, table, column)
+    decimal_scale = get_decimal_scale(column_type)
+    if decimal_scale is not None:
+        return decimal_scale
+    if INTEGER_TYPE_PATTERN.search(column_type):
+        return 0
+    logger.warning(
+        "%s.%s has type %r, amounts are rounded to %s decimals",
+        table, column, column_type, DEFAULT_AMOUNT_DECIMALS
+    )
+    return DEFAULT_AMOUNT_DECIMALS
+
+
+def to_decimal_amounts(units: Sequence[int], decimals: int) -> List[Decimal]:
+    # int đơn vị 10^-decimals -> Decimal đúng scale, vd 1230 (decimals = 2) -> Decimal('12.30')
+    return [Decimal(value).scaleb(-decimals) for value in units]
+
+
+def get_column_codes(values: np.ndarray) -> Tuple[list, np.ndarray]:
+    """
+    (danh sách giá trị khác nhau, mã int64 của từng phần tử); string giữ như str(x) giống query cũ
+    """
+    if values.dtype == object:
+        codes: Dict[str, int] = {}
+        inverse = np.fromiter(
+            (codes.setdefault(str(value), len(codes)) for value in values.tolist()),
+            dtype=np.int64,
+            count=len(values)
+        )
+        return list(codes), inverse
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return uniques.tolist(), inverse.reshape(-1).astype(np.int64)
+
+
+class TransactionSnapshot:
+    """
+    Snapshot transaction của 1 tháng, pre-aggregate ở grain nhỏ nhất
+    (calendar_date × hour × platform × brand_name × sku), lưu dạng cột numpy: mỗi cột key là
+    mã int64 + danh sách giá trị, amount là int64 đơn vị 10^-amount_decimals.
+    Các rollup thô hơn (theo date, channel, brand, sku, ...) được tính local bằng sort + reduceat,
+    chỉ đổi sang Decimal cho các nhóm kết quả.
+    """
+
+    COLUMNS = ('calendar_date', 'hour', 'platform', 'channel', 'brand_name', 'sku')
+
+    def __init__(self, year: int, month: int, result: ColumnarResult, amount_decimals: int = DEFAULT_AMOUNT_DECIMALS):
+        self.year = year
+        self.month = month
+        self.amount_decimals = amount_decimals
+        self.loaded_at = time.monotonic()
+        self.calendar_dates = result['calendar_date']
+        self.hours = result['hour']
+        self.amounts = result['amount']
+
+        self.uniques: Dict[str, list] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        for name in ('calendar_date', 'hour', 'platform', 'brand_name', 'sku'):
+            self.uniques[name], self.codes[name] = get_column_codes(result[name])
+
+        # channel suy ra từ platform: map mã platform -> mã channel
+        channels = [get_channel_from_platform(platform) for platform in self.uniques['platform']]
+        self.uniques['channel'] = sorted(set(channels))
+        channel_index = {channel: i for i, channel in enumerate(self.uniques['channel'])}
+        platform_to_channel = np.array([channel_index[channel] for channel in channels], dtype=np.int64)
+        self.codes['channel'] = platform_to_channel[self.codes['platform']]
+
+        # Giá trị theo mã dạng mảng (datetime64[D] / int64 / object) để decode nhóm bằng fancy index
+        self.unique_values: Dict[str, np.ndarray] = {}
+        for name, uniques in self.uniques.items():
+            if name == 'calendar_date':
+                self.unique_values[name] = np.array(uniques, dtype=DATE_DTYPE).reshape(-1)
+            elif name == 'hour':
+                self.unique_values[name] = np.array(uniques, dtype=np.int64).reshape(-1)
+            else:
+                self.unique_values[name] = np.empty(len(uniques), dtype=object)
+                self.unique_values[name][:] = uniques
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def get_mask(
+        self,
+        dates: Optional[Set[date]] = None,
+        before: Optional[date] = None,
+        until_hour: Optional[int] = None
+    ) -> Optional[np.ndarray]:
+        mask = None
+        if dates is not None:
+            mask = np.isin(self.calendar_dates, np.array(sorted(dates), dtype=DATE_DTYPE))
+        if before is not None:
+            before_mask = self.calendar_dates < np.datetime64(before, 'D')
+            mask = before_mask if mask is None else mask & before_mask
+        if until_hour is not None:
+            hour_mask = self.hours < until_hour
+            mask = hour_mask if mask is None else mask & hour_mask
+        return mask
+
+    def group_amounts(
+        self,
+        keys: Sequence[str],
+        dates: Optional[Set[date]] = None,
+        before: Optional[date] = None,
+        until_hour: Optional[int] = None
+    ) -> Tuple[List[np.ndarray], np.ndarray]:
+        """
+        SUM(amount) GROUP BY keys trên mảng: (mã của từng cột key theo nhóm, tổng int64 theo nhóm)
+        """
+        for key in keys:
+            if key not in self.COLUMNS:
+                raise ValueError(f"Unknown snapshot column: {key}")
+
+        mask = self.get_mask(dates, before, until_hour)
+        amounts = self.amounts if mask is None else self.amounts[mask]
+        if len(amounts) == 0:
+            return [np.empty(0, dtype=np.int64) for _ in keys], np.empty(0, dtype=np.int64)
+
+        # Mã nhóm = ghép mã các cột key (mixed radix), cộng int64 theo nhóm nên tổng chính xác
+        group_codes = np.zeros(len(amounts), dtype=np.int64)
+        n_groups = 1
+        for key in keys:
+            codes = self.codes[key] if mask is None else self.codes[key][mask]
+            group_codes = group_codes * len(self.uniques[key]) + codes
+            n_groups *= len(self.uniques[key])
+
+        if n_groups <= DENSE_GROUPS_FACTOR * len(amounts):
+            # Ít nhóm (vd theo ngày / channel / brand): cộng thẳng vào mảng dày, không cần sort
+            dense_sums = np.zeros(n_groups, dtype=np.int64)
+            np.add.at(dense_sums, group_codes, amounts)
+            groups = np.flatnonzero(np.bincount(group_codes, minlength=n_groups))
+            sums = dense_sums[groups]
+        else:
+            order = np.argsort(group_codes, kind='stable')
+            sorted_codes = group_codes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+            sums = np.add.reduceat(amounts[order], starts)
+            groups = sorted_codes[starts]
+
+        key_codes = []
+        for key in reversed(keys):
+            n_uniques = len(self.uniques[key])
+            key_codes.append(groups % n_uniques)
+            groups = groups // n_uniques
+        key_codes.reverse()
+        return key_codes, sums
+
+    def rollup(
+        self,
+        keys: Sequence[str],
+        dates: Optional[Set[date]] = None,
+        before: Optional[date] = None,
+        until_hour: Optional[int] = None
+    ) -> Dict[Tuple, Decimal]:
+        """
+        SUM(amount) GROUP BY keys, với các filter:
+            dates: chỉ lấy calendar_date thuộc set này
+            before: calendar_date < before
+            until_hour: hour < until_hour
+        Returns: dict {tuple(keys): amount}
+        """
+        key_codes, sums = self.group_amounts(keys, dates, before, until_hour)
+        if len(sums) == 0:
+            return {}
+        amounts = to_decimal_amounts(sums.tolist(), self.amount_decimals)
+        if not keys:
+            return {(): amounts[0]}
+        key_values = [self.unique_values[key][codes].tolist() for key, codes in zip(keys, key_codes)]
+        return dict(zip(zip(*key_values), amounts))
+
+    def rollup_columns(
+        self,
+        keys: Sequence[str],
+        value: str = 'amount',
+        dates: Optional[Set[date]] = None,
+        before: Optional[date] = None,
+        until_hour: Optional[int] = None
+    ) -> ColumnarResult:
+        """
+        Giống rollup nhưng trả về dạng cột (calendar_date datetime64[D], string object, value float64),
+        không tạo Decimal / dict cho từng nhóm
+        """
+        key_codes, sums = self.group_amounts(keys, dates, before, until_hour)
+        columns = {key: self.unique_values[key][codes] for key, codes in zip(keys, key_codes)}
+        columns[value] = sums / 10 ** self.amount_decimals
+        return ColumnarResult(list(keys) + [value], columns)
+
+    def max_hour(self, calendar_date: date) -> Optional[int]:
+        hours = self.hours[self.calendar_dates == np.datetime64(calendar_date, 'D')]
+        return int(hours.max()) if len(hours) else None
+
+
+class TransactionSnapshotCache:
+    """
+    Cache snapshot theo (year, month), có TTL và invalidate thủ công.
+    Mỗi tháng chỉ scan object_sql_transaction_details 1 lần trong thời gian TTL.
+    pin() / unpin(): trong 1 lần chạy pipeline snapshot không bị reload (mọi stage thấy cùng actual),
+    TTL chỉ áp dụng giữa các lần chạy.
+    """
+
+    def __init__(self, client, ttl_seconds: Optional[float] = None):
+        self.client = client
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("KPI_SNAPSHOT_TTL_SECONDS", "300"))
+        self.ttl_seconds = ttl_seconds
+        self.snapshots: Dict[Tuple[int, int], TransactionSnapshot] = {}
+        self.load_count = 0
+        self.amount_decimals: Optional[int] = None
+        self.pinned = False
+        self.lock = threading.Lock()
+
+    def is_expired(self, snapshot: TransactionSnapshot) -> bool:
+        return time.monotonic() - snapshot.loaded_at > self.ttl_seconds
+
+    def pin(self) -> None:
+        # Bắt đầu 1 lần chạy: bỏ snapshot đã hết TTL, sau đó giữ nguyên snapshot tới khi unpin()
+        with self.lock:
+            for key, snapshot in list(self.snapshots.items()):
+                if self.is_expired(snapshot):
+                    del self.snapshots[key]
+            self.pinned = True
+
+    def unpin(self) -> None:
+        with self.lock:
+            self.pinned = False
+
+    def get(self, year: int, month: int) -> TransactionSnapshot:
+        with self.lock:
+            snapshot = self.snapshots.get((year, month))
+            if snapshot is None or (not self.pinned and self.is_expired(snapshot)):
+                snapshot = self.load(year, month)
+                self.snapshots[(year, month)] = snapshot
+            return snapshot
+
+    def invalidate(self, year: Optional[int] = None, month: Optional[int] = None) -> None:
+        with self.lock:
+            if year is None and month is None:
+                self.snapshots.clear()
+                return
+            for key in list(self.snapshots.keys()):
+                if (year is None or key[0] == year) and (month is None or key[1] == month):
+                    del self.snapshots[key]
+
+    def load(self, year: int, month: int) -> TransactionSnapshot:
+        if self.amount_decimals is None:
+            self.amount_decimals = get_amount_decimals(self.client)
+
+        query = f"""
+            SELECT
+                toDate(created_at) AS calendar_date,
+                toHour(created_at) AS hour,
+                platform,
+                brand_name,
+                CAST(sku AS String) AS sku,
+                toInt64(round(SUM(COALESCE(total_amount, 0)) * {10 ** self.amount_decimals})) AS amount
+            FROM {TRANSACTION_TABLE} FINAL
+            WHERE toYear(created_at) = {year}
+              AND toMonth(created_at) = {month}
+              AND status NOT IN ('Canceled', 'Cancel')
+            GROUP BY calendar_date, hour, platform, brand_name, sku
+        """
+
+        result = query_columns(
+            self.client,
+            query,
+            dtypes={'calendar_date': DATE_DTYPE, 'hour': INT_DTYPE, 'amount': INT_DTYPE},
+            column_names=['calendar_date', 'hour', 'platform', 'brand_name', 'sku', 'amount']
+        )
+        self.load_count += 1
+
+        return TransactionSnapshot(year, month, result, self.amount_decimals)